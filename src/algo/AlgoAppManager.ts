@@ -9,13 +9,15 @@ export default class AlgoAppManager {
   constructor(private readonly algoClient: AlgoClient) {}
 
   /**
-   * Compiles and deploys the provided stateful application
+   * Compiles and deploys the provided stateful application.
+   * Programs are either TEAL sources, compiled by algod, or already assembled bytecode
+   * (e.g. an instantiated `ProgramTemplate`), which is deployed as is.
    * @returns An ID of the newly created application
    */
   async create(args: {
     creatorMnemonic: string;
-    approvalProgramSource: string;
-    clearProgramSource: string;
+    approvalProgramSource: string | Uint8Array;
+    clearProgramSource: string | Uint8Array;
     localState: StateSchema;
     globalState: StateSchema;
     appArgs?: AppArgument[];
@@ -29,8 +31,8 @@ export default class AlgoAppManager {
   }): Promise<{ id: number; address: string }> {
     const senderAccount = algosdk.mnemonicToSecretKey(args.creatorMnemonic);
     const [approvalProgram, clearProgram, params] = await Promise.all([
-      this.algoClient.compileProgram(args.approvalProgramSource),
-      this.algoClient.compileProgram(args.clearProgramSource),
+      this.toProgram(args.approvalProgramSource),
+      this.toProgram(args.clearProgramSource),
       this.algoClient.getDefaultParams(),
     ]);
     const txn = algosdk.makeApplicationCreateTxn(
@@ -61,13 +63,14 @@ export default class AlgoAppManager {
   }
 
   /**
-   * Updates an application's approval and clear programs
+   * Updates an application's approval and clear programs,
+   * given as TEAL sources or assembled bytecode like in `create`
    */
   async update(args: {
     creatorMnemonic: string;
     appId: number;
-    approvalProgramSource: string;
-    clearProgramSource: string;
+    approvalProgramSource: string | Uint8Array;
+    clearProgramSource: string | Uint8Array;
     appArgs?: AppArgument[];
     accounts?: string[];
     foreignApps?: number[];
@@ -77,8 +80,8 @@ export default class AlgoAppManager {
     rekeyTo?: string;
   }): Promise<void> {
     const [approvalProgram, clearProgram] = await Promise.all([
-      this.algoClient.compileProgram(args.approvalProgramSource),
-      this.algoClient.compileProgram(args.clearProgramSource),
+      this.toProgram(args.approvalProgramSource),
+      this.toProgram(args.clearProgramSource),
     ]);
     await this.algoClient.sendTransaction(
       args.creatorMnemonic,
@@ -249,4 +252,10 @@ export default class AlgoAppManager {
       )
     );
   }
+
+  private async toProgram(program: string | Uint8Array): Promise<Uint8Array> {
+    return typeof program === "string"
+      ? this.algoClient.compileProgram(program)
+      : program;
+  }
 }
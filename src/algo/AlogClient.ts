@@ -4,15 +4,18 @@ import {
   assignGroupID,
   SuggestedParams,
   Transaction,
-  waitForConfirmation,
   mnemonicToSecretKey,
 } from "algosdk";
+import ConfirmationTracker from "./ConfirmationTracker";
+import SuggestedParamsCache from "./SuggestedParamsCache";
 import { TransactionWrapperFactory } from "./types/transactions/types";
 
 const MAX_WAIT_ROUNDS = 4;
 
 export default class AlgoClient {
   private readonly client: Algodv2;
+  private readonly paramsCache: SuggestedParamsCache;
+  private readonly confirmationTracker: ConfirmationTracker;
 
   constructor(
     hostUrl = "http://localhost",
@@ -20,6 +23,12 @@ export default class AlgoClient {
     token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
   ) {
     this.client = new Algodv2(token, hostUrl, hostPort);
+    // Every submitter shares the params of the current round and one follower of the
+    // chain, which refreshes the params when it sees a new round
+    this.paramsCache = new SuggestedParamsCache(this.client);
+    this.confirmationTracker = new ConfirmationTracker(this.client, (round) =>
+      this.paramsCache.observeRound(round)
+    );
   }
 
   async accountInformation(address: string): Promise<{ amount: number }> {
@@ -29,6 +38,27 @@ export default class AlgoClient {
     };
   }
 
+  /**
+   * Local state of an account in an application, by key; empty when the account is not
+   * opted in. Byte slice values are base64 encoded, as algod returns them.
+   */
+  async applicationLocalState(
+    address: string,
+    appId: number
+  ): Promise<Record<string, number | string>> {
+    const accountInfo = await this.client.accountInformation(address).do();
+    const appLocalState = (accountInfo["apps-local-state"] || []).find(
+      (localState: Record<string, any>) => localState.id === appId
+    );
+    const state: Record<string, number | string> = {};
+    for (const { key, value } of appLocalState?.["key-value"] || []) {
+      // type 1 is a byte slice, 2 an integer
+      state[Buffer.from(key, "base64").toString()] =
+        value.type === 1 ? value.bytes : value.uint;
+    }
+    return state;
+  }
+
   async compileProgram(programSource: string): Promise<Uint8Array> {
     const encoder = new TextEncoder();
     const programBytes = encoder.encode(programSource);
@@ -37,7 +67,7 @@ export default class AlgoClient {
   }
 
   async getDefaultParams(): Promise<SuggestedParams> {
-    const params = await this.client.getTransactionParams().do();
+    const params = await this.paramsCache.get();
     params.fee = ALGORAND_MIN_TX_FEE;
     params.flatFee = true;
     return params;
@@ -60,10 +90,9 @@ export default class AlgoClient {
     transaction: Transaction,
     secretKey: Uint8Array
   ): Promise<void> {
-    const txId = transaction.txID().toString();
     const signedTxn = transaction.signTxn(secretKey);
     await this.client.sendRawTransaction(signedTxn).do();
-    await waitForConfirmation(this.client, txId, MAX_WAIT_ROUNDS);
+    await this.confirmationTracker.wait(transaction, MAX_WAIT_ROUNDS);
   }
 
   async getAssetId(transaction: Transaction): Promise<number> {
@@ -100,9 +129,11 @@ export default class AlgoClient {
     );
     assignGroupID(txnWrappers.map((txnWrapper) => txnWrapper.transaction));
     const signedTransactions = txnWrappers.map((txn) => txn.signTransaction());
-    const { txId } = await this.client
-      .sendRawTransaction(signedTransactions)
-      .do();
-    await waitForConfirmation(this.client, txId, MAX_WAIT_ROUNDS);
+    await this.client.sendRawTransaction(signedTransactions).do();
+    // the transactions of a group are confirmed in the same block
+    await this.confirmationTracker.wait(
+      txnWrappers[0].transaction,
+      MAX_WAIT_ROUNDS
+    );
   }
 }
@@ -0,0 +1,201 @@
+import { Algodv2, Transaction } from "algosdk";
+
+/**
+ * Rounds whose transaction IDs are remembered, for transactions that are awaited
+ * after the block confirming them was read
+ */
+const RECENT_ROUNDS = 8;
+
+type Waiter = {
+  firstRound: number;
+  lastRound: number;
+  maxRounds: number;
+  resolve: (confirmedRound: number) => void;
+  reject: (error: Error) => void;
+};
+
+/**
+ * Waits for transactions to be confirmed by following the chain once for all of them.
+ * While transactions are awaited, one loop waits for each new round, reads its block and
+ * resolves the awaited transactions it contains, so the algod requests grow with the
+ * number of rounds rather than with the number of transactions.
+ */
+export default class ConfirmationTracker {
+  private readonly waiters = new Map<string, Waiter[]>();
+  /**
+   * Transaction ID -> confirmed round, for the last RECENT_ROUNDS blocks read
+   */
+  private readonly recent = new Map<string, number>();
+  private readonly recentRounds: string[][] = [];
+  /**
+   * Next block to read
+   */
+  private nextRound = 0;
+  private following = false;
+
+  constructor(
+    private readonly client: Algodv2,
+    private readonly onRound: (round: number) => void = () => undefined
+  ) {}
+
+  /**
+   * Resolves with the confirmed round of a sent transaction, or rejects when it is not
+   * confirmed within `maxRounds` rounds after its first valid round.
+   */
+  wait(transaction: Transaction, maxRounds: number): Promise<number> {
+    const txId = transaction.txID().toString();
+    const confirmedRound = this.recent.get(txId);
+    if (confirmedRound !== undefined) {
+      return Promise.resolve(confirmedRound);
+    }
+    return new Promise((resolve, reject) => {
+      const firstRound = transaction.firstRound;
+      const waiter = {
+        firstRound,
+        lastRound: Math.max(firstRound, this.nextRound - 1) + maxRounds,
+        maxRounds,
+        resolve,
+        reject,
+      };
+      this.waiters.set(txId, [...(this.waiters.get(txId) || []), waiter]);
+      if (this.following && firstRound < this.nextRound - RECENT_ROUNDS) {
+        // the blocks it may be in are no longer remembered
+        this.checkPending(txId);
+      }
+      if (!this.following) {
+        this.follow().catch((error) => this.rejectAll(error));
+      }
+    });
+  }
+
+  private async follow(): Promise<void> {
+    this.following = true;
+    try {
+      const status = await this.client.status().do();
+      const lastRound: number = status["last-round"];
+      this.onRound(lastRound);
+      const firstRound = Math.min(
+        ...this.allWaiters().map((waiter) => waiter.firstRound)
+      );
+      // Blocks read before the tracker went idle are remembered, older blocks are not
+      // read again: transactions that may be in them are looked up once instead
+      this.nextRound = Math.max(
+        Math.min(firstRound, lastRound),
+        this.nextRound,
+        lastRound - RECENT_ROUNDS
+      );
+      for (const [txId, txWaiters] of this.waiters) {
+        if (txWaiters.some((waiter) => waiter.firstRound < this.nextRound)) {
+          this.checkPending(txId);
+        }
+      }
+      while (this.waiters.size) {
+        const { block } = await this.client.block(this.nextRound).do();
+        this.readBlock(this.nextRound, block);
+        this.nextRound += 1;
+        this.expireWaiters();
+        if (this.waiters.size) {
+          // returns at once while the tracker is behind the chain
+          const status = await this.client
+            .statusAfterBlock(this.nextRound - 1)
+            .do();
+          this.onRound(status["last-round"]);
+        }
+      }
+    } finally {
+      this.following = false;
+    }
+  }
+
+  private readBlock(round: number, block: Record<string, any>): void {
+    const txIds: string[] = (block.txns || []).map(
+      (signedTxn: Record<string, any>) => {
+        // Transactions in a block omit the genesis hash and, unless "hgi" is set, the
+        // genesis ID, both are part of the transaction ID
+        const txn = { ...signedTxn.txn, gh: block.gh };
+        if (signedTxn.hgi) {
+          txn.gen = block.gen;
+        }
+        return Transaction.from_obj_for_encoding(txn).txID().toString();
+      }
+    );
+    for (const txId of txIds) {
+      this.recent.set(txId, round);
+      const waiters = this.waiters.get(txId);
+      if (waiters) {
+        this.waiters.delete(txId);
+        waiters.forEach((waiter) => waiter.resolve(round));
+      }
+    }
+    this.recentRounds.push(txIds);
+    if (this.recentRounds.length > RECENT_ROUNDS) {
+      (this.recentRounds.shift() as string[]).forEach((txId) =>
+        this.recent.delete(txId)
+      );
+    }
+  }
+
+  private expireWaiters(): void {
+    const round = this.nextRound - 1;
+    for (const [txId, waiters] of this.waiters) {
+      const expired = waiters.filter((waiter) => waiter.lastRound <= round);
+      if (!expired.length) {
+        continue;
+      }
+      const remaining = waiters.filter((waiter) => waiter.lastRound > round);
+      if (remaining.length) {
+        this.waiters.set(txId, remaining);
+      } else {
+        this.waiters.delete(txId);
+      }
+      this.explainTimeout(txId).then((message) =>
+        expired.forEach((waiter) =>
+          waiter.reject(
+            new Error(
+              message ||
+                `Transaction ${txId} not confirmed after ${waiter.maxRounds} rounds`
+            )
+          )
+        )
+      );
+    }
+  }
+
+  /**
+   * The reason a transaction was dropped from the transaction pool, if it was
+   */
+  private async explainTimeout(txId: string): Promise<string | undefined> {
+    try {
+      const info = await this.client.pendingTransactionInformation(txId).do();
+      return info["pool-error"]
+        ? `Transaction ${txId} rejected: ${info["pool-error"]}`
+        : undefined;
+    } catch {
+      return undefined;
+    }
+  }
+
+  private async checkPending(txId: string): Promise<void> {
+    try {
+      const info = await this.client.pendingTransactionInformation(txId).do();
+      const confirmedRound = info["confirmed-round"];
+      const waiters = this.waiters.get(txId);
+      if (confirmedRound && waiters) {
+        this.waiters.delete(txId);
+        waiters.forEach((waiter) => waiter.resolve(confirmedRound));
+      }
+    } catch {
+      // followed like the other transactions
+    }
+  }
+
+  private allWaiters(): Waiter[] {
+    return ([] as Waiter[]).concat(...this.waiters.values());
+  }
+
+  private rejectAll(error: Error): void {
+    const waiters = this.allWaiters();
+    this.waiters.clear();
+    waiters.forEach((waiter) => waiter.reject(error));
+  }
+}
@@ -0,0 +1,133 @@
+import { promises as fs } from "fs";
+
+/**
+ * A `TMPL_` variable of an assembled program template.
+ */
+export type TemplateVariable = {
+  name: string;
+  type: "int" | "bytes";
+  /**
+   * Offset of the one-byte placeholder in the template bytecode
+   */
+  offset: number;
+};
+
+export type TemplateValues = Record<string, number | Uint8Array>;
+
+/**
+ * A program assembled once with `TMPL_` placeholders by `src/contracts/build.py`
+ * ("<program>.template.json", see `src/contracts/avm/template.py`).
+ * Instantiating it patches the values into the bytecode offline, so deployments
+ * do not compile the program on algod.
+ */
+export default class ProgramTemplate {
+  private static readonly templates = new Map<string, Promise<ProgramTemplate>>();
+
+  private readonly programs = new Map<string, Uint8Array>();
+
+  constructor(
+    private readonly bytecode: Uint8Array,
+    private readonly variables: TemplateVariable[]
+  ) {}
+
+  /**
+   * Loads a template file once per process
+   */
+  static load(filePath: string): Promise<ProgramTemplate> {
+    let template = ProgramTemplate.templates.get(filePath);
+    if (!template) {
+      template = fs.readFile(filePath, "utf8").then((text) => {
+        const { bytecode, variables } = JSON.parse(text);
+        return new ProgramTemplate(
+          new Uint8Array(Buffer.from(bytecode, "base64")),
+          variables
+        );
+      });
+      ProgramTemplate.templates.set(filePath, template);
+    }
+    return template;
+  }
+
+  /**
+   * Returns the program bytecode with the template variables replaced by `values`.
+   * Programs are cached per values.
+   */
+  instantiate(values: TemplateValues = {}): Uint8Array {
+    const key = Object.keys(values)
+      .sort()
+      .map((name) => {
+        const encoded = ProgramTemplate.encodeValue(name, values[name]);
+        return `${name}=${typeof values[name]}:${Buffer.from(encoded).toString("hex")}`;
+      })
+      .join(",");
+    let program = this.programs.get(key);
+    if (!program) {
+      program = this.patch(values);
+      this.programs.set(key, program);
+    }
+    return program;
+  }
+
+  private patch(values: TemplateValues): Uint8Array {
+    for (const name of Object.keys(values)) {
+      if (!this.variables.some((variable) => variable.name === name)) {
+        throw new Error(`Unknown template variable ${name}`);
+      }
+    }
+    const parts: Uint8Array[] = [];
+    let position = 0;
+    for (const variable of this.variables) {
+      const value = values[variable.name];
+      if (value === undefined) {
+        throw new Error(`No value for template variable ${variable.name}`);
+      }
+      if ((variable.type === "int") !== (typeof value === "number")) {
+        throw new Error(
+          `Template variable ${variable.name} must be ${
+            variable.type === "int" ? "a number" : "bytes"
+          }`
+        );
+      }
+      parts.push(this.bytecode.subarray(position, variable.offset));
+      parts.push(ProgramTemplate.encodeValue(variable.name, value));
+      position = variable.offset + 1;
+    }
+    parts.push(this.bytecode.subarray(position));
+    const program = new Uint8Array(
+      parts.reduce((length, part) => length + part.length, 0)
+    );
+    let offset = 0;
+    for (const part of parts) {
+      program.set(part, offset);
+      offset += part.length;
+    }
+    return program;
+  }
+
+  private static encodeValue(
+    name: string,
+    value: number | Uint8Array
+  ): Uint8Array {
+    if (typeof value !== "number") {
+      return new Uint8Array([
+        ...ProgramTemplate.encodeVarint(value.length),
+        ...value,
+      ]);
+    }
+    if (!Number.isSafeInteger(value) || value < 0) {
+      throw new Error(`Invalid value of template variable ${name}`);
+    }
+    return ProgramTemplate.encodeVarint(value);
+  }
+
+  private static encodeVarint(value: number): Uint8Array {
+    const bytes: number[] = [];
+    let remaining = value;
+    while (remaining >= 0x80) {
+      bytes.push((remaining % 0x80) | 0x80);
+      remaining = Math.floor(remaining / 0x80);
+    }
+    bytes.push(remaining);
+    return new Uint8Array(bytes);
+  }
+}
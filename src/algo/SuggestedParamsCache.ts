@@ -0,0 +1,58 @@
+import { Algodv2, SuggestedParams } from "algosdk";
+
+/**
+ * Approximate time between two blocks, after which cached params are refreshed when no
+ * new round was observed.
+ */
+const ROUND_TIME_MS = 4000;
+
+/**
+ * Suggested transaction params shared by every submitter of an `AlgoClient`.
+ * They are fetched at most once per round: concurrent callers share one request, and the
+ * cache is refreshed when a newer round is observed (see `ConfirmationTracker`) or after
+ * about one round time otherwise.
+ */
+export default class SuggestedParamsCache {
+  private params?: SuggestedParams;
+  private fetchedAt = 0;
+  private request?: Promise<SuggestedParams>;
+
+  constructor(private readonly client: Algodv2) {}
+
+  /**
+   * Returns a copy of the cached params, callers may change it
+   */
+  async get(): Promise<SuggestedParams> {
+    let params = this.params;
+    if (!params || Date.now() - this.fetchedAt >= ROUND_TIME_MS) {
+      if (!this.request) {
+        this.request = this.fetch();
+      }
+      params = await this.request;
+    }
+    return { ...params };
+  }
+
+  /**
+   * Drops the cached params once a round after the one they were fetched in is observed
+   */
+  observeRound(round: number): void {
+    if (this.params && round > this.params.firstRound) {
+      this.params = undefined;
+    }
+  }
+
+  /**
+   * Fetches the params, the request being shared by the callers until it settles
+   */
+  private async fetch(): Promise<SuggestedParams> {
+    try {
+      const params = await this.client.getTransactionParams().do();
+      this.params = params;
+      this.fetchedAt = Date.now();
+      return params;
+    } finally {
+      this.request = undefined;
+    }
+  }
+}
@@ -0,0 +1,17 @@
+import AppArgument from "./AppArgument";
+
+export default class ByteAppArgument extends AppArgument {
+  readonly value: number;
+
+  constructor(value: number) {
+    super();
+    if (!Number.isInteger(value) || value < 0 || value > 255) {
+      throw new Error("Invalid byte app argument.");
+    }
+    this.value = value;
+  }
+
+  toBinary(): Uint8Array {
+    return new Uint8Array([this.value]);
+  }
+}
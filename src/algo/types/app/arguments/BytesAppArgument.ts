@@ -0,0 +1,17 @@
+import AppArgument from "./AppArgument";
+
+export default class BytesAppArgument extends AppArgument {
+  readonly value: Uint8Array;
+
+  constructor(value: Uint8Array) {
+    super();
+    if (!(value instanceof Uint8Array)) {
+      throw new Error("Invalid bytes app argument.");
+    }
+    this.value = value;
+  }
+
+  toBinary(): Uint8Array {
+    return this.value;
+  }
+}
@@ -0,0 +1,7 @@
+from .address import ZERO_ADDRESS, application_address, decode_address, encode_address, logic_sig_address
+from .assembler import AssemblerError, Program, assemble, assemble_source, disassemble, parse
+from .interpreter import EvalResult, LogicError, TransactionRejected, evaluate_group
+from .ledger import Ledger, LedgerError, Transaction
+from .optimizer import OptimizationReport, optimize, optimize_with_report
+from .profile import Profile, subroutine_names
+from .template import Template, TemplateVariable, assemble_template, assemble_template_source, instantiate, substitute
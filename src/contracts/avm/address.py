@@ -0,0 +1,32 @@
+import base64
+import hashlib
+
+# Algorand address helpers: an address is the base32 encoding of a 32-byte public key
+# followed by the last 4 bytes of its SHA-512/256 digest.
+
+ZERO_ADDRESS = bytes(32)
+
+
+def sha512_256(data: bytes) -> bytes:
+    return hashlib.new("sha512_256", data).digest()
+
+
+def encode_address(public_key: bytes) -> str:
+    checksum = sha512_256(public_key)[-4:]
+    return base64.b32encode(public_key + checksum).decode().rstrip("=")
+
+
+def decode_address(address: str) -> bytes:
+    decoded = base64.b32decode(address + "=" * (-len(address) % 8))
+    public_key, checksum = decoded[:32], decoded[32:]
+    if len(public_key) != 32 or sha512_256(public_key)[-4:] != checksum:
+        raise ValueError(f"invalid address {address}")
+    return public_key
+
+
+def application_address(app_id: int) -> bytes:
+    return sha512_256(b"appID" + app_id.to_bytes(8, "big"))
+
+
+def logic_sig_address(bytecode: bytes) -> bytes:
+    return sha512_256(b"Program" + bytecode)
@@ -0,0 +1,375 @@
+import base64
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Tuple
+
+from .address import decode_address
+from .opcodes import FIELDS, NAMED_INTS, OPS_BY_NAME, OPS_BY_OPCODE
+
+
+class AssemblerError(Exception):
+    pass
+
+
+class Instruction(NamedTuple):
+    op: str
+    # Decoded immediates: ints, bytes, field names or a label name
+    immediates: Tuple
+    # 1-based line of the TEAL source
+    line: int
+
+
+class Program(NamedTuple):
+    version: int
+    instructions: List[Instruction]
+    # label -> index of the instruction following it
+    labels: Dict[str, int]
+
+
+# "int TMPL_NAME" and "byte TMPL_NAME" are template variables, the same as in PyTeal's Tmpl
+TEMPLATE_PREFIX = "TMPL_"
+
+TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|//.*|\S+')
+
+
+def tokenize(line: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(line):
+        if token.startswith("//"):
+            break
+        tokens.append(token)
+    return tokens
+
+
+def parse_int(token: str) -> int:
+    if token in NAMED_INTS:
+        return NAMED_INTS[token]
+    if token.startswith(("0x", "0X")):
+        value = int(token, 16)
+    elif len(token) > 1 and token.startswith("0"):
+        value = int(token, 8)
+    else:
+        value = int(token)
+    if not 0 <= value < 2 ** 64:
+        raise AssemblerError(f"{token} is not a uint64")
+    return value
+
+
+def parse_string(token: str) -> bytes:
+    body = token[1:-1]
+    result = bytearray()
+    i = 0
+    while i < len(body):
+        char = body[i]
+        if char != "\\":
+            result += char.encode()
+            i += 1
+            continue
+        escaped = body[i + 1]
+        if escaped == "x":
+            result.append(int(body[i + 2:i + 4], 16))
+            i += 4
+            continue
+        result += {"n": b"\n", "r": b"\r", "t": b"\t", '"': b'"', "\\": b"\\", "0": b"\0"}[escaped]
+        i += 2
+    return bytes(result)
+
+
+def parse_bytes(args: List[str]) -> bytes:
+    first = args[0]
+    if first.startswith('"'):
+        return parse_string(first)
+    if first.startswith("0x"):
+        return bytes.fromhex(first[2:])
+    encoded = None
+    if first in ("base64", "b64", "base32", "b32") and len(args) > 1:
+        kind, encoded = first, args[1]
+    else:
+        match = re.fullmatch(r"(base64|b64|base32|b32)\((.*)\)", first)
+        if match:
+            kind, encoded = match.groups()
+    if encoded is None:
+        raise AssemblerError(f"cannot parse byte constant {' '.join(args)}")
+    if kind in ("base64", "b64"):
+        return base64.b64decode(encoded)
+    return base64.b32decode(encoded + "=" * (-len(encoded) % 8))
+
+
+def method_selector(signature: str) -> bytes:
+    return hashlib.new("sha512_256", signature.encode()).digest()[:4]
+
+
+def is_template_variable(value) -> bool:
+    return isinstance(value, str) and value.startswith(TEMPLATE_PREFIX)
+
+
+def parse_immediates(op: str, args: List[str]) -> Tuple:
+    if op in ("int", "byte") and len(args) == 1 and is_template_variable(args[0]):
+        # Placeholder instantiated later, see avm/template.py
+        return (args[0],)
+    if op == "int":
+        return (parse_int(args[0]),)
+    if op == "byte":
+        return (parse_bytes(args),)
+    if op == "addr":
+        return (decode_address(args[0]),)
+    if op == "method":
+        return (method_selector(parse_string(args[0]).decode()),)
+    spec = OPS_BY_NAME.get(op)
+    if spec is None:
+        raise AssemblerError(f"unknown opcode {op}")
+    if spec.immediates == "I":
+        return tuple(parse_int(arg) for arg in args)
+    if spec.immediates == "B":
+        return tuple(parse_bytes([arg]) for arg in args)
+    if len(args) != len(spec.immediates):
+        raise AssemblerError(f"{op} expects {len(spec.immediates)} immediate arguments")
+    immediates = []
+    for kind, arg in zip(spec.immediates, args):
+        if kind in FIELDS:
+            if arg not in FIELDS[kind]:
+                raise AssemblerError(f"unknown field {arg} of {op}")
+            immediates.append(arg)
+        elif kind == "L":
+            immediates.append(arg)
+        elif kind == "b":
+            immediates.append(parse_bytes([arg]))
+        else:
+            immediates.append(parse_int(arg))
+    return tuple(immediates)
+
+
+def parse(source: str) -> Program:
+    """Parses TEAL assembly into a Program; constants are decoded, labels are kept by name."""
+    version = 1
+    instructions = []
+    labels = {}
+    for line_number, line in enumerate(source.splitlines(), start=1):
+        tokens = tokenize(line)
+        if not tokens:
+            continue
+        if tokens[0] == "#pragma":
+            if tokens[1] == "version":
+                version = int(tokens[2])
+            continue
+        if len(tokens) == 1 and tokens[0].endswith(":"):
+            labels[tokens[0][:-1]] = len(instructions)
+            continue
+        op, args = tokens[0], tokens[1:]
+        try:
+            immediates = parse_immediates(op, args)
+        except (AssemblerError, ValueError, IndexError, KeyError) as error:
+            raise AssemblerError(f"line {line_number}: {error}") from error
+        instructions.append(Instruction(op, immediates, line_number))
+    for instruction in instructions:
+        spec = OPS_BY_NAME.get(instruction.op)
+        if spec is not None and spec.immediates == "L" and instruction.immediates[0] not in labels:
+            raise AssemblerError(f"line {instruction.line}: unknown label {instruction.immediates[0]}")
+    return Program(version, instructions, labels)
+
+
+def encode_varint(value: int) -> bytes:
+    result = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            result.append(byte | 0x80)
+        else:
+            result.append(byte)
+            return bytes(result)
+
+
+def encode_bytes(value: bytes) -> bytes:
+    return encode_varint(len(value)) + value
+
+
+def create_constant_blocks(program: Program) -> Program:
+    """Replaces the int/byte/addr/method pseudo-ops the same way "goal clerk compile" and PyTeal's
+    assembleConstants do: constants used more than once go into intcblock/bytecblock ordered by
+    frequency, single-use constants become pushint/pushbytes. Template variables always go into the
+    blocks, so that instantiating them never moves an instruction relative to a branch."""
+    if any(instruction.op in ("intcblock", "bytecblock") for instruction in program.instructions):
+        return program
+    int_freqs = OrderedDict()
+    byte_freqs = OrderedDict()
+    for instruction in program.instructions:
+        if instruction.op == "int":
+            int_freqs[instruction.immediates[0]] = int_freqs.get(instruction.immediates[0], 0) + 1
+        elif instruction.op in ("byte", "addr", "method"):
+            byte_freqs[instruction.immediates[0]] = byte_freqs.get(instruction.immediates[0], 0) + 1
+    int_block = [
+        value for value in sorted(int_freqs, key=lambda value: int_freqs[value], reverse=True)
+        if int_freqs[value] > 1 or is_template_variable(value)
+    ]
+    byte_block = [
+        value for value in sorted(byte_freqs, key=lambda value: byte_freqs[value], reverse=True)
+        if byte_freqs[value] > 1 or is_template_variable(value)
+    ]
+
+    prologue = []
+    if int_block:
+        prologue.append(Instruction("intcblock", tuple(int_block), 0))
+    if byte_block:
+        prologue.append(Instruction("bytecblock", tuple(byte_block), 0))
+
+    def constant_op(instruction, block, push_op, ref_op):
+        value = instruction.immediates[0]
+        if value not in block:
+            return Instruction(push_op, (value,), instruction.line)
+        index = block.index(value)
+        if index < 4:
+            return Instruction(f"{ref_op}_{index}", (), instruction.line)
+        return Instruction(ref_op, (index,), instruction.line)
+
+    instructions = list(prologue)
+    for instruction in program.instructions:
+        if instruction.op == "int":
+            instruction = constant_op(instruction, int_block, "pushint", "intc")
+        elif instruction.op in ("byte", "addr", "method"):
+            instruction = constant_op(instruction, byte_block, "pushbytes", "bytec")
+        instructions.append(instruction)
+    labels = {label: index + len(prologue) for label, index in program.labels.items()}
+    return Program(program.version, instructions, labels)
+
+
+def encode_immediates(spec, immediates, offset_of_label, end) -> bytes:
+    if spec.immediates == "I":
+        return encode_varint(len(immediates)) + b"".join(encode_varint(value) for value in immediates)
+    if spec.immediates == "B":
+        return encode_varint(len(immediates)) + b"".join(encode_bytes(value) for value in immediates)
+    encoded = bytearray()
+    for kind, value in zip(spec.immediates, immediates):
+        if kind in FIELDS:
+            encoded.append(FIELDS[kind].index(value))
+        elif kind == "L":
+            jump = offset_of_label(value) - end
+            if not -0x8000 <= jump <= 0x7FFF:
+                raise AssemblerError(f"branch to {value} is too far")
+            encoded += jump.to_bytes(2, "big", signed=True)
+        elif kind == "i":
+            encoded += encode_varint(value)
+        elif kind == "b":
+            encoded += encode_bytes(value)
+        else:
+            encoded.append(value)
+    return bytes(encoded)
+
+
+def instruction_size(instruction: Instruction) -> int:
+    spec = OPS_BY_NAME[instruction.op]
+    return 1 + len(encode_immediates(spec, instruction.immediates, lambda label: 0, 0))
+
+
+def assemble(program: Program) -> bytes:
+    """Assembles a parsed program into AVM bytecode; programs with template variables are assembled
+    with avm.template.assemble_template instead."""
+    program = create_constant_blocks(program)
+    for instruction in program.instructions[:2]:
+        templates = [value for value in instruction.immediates if is_template_variable(value)]
+        if templates:
+            raise AssemblerError(f"template variables {', '.join(templates)} are not instantiated")
+    offsets = []
+    offset = len(encode_varint(program.version))
+    for instruction in program.instructions:
+        offsets.append(offset)
+        offset += instruction_size(instruction)
+    offsets.append(offset)
+
+    def offset_of_label(label):
+        return offsets[program.labels[label]]
+
+    bytecode = bytearray(encode_varint(program.version))
+    for index, instruction in enumerate(program.instructions):
+        spec = OPS_BY_NAME[instruction.op]
+        end = offsets[index + 1]
+        bytecode.append(spec.opcode)
+        bytecode += encode_immediates(spec, instruction.immediates, offset_of_label, end)
+    return bytes(bytecode)
+
+
+def assemble_source(source: str) -> bytes:
+    return assemble(parse(source))
+
+
+def decode_varint(bytecode: bytes, offset: int) -> Tuple[int, int]:
+    """(value, offset after it) of the varint at offset."""
+    value = shift = 0
+    while True:
+        if offset >= len(bytecode):
+            raise AssemblerError("truncated varint")
+        byte = bytecode[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def decode_bytes(bytecode: bytes, offset: int) -> Tuple[bytes, int]:
+    length, offset = decode_varint(bytecode, offset)
+    if offset + length > len(bytecode):
+        raise AssemblerError("truncated bytes")
+    return bytecode[offset:offset + length], offset + length
+
+
+def decode_immediates(spec, bytecode: bytes, offset: int) -> Tuple[Tuple, int]:
+    # Branch targets are returned as absolute offsets, disassemble() names them.
+    if spec.immediates in ("I", "B"):
+        count, offset = decode_varint(bytecode, offset)
+        decode = decode_varint if spec.immediates == "I" else decode_bytes
+        values = []
+        for _ in range(count):
+            value, offset = decode(bytecode, offset)
+            values.append(value)
+        return tuple(values), offset
+    immediates = []
+    for kind in spec.immediates:
+        if kind == "i":
+            value, offset = decode_varint(bytecode, offset)
+        elif kind == "b":
+            value, offset = decode_bytes(bytecode, offset)
+        elif kind == "L":
+            if offset + 2 > len(bytecode):
+                raise AssemblerError("truncated branch offset")
+            value = offset + 2 + int.from_bytes(bytecode[offset:offset + 2], "big", signed=True)
+            offset += 2
+        else:
+            if offset >= len(bytecode):
+                raise AssemblerError(f"truncated immediate of {spec.name}")
+            value = bytecode[offset]
+            offset += 1
+            if kind in FIELDS:
+                if value >= len(FIELDS[kind]):
+                    raise AssemblerError(f"unknown field {value} of {spec.name}")
+                value = FIELDS[kind][value]
+        immediates.append(value)
+    return tuple(immediates), offset
+
+
+def disassemble(bytecode: bytes) -> Program:
+    """Decodes AVM bytecode into a Program, e.g. a program received by a fake algod. Branch
+    targets are labeled "label_<offset>" and the line of an instruction is its offset."""
+    version, offset = decode_varint(bytecode, 0)
+    instructions = []
+    index_of_offset = {}
+    while offset < len(bytecode):
+        spec = OPS_BY_OPCODE.get(bytecode[offset])
+        if spec is None:
+            raise AssemblerError(f"offset {offset}: unknown opcode {bytecode[offset]:#04x}")
+        index_of_offset[offset] = len(instructions)
+        immediates, end = decode_immediates(spec, bytecode, offset + 1)
+        instructions.append(Instruction(spec.name, immediates, offset))
+        offset = end
+    index_of_offset[offset] = len(instructions)
+    labels = {}
+    for index, instruction in enumerate(instructions):
+        if OPS_BY_NAME[instruction.op].immediates == "L":
+            target = instruction.immediates[0]
+            if target not in index_of_offset:
+                raise AssemblerError(f"offset {instruction.line}: branch into the middle of an instruction")
+            label = f"label_{target}"
+            labels[label] = index_of_offset[target]
+            instructions[index] = instruction._replace(immediates=(label,))
+    return Program(version, instructions, labels)
@@ -0,0 +1,1309 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from .address import ZERO_ADDRESS, application_address, logic_sig_address
+from .assembler import AssemblerError, Program, assemble, disassemble, parse
+from .ledger import (
+    MIN_TXN_FEE,
+    Application,
+    Ledger,
+    LedgerError,
+    Transaction,
+    check_schema,
+    check_state_entry,
+    field_attribute,
+    group_fee_credit,
+)
+from .opcodes import ARRAY_TXN_FIELDS, NAMED_INTS, OPS_BY_NAME, TXN_TYPES
+
+# Local TEAL interpreter (TEAL v5 plus "itxn_next" from v6) evaluating transaction groups against
+# the in-memory Ledger: the approval and clear programs of the application calls, and the logic
+# signatures (Mode.Signature) of the transactions carrying one.
+
+UINT64_MAX = 2 ** 64 - 1
+MAX_STACK_DEPTH = 1000
+MAX_BYTES_LENGTH = 4096
+MAX_BYTE_MATH_LENGTH = 64
+MAX_GROUP_SIZE = 16
+APP_CALL_BUDGET = 700
+LOGIC_SIG_BUDGET = 20000
+MAX_INNER_TXNS = 16
+MAX_LOG_CALLS = 32
+MAX_LOG_SIZE = 1024
+SCRATCH_SLOTS = 256
+
+OPT_IN = NAMED_INTS["OptIn"]
+CLOSE_OUT = NAMED_INTS["CloseOut"]
+CLEAR_STATE = NAMED_INTS["ClearState"]
+UPDATE_APPLICATION = NAMED_INTS["UpdateApplication"]
+DELETE_APPLICATION = NAMED_INTS["DeleteApplication"]
+
+STATE_READ_OPS = frozenset(("app_global_get", "app_global_get_ex", "app_local_get", "app_local_get_ex"))
+STATE_WRITE_OPS = frozenset(("app_global_put", "app_global_del", "app_local_put", "app_local_del"))
+# Opcodes and global fields a logic signature cannot use
+APPLICATION_OPS = STATE_READ_OPS | STATE_WRITE_OPS | frozenset((
+    "balance", "min_balance", "app_opted_in", "asset_holding_get", "asset_params_get", "app_params_get", "log",
+    "itxn_begin", "itxn_next", "itxn_field", "itxn_submit", "itxn", "itxna", "gload", "gloads", "gaid", "gaids",
+))
+APPLICATION_GLOBALS = frozenset(("CurrentApplicationID", "CreatorAddress", "CurrentApplicationAddress"))
+
+
+class LogicError(Exception):
+    def __init__(self, message: str, line: Optional[int] = None):
+        super().__init__(message if line is None else f"line {line}: {message}")
+        self.line = line
+
+
+class TransactionRejected(LogicError):
+    pass
+
+
+class Budget:
+    """Opcode budget pooled across the application calls of a group, or of one logic signature."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.used = 0
+
+    def consume(self, cost: int):
+        self.used += cost
+        if self.used > self.total:
+            raise LogicError(f"dynamic cost budget exceeded, executing cost {self.used} > budget {self.total}")
+
+
+class GroupContext:
+    def __init__(self, ledger: Ledger, txns: List[Transaction]):
+        self.ledger = ledger
+        self.txns = txns
+        self.budget = Budget(APP_CALL_BUDGET * sum(1 for txn in txns if txn.type == "appl"))
+        self.fee_credit = group_fee_credit(txns)
+        # txn index -> scratch space of the application call, for gload/gloads
+        self.scratch: Dict[int, list] = {}
+        # txn index -> ID of the application or asset it created, for gaid/gaids
+        self.created_ids: Dict[int, int] = {}
+
+
+class EvalResult:
+    def __init__(self, txn: Transaction, app_id: int = 0):
+        self.txn = txn
+        self.app_id = app_id
+        self.logs: List[bytes] = []
+        self.inner_txns: List[Transaction] = []
+        self.cost = 0
+
+
+def as_program(program) -> Program:
+    return program if isinstance(program, Program) else parse(program)
+
+
+def to_uint(value, line) -> int:
+    if not isinstance(value, int):
+        raise LogicError("uint64 expected, got bytes", line)
+    return value
+
+
+def to_bytes(value, line) -> bytes:
+    if not isinstance(value, bytes):
+        raise LogicError("bytes expected, got uint64", line)
+    return value
+
+
+def check_uint(value: int, line) -> int:
+    if value < 0 or value > UINT64_MAX:
+        raise LogicError("uint64 " + ("underflow" if value < 0 else "overflow"), line)
+    return value
+
+
+class Interpreter:
+    """Runs a program of an application, or the logic signature of a transaction if app is None."""
+
+    def __init__(self, program: Program, group: GroupContext, index: int, app: Optional[Application],
+                 result: EvalResult, profile=None):
+        self.program = program
+        self.group = group
+        self.ledger = group.ledger
+        self.index = index
+        self.txn = group.txns[index]
+        self.app = app
+        # every logic signature has a budget of its own
+        self.budget = group.budget if app is not None else Budget(LOGIC_SIG_BUDGET)
+        self.result = result
+        self.profile = profile
+        self.stack = []
+        self.scratch = [0] * SCRATCH_SLOTS
+        self.call_stack = []
+        self.intc = ()
+        self.bytec = ()
+        self.inner_group: List[Transaction] = []
+        self.line = 0
+
+    # -- helpers
+
+    def pop(self):
+        if not self.stack:
+            raise LogicError("stack underflow", self.line)
+        return self.stack.pop()
+
+    def pop_uint(self) -> int:
+        return to_uint(self.pop(), self.line)
+
+    def pop_bytes(self) -> bytes:
+        return to_bytes(self.pop(), self.line)
+
+    def push(self, value):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, bytes) and len(value) > MAX_BYTES_LENGTH:
+            raise LogicError("bytes too long", self.line)
+        self.stack.append(value)
+        if len(self.stack) > MAX_STACK_DEPTH:
+            raise LogicError("stack overflow", self.line)
+
+    def fail(self, message: str):
+        raise LogicError(message, self.line)
+
+    def available_accounts(self):
+        return [self.txn.sender, *self.txn.accounts, self.app.address,
+                *(application_address(app_id) for app_id in self.txn.applications)]
+
+    def resolve_account(self, value) -> bytes:
+        if isinstance(value, int):
+            if value == 0:
+                return self.txn.sender
+            if value <= len(self.txn.accounts):
+                return self.txn.accounts[value - 1]
+            self.fail(f"invalid Accounts index {value}")
+        if value not in self.available_accounts():
+            self.fail("invalid Account reference")
+        return value
+
+    def resolve_app(self, value: int) -> int:
+        apps = [self.app.id, *self.txn.applications]
+        if value < len(apps):
+            return apps[value]
+        if value not in apps:
+            self.fail(f"invalid App reference {value}")
+        return value
+
+    def resolve_asset(self, value: int) -> int:
+        if value < len(self.txn.assets):
+            return self.txn.assets[value]
+        if value not in self.txn.assets:
+            self.fail(f"invalid Asset reference {value}")
+        return value
+
+    def local_state(self, address: bytes, app_id: int, required: bool = True):
+        account = self.ledger.existing_account(address)
+        state = account.local_states.get(app_id) if account is not None else None
+        if state is None and required:
+            self.fail(f"account is not opted in to application {app_id}")
+        return state
+
+    def record_state(self, op: str, key: bytes):
+        if self.profile is not None:
+            if op in STATE_READ_OPS:
+                self.profile.state_read(op, key)
+            else:
+                self.profile.state_write(op, key)
+
+    def txn_field(self, txn: Transaction, field: str, array_index: Optional[int] = None):
+        if field in ARRAY_TXN_FIELDS:
+            if array_index is None:
+                self.fail(f"{field} requires an array index")
+            values = {
+                "ApplicationArgs": txn.application_args,
+                "Accounts": [txn.sender, *txn.accounts],
+                "Assets": txn.assets,
+                "Applications": [txn.application_id, *txn.applications],
+                "Logs": txn.logs,
+            }[field]
+            if array_index >= len(values):
+                self.fail(f"invalid {field} index {array_index}")
+            return values[array_index]
+        if field == "Type":
+            return txn.type.encode()
+        if field == "NumAppArgs":
+            return len(txn.application_args)
+        if field == "NumAccounts":
+            return len(txn.accounts)
+        if field == "NumAssets":
+            return len(txn.assets)
+        if field == "NumApplications":
+            return len(txn.applications)
+        if field == "NumLogs":
+            return len(txn.logs)
+        if field in ("ApprovalProgram", "ClearStateProgram"):
+            program = getattr(txn, field_attribute(field))
+            return assemble(as_program(program)) if program else b""
+        if field == "FirstValidTime":
+            self.fail("FirstValidTime is not supported")
+        return getattr(txn, field_attribute(field))
+
+    def check_budget(self, cost: int):
+        self.result.cost += cost
+        try:
+            self.budget.consume(cost)
+        except LogicError as error:
+            self.fail(str(error))
+
+    # -- evaluation
+
+    def run(self) -> bool:
+        instructions = self.program.instructions
+        labels = self.program.labels
+        pc = 0
+        while pc < len(instructions):
+            instruction = instructions[pc]
+            self.line = instruction.line
+            spec = OPS_BY_NAME.get(instruction.op)
+            cost = spec.cost if spec is not None else 1
+            if spec is not None and spec.version > self.program.version:
+                self.fail(f"{instruction.op} is not available in TEAL v{self.program.version}")
+            if self.app is None and instruction.op in APPLICATION_OPS:
+                self.fail(f"{instruction.op} is only available to applications")
+            self.check_budget(cost)
+            if self.profile is not None:
+                self.profile.op(instruction, cost)
+            op = instruction.op
+            imm = instruction.immediates
+
+            if op in ("bnz", "bz", "b"):
+                if op == "b" or (self.pop_uint() != 0) == (op == "bnz"):
+                    pc = labels[imm[0]]
+                    continue
+            elif op == "callsub":
+                self.call_stack.append(pc + 1)
+                if self.profile is not None:
+                    self.profile.call(imm[0])
+                pc = labels[imm[0]]
+                continue
+            elif op == "retsub":
+                if not self.call_stack:
+                    self.fail("retsub with empty callstack")
+                if self.profile is not None:
+                    self.profile.ret()
+                pc = self.call_stack.pop()
+                continue
+            elif op == "return":
+                value = self.pop_uint()
+                self.stack = [value]
+                break
+            elif op == "err":
+                self.fail("err opcode executed")
+            else:
+                handler = HANDLERS.get(op)
+                if handler is None:
+                    self.fail(f"unsupported opcode {op}")
+                handler(self, imm)
+            pc += 1
+
+        if self.profile is not None:
+            self.profile.finish()
+        if self.app is not None:
+            self.group.scratch[self.index] = self.scratch
+        if len(self.stack) != 1:
+            self.fail(f"stack finished with {len(self.stack)} values")
+        return to_uint(self.stack[0], self.line) != 0
+
+    # -- inner transactions
+
+    def inner_fee(self) -> int:
+        # Like go-algorand: what the inner group begun so far still owes, less the fee credit,
+        # which is only used up by itxn_submit.
+        if self.program.version < 6:
+            return MIN_TXN_FEE
+        owed = MIN_TXN_FEE * (len(self.inner_group) + 1) - sum(txn.fee for txn in self.inner_group)
+        return max(0, owed - self.group.fee_credit)
+
+    def begin_inner(self):
+        txn = Transaction(type="pay", sender=self.app.address, fee=self.inner_fee())
+        txn.type = ""
+        self.inner_group.append(txn)
+
+    def set_inner_field(self, field: str, value):
+        if not self.inner_group:
+            self.fail("itxn_field without itxn_begin")
+        txn = self.inner_group[-1]
+        if field == "TypeEnum":
+            if to_uint(value, self.line) not in TXN_TYPES:
+                self.fail(f"unknown type enum {value}")
+            txn.type = TXN_TYPES[value]
+        elif field == "Type":
+            txn.type = to_bytes(value, self.line).decode()
+        elif field in ("Receiver", "CloseRemainderTo", "AssetReceiver", "AssetCloseTo", "AssetSender", "Sender"):
+            address = to_bytes(value, self.line)
+            if len(address) != 32:
+                self.fail(f"{field} must be a 32 byte address")
+            if address != ZERO_ADDRESS and field != "Sender":
+                self.resolve_account(address)
+            setattr(txn, field_attribute(field), address)
+        elif field == "XferAsset":
+            txn.xfer_asset = self.resolve_asset(to_uint(value, self.line))
+        else:
+            setattr(txn, field_attribute(field), value)
+
+    def submit_inner(self):
+        if not self.inner_group:
+            self.fail("itxn_submit without itxn_begin")
+        if len(self.result.inner_txns) + len(self.inner_group) > MAX_INNER_TXNS:
+            self.fail(f"too many inner transactions ({MAX_INNER_TXNS} allowed)")
+        for txn in self.inner_group:
+            if txn.type not in ("pay", "axfer"):
+                self.fail(f"unsupported inner transaction type {txn.type or 'unset'}")
+            if txn.sender != self.app.address:
+                self.fail("inner transaction sender must be the application account")
+            if txn.fee < MIN_TXN_FEE:
+                if self.group.fee_credit < MIN_TXN_FEE - txn.fee:
+                    self.fail("fee too small")
+            self.group.fee_credit += txn.fee - MIN_TXN_FEE
+            sender = self.ledger.account(txn.sender)
+            if sender.balance < txn.fee:
+                self.fail(f"balance {sender.balance} cannot pay inner transaction fee {txn.fee}")
+            sender.balance -= txn.fee
+            try:
+                self.ledger.apply_transfer(txn)
+                self.ledger.check_min_balance(txn.sender)
+            except LedgerError as error:
+                self.fail(f"inner transaction failed: {error}")
+            self.result.inner_txns.append(txn)
+            if self.profile is not None:
+                self.profile.inner(txn)
+        self.inner_group = []
+
+
+def binary_uint(function):
+    def handler(vm, imm):
+        b = vm.pop_uint()
+        a = vm.pop_uint()
+        vm.push(check_uint(function(vm, a, b), vm.line))
+    return handler
+
+
+def unary_uint(function):
+    def handler(vm, imm):
+        vm.push(check_uint(function(vm, vm.pop_uint()), vm.line))
+    return handler
+
+
+def divide(vm, a, b):
+    if b == 0:
+        vm.fail("/ 0")
+    return a // b
+
+
+def modulo(vm, a, b):
+    if b == 0:
+        vm.fail("% 0")
+    return a % b
+
+
+def shift_left(vm, a, b):
+    if b > 63:
+        vm.fail("shl arg too big")
+    return (a << b) & UINT64_MAX
+
+
+def shift_right(vm, a, b):
+    if b > 63:
+        vm.fail("shr arg too big")
+    return a >> b
+
+
+def power(vm, a, b):
+    if a == 0 and b == 0:
+        vm.fail("0^0 is undefined")
+    if a > 1 and b > 64:
+        vm.fail("exp overflow")
+    return a ** b
+
+
+def equality(negate: bool):
+    def handler(vm, imm):
+        b = vm.pop()
+        a = vm.pop()
+        if type(a) is not type(b):
+            vm.fail("cannot compare uint64 to bytes")
+        vm.push((a == b) != negate)
+    return handler
+
+
+def byte_math(function, max_length=MAX_BYTE_MATH_LENGTH):
+    def handler(vm, imm):
+        b = vm.pop_bytes()
+        a = vm.pop_bytes()
+        if len(a) > MAX_BYTE_MATH_LENGTH or len(b) > MAX_BYTE_MATH_LENGTH:
+            vm.fail("byte math input too long")
+        value = function(vm, int.from_bytes(a, "big"), int.from_bytes(b, "big"))
+        if isinstance(value, bool):
+            vm.push(value)
+            return
+        if value < 0:
+            vm.fail("byte math underflow")
+        encoded = value.to_bytes((value.bit_length() + 7) // 8, "big") if value else b""
+        if len(encoded) > max_length:
+            vm.fail("byte math result too long")
+        vm.push(encoded)
+    return handler
+
+
+def byte_bitwise(function):
+    def handler(vm, imm):
+        b = vm.pop_bytes()
+        a = vm.pop_bytes()
+        length = max(len(a), len(b))
+        a, b = a.rjust(length, b"\0"), b.rjust(length, b"\0")
+        vm.push(bytes(function(x, y) for x, y in zip(a, b)))
+    return handler
+
+
+def byte_division(vm, a, b):
+    if b == 0:
+        vm.fail("division by zero")
+    return a // b
+
+
+def byte_modulo(vm, a, b):
+    if b == 0:
+        vm.fail("modulo by zero")
+    return a % b
+
+
+def op_mulw(vm, imm):
+    b = vm.pop_uint()
+    a = vm.pop_uint()
+    product = a * b
+    vm.push(product >> 64)
+    vm.push(product & UINT64_MAX)
+
+
+def op_addw(vm, imm):
+    b = vm.pop_uint()
+    a = vm.pop_uint()
+    total = a + b
+    vm.push(total >> 64)
+    vm.push(total & UINT64_MAX)
+
+
+def op_divmodw(vm, imm):
+    d_lo = vm.pop_uint()
+    d_hi = vm.pop_uint()
+    n_lo = vm.pop_uint()
+    n_hi = vm.pop_uint()
+    divisor = (d_hi << 64) | d_lo
+    if divisor == 0:
+        vm.fail("/ 0")
+    quotient, remainder = divmod((n_hi << 64) | n_lo, divisor)
+    for value in (quotient >> 64, quotient & UINT64_MAX, remainder >> 64, remainder & UINT64_MAX):
+        vm.push(value)
+
+
+def op_divw(vm, imm):
+    divisor = vm.pop_uint()
+    lo = vm.pop_uint()
+    hi = vm.pop_uint()
+    if divisor == 0:
+        vm.fail("/ 0")
+    vm.push(check_uint(((hi << 64) | lo) // divisor, vm.line))
+
+
+def op_expw(vm, imm):
+    b = vm.pop_uint()
+    a = vm.pop_uint()
+    if a == 0 and b == 0:
+        vm.fail("0^0 is undefined")
+    value = a ** b if a < 2 or b <= 128 else 2 ** 128
+    if value > (1 << 128) - 1:
+        vm.fail("expw overflow")
+    vm.push(value >> 64)
+    vm.push(value & UINT64_MAX)
+
+
+def op_btoi(vm, imm):
+    value = vm.pop_bytes()
+    if len(value) > 8:
+        vm.fail("btoi arg too long")
+    vm.push(int.from_bytes(value, "big"))
+
+
+def op_bitlen(vm, imm):
+    value = vm.pop()
+    vm.push((int.from_bytes(value, "big") if isinstance(value, bytes) else value).bit_length())
+
+
+def op_bzero(vm, imm):
+    length = vm.pop_uint()
+    if length > MAX_BYTES_LENGTH:
+        vm.fail("bzero attempted to create a too large string")
+    vm.push(bytes(length))
+
+
+def op_concat(vm, imm):
+    b = vm.pop_bytes()
+    a = vm.pop_bytes()
+    if len(a) + len(b) > MAX_BYTES_LENGTH:
+        vm.fail("concat produced a too big byte-array")
+    vm.push(a + b)
+
+
+def substring(vm, value: bytes, start: int, end: int) -> bytes:
+    if end < start:
+        vm.fail("substring end before start")
+    if end > len(value):
+        vm.fail("substring range beyond length of string")
+    return value[start:end]
+
+
+def op_substring(vm, imm):
+    vm.push(substring(vm, vm.pop_bytes(), imm[0], imm[1]))
+
+
+def op_substring3(vm, imm):
+    end = vm.pop_uint()
+    start = vm.pop_uint()
+    vm.push(substring(vm, vm.pop_bytes(), start, end))
+
+
+def extract(vm, value: bytes, start: int, length: int) -> bytes:
+    if start > len(value) or start + length > len(value):
+        vm.fail("extract range beyond length of string")
+    return value[start:start + length]
+
+
+def op_extract(vm, imm):
+    value = vm.pop_bytes()
+    start, length = imm
+    vm.push(extract(vm, value, start, length if length else len(value) - min(start, len(value))))
+
+
+def op_extract3(vm, imm):
+    length = vm.pop_uint()
+    start = vm.pop_uint()
+    vm.push(extract(vm, vm.pop_bytes(), start, length))
+
+
+def extract_uint(width: int):
+    def handler(vm, imm):
+        start = vm.pop_uint()
+        vm.push(int.from_bytes(extract(vm, vm.pop_bytes(), start, width), "big"))
+    return handler
+
+
+def op_getbyte(vm, imm):
+    index = vm.pop_uint()
+    value = vm.pop_bytes()
+    if index >= len(value):
+        vm.fail("getbyte index beyond array length")
+    vm.push(value[index])
+
+
+def op_setbyte(vm, imm):
+    byte = vm.pop_uint()
+    index = vm.pop_uint()
+    value = vm.pop_bytes()
+    if index >= len(value):
+        vm.fail("setbyte index beyond array length")
+    if byte > 255:
+        vm.fail("setbyte value > 255")
+    vm.push(value[:index] + bytes((byte,)) + value[index + 1:])
+
+
+def op_getbit(vm, imm):
+    index = vm.pop_uint()
+    value = vm.pop()
+    if isinstance(value, int):
+        if index > 63:
+            vm.fail("getbit index > 63 with uint64")
+        vm.push((value >> index) & 1)
+        return
+    if index >= len(value) * 8:
+        vm.fail("getbit index beyond byteslice")
+    vm.push((value[index // 8] >> (7 - index % 8)) & 1)
+
+
+def op_setbit(vm, imm):
+    bit = vm.pop_uint()
+    index = vm.pop_uint()
+    value = vm.pop()
+    if bit > 1:
+        vm.fail("setbit value > 1")
+    if isinstance(value, int):
+        if index > 63:
+            vm.fail("setbit index > 63 with uint64")
+        vm.push((value | (1 << index)) if bit else (value & ~(1 << index)))
+        return
+    if index >= len(value) * 8:
+        vm.fail("setbit index beyond byteslice")
+    mask = 1 << (7 - index % 8)
+    updated = bytearray(value)
+    updated[index // 8] = (updated[index // 8] | mask) if bit else (updated[index // 8] & ~mask)
+    vm.push(bytes(updated))
+
+
+def op_sqrt(vm, imm):
+    value = vm.pop_uint()
+    root = int(value ** 0.5)
+    while root * root > value:
+        root -= 1
+    while (root + 1) * (root + 1) <= value:
+        root += 1
+    vm.push(root)
+
+
+def hash_op(name):
+    def handler(vm, imm):
+        vm.push(hashlib.new(name, vm.pop_bytes()).digest())
+    return handler
+
+
+def op_keccak256(vm, imm):
+    try:
+        from Cryptodome.Hash import keccak
+    except ImportError:
+        vm.fail("keccak256 requires pycryptodomex")
+    vm.push(keccak.new(data=vm.pop_bytes(), digest_bits=256).digest())
+
+
+# -- constants and scratch space
+
+def op_intcblock(vm, imm):
+    vm.intc = imm
+
+
+def op_bytecblock(vm, imm):
+    vm.bytec = imm
+
+
+def constant(block_name: str, fixed_index: Optional[int] = None):
+    def handler(vm, imm):
+        block = getattr(vm, block_name)
+        index = fixed_index if fixed_index is not None else imm[0]
+        if index >= len(block):
+            vm.fail(f"{block_name} {index} beyond {len(block)} constants")
+        vm.push(block[index])
+    return handler
+
+
+def op_push_immediate(vm, imm):
+    vm.push(imm[0])
+
+
+def op_load(vm, imm):
+    vm.push(vm.scratch[imm[0]])
+
+
+def op_store(vm, imm):
+    vm.scratch[imm[0]] = vm.pop()
+
+
+def op_loads(vm, imm):
+    slot = vm.pop_uint()
+    if slot >= SCRATCH_SLOTS:
+        vm.fail("invalid scratch space slot")
+    vm.push(vm.scratch[slot])
+
+
+def op_stores(vm, imm):
+    value = vm.pop()
+    slot = vm.pop_uint()
+    if slot >= SCRATCH_SLOTS:
+        vm.fail("invalid scratch space slot")
+    vm.scratch[slot] = value
+
+
+def group_scratch(vm, txn_index: int, slot: int):
+    if txn_index >= vm.index:
+        vm.fail("can't get scratch of a transaction that has not been evaluated yet")
+    if txn_index not in vm.group.scratch:
+        vm.fail(f"transaction {txn_index} is not an application call")
+    return vm.group.scratch[txn_index][slot]
+
+
+def op_gload(vm, imm):
+    vm.push(group_scratch(vm, imm[0], imm[1]))
+
+
+def op_gloads(vm, imm):
+    vm.push(group_scratch(vm, vm.pop_uint(), imm[0]))
+
+
+def created_id(vm, txn_index: int):
+    if txn_index >= vm.index or txn_index not in vm.group.created_ids:
+        vm.fail(f"transaction {txn_index} did not create an asset or application")
+    return vm.group.created_ids[txn_index]
+
+
+def op_gaid(vm, imm):
+    vm.push(created_id(vm, imm[0]))
+
+
+def op_gaids(vm, imm):
+    vm.push(created_id(vm, vm.pop_uint()))
+
+
+# -- stack manipulation
+
+def op_pop(vm, imm):
+    vm.pop()
+
+
+def op_dup(vm, imm):
+    value = vm.pop()
+    vm.push(value)
+    vm.push(value)
+
+
+def op_dup2(vm, imm):
+    b = vm.pop()
+    a = vm.pop()
+    for value in (a, b, a, b):
+        vm.push(value)
+
+
+def op_dig(vm, imm):
+    if imm[0] >= len(vm.stack):
+        vm.fail(f"dig {imm[0]} with stack size {len(vm.stack)}")
+    vm.push(vm.stack[-1 - imm[0]])
+
+
+def op_swap(vm, imm):
+    b = vm.pop()
+    a = vm.pop()
+    vm.push(b)
+    vm.push(a)
+
+
+def op_select(vm, imm):
+    condition = vm.pop_uint()
+    b = vm.pop()
+    a = vm.pop()
+    vm.push(b if condition else a)
+
+
+def op_cover(vm, imm):
+    depth = imm[0]
+    if depth >= len(vm.stack):
+        vm.fail(f"cover {depth} with stack size {len(vm.stack)}")
+    value = vm.stack.pop()
+    vm.stack.insert(len(vm.stack) - depth, value)
+
+
+def op_uncover(vm, imm):
+    depth = imm[0]
+    if depth >= len(vm.stack):
+        vm.fail(f"uncover {depth} with stack size {len(vm.stack)}")
+    vm.stack.append(vm.stack.pop(-1 - depth))
+
+
+def op_assert(vm, imm):
+    if vm.pop_uint() == 0:
+        vm.fail("assert failed")
+
+
+def op_log(vm, imm):
+    message = vm.pop_bytes()
+    vm.result.logs.append(message)
+    if len(vm.result.logs) > MAX_LOG_CALLS or sum(len(log) for log in vm.result.logs) > MAX_LOG_SIZE:
+        vm.fail("too many log calls or log size exceeded")
+    if vm.profile is not None:
+        vm.profile.log(message)
+
+
+def logic_sig_arg(fixed_index: Optional[int] = None, from_stack: bool = False):
+    def handler(vm, imm):
+        if vm.app is not None:
+            vm.fail("arg is only available to logic signatures")
+        index = vm.pop_uint() if from_stack else fixed_index if fixed_index is not None else imm[0]
+        if index >= len(vm.txn.logic_sig_args):
+            vm.fail(f"cannot load arg[{index}] of {len(vm.txn.logic_sig_args)}")
+        vm.push(vm.txn.logic_sig_args[index])
+    return handler
+
+
+# -- transaction fields
+
+def op_txn(vm, imm):
+    vm.push(vm.txn_field(vm.txn, imm[0]))
+
+
+def op_txna(vm, imm):
+    vm.push(vm.txn_field(vm.txn, imm[0], imm[1]))
+
+
+def op_txnas(vm, imm):
+    vm.push(vm.txn_field(vm.txn, imm[0], vm.pop_uint()))
+
+
+def group_txn(vm, index: int) -> Transaction:
+    if index >= len(vm.group.txns):
+        vm.fail(f"gtxn lookup TxnGroup[{index}] but it only has {len(vm.group.txns)}")
+    return vm.group.txns[index]
+
+
+def op_gtxn(vm, imm):
+    vm.push(vm.txn_field(group_txn(vm, imm[0]), imm[1]))
+
+
+def op_gtxna(vm, imm):
+    vm.push(vm.txn_field(group_txn(vm, imm[0]), imm[1], imm[2]))
+
+
+def op_gtxnas(vm, imm):
+    array_index = vm.pop_uint()
+    vm.push(vm.txn_field(group_txn(vm, imm[0]), imm[1], array_index))
+
+
+def op_gtxns(vm, imm):
+    vm.push(vm.txn_field(group_txn(vm, vm.pop_uint()), imm[0]))
+
+
+def op_gtxnsa(vm, imm):
+    vm.push(vm.txn_field(group_txn(vm, vm.pop_uint()), imm[0], imm[1]))
+
+
+def op_gtxnsas(vm, imm):
+    array_index = vm.pop_uint()
+    vm.push(vm.txn_field(group_txn(vm, vm.pop_uint()), imm[0], array_index))
+
+
+def op_global(vm, imm):
+    field = imm[0]
+    if vm.app is None and field in APPLICATION_GLOBALS:
+        vm.fail(f"global {field} is only available to applications")
+    values = {
+        "MinTxnFee": lambda: MIN_TXN_FEE,
+        "MinBalance": lambda: 100000,
+        "MaxTxnLife": lambda: 1000,
+        "ZeroAddress": lambda: ZERO_ADDRESS,
+        "GroupSize": lambda: len(vm.group.txns),
+        "LogicSigVersion": lambda: 6,
+        "Round": lambda: vm.ledger.round,
+        "LatestTimestamp": lambda: vm.ledger.latest_timestamp,
+        "CurrentApplicationID": lambda: vm.app.id,
+        "CreatorAddress": lambda: vm.app.creator,
+        "CurrentApplicationAddress": lambda: vm.app.address,
+        "GroupID": lambda: bytes(32),
+    }
+    vm.push(values[field]())
+
+
+# -- ledger access
+
+def op_balance(vm, imm):
+    vm.push(vm.ledger.account(vm.resolve_account(vm.pop())).balance)
+
+
+def op_min_balance(vm, imm):
+    vm.push(vm.ledger.min_balance(vm.resolve_account(vm.pop())))
+
+
+def op_app_opted_in(vm, imm):
+    app_id = vm.resolve_app(vm.pop_uint())
+    address = vm.resolve_account(vm.pop())
+    vm.push(vm.local_state(address, app_id, required=False) is not None)
+
+
+def op_app_local_get(vm, imm):
+    key = vm.pop_bytes()
+    address = vm.resolve_account(vm.pop())
+    vm.record_state("app_local_get", key)
+    vm.push(vm.local_state(address, vm.app.id).get(key, 0))
+
+
+def op_app_local_get_ex(vm, imm):
+    key = vm.pop_bytes()
+    app_id = vm.resolve_app(vm.pop_uint())
+    address = vm.resolve_account(vm.pop())
+    vm.record_state("app_local_get_ex", key)
+    state = vm.local_state(address, app_id, required=False) or {}
+    vm.push(state.get(key, 0))
+    vm.push(key in state)
+
+
+def op_app_global_get(vm, imm):
+    key = vm.pop_bytes()
+    vm.record_state("app_global_get", key)
+    vm.push(vm.app.global_state.get(key, 0))
+
+
+def op_app_global_get_ex(vm, imm):
+    key = vm.pop_bytes()
+    app_id = vm.resolve_app(vm.pop_uint())
+    vm.record_state("app_global_get_ex", key)
+    app = vm.ledger.apps.get(app_id)
+    state = app.global_state if app is not None else {}
+    vm.push(state.get(key, 0))
+    vm.push(key in state)
+
+
+def put_state(vm, state, schema, key, value):
+    try:
+        check_state_entry(key, value)
+        state[key] = value
+        check_schema(state, schema)
+    except LedgerError as error:
+        vm.fail(str(error))
+
+
+def op_app_local_put(vm, imm):
+    value = vm.pop()
+    key = vm.pop_bytes()
+    address = vm.resolve_account(vm.pop())
+    vm.record_state("app_local_put", key)
+    put_state(vm, vm.local_state(address, vm.app.id), vm.app.local_schema, key, value)
+
+
+def op_app_global_put(vm, imm):
+    value = vm.pop()
+    key = vm.pop_bytes()
+    vm.record_state("app_global_put", key)
+    put_state(vm, vm.app.global_state, vm.app.global_schema, key, value)
+
+
+def op_app_local_del(vm, imm):
+    key = vm.pop_bytes()
+    address = vm.resolve_account(vm.pop())
+    vm.record_state("app_local_del", key)
+    vm.local_state(address, vm.app.id).pop(key, None)
+
+
+def op_app_global_del(vm, imm):
+    key = vm.pop_bytes()
+    vm.record_state("app_global_del", key)
+    vm.app.global_state.pop(key, None)
+
+
+def op_asset_holding_get(vm, imm):
+    asset_id = vm.resolve_asset(vm.pop_uint())
+    address = vm.resolve_account(vm.pop())
+    account = vm.ledger.accounts.get(address)
+    holding = account.assets.get(asset_id) if account is not None else None
+    if holding is None:
+        vm.push(0)
+        vm.push(0)
+        return
+    vm.push(holding.amount if imm[0] == "AssetBalance" else int(holding.frozen))
+    vm.push(1)
+
+
+def op_asset_params_get(vm, imm):
+    asset_id = vm.resolve_asset(vm.pop_uint())
+    asset = vm.ledger.assets.get(asset_id)
+    if asset is None:
+        vm.push(0)
+        vm.push(0)
+        return
+    value = getattr(asset, field_attribute(imm[0][len("Asset"):]))
+    vm.push(int(value) if isinstance(value, bool) else value)
+    vm.push(1)
+
+
+def op_app_params_get(vm, imm):
+    app_id = vm.resolve_app(vm.pop_uint())
+    app = vm.ledger.apps.get(app_id)
+    if app is None:
+        vm.push(0)
+        vm.push(0)
+        return
+    values = {
+        "AppApprovalProgram": lambda: assemble(app.approval_program),
+        "AppClearStateProgram": lambda: assemble(app.clear_program),
+        "AppGlobalNumUint": lambda: app.global_schema[0],
+        "AppGlobalNumByteSlice": lambda: app.global_schema[1],
+        "AppLocalNumUint": lambda: app.local_schema[0],
+        "AppLocalNumByteSlice": lambda: app.local_schema[1],
+        "AppExtraProgramPages": lambda: app.extra_pages,
+        "AppCreator": lambda: app.creator,
+        "AppAddress": lambda: app.address,
+    }
+    vm.push(values[imm[0]]())
+    vm.push(1)
+
+
+# -- inner transactions
+
+def op_itxn_begin(vm, imm):
+    if vm.inner_group:
+        vm.fail("itxn_begin without itxn_submit")
+    vm.begin_inner()
+
+
+def op_itxn_next(vm, imm):
+    if not vm.inner_group:
+        vm.fail("itxn_next without itxn_begin")
+    vm.begin_inner()
+
+
+def op_itxn_field(vm, imm):
+    vm.set_inner_field(imm[0], vm.pop())
+
+
+def op_itxn_submit(vm, imm):
+    vm.submit_inner()
+
+
+def last_inner(vm) -> Transaction:
+    if not vm.result.inner_txns:
+        vm.fail("no inner transaction available")
+    return vm.result.inner_txns[-1]
+
+
+def op_itxn(vm, imm):
+    vm.push(vm.txn_field(last_inner(vm), imm[0]))
+
+
+def op_itxna(vm, imm):
+    vm.push(vm.txn_field(last_inner(vm), imm[0], imm[1]))
+
+
+def unsupported(vm, imm):
+    vm.fail("unsupported opcode")
+
+
+HANDLERS = {
+    "+": binary_uint(lambda vm, a, b: a + b),
+    "-": binary_uint(lambda vm, a, b: a - b),
+    "*": binary_uint(lambda vm, a, b: a * b),
+    "/": binary_uint(divide),
+    "%": binary_uint(modulo),
+    "<": binary_uint(lambda vm, a, b: int(a < b)),
+    ">": binary_uint(lambda vm, a, b: int(a > b)),
+    "<=": binary_uint(lambda vm, a, b: int(a <= b)),
+    ">=": binary_uint(lambda vm, a, b: int(a >= b)),
+    "&&": binary_uint(lambda vm, a, b: int(bool(a) and bool(b))),
+    "||": binary_uint(lambda vm, a, b: int(bool(a) or bool(b))),
+    "|": binary_uint(lambda vm, a, b: a | b),
+    "&": binary_uint(lambda vm, a, b: a & b),
+    "^": binary_uint(lambda vm, a, b: a ^ b),
+    "shl": binary_uint(shift_left),
+    "shr": binary_uint(shift_right),
+    "exp": binary_uint(power),
+    "==": equality(False),
+    "!=": equality(True),
+    "!": unary_uint(lambda vm, a: int(a == 0)),
+    "~": unary_uint(lambda vm, a: UINT64_MAX ^ a),
+    "len": lambda vm, imm: vm.push(len(vm.pop_bytes())),
+    "itob": lambda vm, imm: vm.push(vm.pop_uint().to_bytes(8, "big")),
+    "btoi": op_btoi,
+    "mulw": op_mulw,
+    "addw": op_addw,
+    "divmodw": op_divmodw,
+    "divw": op_divw,
+    "expw": op_expw,
+    "sqrt": op_sqrt,
+    "bitlen": op_bitlen,
+    "bzero": op_bzero,
+    "b+": byte_math(lambda vm, a, b: a + b, MAX_BYTE_MATH_LENGTH + 1),
+    "b-": byte_math(lambda vm, a, b: a - b),
+    "b*": byte_math(lambda vm, a, b: a * b, 2 * MAX_BYTE_MATH_LENGTH),
+    "b/": byte_math(byte_division),
+    "b%": byte_math(byte_modulo),
+    "b<": byte_math(lambda vm, a, b: a < b),
+    "b>": byte_math(lambda vm, a, b: a > b),
+    "b<=": byte_math(lambda vm, a, b: a <= b),
+    "b>=": byte_math(lambda vm, a, b: a >= b),
+    "b==": byte_math(lambda vm, a, b: a == b),
+    "b!=": byte_math(lambda vm, a, b: a != b),
+    "b|": byte_bitwise(lambda x, y: x | y),
+    "b&": byte_bitwise(lambda x, y: x & y),
+    "b^": byte_bitwise(lambda x, y: x ^ y),
+    "b~": lambda vm, imm: vm.push(bytes(255 - x for x in vm.pop_bytes())),
+    "sha256": hash_op("sha256"),
+    "sha512_256": hash_op("sha512_256"),
+    "keccak256": op_keccak256,
+    "ed25519verify": unsupported,
+    "ecdsa_verify": unsupported,
+    "ecdsa_pk_decompress": unsupported,
+    "ecdsa_pk_recover": unsupported,
+    "concat": op_concat,
+    "substring": op_substring,
+    "substring3": op_substring3,
+    "extract": op_extract,
+    "extract3": op_extract3,
+    "extract_uint16": extract_uint(2),
+    "extract_uint32": extract_uint(4),
+    "extract_uint64": extract_uint(8),
+    "getbyte": op_getbyte,
+    "setbyte": op_setbyte,
+    "getbit": op_getbit,
+    "setbit": op_setbit,
+    "int": op_push_immediate,
+    "byte": op_push_immediate,
+    "addr": op_push_immediate,
+    "method": op_push_immediate,
+    "pushint": op_push_immediate,
+    "pushbytes": op_push_immediate,
+    "intcblock": op_intcblock,
+    "bytecblock": op_bytecblock,
+    "intc": constant("intc"),
+    "bytec": constant("bytec"),
+    **{f"intc_{index}": constant("intc", index) for index in range(4)},
+    **{f"bytec_{index}": constant("bytec", index) for index in range(4)},
+    "arg": logic_sig_arg(),
+    "args": logic_sig_arg(from_stack=True),
+    **{f"arg_{index}": logic_sig_arg(index) for index in range(4)},
+    "load": op_load,
+    "store": op_store,
+    "loads": op_loads,
+    "stores": op_stores,
+    "gload": op_gload,
+    "gloads": op_gloads,
+    "gaid": op_gaid,
+    "gaids": op_gaids,
+    "pop": op_pop,
+    "dup": op_dup,
+    "dup2": op_dup2,
+    "dig": op_dig,
+    "swap": op_swap,
+    "select": op_select,
+    "cover": op_cover,
+    "uncover": op_uncover,
+    "assert": op_assert,
+    "log": op_log,
+    "txn": op_txn,
+    "txna": op_txna,
+    "txnas": op_txnas,
+    "gtxn": op_gtxn,
+    "gtxna": op_gtxna,
+    "gtxnas": op_gtxnas,
+    "gtxns": op_gtxns,
+    "gtxnsa": op_gtxnsa,
+    "gtxnsas": op_gtxnsas,
+    "global": op_global,
+    "balance": op_balance,
+    "min_balance": op_min_balance,
+    "app_opted_in": op_app_opted_in,
+    "app_local_get": op_app_local_get,
+    "app_local_get_ex": op_app_local_get_ex,
+    "app_global_get": op_app_global_get,
+    "app_global_get_ex": op_app_global_get_ex,
+    "app_local_put": op_app_local_put,
+    "app_global_put": op_app_global_put,
+    "app_local_del": op_app_local_del,
+    "app_global_del": op_app_global_del,
+    "asset_holding_get": op_asset_holding_get,
+    "asset_params_get": op_asset_params_get,
+    "app_params_get": op_app_params_get,
+    "itxn_begin": op_itxn_begin,
+    "itxn_next": op_itxn_next,
+    "itxn_field": op_itxn_field,
+    "itxn_submit": op_itxn_submit,
+    "itxn": op_itxn,
+    "itxna": op_itxna,
+}
+
+
+# -- group evaluation
+
+def evaluate_app_call(group: GroupContext, index: int, profile=None) -> EvalResult:
+    ledger = group.ledger
+    txn = group.txns[index]
+    if txn.application_id == 0:
+        app = Application(
+            ledger.allocate_id(),
+            txn.sender,
+            as_program(txn.approval_program),
+            as_program(txn.clear_state_program),
+            (txn.global_num_uint, txn.global_num_byte_slice),
+            (txn.local_num_uint, txn.local_num_byte_slice),
+            txn.extra_program_pages,
+        )
+        ledger.add_app(app)
+        group.created_ids[index] = app.id
+    else:
+        app = ledger.app(txn.application_id)
+    result = EvalResult(txn, app.id)
+
+    if txn.on_completion == OPT_IN:
+        if app.id in ledger.account(txn.sender).local_states:
+            raise LogicError(f"account already opted in to application {app.id}")
+        ledger.opt_in_app(txn.sender, app.id)
+
+    if txn.on_completion == CLEAR_STATE:
+        if app.id not in ledger.account(txn.sender).local_states:
+            raise LogicError(f"account is not opted in to application {app.id}")
+        snapshot = ledger.snapshot()
+        try:
+            Interpreter(app.clear_program, group, index, app, result, profile).run()
+            ledger.release(snapshot)
+        except LogicError:
+            # A failing clear state program is rolled back but the local state is cleared anyway.
+            ledger.restore(snapshot)
+            app = ledger.app(app.id)
+        ledger.account(txn.sender).local_states.pop(app.id, None)
+        return result
+
+    if not Interpreter(app.approval_program, group, index, app, result, profile).run():
+        raise TransactionRejected(f"transaction rejected by application {app.id}")
+
+    if txn.on_completion == CLOSE_OUT:
+        ledger.account(txn.sender).local_states.pop(app.id, None)
+    elif txn.on_completion == UPDATE_APPLICATION:
+        app.approval_program = as_program(txn.approval_program)
+        app.clear_program = as_program(txn.clear_state_program)
+    elif txn.on_completion == DELETE_APPLICATION:
+        del ledger.apps[app.id]
+    return result
+
+
+def evaluate_logic_sig(group: GroupContext, index: int):
+    txn = group.txns[index]
+    if isinstance(txn.logic_sig, bytes):
+        # as received, its address is that of these bytes rather than of a program assembled again
+        bytecode = txn.logic_sig
+        try:
+            program = disassemble(bytecode)
+        except AssemblerError as error:
+            raise LogicError(f"transaction {index}: invalid logic signature: {error}") from error
+    else:
+        program = as_program(txn.logic_sig)
+        bytecode = assemble(program)
+    if txn.sender != logic_sig_address(bytecode):
+        raise LogicError(f"transaction {index} is not sent by the address of its logic signature")
+    try:
+        approved = Interpreter(program, group, index, None, EvalResult(txn)).run()
+    except LogicError as error:
+        raise TransactionRejected(f"transaction {index} rejected by its logic signature: {error}") from error
+    if not approved:
+        raise TransactionRejected(f"transaction {index} rejected by its logic signature")
+
+
+def evaluate_group(ledger: Ledger, txns: List[Transaction], profile=None) -> List[EvalResult]:
+    """Evaluates and applies a transaction group atomically.
+
+    Raises LogicError (TransactionRejected if a logic signature or an approval program rejected
+    its transaction) or LedgerError; the ledger is left untouched in that case. The logic signatures are
+    evaluated first, like algod checks the signatures before applying the group. The optional
+    profile (see avm.profile.Profile) observes every application call of the group."""
+    if not 0 < len(txns) <= MAX_GROUP_SIZE:
+        raise LogicError(f"group size must be between 1 and {MAX_GROUP_SIZE}")
+    snapshot = ledger.snapshot()
+    try:
+        group = GroupContext(ledger, txns)
+        if group.fee_credit < 0:
+            raise LedgerError("fee too small")
+        for index, txn in enumerate(txns):
+            txn.group_index = index
+        for index, txn in enumerate(txns):
+            if txn.logic_sig is not None:
+                evaluate_logic_sig(group, index)
+        results = []
+        for index, txn in enumerate(txns):
+            sender = ledger.account(txn.sender)
+            if sender.balance < txn.fee:
+                raise LedgerError(f"balance {sender.balance} cannot pay fee {txn.fee}")
+            sender.balance -= txn.fee
+            if txn.type == "appl":
+                result = evaluate_app_call(group, index, profile)
+                txn.logs = result.logs
+                ledger.check_min_balance(ledger.app(result.app_id).address if result.app_id in ledger.apps else txn.sender)
+            else:
+                ledger.apply_transfer(txn)
+                result = EvalResult(txn)
+            ledger.check_min_balance(txn.sender)
+            results.append(result)
+        ledger.release(snapshot)
+        return results
+    except Exception:
+        # LogicError or LedgerError, anything else is restored too so that no snapshot stays open
+        ledger.restore(snapshot)
+        raise
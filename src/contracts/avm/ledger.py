@@ -0,0 +1,384 @@
+import copy
+import re
+from typing import Dict, List, Optional, Tuple
+
+from .address import ZERO_ADDRESS, application_address, sha512_256
+from .opcodes import NAMED_INTS, TXN_FIELDS
+
+# In-memory ledger used by the local AVM: accounts with Algo/asset balances and
+# local state, applications with global state, and assets.
+#
+# Groups are rolled back with a journal rather than a copy of the ledger: a snapshot keeps the
+# original of each account, application and asset the first time it is accessed for a change,
+# so the cost of a group does not grow with the size of the ledger. Whatever changes the state
+# goes through account(), app() or the methods adding objects, which record them.
+
+MIN_TXN_FEE = 1000
+MIN_ACCOUNT_BALANCE = 100000
+ASSET_MIN_BALANCE = 100000
+APP_PAGE_MIN_BALANCE = 100000
+APP_OPT_IN_MIN_BALANCE = 100000
+SCHEMA_UINT_MIN_BALANCE = 28500
+SCHEMA_BYTES_MIN_BALANCE = 50000
+MAX_KEY_LENGTH = 64
+MAX_KEY_VALUE_LENGTH = 128
+
+
+class LedgerError(Exception):
+    pass
+
+
+def field_attribute(field_name: str) -> str:
+    """TEAL field name to Transaction attribute name, e.g. "CloseRemainderTo" -> "close_remainder_to"."""
+    return re.sub(r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])", "_", field_name).lower()
+
+
+ADDRESS_FIELDS = frozenset((
+    "Sender", "Receiver", "CloseRemainderTo", "AssetSender", "AssetReceiver", "AssetCloseTo", "RekeyTo",
+    "ConfigAssetManager", "ConfigAssetReserve", "ConfigAssetFreeze", "ConfigAssetClawback", "FreezeAssetAccount",
+))
+BYTES_FIELDS = frozenset((
+    "Note", "Type", "TxID", "ApprovalProgram", "ClearStateProgram",
+    "ConfigAssetUnitName", "ConfigAssetName", "ConfigAssetURL", "ConfigAssetMetadataHash",
+))
+FIXED_BYTES_FIELDS = {"Lease": 32, "VotePK": 32, "SelectionPK": 32}
+# Fields derived from other fields or from the evaluation, they cannot be passed to Transaction()
+DERIVED_FIELDS = frozenset(("TypeEnum", "GroupIndex", "TxID", "NumAppArgs", "NumAccounts", "NumAssets", "NumApplications", "NumLogs"))
+
+
+def default_field_value(field_name: str, is_array: bool):
+    if is_array:
+        return []
+    if field_name in ADDRESS_FIELDS:
+        return ZERO_ADDRESS
+    if field_name in FIXED_BYTES_FIELDS:
+        return bytes(FIXED_BYTES_FIELDS[field_name])
+    if field_name in BYTES_FIELDS:
+        return b""
+    return 0
+
+
+TRANSACTION_ATTRIBUTES = {
+    field_attribute(name): (name, is_array) for name, is_array in TXN_FIELDS if name not in DERIVED_FIELDS
+}
+
+
+class Transaction:
+    """A transaction of the mock ledger. Attributes are the snake_case names of the TEAL txn fields,
+    e.g. Transaction(type="appl", sender=address, application_id=1, application_args=[b"CANCEL"]).
+    "type" is the short type name ("pay", "axfer", "appl", ...); the approval and clear programs of
+    an application create/update call are TEAL sources.
+
+    A transaction signed by a logic signature carries its program (logic_sig, a TEAL source, a
+    parsed program or bytecode) and arguments (logic_sig_args), its sender is then the address of
+    the program: delegated logic signatures are not supported."""
+
+    def __init__(self, **fields):
+        has_fee = fields.get("fee") is not None
+        self.logic_sig = fields.pop("logic_sig", None)
+        self.logic_sig_args: List[bytes] = fields.pop("logic_sig_args", None) or []
+        for attribute, (name, is_array) in TRANSACTION_ATTRIBUTES.items():
+            value = fields.pop(attribute, None)
+            setattr(self, attribute, default_field_value(name, is_array) if value is None else value)
+        if fields:
+            raise TypeError(f"unknown transaction fields: {', '.join(fields)}")
+        if not has_fee:
+            self.fee = MIN_TXN_FEE
+        self.group_index = 0
+
+    @property
+    def type_enum(self) -> int:
+        return NAMED_INTS[self.type]
+
+    @property
+    def tx_id(self) -> bytes:
+        # Not the canonical msgpack hash: only stable and unique enough for the mock ledger.
+        return sha512_256(repr(sorted((key, repr(value)) for key, value in vars(self).items())).encode())
+
+    def copy(self, **changes) -> "Transaction":
+        txn = copy.copy(self)
+        for attribute, value in changes.items():
+            setattr(txn, attribute, value)
+        return txn
+
+
+class AssetHolding:
+    def __init__(self, amount: int = 0, frozen: bool = False):
+        self.amount = amount
+        self.frozen = frozen
+
+
+class Asset:
+    def __init__(self, asset_id: int, creator: bytes, total: int, decimals: int = 0, default_frozen: bool = False,
+                 unit_name: bytes = b"", name: bytes = b"", url: bytes = b"", metadata_hash: bytes = b"",
+                 manager: bytes = ZERO_ADDRESS, reserve: bytes = ZERO_ADDRESS, freeze: bytes = ZERO_ADDRESS,
+                 clawback: bytes = ZERO_ADDRESS):
+        self.id = asset_id
+        self.creator = creator
+        self.total = total
+        self.decimals = decimals
+        self.default_frozen = default_frozen
+        self.unit_name = unit_name
+        self.name = name
+        self.url = url
+        self.metadata_hash = metadata_hash
+        self.manager = manager
+        self.reserve = reserve
+        self.freeze = freeze
+        self.clawback = clawback
+
+
+class Application:
+    def __init__(self, app_id: int, creator: bytes, approval_program, clear_program,
+                 global_schema: Tuple[int, int], local_schema: Tuple[int, int], extra_pages: int = 0):
+        self.id = app_id
+        self.creator = creator
+        # parsed avm.assembler.Program instances
+        self.approval_program = approval_program
+        self.clear_program = clear_program
+        # (number of uints, number of byte slices)
+        self.global_schema = global_schema
+        self.local_schema = local_schema
+        self.extra_pages = extra_pages
+        self.global_state: Dict[bytes, object] = {}
+
+    @property
+    def address(self) -> bytes:
+        return application_address(self.id)
+
+    def copy(self) -> "Application":
+        # Programs are never mutated in place, the copy shares them.
+        app = copy.copy(self)
+        app.global_state = dict(self.global_state)
+        return app
+
+
+class Account:
+    def __init__(self, address: bytes, balance: int = 0):
+        self.address = address
+        self.balance = balance
+        self.assets: Dict[int, AssetHolding] = {}
+        self.local_states: Dict[int, Dict[bytes, object]] = {}
+
+    def copy(self) -> "Account":
+        account = Account(self.address, self.balance)
+        account.assets = {asset_id: AssetHolding(holding.amount, holding.frozen) for asset_id, holding in self.assets.items()}
+        account.local_states = {app_id: dict(state) for app_id, state in self.local_states.items()}
+        return account
+
+
+class Snapshot:
+    """Originals of the objects changed since Ledger.snapshot(), None for those created since."""
+
+    def __init__(self, next_id: int):
+        self.next_id = next_id
+        self.accounts: Dict[bytes, Optional[Account]] = {}
+        self.apps: Dict[int, Optional[Application]] = {}
+        self.assets: Dict[int, Optional[Asset]] = {}
+
+    def tables(self):
+        return self.accounts, self.apps, self.assets
+
+
+def check_state_entry(key: bytes, value):
+    if len(key) > MAX_KEY_LENGTH:
+        raise LedgerError(f"key too long: {len(key)}")
+    if isinstance(value, bytes) and len(key) + len(value) > MAX_KEY_VALUE_LENGTH:
+        raise LedgerError(f"key/value total {len(key) + len(value)} is longer than {MAX_KEY_VALUE_LENGTH}")
+
+
+def check_schema(state: Dict[bytes, object], schema: Tuple[int, int]):
+    uints = sum(1 for value in state.values() if isinstance(value, int))
+    if uints > schema[0]:
+        raise LedgerError(f"store integer count {uints} exceeds schema integer count {schema[0]}")
+    if len(state) - uints > schema[1]:
+        raise LedgerError(f"store bytes count {len(state) - uints} exceeds schema bytes count {schema[1]}")
+
+
+class Ledger:
+    def __init__(self, round: int = 1, latest_timestamp: int = 0):
+        self.round = round
+        self.latest_timestamp = latest_timestamp
+        self.accounts: Dict[bytes, Account] = {}
+        self.apps: Dict[int, Application] = {}
+        self.assets: Dict[int, Asset] = {}
+        self.next_id = 1
+        # open snapshots, innermost last
+        self.snapshots: List[Snapshot] = []
+
+    def snapshot(self) -> Snapshot:
+        """Starts recording changes, until restore() undoes them or release() keeps them."""
+        snapshot = Snapshot(self.next_id)
+        self.snapshots.append(snapshot)
+        return snapshot
+
+    def restore(self, snapshot: Snapshot):
+        """Undoes the changes made since snapshot, those of the snapshots taken after it included."""
+        while self.snapshots:
+            undone = self.snapshots.pop()
+            for originals, table in zip(undone.tables(), (self.accounts, self.apps, self.assets)):
+                for key, original in originals.items():
+                    if original is None:
+                        table.pop(key, None)
+                    else:
+                        table[key] = original
+            self.next_id = undone.next_id
+            if undone is snapshot:
+                return
+
+    def release(self, snapshot: Snapshot):
+        """Keeps the changes made since snapshot, the enclosing snapshot can still undo them."""
+        released = self.snapshots[self.snapshots.index(snapshot):]
+        del self.snapshots[-len(released):]
+        if self.snapshots:
+            for inner in released:
+                for originals, inner_originals in zip(self.snapshots[-1].tables(), inner.tables()):
+                    for key, original in inner_originals.items():
+                        originals.setdefault(key, original)
+
+    def record(self, table: str, key):
+        # Keeps the original of an object about to change, in the innermost snapshot.
+        if self.snapshots:
+            originals = getattr(self.snapshots[-1], table)
+            if key not in originals:
+                current = getattr(self, table).get(key)
+                originals[key] = current.copy() if current is not None else None
+
+    def allocate_id(self) -> int:
+        allocated = self.next_id
+        self.next_id += 1
+        return allocated
+
+    def account(self, address: bytes) -> Account:
+        self.record("accounts", address)
+        if address not in self.accounts:
+            self.accounts[address] = Account(address)
+        return self.accounts[address]
+
+    def fund(self, address: bytes, amount: int) -> Account:
+        account = self.account(address)
+        account.balance += amount
+        return account
+
+    def app(self, app_id: int) -> Application:
+        if app_id not in self.apps:
+            raise LedgerError(f"application {app_id} does not exist")
+        self.record("apps", app_id)
+        return self.apps[app_id]
+
+    def add_app(self, app: Application):
+        self.record("apps", app.id)
+        self.apps[app.id] = app
+
+    def existing_account(self, address: bytes) -> Optional[Account]:
+        """The account at address about to change, None (and nothing created) if there is none."""
+        if address not in self.accounts:
+            return None
+        return self.account(address)
+
+    def asset(self, asset_id: int) -> Asset:
+        if asset_id not in self.assets:
+            raise LedgerError(f"asset {asset_id} does not exist")
+        return self.assets[asset_id]
+
+    def create_asset(self, creator: bytes, total: int, **params) -> int:
+        asset_id = self.allocate_id()
+        self.record("assets", asset_id)
+        self.assets[asset_id] = Asset(asset_id, creator, total, **params)
+        self.account(creator).assets[asset_id] = AssetHolding(total, params.get("default_frozen", False))
+        return asset_id
+
+    def install_app(self, creator: bytes, approval_program, clear_program,
+                    global_schema: Tuple[int, int] = (0, 0), local_schema: Tuple[int, int] = (0, 0),
+                    global_state: Optional[Dict[bytes, object]] = None) -> int:
+        """Creates an application without running its creation branch, e.g. to set up a profiling scenario."""
+        app_id = self.allocate_id()
+        app = Application(app_id, creator, approval_program, clear_program, global_schema, local_schema)
+        app.global_state.update(global_state or {})
+        self.add_app(app)
+        return app_id
+
+    def opt_in_app(self, address: bytes, app_id: int, local_state: Optional[Dict[bytes, object]] = None):
+        self.account(address).local_states[app_id] = dict(local_state or {})
+
+    def opt_in_asset(self, address: bytes, asset_id: int, amount: int = 0):
+        self.account(address).assets[asset_id] = AssetHolding(amount, self.asset(asset_id).default_frozen)
+
+    def min_balance(self, address: bytes) -> int:
+        account = self.account(address)
+        balance = MIN_ACCOUNT_BALANCE + ASSET_MIN_BALANCE * len(account.assets)
+        for app_id in account.local_states:
+            uints, byte_slices = self.apps[app_id].local_schema if app_id in self.apps else (0, 0)
+            balance += APP_OPT_IN_MIN_BALANCE + SCHEMA_UINT_MIN_BALANCE * uints + SCHEMA_BYTES_MIN_BALANCE * byte_slices
+        for app in self.apps.values():
+            if app.creator == address:
+                uints, byte_slices = app.global_schema
+                balance += APP_PAGE_MIN_BALANCE * (1 + app.extra_pages)
+                balance += SCHEMA_UINT_MIN_BALANCE * uints + SCHEMA_BYTES_MIN_BALANCE * byte_slices
+        return balance
+
+    def check_min_balance(self, address: bytes):
+        account = self.accounts.get(address)
+        # Closed and never funded accounts have no minimum balance.
+        if account is None or (account.balance == 0 and self.min_balance(address) == MIN_ACCOUNT_BALANCE):
+            return
+        if account.balance < self.min_balance(address):
+            raise LedgerError(f"account balance {account.balance} below min {self.min_balance(address)}")
+
+    def pay(self, sender: bytes, receiver: bytes, amount: int, close_to: bytes = ZERO_ADDRESS):
+        source = self.account(sender)
+        if source.balance < amount:
+            raise LedgerError(f"overspend: balance {source.balance}, amount {amount}")
+        source.balance -= amount
+        self.account(receiver).balance += amount
+        if close_to != ZERO_ADDRESS:
+            if source.assets or source.local_states:
+                raise LedgerError("cannot close an account holding assets or opted in to applications")
+            self.account(close_to).balance += source.balance
+            del self.accounts[sender]
+
+    def transfer_asset(self, sender: bytes, receiver: bytes, asset_id: int, amount: int,
+                       close_to: bytes = ZERO_ADDRESS, asset_sender: bytes = ZERO_ADDRESS):
+        self.asset(asset_id)
+        if asset_sender == ZERO_ADDRESS and sender == receiver and amount == 0 and asset_id not in self.account(sender).assets:
+            self.opt_in_asset(sender, asset_id)
+            return
+        source_address = sender if asset_sender == ZERO_ADDRESS else asset_sender
+        source = self.account(source_address).assets.get(asset_id)
+        target = self.account(receiver).assets.get(asset_id)
+        if source is None or target is None:
+            raise LedgerError(f"asset {asset_id} missing from {'sender' if source is None else 'receiver'}")
+        if source.amount < amount:
+            raise LedgerError(f"underflow on subtracting {amount} from sender amount {source.amount}")
+        source.amount -= amount
+        target.amount += amount
+        if close_to != ZERO_ADDRESS:
+            close_target = self.account(close_to).assets.get(asset_id)
+            if close_target is None:
+                raise LedgerError(f"asset {asset_id} missing from close-to account")
+            close_target.amount += source.amount
+            del self.account(source_address).assets[asset_id]
+
+    def apply_transfer(self, txn: Transaction):
+        """Applies the balance effects of a payment or asset transfer (fees excluded)."""
+        if txn.type == "pay":
+            self.pay(txn.sender, txn.receiver, txn.amount, txn.close_remainder_to)
+        elif txn.type == "axfer":
+            self.transfer_asset(txn.sender, txn.asset_receiver, txn.xfer_asset, txn.asset_amount,
+                                txn.asset_close_to, txn.asset_sender)
+        else:
+            raise LedgerError(f"unsupported transaction type {txn.type}")
+
+    def state_snapshot(self, app_id: int) -> Dict[str, object]:
+        """Global state and every local state of an application, e.g. to diff before/after a call."""
+        return {
+            "global": dict(self.app(app_id).global_state),
+            "local": {
+                address: dict(account.local_states[app_id])
+                for address, account in self.accounts.items() if app_id in account.local_states
+            },
+        }
+
+
+def group_fee_credit(txns: List[Transaction]) -> int:
+    return sum(txn.fee for txn in txns) - MIN_TXN_FEE * len(txns)
@@ -0,0 +1,305 @@
+from typing import NamedTuple
+
+# TEAL opcode table (https://developer.algorand.org/docs/get-details/dryrun/ and the TEAL opcode spec).
+#
+# Immediate encodings:
+#  u - uint8
+#  t - txn field (uint8), g - global field, h - asset holding field, p - asset params field, a - app params field
+#  i - varint, b - varint length prefixed bytes
+#  L - label (int16 offset relative to the end of the instruction)
+#  I - intcblock (varint count + varints), B - bytecblock (varint count + length prefixed bytes)
+
+
+class OpSpec(NamedTuple):
+    name: str
+    opcode: int
+    immediates: str = ""
+    cost: int = 1
+    version: int = 1
+
+
+OPS = (
+    OpSpec("err", 0x00),
+    OpSpec("sha256", 0x01, cost=35),
+    OpSpec("keccak256", 0x02, cost=130),
+    OpSpec("sha512_256", 0x03, cost=45),
+    OpSpec("ed25519verify", 0x04, cost=1900),
+    OpSpec("ecdsa_verify", 0x05, "u", cost=1700, version=5),
+    OpSpec("ecdsa_pk_decompress", 0x06, "u", cost=650, version=5),
+    OpSpec("ecdsa_pk_recover", 0x07, "u", cost=2000, version=5),
+    OpSpec("+", 0x08),
+    OpSpec("-", 0x09),
+    OpSpec("/", 0x0A),
+    OpSpec("*", 0x0B),
+    OpSpec("<", 0x0C),
+    OpSpec(">", 0x0D),
+    OpSpec("<=", 0x0E),
+    OpSpec(">=", 0x0F),
+    OpSpec("&&", 0x10),
+    OpSpec("||", 0x11),
+    OpSpec("==", 0x12),
+    OpSpec("!=", 0x13),
+    OpSpec("!", 0x14),
+    OpSpec("len", 0x15),
+    OpSpec("itob", 0x16),
+    OpSpec("btoi", 0x17),
+    OpSpec("%", 0x18),
+    OpSpec("|", 0x19),
+    OpSpec("&", 0x1A),
+    OpSpec("^", 0x1B),
+    OpSpec("~", 0x1C),
+    OpSpec("mulw", 0x1D),
+    OpSpec("addw", 0x1E, version=2),
+    OpSpec("divmodw", 0x1F, cost=20, version=4),
+    OpSpec("intcblock", 0x20, "I"),
+    OpSpec("intc", 0x21, "u"),
+    OpSpec("intc_0", 0x22),
+    OpSpec("intc_1", 0x23),
+    OpSpec("intc_2", 0x24),
+    OpSpec("intc_3", 0x25),
+    OpSpec("bytecblock", 0x26, "B"),
+    OpSpec("bytec", 0x27, "u"),
+    OpSpec("bytec_0", 0x28),
+    OpSpec("bytec_1", 0x29),
+    OpSpec("bytec_2", 0x2A),
+    OpSpec("bytec_3", 0x2B),
+    OpSpec("arg", 0x2C, "u"),
+    OpSpec("arg_0", 0x2D),
+    OpSpec("arg_1", 0x2E),
+    OpSpec("arg_2", 0x2F),
+    OpSpec("arg_3", 0x30),
+    OpSpec("txn", 0x31, "t"),
+    OpSpec("global", 0x32, "g"),
+    OpSpec("gtxn", 0x33, "ut"),
+    OpSpec("load", 0x34, "u"),
+    OpSpec("store", 0x35, "u"),
+    OpSpec("txna", 0x36, "tu", version=2),
+    OpSpec("gtxna", 0x37, "utu", version=2),
+    OpSpec("gtxns", 0x38, "t", version=3),
+    OpSpec("gtxnsa", 0x39, "tu", version=3),
+    OpSpec("gload", 0x3A, "uu", version=4),
+    OpSpec("gloads", 0x3B, "u", version=4),
+    OpSpec("gaid", 0x3C, "u", version=4),
+    OpSpec("gaids", 0x3D, version=4),
+    OpSpec("loads", 0x3E, version=5),
+    OpSpec("stores", 0x3F, version=5),
+    OpSpec("bnz", 0x40, "L"),
+    OpSpec("bz", 0x41, "L", version=2),
+    OpSpec("b", 0x42, "L", version=2),
+    OpSpec("return", 0x43, version=2),
+    OpSpec("assert", 0x44, version=3),
+    OpSpec("pop", 0x48),
+    OpSpec("dup", 0x49),
+    OpSpec("dup2", 0x4A, version=2),
+    OpSpec("dig", 0x4B, "u", version=3),
+    OpSpec("swap", 0x4C, version=3),
+    OpSpec("select", 0x4D, version=3),
+    OpSpec("cover", 0x4E, "u", version=5),
+    OpSpec("uncover", 0x4F, "u", version=5),
+    OpSpec("concat", 0x50, version=2),
+    OpSpec("substring", 0x51, "uu", version=2),
+    OpSpec("substring3", 0x52, version=2),
+    OpSpec("getbit", 0x53, version=3),
+    OpSpec("setbit", 0x54, version=3),
+    OpSpec("getbyte", 0x55, version=3),
+    OpSpec("setbyte", 0x56, version=3),
+    OpSpec("extract", 0x57, "uu", version=5),
+    OpSpec("extract3", 0x58, version=5),
+    OpSpec("extract_uint16", 0x59, version=5),
+    OpSpec("extract_uint32", 0x5A, version=5),
+    OpSpec("extract_uint64", 0x5B, version=5),
+    OpSpec("balance", 0x60, version=2),
+    OpSpec("app_opted_in", 0x61, version=2),
+    OpSpec("app_local_get", 0x62, version=2),
+    OpSpec("app_local_get_ex", 0x63, version=2),
+    OpSpec("app_global_get", 0x64, version=2),
+    OpSpec("app_global_get_ex", 0x65, version=2),
+    OpSpec("app_local_put", 0x66, version=2),
+    OpSpec("app_global_put", 0x67, version=2),
+    OpSpec("app_local_del", 0x68, version=2),
+    OpSpec("app_global_del", 0x69, version=2),
+    OpSpec("asset_holding_get", 0x70, "h", version=2),
+    OpSpec("asset_params_get", 0x71, "p", version=2),
+    OpSpec("app_params_get", 0x72, "a", version=5),
+    OpSpec("min_balance", 0x78, version=3),
+    OpSpec("pushbytes", 0x80, "b", version=3),
+    OpSpec("pushint", 0x81, "i", version=3),
+    OpSpec("callsub", 0x88, "L", version=4),
+    OpSpec("retsub", 0x89, version=4),
+    OpSpec("shl", 0x90, version=4),
+    OpSpec("shr", 0x91, version=4),
+    OpSpec("sqrt", 0x92, cost=4, version=4),
+    OpSpec("bitlen", 0x93, version=4),
+    OpSpec("exp", 0x94, version=4),
+    OpSpec("expw", 0x95, cost=10, version=4),
+    OpSpec("divw", 0x97, version=6),
+    OpSpec("b+", 0x98, cost=10, version=4),
+    OpSpec("b-", 0x99, cost=10, version=4),
+    OpSpec("b/", 0x9A, cost=20, version=4),
+    OpSpec("b*", 0x9B, cost=20, version=4),
+    OpSpec("b<", 0x9C, version=4),
+    OpSpec("b>", 0x9D, version=4),
+    OpSpec("b<=", 0x9E, version=4),
+    OpSpec("b>=", 0x9F, version=4),
+    OpSpec("b==", 0xA0, version=4),
+    OpSpec("b!=", 0xA1, version=4),
+    OpSpec("b%", 0xA2, cost=20, version=4),
+    OpSpec("b|", 0xA3, cost=6, version=4),
+    OpSpec("b&", 0xA4, cost=6, version=4),
+    OpSpec("b^", 0xA5, cost=6, version=4),
+    OpSpec("b~", 0xA6, cost=4, version=4),
+    OpSpec("bzero", 0xAF, version=4),
+    OpSpec("log", 0xB0, version=5),
+    OpSpec("itxn_begin", 0xB1, version=5),
+    OpSpec("itxn_field", 0xB2, "t", version=5),
+    OpSpec("itxn_submit", 0xB3, version=5),
+    OpSpec("itxn", 0xB4, "t", version=5),
+    OpSpec("itxna", 0xB5, "tu", version=5),
+    OpSpec("itxn_next", 0xB6, version=6),
+    OpSpec("txnas", 0xC0, "t", version=5),
+    OpSpec("gtxnas", 0xC1, "ut", version=5),
+    OpSpec("gtxnsas", 0xC2, "t", version=5),
+    OpSpec("args", 0xC3, version=5),
+)
+
+OPS_BY_NAME = {spec.name: spec for spec in OPS}
+OPS_BY_OPCODE = {spec.opcode: spec for spec in OPS}
+
+# (name, is array)
+TXN_FIELDS = (
+    ("Sender", False),
+    ("Fee", False),
+    ("FirstValid", False),
+    ("FirstValidTime", False),
+    ("LastValid", False),
+    ("Note", False),
+    ("Lease", False),
+    ("Receiver", False),
+    ("Amount", False),
+    ("CloseRemainderTo", False),
+    ("VotePK", False),
+    ("SelectionPK", False),
+    ("VoteFirst", False),
+    ("VoteLast", False),
+    ("VoteKeyDilution", False),
+    ("Type", False),
+    ("TypeEnum", False),
+    ("XferAsset", False),
+    ("AssetAmount", False),
+    ("AssetSender", False),
+    ("AssetReceiver", False),
+    ("AssetCloseTo", False),
+    ("GroupIndex", False),
+    ("TxID", False),
+    ("ApplicationID", False),
+    ("OnCompletion", False),
+    ("ApplicationArgs", True),
+    ("NumAppArgs", False),
+    ("Accounts", True),
+    ("NumAccounts", False),
+    ("ApprovalProgram", False),
+    ("ClearStateProgram", False),
+    ("RekeyTo", False),
+    ("ConfigAsset", False),
+    ("ConfigAssetTotal", False),
+    ("ConfigAssetDecimals", False),
+    ("ConfigAssetDefaultFrozen", False),
+    ("ConfigAssetUnitName", False),
+    ("ConfigAssetName", False),
+    ("ConfigAssetURL", False),
+    ("ConfigAssetMetadataHash", False),
+    ("ConfigAssetManager", False),
+    ("ConfigAssetReserve", False),
+    ("ConfigAssetFreeze", False),
+    ("ConfigAssetClawback", False),
+    ("FreezeAsset", False),
+    ("FreezeAssetAccount", False),
+    ("FreezeAssetFrozen", False),
+    ("Assets", True),
+    ("NumAssets", False),
+    ("Applications", True),
+    ("NumApplications", False),
+    ("GlobalNumUint", False),
+    ("GlobalNumByteSlice", False),
+    ("LocalNumUint", False),
+    ("LocalNumByteSlice", False),
+    ("ExtraProgramPages", False),
+    ("Nonparticipation", False),
+    ("Logs", True),
+    ("NumLogs", False),
+    ("CreatedAssetID", False),
+    ("CreatedApplicationID", False),
+)
+
+GLOBAL_FIELDS = (
+    "MinTxnFee",
+    "MinBalance",
+    "MaxTxnLife",
+    "ZeroAddress",
+    "GroupSize",
+    "LogicSigVersion",
+    "Round",
+    "LatestTimestamp",
+    "CurrentApplicationID",
+    "CreatorAddress",
+    "CurrentApplicationAddress",
+    "GroupID",
+)
+
+ASSET_HOLDING_FIELDS = ("AssetBalance", "AssetFrozen")
+
+ASSET_PARAMS_FIELDS = (
+    "AssetTotal",
+    "AssetDecimals",
+    "AssetDefaultFrozen",
+    "AssetUnitName",
+    "AssetName",
+    "AssetURL",
+    "AssetMetadataHash",
+    "AssetManager",
+    "AssetReserve",
+    "AssetFreeze",
+    "AssetClawback",
+    "AssetCreator",
+)
+
+APP_PARAMS_FIELDS = (
+    "AppApprovalProgram",
+    "AppClearStateProgram",
+    "AppGlobalNumUint",
+    "AppGlobalNumByteSlice",
+    "AppLocalNumUint",
+    "AppLocalNumByteSlice",
+    "AppExtraProgramPages",
+    "AppCreator",
+    "AppAddress",
+)
+
+FIELDS = {
+    "t": tuple(name for name, _ in TXN_FIELDS),
+    "g": GLOBAL_FIELDS,
+    "h": ASSET_HOLDING_FIELDS,
+    "p": ASSET_PARAMS_FIELDS,
+    "a": APP_PARAMS_FIELDS,
+}
+
+ARRAY_TXN_FIELDS = frozenset(name for name, is_array in TXN_FIELDS if is_array)
+
+# Named integer constants accepted by the "int" pseudo-op.
+NAMED_INTS = {
+    "NoOp": 0,
+    "OptIn": 1,
+    "CloseOut": 2,
+    "ClearState": 3,
+    "UpdateApplication": 4,
+    "DeleteApplication": 5,
+    "unknown": 0,
+    "pay": 1,
+    "keyreg": 2,
+    "acfg": 3,
+    "axfer": 4,
+    "afrz": 5,
+    "appl": 6,
+}
+
+TXN_TYPES = {value: name for name, value in NAMED_INTS.items() if value and name.islower()}
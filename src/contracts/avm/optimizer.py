@@ -0,0 +1,352 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .assembler import AssemblerError, is_template_variable, parse_bytes, parse_int, tokenize
+
+# Peephole optimizer of the TEAL generated by PyTeal. build.py runs it before writing the
+# programs and the benchmark scenarios load the programs through it, so what is measured is what
+# is deployed.
+#
+# It rewrites the source, keeping labels and the subroutine comments, and repeats its passes
+# until none of them changes anything:
+#  - constant folding of "int a; int b; <op>", "int a; !", "byte a; len" and of the concat of
+#    constants, "int a; itob" included
+#  - a push repeated right away becomes "dup", "store n; load n" becomes "dup; store n"
+#  - trivial branches: the If(c, Int(1), Int(0)) wrapper around a condition, branches on
+#    constants, branches to the next instruction, branches to branches and to return/err
+#  - dead code: instructions after b, return, err or retsub up to the next used label, and the
+#    labels nothing jumps to
+#  - straight-line subroutines called once or not longer than INLINE_MAX_OPS are inlined, and
+#    the callers of subroutines with the same body share one of them
+#
+# Constants used more than once are not handled here, the assembler already puts them in the
+# intcblock/bytecblock (create_constant_blocks) like goal does. Template variables are never folded.
+
+INLINE_MAX_OPS = 4
+MAX_BYTES_LENGTH = 4096
+MAX_PASSES = 50
+
+LABEL = ":"
+PRAGMA = "#pragma"
+BRANCH_OPS = ("b", "bz", "bnz")
+JUMP_OPS = BRANCH_OPS + ("callsub",)
+TERMINATOR_OPS = ("b", "return", "err", "retsub")
+BOOLEAN_OPS = ("==", "!=", "<", ">", "<=", ">=", "&&", "||", "!")
+# ops pushing one value without popping anything
+PUSH_OPS = ("int", "byte", "addr", "txn", "txna", "gtxn", "gtxna", "global", "load")
+
+UINT_OPS = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b if a >= b else None,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a // b if b else None,
+    "%": lambda a, b: a % b if b else None,
+    "==": lambda a, b: int(a == b),
+    "!=": lambda a, b: int(a != b),
+    "<": lambda a, b: int(a < b),
+    ">": lambda a, b: int(a > b),
+    "<=": lambda a, b: int(a <= b),
+    ">=": lambda a, b: int(a >= b),
+    "&&": lambda a, b: int(bool(a and b)),
+    "||": lambda a, b: int(bool(a or b)),
+}
+
+
+class Line(NamedTuple):
+    # LABEL for a label, PRAGMA for a directive
+    op: str
+    args: Tuple[str, ...]
+    # comment lines above a label, the names PyTeal writes above the subroutines
+    comments: Tuple[str, ...] = ()
+
+    def text(self) -> str:
+        if self.op == LABEL:
+            return self.args[0] + ":"
+        return " ".join((self.op,) + self.args)
+
+
+class OptimizationReport(NamedTuple):
+    bytes_before: int
+    bytes_after: int
+    opcodes_before: int
+    opcodes_after: int
+
+    def summary(self) -> str:
+        return (
+            f"{self.bytes_before} -> {self.bytes_after} bytes ({self.bytes_after - self.bytes_before:+d}), "
+            f"{self.opcodes_before} -> {self.opcodes_after} opcodes ({self.opcodes_after - self.opcodes_before:+d})"
+        )
+
+
+def parse_lines(teal: str) -> List[Line]:
+    lines = []
+    comments = []
+    for text in teal.splitlines():
+        text = text.strip()
+        if text.startswith(PRAGMA):
+            lines.append(Line(PRAGMA, tuple(text.split()[1:])))
+        elif text.startswith("//"):
+            comments.append(text)
+        elif text:
+            tokens = tokenize(text)
+            if len(tokens) == 1 and tokens[0].endswith(":"):
+                lines.append(Line(LABEL, (tokens[0][:-1],), tuple(comments)))
+            else:
+                lines.append(Line(tokens[0], tuple(tokens[1:])))
+            comments = []
+    return lines
+
+
+def render(lines: List[Line]) -> str:
+    text = []
+    for line in lines:
+        if line.comments:
+            text.append("")
+            text.extend(line.comments)
+        text.append(line.text())
+    return "\n".join(text) + "\n"
+
+
+def int_value(line: Line) -> Optional[int]:
+    if line.op != "int" or is_template_variable(line.args[0]):
+        return None
+    return parse_int(line.args[0])
+
+
+def bytes_value(line: Line) -> Optional[bytes]:
+    if line.op != "byte" or is_template_variable(line.args[0]):
+        return None
+    return parse_bytes(list(line.args))
+
+
+def int_line(value: int) -> Line:
+    return Line("int", (str(value),))
+
+
+def bytes_line(value: bytes) -> Line:
+    return Line("byte", ("0x" + value.hex(),))
+
+
+def constant_bytes(out: List[Line], end: int) -> Tuple[Optional[bytes], int]:
+    """(value, number of lines) of the constant byte string pushed by the lines before out[end],
+    "byte" or "int; itob". An itob is only folded into a concat: on its own, an 8-byte constant
+    is larger than the int and the itob it saves."""
+    if end >= 1 and bytes_value(out[end - 1]) is not None:
+        return bytes_value(out[end - 1]), 1
+    if end >= 2 and out[end - 1].op == "itob" and int_value(out[end - 2]) is not None:
+        return int_value(out[end - 2]).to_bytes(8, "big"), 2
+    return None, 0
+
+
+def reduce_tail(out: List[Line]) -> bool:
+    """Rewrites the last instructions of out, returns whether it did."""
+    last = out[-1]
+    if len(out) >= 3 and last.op in UINT_OPS:
+        a, b = int_value(out[-3]), int_value(out[-2])
+        if a is not None and b is not None:
+            value = UINT_OPS[last.op](a, b)
+            if value is not None and value < 2 ** 64:
+                out[-3:] = [int_line(value)]
+                return True
+    if last.op == "concat":
+        second, second_length = constant_bytes(out, len(out) - 1)
+        first, first_length = constant_bytes(out, len(out) - 1 - second_length)
+        if first is not None and second is not None and len(first) + len(second) <= MAX_BYTES_LENGTH:
+            out[-1 - second_length - first_length:] = [bytes_line(first + second)]
+            return True
+    if len(out) < 2:
+        return False
+    previous = out[-2]
+    if last.op == "!" and int_value(previous) is not None:
+        out[-2:] = [int_line(int(not int_value(previous)))]
+        return True
+    if last.op == "len" and bytes_value(previous) is not None:
+        out[-2:] = [int_line(len(bytes_value(previous)))]
+        return True
+    if last.op in ("bz", "bnz") and int_value(previous) is not None:
+        taken = bool(int_value(previous)) == (last.op == "bnz")
+        out[-2:] = [Line("b", last.args)] if taken else []
+        return True
+    if last.op in PUSH_OPS and last == previous:
+        out[-1] = Line("dup", ())
+        return True
+    if last.op == "load" and previous.op == "store" and last.args == previous.args:
+        out[-2:] = [Line("dup", ()), previous]
+        return True
+    return False
+
+
+def fold(lines: List[Line]) -> List[Line]:
+    out = []
+    for line in lines:
+        out.append(line)
+        while out and out[-1].op not in (LABEL, PRAGMA) and reduce_tail(out):
+            pass
+    return out
+
+
+def references(lines: List[Line]) -> Dict[str, int]:
+    counts = {}
+    for line in lines:
+        if line.op in JUMP_OPS:
+            counts[line.args[0]] = counts.get(line.args[0], 0) + 1
+    return counts
+
+
+def label_positions(lines: List[Line]) -> Dict[str, int]:
+    return {line.args[0]: index for index, line in enumerate(lines) if line.op == LABEL}
+
+
+def first_instruction(lines: List[Line], index: int) -> Optional[Line]:
+    """The instruction executed first from lines[index], skipping labels."""
+    while index < len(lines) and lines[index].op == LABEL:
+        index += 1
+    return lines[index] if index < len(lines) else None
+
+
+def simplify_branches(lines: List[Line]) -> List[Line]:
+    refs = references(lines)
+    positions = label_positions(lines)
+    out = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        window = lines[index:index + 6]
+        # bnz then; int 0; b end; then: int 1; end: -- If(c, Int(1), Int(0))
+        if (len(window) == 6 and [item.op for item in window] == ["bnz", "int", "b", LABEL, "int", LABEL]
+                and window[0].args[0] == window[3].args[0] and window[2].args[0] == window[5].args[0]
+                and int_value(window[1]) == 0 and int_value(window[4]) == 1
+                and refs[window[3].args[0]] == 1 and refs[window[5].args[0]] == 1
+                and not window[3].comments and not window[5].comments):
+            if not (out and out[-1].op in BOOLEAN_OPS):
+                out.extend([int_line(0), Line("!=", ())])
+            index += 6
+            continue
+        if line.op in BRANCH_OPS:
+            target = line.args[0]
+            # a branch to the next instruction
+            following = index + 1
+            while following < len(lines) and lines[following].op == LABEL and lines[following].args[0] != target:
+                following += 1
+            if following < len(lines) and lines[following].op == LABEL:
+                if line.op != "b":
+                    out.append(Line("pop", ()))
+                index += 1
+                continue
+            destination = first_instruction(lines, positions[target] + 1)
+            if destination is not None and destination.op == "b" and destination.args[0] != target:
+                line = Line(line.op, destination.args)
+            elif line.op == "b" and destination is not None and destination.op in ("return", "err"):
+                line = destination
+        out.append(line)
+        index += 1
+    return out
+
+
+def subroutine_bodies(lines: List[Line]) -> Dict[str, Tuple[int, int]]:
+    """(start, end) of the lines of each subroutine, from its label to the next one."""
+    called = {line.args[0] for line in lines if line.op == "callsub"}
+    starts = sorted(index for index, line in enumerate(lines) if line.op == LABEL and line.args[0] in called)
+    return {
+        lines[start].args[0]: (start + 1, end)
+        for start, end in zip(starts, starts[1:] + [len(lines)])
+    }
+
+
+def is_straight_line(body: List[Line]) -> bool:
+    return bool(body) and body[-1].op == "retsub" and all(
+        line.op not in JUMP_OPS + TERMINATOR_OPS + (LABEL,) for line in body[:-1]
+    )
+
+
+def canonical_body(body: List[Line]) -> Optional[Tuple]:
+    """The body with its own labels numbered, None if it falls through or others jump into it."""
+    if not body or body[-1].op not in TERMINATOR_OPS:
+        return None
+    own_labels = {line.args[0]: str(number) for number, line in enumerate(item for item in body if item.op == LABEL)}
+    return tuple(
+        (line.op, (own_labels[line.args[0]],) if line.args and line.args[0] in own_labels and line.op in JUMP_OPS + (LABEL,) else line.args)
+        for line in body
+    )
+
+
+def merge_subroutines(lines: List[Line]) -> List[Line]:
+    bodies = subroutine_bodies(lines)
+    refs = references(lines)
+    inlined = {}
+    renamed = {}
+    seen = {}
+    for name, (start, end) in bodies.items():
+        body = lines[start:end]
+        if is_straight_line(body) and (refs[name] == 1 or len(body) - 1 <= INLINE_MAX_OPS):
+            inlined[name] = body[:-1]
+            continue
+        key = canonical_body(body)
+        own_labels = [line.args[0] for line in body if line.op == LABEL]
+        internal_refs = references(body)
+        if key is None or any(refs.get(label, 0) != internal_refs.get(label, 0) for label in own_labels):
+            continue
+        if key in seen:
+            renamed[name] = seen[key]
+        else:
+            seen[key] = name
+    out = []
+    for line in lines:
+        if line.op == "callsub" and line.args[0] in inlined:
+            out.extend(inlined[line.args[0]])
+        elif line.op == "callsub" and line.args[0] in renamed:
+            out.append(Line("callsub", (renamed[line.args[0]],)))
+        else:
+            out.append(line)
+    return out
+
+
+def remove_dead_code(lines: List[Line]) -> List[Line]:
+    refs = references(lines)
+    out = []
+    reachable = True
+    for line in lines:
+        if line.op == PRAGMA:
+            out.append(line)
+        elif line.op == LABEL:
+            if refs.get(line.args[0]):
+                out.append(line)
+                reachable = True
+        elif reachable:
+            out.append(line)
+            reachable = line.op not in TERMINATOR_OPS
+    return out
+
+
+def optimize(teal: str) -> str:
+    """Optimizes a TEAL program, see the passes above."""
+    lines = parse_lines(teal)
+    for _ in range(MAX_PASSES):
+        optimized = remove_dead_code(merge_subroutines(simplify_branches(fold(lines))))
+        if optimized == lines:
+            break
+        lines = optimized
+    return render(lines)
+
+
+def program_stats(teal: str) -> Tuple[int, int]:
+    """(bytecode size, number of opcodes) of a TEAL program, template variables included.
+    Raises AssemblerError if the program does not assemble."""
+    from .template import assemble_template_source
+
+    size = len(assemble_template_source(teal).bytecode)
+    opcodes = sum(1 for line in parse_lines(teal) if line.op not in (LABEL, PRAGMA))
+    return size, opcodes
+
+
+def optimize_with_report(teal: str) -> Tuple[str, OptimizationReport]:
+    """The optimized program and what it saved; the program is kept as is if the optimized one
+    would grow or does not assemble."""
+    bytes_before, opcodes_before = program_stats(teal)
+    optimized = optimize(teal)
+    try:
+        bytes_after, opcodes_after = program_stats(optimized)
+    except AssemblerError:
+        bytes_after = None
+    if bytes_after is None or bytes_after > bytes_before:
+        optimized, bytes_after, opcodes_after = teal, bytes_before, opcodes_before
+    return optimized, OptimizationReport(bytes_before, bytes_after, opcodes_before, opcodes_after)
@@ -0,0 +1,139 @@
+from collections import Counter, defaultdict
+from typing import Dict
+
+# Execution profile collected by the interpreter: opcode counts and cost, cost per subroutine,
+# state reads/writes per key and inner transactions.
+
+MAIN_ROUTINE = "main"
+
+
+def subroutine_names(ast, version: int = 5) -> Dict[str, str]:
+    """Maps the "subN" labels PyTeal 0.9 generates for a program to the subroutine names,
+    e.g. {"sub0": "can_cancel_order", ...}. Newer PyTeal versions already use the names as labels."""
+    from pyteal import Mode
+    from pyteal.compiler.compiler import CompileOptions, compileSubroutine
+    from pyteal.compiler.subroutines import resolveSubroutines
+
+    mapping = {}
+    compileSubroutine(ast, CompileOptions(mode=Mode.Application, version=version), mapping, {}, {})
+    return {label: subroutine.name() for subroutine, label in resolveSubroutines(mapping).items()}
+
+
+class SubroutineStats:
+    def __init__(self):
+        self.calls = 0
+        # cost of the subroutine body alone
+        self.exclusive_cost = 0
+        # cost including the subroutines it calls
+        self.inclusive_cost = 0
+
+
+class Profile:
+    def __init__(self, names: Dict[str, str] = None):
+        self.names = names or {}
+        self.cost = 0
+        self.opcodes = Counter()
+        self.opcode_costs = Counter()
+        self.subroutines: Dict[str, SubroutineStats] = defaultdict(SubroutineStats)
+        self.state_reads = Counter()
+        self.state_writes = Counter()
+        self.inner_txns = []
+        self.logs = []
+        # [(routine name, total cost when it was called)]
+        self.frames = [(MAIN_ROUTINE, 0)]
+
+    # -- interpreter hooks
+
+    def op(self, instruction, cost: int):
+        self.cost += cost
+        self.opcodes[instruction.op] += 1
+        self.opcode_costs[instruction.op] += cost
+        self.subroutines[self.frames[-1][0]].exclusive_cost += cost
+
+    def call(self, label: str):
+        name = self.names.get(label, label)
+        self.subroutines[name].calls += 1
+        self.frames.append((name, self.cost))
+
+    def ret(self):
+        name, start = self.frames.pop()
+        self.subroutines[name].inclusive_cost += self.cost - start
+
+    def finish(self):
+        # A program may return from inside a subroutine.
+        while len(self.frames) > 1:
+            self.ret()
+        main = self.subroutines[MAIN_ROUTINE]
+        main.calls += 1
+        main.inclusive_cost += self.cost - self.frames[0][1]
+        self.frames = [(MAIN_ROUTINE, self.cost)]
+
+    def state_read(self, op: str, key: bytes):
+        self.state_reads[(op, key)] += 1
+
+    def state_write(self, op: str, key: bytes):
+        self.state_writes[(op, key)] += 1
+
+    def inner(self, txn):
+        self.inner_txns.append(txn)
+
+    def log(self, data: bytes):
+        self.logs.append(data)
+
+    # -- results
+
+    def summary(self):
+        return {
+            "cost": self.cost,
+            "opcodes": sum(self.opcodes.values()),
+            "state_reads": sum(self.state_reads.values()),
+            "state_writes": sum(self.state_writes.values()),
+            "inner_txns": len(self.inner_txns),
+            "logs": len(self.logs),
+        }
+
+    def to_dict(self):
+        return {
+            **self.summary(),
+            "opcode_costs": dict(self.opcode_costs),
+            "subroutines": {
+                name: {"calls": stats.calls, "exclusive_cost": stats.exclusive_cost, "inclusive_cost": stats.inclusive_cost}
+                for name, stats in self.subroutines.items()
+            },
+            "state": {
+                f"{op} {format_key(key)}": {"reads": self.state_reads[(op, key)], "writes": self.state_writes[(op, key)]}
+                for op, key in sorted(set(self.state_reads) | set(self.state_writes))
+            },
+            "inner_txn_types": dict(Counter(txn.type for txn in self.inner_txns)),
+        }
+
+    def report(self, top: int = 10) -> str:
+        summary = self.summary()
+        lines = [
+            "cost {cost}, {opcodes} opcodes, {state_reads} state reads, {state_writes} state writes, "
+            "{inner_txns} inner txns, {logs} logs".format(**summary),
+            "",
+            f"{'subroutine':<32}{'calls':>8}{'self':>8}{'total':>8}",
+        ]
+        for name, stats in sorted(self.subroutines.items(), key=lambda item: -item[1].inclusive_cost):
+            lines.append(f"{name:<32}{stats.calls:>8}{stats.exclusive_cost:>8}{stats.inclusive_cost:>8}")
+        lines += ["", f"{'opcode':<32}{'count':>8}{'cost':>8}"]
+        for op, cost in self.opcode_costs.most_common(top):
+            lines.append(f"{op:<32}{self.opcodes[op]:>8}{cost:>8}")
+        state_keys = sorted(set(self.state_reads) | set(self.state_writes))
+        if state_keys:
+            lines += ["", f"{'state access':<48}{'reads':>8}{'writes':>8}"]
+            for op, key in state_keys:
+                label = f"{op} {format_key(key)}"
+                lines.append(f"{label:<48}{self.state_reads[(op, key)]:>8}{self.state_writes[(op, key)]:>8}")
+        return "\n".join(lines)
+
+
+def format_key(key: bytes) -> str:
+    try:
+        text = key.decode()
+        if text.isprintable():
+            return text
+    except UnicodeDecodeError:
+        pass
+    return "0x" + key.hex()
@@ -0,0 +1,137 @@
+import base64
+import json
+from functools import lru_cache
+from typing import Dict, Mapping, NamedTuple, Tuple, Union
+
+from .assembler import (
+    AssemblerError,
+    Instruction,
+    Program,
+    assemble,
+    create_constant_blocks,
+    encode_bytes,
+    encode_varint,
+    is_template_variable,
+    parse,
+)
+
+# Programs assembled once with TMPL_ placeholders and instantiated offline.
+#
+# Template variables always sit in the intcblock/bytecblock at the start of the program (see
+# create_constant_blocks), before any branch. Their placeholders are assembled as 0 and as an
+# empty byte string, one byte each, and instantiating a template replaces those bytes with the
+# varint or the length-prefixed value: the instructions after the blocks move as a whole, so the
+# relative branch offsets and the constant indexes stay valid and nothing is reassembled.
+
+TemplateValue = Union[int, bytes]
+
+INT_PLACEHOLDER = 0
+BYTES_PLACEHOLDER = b""
+
+
+class TemplateVariable(NamedTuple):
+    name: str
+    # "int" or "bytes"
+    type: str
+    # offset of the one-byte placeholder in the template bytecode
+    offset: int
+
+
+class Template(NamedTuple):
+    bytecode: bytes
+    # ordered by offset
+    variables: Tuple[TemplateVariable, ...]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "bytecode": base64.b64encode(self.bytecode).decode(),
+            "variables": [variable._asdict() for variable in self.variables],
+        }, indent=2)
+
+    @staticmethod
+    def from_json(text: str) -> "Template":
+        data = json.loads(text)
+        return Template(
+            base64.b64decode(data["bytecode"]),
+            tuple(TemplateVariable(**variable) for variable in data["variables"]),
+        )
+
+
+def substitute(program: Program, values: Mapping[str, TemplateValue]) -> Program:
+    """Replaces the template variables of a parsed program, e.g. to evaluate it with the interpreter."""
+    instructions = []
+    for instruction in program.instructions:
+        immediates = instruction.immediates
+        if instruction.op in ("int", "byte", "intcblock", "bytecblock"):
+            immediates = tuple(
+                check_value(value, values.get(value), "int" if instruction.op in ("int", "intcblock") else "bytes")
+                if is_template_variable(value) else value
+                for value in immediates
+            )
+        instructions.append(Instruction(instruction.op, immediates, instruction.line))
+    return Program(program.version, instructions, program.labels)
+
+
+def assemble_template(program: Program) -> Template:
+    """Assembles a parsed program with template variables into a Template."""
+    program = create_constant_blocks(program)
+    variables = []
+    placeholders = {}
+    offset = len(encode_varint(program.version))
+    for instruction in program.instructions:
+        if instruction.op not in ("intcblock", "bytecblock"):
+            break
+        variable_type = "int" if instruction.op == "intcblock" else "bytes"
+        # opcode and number of constants
+        offset += 1 + len(encode_varint(len(instruction.immediates)))
+        for value in instruction.immediates:
+            if is_template_variable(value):
+                if value in placeholders:
+                    raise AssemblerError(f"template variable {value} is used both as an int and as bytes")
+                variables.append(TemplateVariable(value, variable_type, offset))
+                placeholders[value] = INT_PLACEHOLDER if variable_type == "int" else BYTES_PLACEHOLDER
+                offset += 1
+            else:
+                offset += len(encode_varint(value) if variable_type == "int" else encode_bytes(value))
+    bytecode = assemble(substitute(program, placeholders))
+    return Template(bytecode, tuple(variables))
+
+
+def assemble_template_source(source: str) -> Template:
+    return assemble_template(parse(source))
+
+
+def check_value(name: str, value, variable_type: str) -> TemplateValue:
+    if value is None:
+        raise AssemblerError(f"no value for template variable {name}")
+    if variable_type == "int":
+        if not isinstance(value, int) or not 0 <= value < 2 ** 64:
+            raise AssemblerError(f"template variable {name} must be a uint64, got {value!r}")
+    elif not isinstance(value, bytes):
+        raise AssemblerError(f"template variable {name} must be bytes, got {value!r}")
+    return value
+
+
+def instantiate(template: Template, values: Mapping[str, TemplateValue]) -> bytes:
+    """Returns the bytecode of a template with its variables replaced by values.
+
+    Results are cached per template and values, instantiating the same order parameters twice
+    returns the same bytes without patching them again."""
+    unknown = set(values) - {variable.name for variable in template.variables}
+    if unknown:
+        raise AssemblerError(f"unknown template variables {', '.join(sorted(unknown))}")
+    return _instantiate(template, tuple(sorted(values.items())))
+
+
+@lru_cache(maxsize=1024)
+def _instantiate(template: Template, values: Tuple[Tuple[str, TemplateValue], ...]) -> bytes:
+    values: Dict[str, TemplateValue] = dict(values)
+    bytecode = bytearray()
+    position = 0
+    for variable in template.variables:
+        value = check_value(variable.name, values.get(variable.name), variable.type)
+        bytecode += template.bytecode[position:variable.offset]
+        bytecode += encode_varint(value) if variable.type == "int" else encode_bytes(value)
+        position = variable.offset + 1
+    bytecode += template.bytecode[position:]
+    return bytes(bytecode)
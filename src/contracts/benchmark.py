@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import sys
+
+from avm import assemble
+from scenarios import SCENARIOS, load_programs, run_scenario
+
+# Opcode cost, program size and inner transaction regression check of every router branch.
+# The current numbers are compared with benchmark_baseline.json; any increase fails the run
+# with a diff table. Run with --update after an intended change to record the new baseline.
+#
+# Usage: python3 src/contracts/benchmark.py [--update] [--baseline FILE]
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+METRICS = ("cost", "program_bytes", "inner_txns")
+
+
+def measure():
+    """Returns {"<contract> <path>": {metric: value}} for every scenario."""
+    results = {}
+    for scenario in SCENARIOS:
+        profile = run_scenario(scenario)
+        results[f"{scenario.contract} {scenario.path}"] = {
+            "cost": profile.cost,
+            "program_bytes": len(assemble(load_programs(scenario.contract).approval)),
+            "inner_txns": len(profile.inner_txns),
+        }
+    return results
+
+
+def read_baseline(path: str):
+    try:
+        with open(path, encoding="UTF-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_baseline(path: str, results):
+    with open(path, "w", encoding="UTF-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(baseline, results):
+    """Returns the (scenario, metric, baseline value, current value) rows that changed;
+    the baseline value is None for scenarios missing from the baseline."""
+    rows = []
+    for name, metrics in results.items():
+        for metric in METRICS:
+            expected = baseline.get(name, {}).get(metric)
+            if expected != metrics[metric]:
+                rows.append((name, metric, expected, metrics[metric]))
+    return rows
+
+
+def is_regression(row) -> bool:
+    _, _, expected, current = row
+    return expected is not None and current > expected
+
+
+def format_table(rows) -> str:
+    lines = [f"{'scenario':<36}{'metric':<16}{'baseline':>10}{'current':>10}{'delta':>10}"]
+    for name, metric, expected, current in rows:
+        delta = "new" if expected is None else f"{current - expected:+d}"
+        marker = "  <-- regression" if is_regression((name, metric, expected, current)) else ""
+        baseline_value = "-" if expected is None else expected
+        lines.append(f"{name:<36}{metric:<16}{baseline_value:>10}{current:>10}{delta:>10}{marker}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the contracts' cost and size against the baseline.")
+    parser.add_argument("--update", action="store_true", help="record the current numbers as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file (default: benchmark_baseline.json)")
+    args = parser.parse_args()
+
+    results = measure()
+    if args.update:
+        write_baseline(args.baseline, results)
+        print(f"Baseline of {len(results)} scenarios written to {args.baseline}")
+        return
+
+    baseline = read_baseline(args.baseline)
+    rows = compare(baseline, results)
+    removed = sorted(set(baseline) - set(results))
+    if rows:
+        print(format_table(rows))
+    for name in removed:
+        print(f"{name}: no longer benchmarked")
+    regressions = [row for row in rows if is_regression(row)]
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} regression(s) against {args.baseline}, "
+              "run with --update if the increase is intended.")
+        sys.exit(1)
+    print(f"{len(results)} scenarios, no regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+from typing import NamedTuple, Tuple
+
+# Builds every contract into ./dist in a process pool.
+# Each contract is keyed by a hash of its source, the modules it imports, the PyTeal version
+# and the TEAL version; contracts whose key matches the manifest are not rebuilt.
+# Programs of contracts with TMPL_ variables are also assembled into "<program>.template.json",
+# which deployments instantiate offline instead of compiling the TEAL (avm/template.py).
+# The programs go through the peephole optimizer (avm/optimizer.py) before being written; the
+# manifest records their size before and after it.
+#
+# Usage: python3 src/contracts/build.py [--out ./dist] [--jobs N] [--force] [--no-optimize]
+
+CONTRACTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_FILE_NAME = ".build-manifest.json"
+
+
+class Contract(NamedTuple):
+    name: str
+    source: str
+    # Local modules imported by the source, relative to CONTRACTS_DIR
+    dependencies: Tuple[str, ...]
+    # (output file name, program function name) pairs
+    programs: Tuple[Tuple[str, str], ...]
+    teal_version: int = 5
+    # Also write the assembled program templates
+    templates: bool = False
+    # The programs are logic signatures (Mode.Signature) rather than applications
+    signature: bool = False
+
+    def output_files(self) -> Tuple[str, ...]:
+        files = tuple(file_name for file_name, _ in self.programs)
+        if self.templates:
+            files += tuple(template_file_name(file_name) for file_name in files)
+        return files
+
+
+CONTRACTS = (
+    Contract(
+        "delivery",
+        "delivery/app.py",
+        ("delivery/enums.py", "utils/event_utils.py", "utils/inner_txn_utils.py", "utils/router_utils.py"),
+        (("escrow_approval.teal", "approval_program"), ("escrow_clear_program.teal", "clear_program")),
+        # Inner transaction groups (itxn_next) need TEAL v6
+        teal_version=6,
+        templates=True,
+    ),
+    Contract(
+        "delivery_packed",
+        "delivery/app.py",
+        ("delivery/enums.py", "utils/event_utils.py", "utils/inner_txn_utils.py", "utils/router_utils.py"),
+        (("escrow_packed_approval.teal", "packed_approval_program"), ("escrow_packed_clear_program.teal", "clear_program")),
+        teal_version=6,
+        templates=True,
+    ),
+    Contract(
+        "order_book",
+        "delivery/order_book_app.py",
+        ("delivery/enums.py", "utils/event_utils.py", "utils/inner_txn_utils.py"),
+        (("order_book_approval.teal", "approval_program"), ("order_book_clear_program.teal", "clear_program")),
+        teal_version=6,
+        templates=True,
+    ),
+    Contract(
+        "delivery_status",
+        "delivery/status_app.py",
+        ("delivery/enums.py", "utils/event_utils.py", "utils/router_utils.py"),
+        (("status_approval.teal", "approval_program"), ("status_clear_program.teal", "clear_program")),
+        teal_version=6,
+        templates=True,
+    ),
+    Contract(
+        "delivery_logicsig",
+        "delivery/escrow_logicsig.py",
+        ("delivery/enums.py",),
+        (("escrow_logicsig.teal", "logicsig_program"),),
+        teal_version=6,
+        templates=True,
+        signature=True,
+    ),
+    Contract(
+        "identity",
+        "identity/app.py",
+        ("utils/event_utils.py",),
+        (("identity_approval.teal", "approval_program"), ("identity_clear_program.teal", "clear")),
+    ),
+    Contract(
+        "reward",
+        "reward/app.py",
+        ("utils/event_utils.py", "utils/inner_txn_utils.py", "utils/router_utils.py"),
+        (("rewards_approval.teal", "approval_program"), ("rewards_clear_state.teal", "clear_state_program")),
+        teal_version=6,
+    ),
+)
+
+
+def template_file_name(file_name: str) -> str:
+    return os.path.splitext(file_name)[0] + ".template.json"
+
+
+def pyteal_version() -> str:
+    return version("pyteal")
+
+
+def contract_hash(contract: Contract, optimized: bool = True) -> str:
+    digest = hashlib.sha256()
+    # The templates are assembled by the local assembler
+    sources = (contract.source,) + contract.dependencies
+    if contract.templates:
+        sources += ("avm/assembler.py", "avm/template.py")
+    if optimized:
+        sources += ("avm/optimizer.py",)
+    for path in sources:
+        digest.update(path.encode())
+        with open(os.path.join(CONTRACTS_DIR, path), "rb") as f:
+            digest.update(f.read())
+    digest.update(pyteal_version().encode())
+    digest.update(str(contract.teal_version).encode())
+    digest.update(str(optimized).encode())
+    return digest.hexdigest()
+
+
+def load_contract_module(contract: Contract):
+    # Contracts import their siblings ("from enums import *") and "utils" by bare name,
+    # the same way they resolve when run as scripts with PYTHONPATH=src/contracts.
+    source_path = os.path.join(CONTRACTS_DIR, contract.source)
+    for path in (os.path.dirname(source_path), CONTRACTS_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(f"{contract.name}_contract", source_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def compile_contract(contract: Contract):
+    """Compiles all programs of a contract and returns {output file name: TEAL source}."""
+    from pyteal import Mode, compileTeal
+
+    module = load_contract_module(contract)
+    mode = Mode.Signature if contract.signature else Mode.Application
+    return {
+        file_name: compileTeal(getattr(module, function_name)(), mode=mode, version=contract.teal_version)
+        for file_name, function_name in contract.programs
+    }
+
+
+def optimize_programs(programs):
+    """Returns the optimized programs and {output file name: OptimizationReport}."""
+    from avm import optimize_with_report
+
+    optimized = {file_name: optimize_with_report(teal) for file_name, teal in programs.items()}
+    return (
+        {file_name: teal for file_name, (teal, _) in optimized.items()},
+        {file_name: report for file_name, (_, report) in optimized.items()},
+    )
+
+
+def build_contract(contract: Contract, optimized: bool = True):
+    """Returns {output file name: content} of all output files of a contract and the
+    optimization reports of its programs (empty if not optimized)."""
+    programs = compile_contract(contract)
+    reports = {}
+    if optimized:
+        programs, reports = optimize_programs(programs)
+    files = dict(programs)
+    if contract.templates:
+        from avm import assemble_template_source
+
+        for file_name, teal in programs.items():
+            files[template_file_name(file_name)] = assemble_template_source(teal).to_json() + "\n"
+    return files, reports
+
+
+def program_size(teal: str):
+    # Number of opcodes in the program, labels, comments and pragmas excluded.
+    opcodes = 0
+    for line in teal.splitlines():
+        line = line.split("//", 1)[0].strip()
+        if line and not line.startswith("#") and not line.endswith(":"):
+            opcodes += 1
+    return {"teal_bytes": len(teal.encode()), "opcodes": opcodes}
+
+
+def optimization_entry(report):
+    # Assembled size and opcodes before and after the optimizer, nothing if it did not run.
+    if report is None:
+        return {}
+    return {"optimizer": report._asdict()}
+
+
+def read_manifest(out_dir: str):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE_NAME), encoding="UTF-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(out_dir: str, manifest):
+    with open(os.path.join(out_dir, MANIFEST_FILE_NAME), "w", encoding="UTF-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def is_up_to_date(contract: Contract, key: str, entry, out_dir: str) -> bool:
+    return (
+        entry is not None
+        and entry.get("hash") == key
+        and all(os.path.exists(os.path.join(out_dir, file_name)) for file_name in contract.output_files())
+    )
+
+
+def build(out_dir: str = "./dist", jobs: int = None, force: bool = False, contracts=CONTRACTS, optimized: bool = True):
+    """Builds stale contracts and returns {name: {program file name: OptimizationReport}} of the rebuilt ones."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = read_manifest(out_dir)
+    stale = []
+    for contract in contracts:
+        key = contract_hash(contract, optimized)
+        if force or not is_up_to_date(contract, key, manifest.get(contract.name), out_dir):
+            stale.append((contract, key))
+    if not stale:
+        return {}
+
+    with ProcessPoolExecutor(max_workers=jobs or min(len(stale), os.cpu_count() or 1)) as executor:
+        results = list(executor.map(
+            build_contract, [contract for contract, _ in stale], [optimized] * len(stale)
+        ))
+
+    for (contract, key), (files, reports) in zip(stale, results):
+        for file_name, content in files.items():
+            with open(os.path.join(out_dir, file_name), "w", encoding="UTF-8") as f:
+                f.write(content)
+        manifest[contract.name] = {
+            "hash": key,
+            "pyteal": pyteal_version(),
+            "teal_version": contract.teal_version,
+            "programs": {
+                file_name: dict(program_size(files[file_name]), **optimization_entry(reports.get(file_name)))
+                for file_name, _ in contract.programs
+            },
+        }
+    write_manifest(out_dir, manifest)
+    return {contract.name: reports for (contract, _), (_, reports) in zip(stale, results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the PyTeal contracts into TEAL.")
+    parser.add_argument("--out", default="./dist", help="output directory (default: ./dist)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of compiler processes")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the sources did not change")
+    parser.add_argument("--no-optimize", action="store_true", help="write the TEAL as compiled by PyTeal")
+    args = parser.parse_args()
+
+    rebuilt = build(args.out, args.jobs, args.force, optimized=not args.no_optimize)
+    for contract in CONTRACTS:
+        print(f"{contract.name}: {'compiled' if contract.name in rebuilt else 'up to date'}")
+        for file_name, report in rebuilt.get(contract.name, {}).items():
+            print(f"  {file_name}: {report.summary()}")
+
+
+if __name__ == "__main__":
+    main()
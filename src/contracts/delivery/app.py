@@ -1,207 +1,349 @@
 from pyteal import *
 
+from utils.event_utils import *
 from utils.inner_txn_utils import *
+from utils.router_utils import *
 from enums import *
 
-@Subroutine(TealType.uint64)
-def can_complete_order():
-    order_status = App.globalGet(GlobalState.Variables.ORDER_STATUS)
-    return Seq(
-        Assert(Txn.sender() == Global.creator_address()),
-        Assert(Or(order_status == OrderStatus.DELIVERED, order_status == OrderStatus.DISPUTE)),
-        Int(1)
-    )
+# Order state shared by the guard and the handler of an action. The guard reads the fields that
+# are used more than once per call into scratch with state.load; fields used once are read
+# where they are used, which is cheaper than a store and a load.
+loaded_order_status = ScratchVar(TealType.uint64)
+loaded_courier_address = ScratchVar(TealType.bytes)
+loaded_record = ScratchVar(TealType.bytes)
 
-@Subroutine(TealType.uint64)
-def can_claim_funds():
-    courier_address = App.globalGet(GlobalState.Variables.COURIER_ADDRESS)
-    order_status = App.globalGet(GlobalState.Variables.ORDER_STATUS)
-    delivered_timestamp = App.globalGet(GlobalState.Variables.DELIVERED_TIMESTAMP)
-    confirmation_dead_line = Add(delivered_timestamp, AppParams.ACCEPT_DELIVERY_WINDOW)
-    return Seq(
-        Assert(Txn.sender() == courier_address),
-        Assert(order_status == OrderStatus.DELIVERED),
-        Assert(Global.latest_timestamp() >= confirmation_dead_line),
-        Int(1)
+def order_event(old_status, new_status, amount=Int(0)):
+    # The application holds a single order, its ID identifies the order.
+    return log_event(
+        EventType.ORDER_STATUS, Global.current_application_id(), Global.current_application_address(),
+        old_status, new_status, amount
     )
 
-@Subroutine(TealType.uint64)
-def can_mark_as_delivered():
-    courier_address = App.globalGet(GlobalState.Variables.COURIER_ADDRESS)
-    order_status = App.globalGet(GlobalState.Variables.ORDER_STATUS)
-    return Seq(
-        Assert(Txn.sender() == courier_address),
-        Assert(order_status == OrderStatus.DELIVERING),
-        Int(1)
-    )
+class KeyedOrderState:
+    """ Each order field under its own GlobalState.Variables key """
+    loaded_fields = {
+        "ORDER_STATUS": loaded_order_status,
+        "COURIER_ADDRESS": loaded_courier_address,
+    }
 
-@Subroutine(TealType.uint64)
-def can_start_disput():
-    order_status = App.globalGet(GlobalState.Variables.ORDER_STATUS)
-    return Seq(
-        Assert(Txn.sender() == Global.creator_address()),
-        Assert(order_status == OrderStatus.DELIVERED),
-        Int(1)
-    )
+    def load(self, *names):
+        return Seq([self.loaded_fields[name].store(self.get(name)) for name in names])
 
-@Subroutine(TealType.uint64)
-def can_pick_up_order():
-    courier_address = App.globalGet(GlobalState.Variables.COURIER_ADDRESS)
-    order_status = App.globalGet(GlobalState.Variables.ORDER_STATUS)
-    return Seq(
-        Assert(Txn.sender() == courier_address),
-        Assert(order_status == OrderStatus.COOKING),
-        Int(1)
-    )
+    def loaded(self, name):
+        return self.loaded_fields[name].load()
 
-@Subroutine(TealType.uint64)
-def can_cancel_order():
-    courier_address = App.globalGet(GlobalState.Variables.COURIER_ADDRESS)
-    restaurant_address = App.globalGet(GlobalState.Variables.RESTAURANT_ADDRESS)
-    order_status = App.globalGet(GlobalState.Variables.ORDER_STATUS)
-    return Seq(
-        Assert(Or(Txn.sender() == courier_address, Txn.sender() == restaurant_address)),
-        Assert(order_status == OrderStatus.COOKING),
-        Int(1)
-    )
+    def get(self, name):
+        return App.globalGet(getattr(GlobalState.Variables, name))
 
-@Subroutine(TealType.uint64)
-def cancel_order():
-    return Seq(
-        App.globalPut(GlobalState.Variables.ORDER_STATUS, OrderStatus.CANCELED),
-        refund(),
-        Int(1)
-    )
+    def put(self, **values):
+        return Seq([App.globalPut(getattr(GlobalState.Variables, name), value) for name, value in values.items()])
 
-@Subroutine(TealType.uint64)
-def pick_up_order():
-    return Seq(
-        App.globalPut(GlobalState.Variables.ORDER_STATUS, OrderStatus.DELIVERING),
-        Int(1)
-    )
+    def create(self, **values):
+        return self.put(**values)
 
-@Subroutine(TealType.uint64)
-def start_disput():
-    return Seq(
-        App.globalPut(GlobalState.Variables.ORDER_STATUS, OrderStatus.DISPUTE),
-        Int(1)
-    )
+class PackedOrderState:
+    """ All order fields in one byte slice at the GlobalState.Record offsets: a call reads the
+    record once, whatever fields it uses, and writes it back once, whatever fields it updates. """
+    field_types = {name: field_type for name, field_type, _ in ORDER_FIELDS}
+    field_sizes = {name: size for name, _, size in ORDER_FIELDS}
 
-@Subroutine(TealType.uint64)
-def handle_creation():
-    courier_address = Txn.application_args[AppParams.COURIER_ADDRESS_INDEX]
-    restaurant_address = Txn.application_args[AppParams.RESTAURANT_ADDRESS_INDEX]
-    reward_amount = Btoi(Txn.application_args[AppParams.COURIER_REWARD_AMOUNT_INDEX])
-    return Seq(
-        App.globalPut(GlobalState.Variables.COURIER_ADDRESS, courier_address),
-        App.globalPut(GlobalState.Variables.RESTAURANT_ADDRESS, restaurant_address),
-        App.globalPut(GlobalState.Variables.COURIER_REWARD_AMOUNT, reward_amount),
-        App.globalPut(GlobalState.Variables.ORDER_STATUS, OrderStatus.COOKING),
-        Int(1)
-    )
+    def load(self, *names):
+        return loaded_record.store(App.globalGet(GlobalState.Record.KEY))
 
-@Subroutine(TealType.none)
-def send_tip_to(address):
-    # Transfer all available PLATO tokens to a courier and close the holding ASA to close the escrow account.
-    # https://developer.algorand.org/docs/get-details/transactions/#close-an-account
-    return inner_asset_transfer_txn(AppParams.ASA_ID, Int(0), address, address)
+    def loaded(self, name):
+        return self.get(name)
 
-@Subroutine(TealType.none)
-def release_funds():
-    amount = App.globalGet(GlobalState.Variables.COURIER_REWARD_AMOUNT)
-    courier_address = App.globalGet(GlobalState.Variables.COURIER_ADDRESS)
-    restaurant_address = App.globalGet(GlobalState.Variables.RESTAURANT_ADDRESS)
-    return Seq(
-        send_tip_to(courier_address),
-        inner_payment_txn(amount, courier_address, restaurant_address)
-    )
+    def get(self, name):
+        offset = getattr(GlobalState.Record, name)
+        if self.field_types[name] == TealType.uint64:
+            return ExtractUint64(loaded_record.load(), Int(offset))
+        return Extract(loaded_record.load(), Int(offset), Int(self.field_sizes[name]))
+
+    def put(self, **values):
+        # TEAL v6 has no "replace" opcode, the record is rebuilt around the updated fields
+        parts = []
+        unchanged_offset = None
+        for name, field_type, size in ORDER_FIELDS:
+            offset = getattr(GlobalState.Record, name)
+            if name not in values:
+                if unchanged_offset is None:
+                    unchanged_offset = offset
+                continue
+            if unchanged_offset is not None:
+                parts.append(Extract(loaded_record.load(), Int(unchanged_offset), Int(offset - unchanged_offset)))
+                unchanged_offset = None
+            parts.append(Itob(values[name]) if field_type == TealType.uint64 else values[name])
+        if unchanged_offset is not None:
+            parts.append(Extract(loaded_record.load(), Int(unchanged_offset), Int(GlobalState.Record.LENGTH - unchanged_offset)))
+        return App.globalPut(GlobalState.Record.KEY, parts[0] if len(parts) == 1 else Concat(*parts))
+
+    def create(self, **values):
+        record = Concat(*[
+            values[name] if field_type == TealType.bytes else Itob(values.get(name, Int(0)))
+            for name, field_type, _ in ORDER_FIELDS
+        ])
+        return Seq(
+            loaded_record.store(record),
+            # the addresses are 32 bytes, or the offsets of the following fields would be off
+            Assert(Len(loaded_record.load()) == Int(GlobalState.Record.LENGTH)),
+            App.globalPut(GlobalState.Record.KEY, loaded_record.load())
+        )
+
+def order_actions(state):
+    """ {ActionType name: guard and handler} of the actions reading and writing the order through state """
+
+    @Subroutine(TealType.uint64)
+    def can_complete_order():
+        return Seq(
+            # the courier address is used by release_funds
+            state.load("ORDER_STATUS", "COURIER_ADDRESS"),
+            Assert(Txn.sender() == Global.creator_address()),
+            Assert(Or(state.loaded("ORDER_STATUS") == OrderStatus.DELIVERED, state.loaded("ORDER_STATUS") == OrderStatus.DISPUTE)),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def can_claim_funds():
+        order_status = state.get("ORDER_STATUS")
+        delivered_timestamp = state.get("DELIVERED_TIMESTAMP")
+        confirmation_dead_line = Add(delivered_timestamp, AppParams.ACCEPT_DELIVERY_WINDOW)
+        return Seq(
+            # the courier address is used by release_funds
+            state.load("COURIER_ADDRESS"),
+            Assert(Txn.sender() == state.loaded("COURIER_ADDRESS")),
+            Assert(order_status == OrderStatus.DELIVERED),
+            Assert(Global.latest_timestamp() >= confirmation_dead_line),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def can_mark_as_delivered():
+        courier_address = state.get("COURIER_ADDRESS")
+        order_status = state.get("ORDER_STATUS")
+        return Seq(
+            state.load(),
+            Assert(Txn.sender() == courier_address),
+            Assert(order_status == OrderStatus.DELIVERING),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def can_start_disput():
+        order_status = state.get("ORDER_STATUS")
+        return Seq(
+            state.load(),
+            Assert(Txn.sender() == Global.creator_address()),
+            Assert(order_status == OrderStatus.DELIVERED),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def can_pick_up_order():
+        courier_address = state.get("COURIER_ADDRESS")
+        order_status = state.get("ORDER_STATUS")
+        return Seq(
+            state.load(),
+            Assert(Txn.sender() == courier_address),
+            Assert(order_status == OrderStatus.COOKING),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def can_cancel_order():
+        courier_address = state.get("COURIER_ADDRESS")
+        restaurant_address = state.get("RESTAURANT_ADDRESS")
+        order_status = state.get("ORDER_STATUS")
+        return Seq(
+            state.load(),
+            Assert(Or(Txn.sender() == courier_address, Txn.sender() == restaurant_address)),
+            Assert(order_status == OrderStatus.COOKING),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def cancel_order():
+        return Seq(
+            state.put(ORDER_STATUS=OrderStatus.CANCELED),
+            refund(),
+            order_event(OrderStatus.COOKING, OrderStatus.CANCELED),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def pick_up_order():
+        return Seq(
+            state.put(ORDER_STATUS=OrderStatus.DELIVERING),
+            order_event(OrderStatus.COOKING, OrderStatus.DELIVERING),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def start_disput():
+        return Seq(
+            state.put(ORDER_STATUS=OrderStatus.DISPUTE),
+            order_event(OrderStatus.DELIVERED, OrderStatus.DISPUTE),
+            Int(1)
+        )
+
+    @Subroutine(TealType.none)
+    def release_funds():
+        # the courier address is loaded by the guard of the action
+        amount = state.get("COURIER_REWARD_AMOUNT")
+        restaurant_address = state.get("RESTAURANT_ADDRESS")
+        courier_address = state.loaded("COURIER_ADDRESS")
+        # Transfer all available PLATO tokens to a courier and close the holding ASA to close the escrow account,
+        # then pay the courier and close the escrow to the restaurant, both in one inner group.
+        # https://developer.algorand.org/docs/get-details/transactions/#close-an-account
+        return InnerTxnGroupBuilder().asset_transfer(
+            AppParams.ASA_ID, Int(0), courier_address, courier_address
+        ).payment(
+            amount, courier_address, restaurant_address
+        ).submit()
+
+    @Subroutine(TealType.uint64)
+    def complete_order():
+        return Seq(
+            state.put(ORDER_STATUS=OrderStatus.COMPLETED),
+            release_funds(),
+            # the status loaded by the guard, DELIVERED or DISPUTE; the amount of the courier payment
+            order_event(state.loaded("ORDER_STATUS"), OrderStatus.COMPLETED, InnerTxn.amount()),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def claim_funds():
+        return Seq(
+            state.put(ORDER_STATUS=OrderStatus.COMPLETED),
+            release_funds(),
+            order_event(OrderStatus.DELIVERED, OrderStatus.COMPLETED, InnerTxn.amount()),
+            Int(1)
+        )
+
+    @Subroutine(TealType.uint64)
+    def food_delivered():
+        return Seq(
+            state.put(DELIVERED_TIMESTAMP=Global.latest_timestamp(), ORDER_STATUS=OrderStatus.DELIVERED),
+            order_event(OrderStatus.DELIVERING, OrderStatus.DELIVERED),
+            Int(1)
+        )
+
+    return {
+        "CANCEL": And(can_cancel_order(), cancel_order()),
+        "PICK_UP_ORDER": And(can_pick_up_order(), pick_up_order()),
+        "START_DISPUTE": And(can_start_disput(), start_disput()),
+        "COMPLETE_ORDER": And(can_complete_order(), complete_order()),
+        "DELIVERED": And(can_mark_as_delivered(), food_delivered()),
+        "CLAIM_FUNDS": And(can_claim_funds(), claim_funds()),
+    }
 
 @Subroutine(TealType.none)
 def refund():
     # Set amount to zero because we want to sent the escrow balance to the "close-to" account.
     amount = Int(0)
     eater_address = Global.creator_address()
-    return Seq(
-        inner_asset_transfer_txn(AppParams.ASA_ID, amount, eater_address, eater_address),
-        inner_payment_txn(amount, eater_address, eater_address)
-    )
+    return InnerTxnGroupBuilder().asset_transfer(
+        AppParams.ASA_ID, amount, eater_address, eater_address
+    ).payment(
+        amount, eater_address, eater_address
+    ).submit()
 
 @Subroutine(TealType.uint64)
-def complete_order():
-    return Seq(
-        App.globalPut(GlobalState.Variables.ORDER_STATUS, OrderStatus.COMPLETED),
-        release_funds(),
-        Int(1)
-    )
-
-@Subroutine(TealType.uint64)
-def claim_funds():
-    return Seq(
-        App.globalPut(GlobalState.Variables.ORDER_STATUS, OrderStatus.COMPLETED),
-        release_funds(),
-        Int(1)
-    )
-
-@Subroutine(TealType.uint64)
-def food_delivered():
+def asa_opt_in():
     return Seq(
-        App.globalPut(GlobalState.Variables.DELIVERED_TIMESTAMP, Global.latest_timestamp()),
-        App.globalPut(GlobalState.Variables.ORDER_STATUS, OrderStatus.DELIVERED),
+        InnerTxnGroupBuilder().asset_opt_in(
+            AppParams.ASA_ID,
+            Global.current_application_address()
+        ).submit(),
         Int(1)
     )
 
-@Subroutine(TealType.uint64)
-def asa_opt_in():
+def handle_creation(state):
+    courier_address = Txn.application_args[AppParams.COURIER_ADDRESS_INDEX]
+    restaurant_address = Txn.application_args[AppParams.RESTAURANT_ADDRESS_INDEX]
+    reward_amount = Btoi(Txn.application_args[AppParams.COURIER_REWARD_AMOUNT_INDEX])
     return Seq(
-        inner_asset_opt_in(
-            AppParams.ASA_ID,
-            Global.current_application_address()
+        state.create(
+            COURIER_ADDRESS=courier_address,
+            RESTAURANT_ADDRESS=restaurant_address,
+            COURIER_REWARD_AMOUNT=reward_amount,
+            ORDER_STATUS=OrderStatus.COOKING,
         ),
+        order_event(Int(0), OrderStatus.COOKING, reward_amount),
         Int(1)
     )
 
-def approval_program():
+def approval_program(packed=False):
     # Mode.Application specifies that this is a smart contract
+    # packed=True keeps the order in one record (GlobalState.Record, GlobalState.PackedSchema)
+    state = PackedOrderState() if packed else KeyedOrderState()
+    actions = order_actions(state)
 
     handle_optin = Return(Int(1))
     handle_closeout = Return(Int(1))
     handle_updateapp = Return(Seq(
-        App.globalPut(GlobalState.Variables.ORDER_STATUS, OrderStatus.DELIVERING),
+        state.load(),
+        order_event(state.get("ORDER_STATUS"), OrderStatus.DELIVERING),
+        state.put(ORDER_STATUS=OrderStatus.DELIVERING),
         Int(1)
     ))
     handle_deleteapp = Return(Int(1))
-    handle_claim_funds = And(can_claim_funds(), claim_funds())
-    handle_complete_order = And(can_complete_order(), complete_order())
-    handle_delivered = And(can_mark_as_delivered(), food_delivered())
-    handle_start_dispute = And(can_start_disput(), start_disput())
-    handle_pick_up_order = And(can_pick_up_order(), pick_up_order())
-    handle_cancel_order = And(can_cancel_order(), cancel_order())
+    handle_claim_funds = actions["CLAIM_FUNDS"]
+    handle_complete_order = actions["COMPLETE_ORDER"]
+    handle_delivered = actions["DELIVERED"]
+    handle_start_dispute = actions["START_DISPUTE"]
+    handle_pick_up_order = actions["PICK_UP_ORDER"]
+    handle_cancel_order = actions["CANCEL"]
 
+    # The action is a one-byte ActionCode or, for older clients, an ActionType name matched one
+    # by one and translated to its code; either way it is routed by the jump table.
     action_type = Txn.application_args[AppParams.ACTION_TYPE_PARAM_INDEX]
-    handle_noop = Cond(
-       [BytesEq(action_type, ActionType.CANCEL), Return(handle_cancel_order)],
-       [BytesEq(action_type, ActionType.PICK_UP_ORDER), Return(handle_pick_up_order)],
-       [BytesEq(action_type, ActionType.START_DISPUTE), Return(handle_start_dispute)],
-       [BytesEq(action_type, ActionType.COMPLETE_ORDER), Return(handle_complete_order)],
-       [BytesEq(action_type, ActionType.DELIVERED), Return(handle_delivered)],
-       [BytesEq(action_type, ActionType.CLAIM_FUNDS), Return(handle_claim_funds)],
-       [BytesEq(action_type, ActionType.ASA_OPT_IN), Return(asa_opt_in())],
-   )
-
-    return Cond(
-        [Txn.application_id() == Int(0), Return(handle_creation())],
+    action_code = ScratchVar(TealType.uint64)
+    action_name_code = Cond(
+        [BytesEq(action_type, ActionType.CANCEL), Int(ActionCode.CANCEL)],
+        [BytesEq(action_type, ActionType.PICK_UP_ORDER), Int(ActionCode.PICK_UP_ORDER)],
+        [BytesEq(action_type, ActionType.START_DISPUTE), Int(ActionCode.START_DISPUTE)],
+        [BytesEq(action_type, ActionType.COMPLETE_ORDER), Int(ActionCode.COMPLETE_ORDER)],
+        [BytesEq(action_type, ActionType.DELIVERED), Int(ActionCode.DELIVERED)],
+        [BytesEq(action_type, ActionType.CLAIM_FUNDS), Int(ActionCode.CLAIM_FUNDS)],
+        [BytesEq(action_type, ActionType.ASA_OPT_IN), Int(ActionCode.ASA_OPT_IN)],
+    )
+    handle_noop = Seq(
+        action_code.store(If(Len(action_type) == ActionCode.LENGTH).Then(Btoi(action_type)).Else(action_name_code)),
+        jump_table(action_code.load(), {
+            ActionCode.CANCEL: Return(handle_cancel_order),
+            ActionCode.PICK_UP_ORDER: Return(handle_pick_up_order),
+            ActionCode.START_DISPUTE: Return(handle_start_dispute),
+            ActionCode.COMPLETE_ORDER: Return(handle_complete_order),
+            ActionCode.DELIVERED: Return(handle_delivered),
+            ActionCode.CLAIM_FUNDS: Return(handle_claim_funds),
+            ActionCode.ASA_OPT_IN: Return(asa_opt_in()),
+        })
+    )
+    handle_other_calls = Cond(
         [Txn.on_completion() == OnComplete.OptIn, handle_optin],
         [Txn.on_completion() == OnComplete.CloseOut, handle_closeout],
         [Txn.on_completion() == OnComplete.UpdateApplication, handle_updateapp],
         [Txn.on_completion() == OnComplete.DeleteApplication, handle_deleteapp],
-        [Txn.on_completion() == OnComplete.NoOp, handle_noop]
     )
 
+    # Order actions are NoOp calls, tested right after the creation; NoOp is zero and an
+    # application ID is never zero once created, so each test is a field and a branch.
+    return If(Txn.application_id()).Then(
+        If(Txn.on_completion()).Then(handle_other_calls).Else(handle_noop)
+    ).Else(
+        Return(handle_creation(state))
+    )
+
+def packed_approval_program():
+    return approval_program(packed=True)
+
 def clear_program():
     return Return(Int(1))
 
 if __name__ == "__main__":
     with open("./dist/escrow_approval.teal", "w", encoding="UTF-8") as f:
-        f.write(compileTeal(approval_program(), mode=Mode.Application, version=5))
+        f.write(compileTeal(approval_program(), mode=Mode.Application, version=6))
+    with open("./dist/escrow_packed_approval.teal", "w", encoding="UTF-8") as f:
+        f.write(compileTeal(packed_approval_program(), mode=Mode.Application, version=6))
     with open("./dist/escrow_clear_program.teal", "w", encoding="UTF-8") as f:
-        f.write(compileTeal(clear_program(), mode=Mode.Application, version=5))
+        f.write(compileTeal(clear_program(), mode=Mode.Application, version=6))
@@ -1,4 +1,4 @@
-from pyteal import TealType, Int, Bytes
+from pyteal import TealType, Int, Bytes, Tmpl
 
 class ActionType:
     """ ActionType the list of supported actions """
@@ -9,6 +9,18 @@ class ActionType:
     START_DISPUTE: TealType.bytes = Bytes("START_DISPUTE")
     CANCEL: TealType.bytes = Bytes("CANCEL")
     PICK_UP_ORDER: TealType.bytes = Bytes("PICK_UP_ORDER")
+    PLACE_ORDER: TealType.bytes = Bytes("PLACE_ORDER")
+
+class ActionCode:
+    """ one-byte action codes routed through a jump table, an alternative to the ActionType names """
+    CANCEL = 1
+    PICK_UP_ORDER = 2
+    START_DISPUTE = 3
+    COMPLETE_ORDER = 4
+    DELIVERED = 5
+    CLAIM_FUNDS = 6
+    ASA_OPT_IN = 7
+    LENGTH: TealType.uint64 = Int(1)
 
 class OrderStatus:
     COOKING: TealType.uint64 = Int(1)
@@ -19,19 +31,52 @@ class OrderStatus:
     CANCELED: TealType.uint64 = Int(6)
 
 class AppParams:
-    ASA_ID: TealType.uint64 = Int(1)
-    ACCEPT_DELIVERY_WINDOW: TealType.uint64 = Int(30) # seconds
+    # Template variables, set per deployment when the assembled program is instantiated (avm/template.py)
+    ASA_ID: TealType.uint64 = Tmpl.Int("TMPL_ASA_ID")
+    ACCEPT_DELIVERY_WINDOW: TealType.uint64 = Tmpl.Int("TMPL_ACCEPT_DELIVERY_WINDOW") # seconds
     ACTION_TYPE_PARAM_INDEX = 0
     COURIER_ADDRESS_INDEX = 0
     RESTAURANT_ADDRESS_INDEX = 1
     COURIER_REWARD_AMOUNT_INDEX = 2
 
+# Fields of an order escrow: (GlobalState.Variables name, type, size in the packed record).
+# The escrow keeps each field under its own GlobalState.Variables key or, with the packed layout
+# (approval_program(packed=True)), all of them in one byte slice at the GlobalState.Record offsets.
+ORDER_FIELDS = (
+    ("COURIER_ADDRESS", TealType.bytes, 32),
+    ("RESTAURANT_ADDRESS", TealType.bytes, 32),
+    ("COURIER_REWARD_AMOUNT", TealType.uint64, 8),
+    ("ORDER_STATUS", TealType.uint64, 8),
+    ("DELIVERED_TIMESTAMP", TealType.uint64, 8),
+)
+
+def count_fields(fields, value_type):
+    return sum(1 for _, field_type, _ in fields if field_type == value_type)
+
+def record_offsets(fields):
+    """ {field name: byte offset} of the fields laid out back to back, and "LENGTH" """
+    offsets = {}
+    offset = 0
+    for name, _, size in fields:
+        offsets[name] = offset
+        offset += size
+    offsets["LENGTH"] = offset
+    return offsets
+
 class GlobalState:
     """ wrapper class for access to predetermined Global State properties"""
     class Schema:
-        """ Global State Schema """
-        NUM_UINTS: TealType.uint64 = Int(3)
-        NUM_BYTESLICES: TealType.uint64 = Int(2)
+        """ Global State Schema, one key per order field """
+        NUM_UINTS: TealType.uint64 = Int(count_fields(ORDER_FIELDS, TealType.uint64))
+        NUM_BYTESLICES: TealType.uint64 = Int(count_fields(ORDER_FIELDS, TealType.bytes))
+
+    class PackedSchema:
+        """ Global State Schema of the packed layout, the record """
+        NUM_UINTS: TealType.uint64 = Int(0)
+        NUM_BYTESLICES: TealType.uint64 = Int(1)
+
+    # Byte offsets of the order fields in the packed record, stored under Record.KEY
+    Record = type("Record", (), {"KEY": Bytes("o"), **record_offsets(ORDER_FIELDS)})
 
     class Variables:
         """ Global State Variables """
@@ -40,3 +85,100 @@ class GlobalState:
         DELIVERED_TIMESTAMP: TealType.bytes = Bytes("deliveredTime")
         COURIER_REWARD_AMOUNT: TealType.bytes = Bytes("courierRewardAmount")
         ORDER_STATUS: TealType.bytes = Bytes("orderStatus")
+
+# Fields of an order of the order book, (name, type, size) as ORDER_FIELDS
+ORDER_BOOK_RECORD_FIELDS = (
+    ("CUSTOMER_ADDRESS", TealType.bytes, 32),
+    ("COURIER_ADDRESS", TealType.bytes, 32),
+    ("RESTAURANT_ADDRESS", TealType.bytes, 32),
+    ("ORDER_AMOUNT", TealType.uint64, 8),
+    ("COURIER_REWARD_AMOUNT", TealType.uint64, 8),
+    ("TIPS_AMOUNT", TealType.uint64, 8),
+)
+# and of its state, which changes with every action
+ORDER_BOOK_STATE_FIELDS = (
+    ("ORDER_STATUS", TealType.uint64, 8),
+    ("DELIVERED_TIMESTAMP", TealType.uint64, 8),
+)
+
+class OrderBook:
+    """ wrapper class for the multi-order escrow application (order_book_app.py) """
+    class Params:
+        """ Application arguments, accounts and group positions of an order call """
+        ACTION_TYPE_PARAM_INDEX = 0
+        ORDER_ID_PARAM_INDEX = 1
+        # PLACE_ORDER only
+        COURIER_ADDRESS_INDEX = 2
+        RESTAURANT_ADDRESS_INDEX = 3
+        COURIER_REWARD_AMOUNT_INDEX = 4
+        # Txn.accounts index of the customer who owns the order (0 is always the sender)
+        CUSTOMER_ACCOUNT_INDEX = 1
+        # PLACE_ORDER must be preceded by [payment, tips asset transfer] in the same group
+        PAYMENT_TXN_OFFSET = 2
+        TIPS_TXN_OFFSET = 1
+        ORDER_ID_LENGTH: TealType.uint64 = Int(8)
+        # Covers the inner transaction fees of the most expensive settlement (release_funds)
+        FEE_RESERVE: TealType.uint64 = Int(3000) # microAlgos
+
+    # Byte offsets of an order record stored in global state under the order ID
+    Record = type("Record", (), record_offsets(ORDER_BOOK_RECORD_FIELDS))
+
+    # Byte offsets of the status of an order, stored in global state under the order ID followed by KEY_SUFFIX
+    State = type("State", (), {"KEY_SUFFIX": Bytes("s"), **record_offsets(ORDER_BOOK_STATE_FIELDS)})
+
+    class Schema:
+        """ Global State Schema, a record and a state per open order """
+        MAX_OPEN_ORDERS = 32
+        NUM_UINTS: TealType.uint64 = Int(0)
+        NUM_BYTESLICES: TealType.uint64 = Int(2 * MAX_OPEN_ORDERS)
+
+# Fields of an order of the shared status app, (name, type, size) as ORDER_FIELDS
+STATUS_RECORD_FIELDS = (
+    ("COURIER_ADDRESS", TealType.bytes, 32),
+    ("RESTAURANT_ADDRESS", TealType.bytes, 32),
+    ("CUSTOMER_ADDRESS", TealType.bytes, 32),
+    ("ORDER_STATUS", TealType.uint64, 8),
+    ("DELIVERED_TIMESTAMP", TealType.uint64, 8),
+    ("DEADLINE", TealType.uint64, 8),
+)
+
+class LogicSigEscrow:
+    """ wrapper class for the per-order logic signature escrow (escrow_logicsig.py) and the
+    shared application tracking the status of those orders (status_app.py) """
+    class Template:
+        """ Template variables of the logic signature, its address is derived from their values """
+        STATUS_APP_ID: TealType.uint64 = Tmpl.Int("TMPL_STATUS_APP_ID")
+        COURIER_ADDRESS: TealType.bytes = Tmpl.Bytes("TMPL_COURIER_ADDRESS")
+        RESTAURANT_ADDRESS: TealType.bytes = Tmpl.Bytes("TMPL_RESTAURANT_ADDRESS")
+        CUSTOMER_ADDRESS: TealType.bytes = Tmpl.Bytes("TMPL_CUSTOMER_ADDRESS")
+        COURIER_REWARD_AMOUNT: TealType.uint64 = Tmpl.Int("TMPL_COURIER_REWARD_AMOUNT")
+        # round after which the customer can cancel an order nobody picked up
+        DEADLINE: TealType.uint64 = Tmpl.Int("TMPL_DEADLINE")
+        # 8 bytes, tells apart the escrows of orders with the same parties and amount
+        ORDER_ID: TealType.bytes = Tmpl.Bytes("TMPL_ORDER_ID")
+
+    class Params:
+        """ Application arguments, accounts and group positions of the status app calls """
+        ACTION_TYPE_PARAM_INDEX = 0
+        # Txn.accounts index of the escrow of the order (0 is always the sender)
+        ESCROW_ACCOUNT_INDEX = 1
+        # opt-in of the escrow, the arguments are checked against the template by the logic signature
+        COURIER_ADDRESS_INDEX = 0
+        RESTAURANT_ADDRESS_INDEX = 1
+        CUSTOMER_ADDRESS_INDEX = 2
+        DEADLINE_INDEX = 3
+        # CANCEL, COMPLETE_ORDER and CLAIM_FUNDS close the escrow: [action call, escrow close out
+        # of the status app, escrow asset close, escrow payment close]
+        ACTION_TXN_INDEX = 0
+        CLOSE_OUT_TXN_INDEX = 1
+        ASSET_CLOSE_TXN_INDEX = 2
+        PAYMENT_CLOSE_TXN_INDEX = 3
+        SETTLEMENT_GROUP_SIZE = 4
+
+    # Byte offsets of the order record stored in the escrow's local state under Record.KEY
+    Record = type("Record", (), {"KEY": Bytes("o"), **record_offsets(STATUS_RECORD_FIELDS)})
+
+    class Schema:
+        """ Local State Schema of an escrow """
+        NUM_UINTS: TealType.uint64 = Int(0)
+        NUM_BYTESLICES: TealType.uint64 = Int(1)
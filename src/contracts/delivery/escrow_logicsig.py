@@ -0,0 +1,120 @@
+from pyteal import *
+
+from enums import *
+
+# Logic signature escrow of one order, the account holding its funds when orders are tracked by
+# the shared status app (status_app.py) instead of an application per order.
+# The program is a template filled with the parties and the amounts of the order, so its address
+# is known before anything is sent: placing an order funds that address and opts it in, with no
+# application to create and no program to compile.
+#
+# The escrow never pays fees, the other transactions of its groups pool them. It signs:
+#  - its opt-in to AppParams.ASA_ID
+#  - its opt-in to the status app, with arguments matching the template
+#  - its close out of the status app, which the app only accepts for settled orders
+#  - the asset and payment closing it, in a group whose first transaction is an action of the
+#    status app on this escrow: CLAIM_FUNDS and COMPLETE_ORDER pay the courier reward and close
+#    to the restaurant, CANCEL closes everything to the customer
+#
+# And does not short-circuit in TEAL and reading a missing argument or account fails the
+# program, so the fields of other transactions are only read once If made sure they exist.
+
+action = Gtxn[LogicSigEscrow.Params.ACTION_TXN_INDEX]
+action_code = action.application_args[LogicSigEscrow.Params.ACTION_TYPE_PARAM_INDEX]
+
+def is_action(*codes):
+    return Or(*[action_code == Bytes("base16", bytes([code]).hex()) for code in codes])
+
+def is_release():
+    return is_action(ActionCode.COMPLETE_ORDER, ActionCode.CLAIM_FUNDS)
+
+def is_refund():
+    return is_action(ActionCode.CANCEL)
+
+def settlement(position, payout):
+    """ Whether the transaction at position of a settlement group of this escrow pays out as payout """
+    return If(And(
+        Global.group_size() == Int(LogicSigEscrow.Params.SETTLEMENT_GROUP_SIZE),
+        Txn.group_index() == Int(position),
+        action.type_enum() == TxnType.ApplicationCall,
+    )).Then(And(
+        action.application_id() == LogicSigEscrow.Template.STATUS_APP_ID,
+        action.on_completion() == OnComplete.NoOp,
+        action.accounts[LogicSigEscrow.Params.ESCROW_ACCOUNT_INDEX] == Txn.sender(),
+        payout,
+    )).Else(
+        Int(0)
+    )
+
+def asset_transfer():
+    is_opt_in = And(
+        Txn.asset_receiver() == Txn.sender(),
+        Txn.asset_amount() == Int(0),
+        Txn.asset_close_to() == Global.zero_address(),
+    )
+    # the tips go where the payment closes
+    close_to = If(is_release()).Then(
+        LogicSigEscrow.Template.COURIER_ADDRESS
+    ).Else(
+        LogicSigEscrow.Template.CUSTOMER_ADDRESS
+    )
+    is_close = settlement(LogicSigEscrow.Params.ASSET_CLOSE_TXN_INDEX, And(
+        Or(is_release(), is_refund()),
+        Txn.asset_amount() == Int(0),
+        Txn.asset_receiver() == close_to,
+        Txn.asset_close_to() == close_to,
+    ))
+    return And(
+        Txn.xfer_asset() == AppParams.ASA_ID,
+        Txn.asset_sender() == Global.zero_address(),
+        If(is_opt_in).Then(Int(1)).Else(is_close),
+    )
+
+def payment():
+    is_release_payment = And(
+        is_release(),
+        Txn.receiver() == LogicSigEscrow.Template.COURIER_ADDRESS,
+        Txn.amount() == LogicSigEscrow.Template.COURIER_REWARD_AMOUNT,
+        Txn.close_remainder_to() == LogicSigEscrow.Template.RESTAURANT_ADDRESS,
+    )
+    is_refund_payment = And(
+        is_refund(),
+        Txn.receiver() == LogicSigEscrow.Template.CUSTOMER_ADDRESS,
+        Txn.amount() == Int(0),
+        Txn.close_remainder_to() == LogicSigEscrow.Template.CUSTOMER_ADDRESS,
+    )
+    return settlement(LogicSigEscrow.Params.PAYMENT_CLOSE_TXN_INDEX, Or(is_release_payment, is_refund_payment))
+
+def application_call():
+    opt_in_args_match = And(
+        Txn.application_args[LogicSigEscrow.Params.COURIER_ADDRESS_INDEX] == LogicSigEscrow.Template.COURIER_ADDRESS,
+        Txn.application_args[LogicSigEscrow.Params.RESTAURANT_ADDRESS_INDEX] == LogicSigEscrow.Template.RESTAURANT_ADDRESS,
+        Txn.application_args[LogicSigEscrow.Params.CUSTOMER_ADDRESS_INDEX] == LogicSigEscrow.Template.CUSTOMER_ADDRESS,
+        Btoi(Txn.application_args[LogicSigEscrow.Params.DEADLINE_INDEX]) == LogicSigEscrow.Template.DEADLINE,
+    )
+    is_opt_in = If(And(
+        Txn.on_completion() == OnComplete.OptIn,
+        Txn.application_args.length() == Int(4),
+    )).Then(opt_in_args_match).Else(Int(0))
+    return And(
+        Txn.application_id() == LogicSigEscrow.Template.STATUS_APP_ID,
+        If(Txn.on_completion() == OnComplete.CloseOut).Then(Int(1)).Else(is_opt_in),
+    )
+
+def logicsig_program():
+    # Mode.Signature specifies that this is a logic signature
+    return Seq(
+        Assert(Len(LogicSigEscrow.Template.ORDER_ID) == Int(8)),
+        Assert(Txn.fee() == Int(0)),
+        Assert(Txn.rekey_to() == Global.zero_address()),
+        Return(Cond(
+            [Txn.type_enum() == TxnType.AssetTransfer, asset_transfer()],
+            [Txn.type_enum() == TxnType.Payment, payment()],
+            [Txn.type_enum() == TxnType.ApplicationCall, application_call()],
+            [Int(1), Int(0)],
+        ))
+    )
+
+if __name__ == "__main__":
+    with open("./dist/escrow_logicsig.teal", "w", encoding="UTF-8") as f:
+        f.write(compileTeal(logicsig_program(), mode=Mode.Signature, version=6))
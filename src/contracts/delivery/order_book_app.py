@@ -0,0 +1,320 @@
+from pyteal import *
+
+from utils.event_utils import *
+from utils.inner_txn_utils import *
+from enums import *
+
+# Long-lived delivery escrow holding many concurrent orders.
+# Each open order lives in the application's global state: a packed record of its parties and
+# amounts (see OrderBook.Record) under its 8-byte order ID, and its status (OrderBook.State)
+# under the order ID followed by OrderBook.State.KEY_SUFFIX. The application owns that state,
+# so no party can drop an order which still holds escrowed funds, the way a customer clearing
+# its local state could. Two global byte slices per order: an order book holds up to
+# OrderBook.Schema.MAX_OPEN_ORDERS open orders, more need more order books.
+#
+# Place order group:
+#  0 - payment customer -> app address (order total price + OrderBook.Params.FEE_RESERVE)
+#  1 - asset transfer of AppParams.ASA_ID customer -> app address (tips, can be zero)
+#  2 - app call [PLACE_ORDER, order id, courier address, restaurant address, courier reward amount]
+#
+# Order calls:
+#  application args - [action type, order id]
+#  accounts - [customer address, courier address, restaurant address]
+#  foreign assets - [AppParams.ASA_ID]
+
+order_id = Txn.application_args[OrderBook.Params.ORDER_ID_PARAM_INDEX]
+customer_address = Txn.accounts[OrderBook.Params.CUSTOMER_ACCOUNT_INDEX]
+state_key = Concat(order_id, OrderBook.State.KEY_SUFFIX)
+order = ScratchVar(TealType.bytes)
+order_state = ScratchVar(TealType.bytes)
+
+def order_address(offset):
+    return Extract(order.load(), Int(offset), Int(32))
+
+def order_uint(offset):
+    return ExtractUint64(order.load(), Int(offset))
+
+def state_uint(offset):
+    return ExtractUint64(order_state.load(), Int(offset))
+
+def with_uint(state, offset, value):
+    # replace2/replace3 come with TEAL v7, in v6 the state is rebuilt around the updated field.
+    return Concat(
+        Substring(state, Int(0), Int(offset)),
+        Itob(value),
+        Substring(state, Int(offset + 8), Int(OrderBook.State.LENGTH))
+    )
+
+def order_event(old_status, new_status, amount=Int(0)):
+    return log_event(EventType.ORDER_STATUS, order_id, customer_address, old_status, new_status, amount)
+
+@Subroutine(TealType.none)
+def load_order():
+    record = App.globalGetEx(Int(0), order_id)
+    return Seq(
+        record,
+        Assert(record.hasValue()),
+        order.store(record.value()),
+        # the funds go back to the customer of the record, not to any account the caller passes
+        Assert(order_address(OrderBook.Record.CUSTOMER_ADDRESS) == customer_address),
+        order_state.store(App.globalGet(state_key))
+    )
+
+@Subroutine(TealType.none)
+def save_order_state():
+    return App.globalPut(state_key, order_state.load())
+
+@Subroutine(TealType.none)
+def close_order():
+    return Seq(
+        App.globalDel(order_id),
+        App.globalDel(state_key)
+    )
+
+@Subroutine(TealType.uint64)
+def can_complete_order():
+    order_status = state_uint(OrderBook.State.ORDER_STATUS)
+    return Seq(
+        Assert(Txn.sender() == customer_address),
+        Assert(Or(order_status == OrderStatus.DELIVERED, order_status == OrderStatus.DISPUTE)),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_claim_funds():
+    courier_address = order_address(OrderBook.Record.COURIER_ADDRESS)
+    order_status = state_uint(OrderBook.State.ORDER_STATUS)
+    delivered_timestamp = state_uint(OrderBook.State.DELIVERED_TIMESTAMP)
+    confirmation_dead_line = Add(delivered_timestamp, AppParams.ACCEPT_DELIVERY_WINDOW)
+    return Seq(
+        Assert(Txn.sender() == courier_address),
+        Assert(order_status == OrderStatus.DELIVERED),
+        Assert(Global.latest_timestamp() >= confirmation_dead_line),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_mark_as_delivered():
+    courier_address = order_address(OrderBook.Record.COURIER_ADDRESS)
+    order_status = state_uint(OrderBook.State.ORDER_STATUS)
+    return Seq(
+        Assert(Txn.sender() == courier_address),
+        Assert(order_status == OrderStatus.DELIVERING),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_start_disput():
+    order_status = state_uint(OrderBook.State.ORDER_STATUS)
+    return Seq(
+        Assert(Txn.sender() == customer_address),
+        Assert(order_status == OrderStatus.DELIVERED),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_pick_up_order():
+    courier_address = order_address(OrderBook.Record.COURIER_ADDRESS)
+    order_status = state_uint(OrderBook.State.ORDER_STATUS)
+    return Seq(
+        Assert(Txn.sender() == courier_address),
+        Assert(order_status == OrderStatus.COOKING),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_cancel_order():
+    courier_address = order_address(OrderBook.Record.COURIER_ADDRESS)
+    restaurant_address = order_address(OrderBook.Record.RESTAURANT_ADDRESS)
+    order_status = state_uint(OrderBook.State.ORDER_STATUS)
+    return Seq(
+        Assert(Or(Txn.sender() == courier_address, Txn.sender() == restaurant_address)),
+        Assert(order_status == OrderStatus.COOKING),
+        Int(1)
+    )
+
+@Subroutine(TealType.none)
+def release_funds():
+    # The escrow is shared by every order, so nothing is closed: each party gets exactly its share.
+    tips_amount = order_uint(OrderBook.Record.TIPS_AMOUNT)
+    order_amount = order_uint(OrderBook.Record.ORDER_AMOUNT)
+    reward_amount = order_uint(OrderBook.Record.COURIER_REWARD_AMOUNT)
+    courier_address = order_address(OrderBook.Record.COURIER_ADDRESS)
+    restaurant_address = order_address(OrderBook.Record.RESTAURANT_ADDRESS)
+    return InnerTxnGroupBuilder().asset_transfer(
+        AppParams.ASA_ID, tips_amount, courier_address
+    ).payment(
+        reward_amount, courier_address
+    ).payment(
+        order_amount - reward_amount, restaurant_address
+    ).submit()
+
+@Subroutine(TealType.none)
+def refund():
+    tips_amount = order_uint(OrderBook.Record.TIPS_AMOUNT)
+    order_amount = order_uint(OrderBook.Record.ORDER_AMOUNT)
+    return InnerTxnGroupBuilder().asset_transfer(
+        AppParams.ASA_ID, tips_amount, customer_address
+    ).payment(
+        order_amount, customer_address
+    ).submit()
+
+@Subroutine(TealType.uint64)
+def cancel_order():
+    return Seq(
+        refund(),
+        close_order(),
+        order_event(OrderStatus.COOKING, OrderStatus.CANCELED, order_uint(OrderBook.Record.ORDER_AMOUNT)),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def pick_up_order():
+    return Seq(
+        order_state.store(with_uint(order_state.load(), OrderBook.State.ORDER_STATUS, OrderStatus.DELIVERING)),
+        save_order_state(),
+        order_event(OrderStatus.COOKING, OrderStatus.DELIVERING),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def start_disput():
+    return Seq(
+        order_state.store(with_uint(order_state.load(), OrderBook.State.ORDER_STATUS, OrderStatus.DISPUTE)),
+        save_order_state(),
+        order_event(OrderStatus.DELIVERED, OrderStatus.DISPUTE),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def complete_order():
+    return Seq(
+        release_funds(),
+        close_order(),
+        # the record is gone from the state but still in scratch
+        order_event(state_uint(OrderBook.State.ORDER_STATUS), OrderStatus.COMPLETED, order_uint(OrderBook.Record.COURIER_REWARD_AMOUNT)),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def claim_funds():
+    return Seq(
+        release_funds(),
+        close_order(),
+        order_event(OrderStatus.DELIVERED, OrderStatus.COMPLETED, order_uint(OrderBook.Record.COURIER_REWARD_AMOUNT)),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def food_delivered():
+    return Seq(
+        order_state.store(with_uint(order_state.load(), OrderBook.State.DELIVERED_TIMESTAMP, Global.latest_timestamp())),
+        order_state.store(with_uint(order_state.load(), OrderBook.State.ORDER_STATUS, OrderStatus.DELIVERED)),
+        save_order_state(),
+        order_event(OrderStatus.DELIVERING, OrderStatus.DELIVERED),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def place_order():
+    payment = Gtxn[Txn.group_index() - Int(OrderBook.Params.PAYMENT_TXN_OFFSET)]
+    tips = Gtxn[Txn.group_index() - Int(OrderBook.Params.TIPS_TXN_OFFSET)]
+    courier_address = Txn.application_args[OrderBook.Params.COURIER_ADDRESS_INDEX]
+    restaurant_address = Txn.application_args[OrderBook.Params.RESTAURANT_ADDRESS_INDEX]
+    reward_amount = Btoi(Txn.application_args[OrderBook.Params.COURIER_REWARD_AMOUNT_INDEX])
+    order_amount = payment.amount() - OrderBook.Params.FEE_RESERVE
+    existing_order = App.globalGetEx(Int(0), order_id)
+    return Seq(
+        Assert(Len(order_id) == OrderBook.Params.ORDER_ID_LENGTH),
+        Assert(Len(courier_address) == Int(32)),
+        Assert(Len(restaurant_address) == Int(32)),
+        existing_order,
+        Assert(Not(existing_order.hasValue())),
+        Assert(Txn.group_index() >= Int(OrderBook.Params.PAYMENT_TXN_OFFSET)),
+        Assert(payment.type_enum() == TxnType.Payment),
+        Assert(payment.sender() == Txn.sender()),
+        Assert(payment.receiver() == Global.current_application_address()),
+        Assert(payment.close_remainder_to() == Global.zero_address()),
+        Assert(payment.amount() > Add(OrderBook.Params.FEE_RESERVE, reward_amount)),
+        Assert(tips.type_enum() == TxnType.AssetTransfer),
+        Assert(tips.sender() == Txn.sender()),
+        Assert(tips.xfer_asset() == AppParams.ASA_ID),
+        Assert(tips.asset_receiver() == Global.current_application_address()),
+        Assert(tips.asset_close_to() == Global.zero_address()),
+        # fails once the global state schema is full, i.e. with MAX_OPEN_ORDERS orders open
+        App.globalPut(order_id, Concat(
+            Txn.sender(),
+            courier_address,
+            restaurant_address,
+            Itob(order_amount),
+            Itob(reward_amount),
+            Itob(tips.asset_amount())
+        )),
+        App.globalPut(state_key, Concat(Itob(OrderStatus.COOKING), Itob(Int(0)))),
+        log_event(EventType.ORDER_STATUS, order_id, Txn.sender(), Int(0), OrderStatus.COOKING, order_amount),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def asa_opt_in():
+    return Seq(
+        Assert(Txn.sender() == Global.creator_address()),
+        InnerTxnGroupBuilder().asset_opt_in(
+            AppParams.ASA_ID,
+            Global.current_application_address()
+        ).submit(),
+        Int(1)
+    )
+
+def approval_program():
+    # Mode.Application specifies that this is a smart contract
+
+    handle_creation = Return(Int(1))
+    # Nothing is kept in local state: opting in is not needed, and opting out or clearing loses nothing.
+    handle_optin = Return(Int(1))
+    handle_closeout = Return(Int(1))
+    # The application holds the funds of every open order, so it can be neither updated nor deleted.
+    handle_updateapp = Return(Int(0))
+    handle_deleteapp = Return(Int(0))
+    handle_claim_funds = And(can_claim_funds(), claim_funds())
+    handle_complete_order = And(can_complete_order(), complete_order())
+    handle_delivered = And(can_mark_as_delivered(), food_delivered())
+    handle_start_dispute = And(can_start_disput(), start_disput())
+    handle_pick_up_order = And(can_pick_up_order(), pick_up_order())
+    handle_cancel_order = And(can_cancel_order(), cancel_order())
+
+    action_type = Txn.application_args[OrderBook.Params.ACTION_TYPE_PARAM_INDEX]
+    handle_order_action = Seq(
+        load_order(),
+        Cond(
+            [BytesEq(action_type, ActionType.CANCEL), Return(handle_cancel_order)],
+            [BytesEq(action_type, ActionType.PICK_UP_ORDER), Return(handle_pick_up_order)],
+            [BytesEq(action_type, ActionType.START_DISPUTE), Return(handle_start_dispute)],
+            [BytesEq(action_type, ActionType.COMPLETE_ORDER), Return(handle_complete_order)],
+            [BytesEq(action_type, ActionType.DELIVERED), Return(handle_delivered)],
+            [BytesEq(action_type, ActionType.CLAIM_FUNDS), Return(handle_claim_funds)],
+        )
+    )
+    handle_noop = Cond(
+        [BytesEq(action_type, ActionType.PLACE_ORDER), Return(place_order())],
+        [BytesEq(action_type, ActionType.ASA_OPT_IN), Return(asa_opt_in())],
+        [Int(1), handle_order_action],
+    )
+
+    return Cond(
+        [Txn.application_id() == Int(0), handle_creation],
+        [Txn.on_completion() == OnComplete.OptIn, handle_optin],
+        [Txn.on_completion() == OnComplete.CloseOut, handle_closeout],
+        [Txn.on_completion() == OnComplete.UpdateApplication, handle_updateapp],
+        [Txn.on_completion() == OnComplete.DeleteApplication, handle_deleteapp],
+        [Txn.on_completion() == OnComplete.NoOp, handle_noop]
+    )
+
+def clear_program():
+    return Return(Int(1))
+
+if __name__ == "__main__":
+    with open("./dist/order_book_approval.teal", "w", encoding="UTF-8") as f:
+        f.write(compileTeal(approval_program(), mode=Mode.Application, version=6))
+    with open("./dist/order_book_clear_program.teal", "w", encoding="UTF-8") as f:
+        f.write(compileTeal(clear_program(), mode=Mode.Application, version=6))
@@ -0,0 +1,266 @@
+from pyteal import *
+
+from utils.event_utils import *
+from utils.router_utils import *
+from enums import *
+
+# Shared application tracking the status of the orders held by logic signature escrows
+# (escrow_logicsig.py), the alternative to creating a delivery application per order.
+# The escrow of an order opts in when the order is placed and its record (see
+# LogicSigEscrow.Record) lives in the escrow's local state. The application never holds funds:
+# it authorizes the actions, and the logic signature only releases the funds in a group
+# carrying an accepted action for its own order.
+#
+# Place order group (sent by the customer, who pays the fees of the group):
+#  0 - payment customer -> escrow (order total price and the escrow minimum balance)
+#  1 - asset opt-in of the escrow to AppParams.ASA_ID
+#  2 - opt-in of the escrow to this application [courier address, restaurant address, customer address, deadline]
+#  3 - asset transfer of AppParams.ASA_ID customer -> escrow (tips, can be zero)
+#
+# Order calls:
+#  application args - [one-byte ActionCode]
+#  accounts - [escrow address]
+# CANCEL, COMPLETE_ORDER and CLAIM_FUNDS are followed by the escrow closing out of this
+# application and closing its asset holding and its account (LogicSigEscrow.Params).
+
+escrow_address = Txn.accounts[LogicSigEscrow.Params.ESCROW_ACCOUNT_INDEX]
+order = ScratchVar(TealType.bytes)
+
+def order_address(offset):
+    return Extract(order.load(), Int(offset), Int(32))
+
+def order_uint(offset):
+    return ExtractUint64(order.load(), Int(offset))
+
+def with_uint(record, offset, value):
+    # TEAL v6 has no "replace" opcode, so the record is rebuilt around the updated field.
+    return Concat(
+        Substring(record, Int(0), Int(offset)),
+        Itob(value),
+        Substring(record, Int(offset + 8), Int(LogicSigEscrow.Record.LENGTH))
+    )
+
+def order_event(old_status, new_status, amount=Int(0)):
+    # The order ID is only known to the logic signature, the escrow address identifies the order.
+    return log_event(EventType.ORDER_STATUS, Int(0), escrow_address, old_status, new_status, amount)
+
+@Subroutine(TealType.none)
+def load_order():
+    record = App.localGetEx(escrow_address, Int(0), LogicSigEscrow.Record.KEY)
+    return Seq(
+        record,
+        Assert(record.hasValue()),
+        order.store(record.value())
+    )
+
+@Subroutine(TealType.none)
+def save_order():
+    return App.localPut(escrow_address, LogicSigEscrow.Record.KEY, order.load())
+
+@Subroutine(TealType.none)
+def check_settlement_group():
+    # The escrow closes in the same group, the logic signature checks where the funds go.
+    close_out = Gtxn[LogicSigEscrow.Params.CLOSE_OUT_TXN_INDEX]
+    asset_close = Gtxn[LogicSigEscrow.Params.ASSET_CLOSE_TXN_INDEX]
+    payment_close = Gtxn[LogicSigEscrow.Params.PAYMENT_CLOSE_TXN_INDEX]
+    return Seq(
+        Assert(Global.group_size() == Int(LogicSigEscrow.Params.SETTLEMENT_GROUP_SIZE)),
+        Assert(Txn.group_index() == Int(LogicSigEscrow.Params.ACTION_TXN_INDEX)),
+        Assert(close_out.type_enum() == TxnType.ApplicationCall),
+        Assert(close_out.sender() == escrow_address),
+        Assert(close_out.application_id() == Global.current_application_id()),
+        Assert(close_out.on_completion() == OnComplete.CloseOut),
+        Assert(asset_close.type_enum() == TxnType.AssetTransfer),
+        Assert(asset_close.sender() == escrow_address),
+        Assert(payment_close.type_enum() == TxnType.Payment),
+        Assert(payment_close.sender() == escrow_address),
+    )
+
+@Subroutine(TealType.uint64)
+def can_complete_order():
+    customer_address = order_address(LogicSigEscrow.Record.CUSTOMER_ADDRESS)
+    order_status = order_uint(LogicSigEscrow.Record.ORDER_STATUS)
+    return Seq(
+        Assert(Txn.sender() == customer_address),
+        Assert(Or(order_status == OrderStatus.DELIVERED, order_status == OrderStatus.DISPUTE)),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_claim_funds():
+    courier_address = order_address(LogicSigEscrow.Record.COURIER_ADDRESS)
+    order_status = order_uint(LogicSigEscrow.Record.ORDER_STATUS)
+    delivered_timestamp = order_uint(LogicSigEscrow.Record.DELIVERED_TIMESTAMP)
+    confirmation_dead_line = Add(delivered_timestamp, AppParams.ACCEPT_DELIVERY_WINDOW)
+    return Seq(
+        Assert(Txn.sender() == courier_address),
+        Assert(order_status == OrderStatus.DELIVERED),
+        Assert(Global.latest_timestamp() >= confirmation_dead_line),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_mark_as_delivered():
+    courier_address = order_address(LogicSigEscrow.Record.COURIER_ADDRESS)
+    order_status = order_uint(LogicSigEscrow.Record.ORDER_STATUS)
+    return Seq(
+        Assert(Txn.sender() == courier_address),
+        Assert(order_status == OrderStatus.DELIVERING),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_start_disput():
+    customer_address = order_address(LogicSigEscrow.Record.CUSTOMER_ADDRESS)
+    order_status = order_uint(LogicSigEscrow.Record.ORDER_STATUS)
+    return Seq(
+        Assert(Txn.sender() == customer_address),
+        Assert(order_status == OrderStatus.DELIVERED),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_pick_up_order():
+    courier_address = order_address(LogicSigEscrow.Record.COURIER_ADDRESS)
+    order_status = order_uint(LogicSigEscrow.Record.ORDER_STATUS)
+    return Seq(
+        Assert(Txn.sender() == courier_address),
+        Assert(order_status == OrderStatus.COOKING),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def can_cancel_order():
+    courier_address = order_address(LogicSigEscrow.Record.COURIER_ADDRESS)
+    restaurant_address = order_address(LogicSigEscrow.Record.RESTAURANT_ADDRESS)
+    customer_address = order_address(LogicSigEscrow.Record.CUSTOMER_ADDRESS)
+    deadline = order_uint(LogicSigEscrow.Record.DEADLINE)
+    order_status = order_uint(LogicSigEscrow.Record.ORDER_STATUS)
+    return Seq(
+        # the customer can take the funds back once nobody picked the order up before the deadline
+        Assert(Or(
+            Txn.sender() == courier_address,
+            Txn.sender() == restaurant_address,
+            And(Txn.sender() == customer_address, Global.round() > deadline)
+        )),
+        Assert(order_status == OrderStatus.COOKING),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def settle(order_status: Expr):
+    payment_close = Gtxn[LogicSigEscrow.Params.PAYMENT_CLOSE_TXN_INDEX]
+    return Seq(
+        check_settlement_group(),
+        order_event(order_uint(LogicSigEscrow.Record.ORDER_STATUS), order_status, payment_close.amount()),
+        order.store(with_uint(order.load(), LogicSigEscrow.Record.ORDER_STATUS, order_status)),
+        save_order(),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def pick_up_order():
+    return Seq(
+        order.store(with_uint(order.load(), LogicSigEscrow.Record.ORDER_STATUS, OrderStatus.DELIVERING)),
+        save_order(),
+        order_event(OrderStatus.COOKING, OrderStatus.DELIVERING),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def start_disput():
+    return Seq(
+        order.store(with_uint(order.load(), LogicSigEscrow.Record.ORDER_STATUS, OrderStatus.DISPUTE)),
+        save_order(),
+        order_event(OrderStatus.DELIVERED, OrderStatus.DISPUTE),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def food_delivered():
+    return Seq(
+        order.store(with_uint(order.load(), LogicSigEscrow.Record.DELIVERED_TIMESTAMP, Global.latest_timestamp())),
+        order.store(with_uint(order.load(), LogicSigEscrow.Record.ORDER_STATUS, OrderStatus.DELIVERED)),
+        save_order(),
+        order_event(OrderStatus.DELIVERING, OrderStatus.DELIVERED),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def open_order():
+    courier_address = Txn.application_args[LogicSigEscrow.Params.COURIER_ADDRESS_INDEX]
+    restaurant_address = Txn.application_args[LogicSigEscrow.Params.RESTAURANT_ADDRESS_INDEX]
+    customer_address = Txn.application_args[LogicSigEscrow.Params.CUSTOMER_ADDRESS_INDEX]
+    deadline = Txn.application_args[LogicSigEscrow.Params.DEADLINE_INDEX]
+    return Seq(
+        Assert(Len(courier_address) == Int(32)),
+        Assert(Len(restaurant_address) == Int(32)),
+        Assert(Len(customer_address) == Int(32)),
+        Assert(Len(deadline) == Int(8)),
+        App.localPut(Txn.sender(), LogicSigEscrow.Record.KEY, Concat(
+            courier_address,
+            restaurant_address,
+            customer_address,
+            Itob(OrderStatus.COOKING),
+            Itob(Int(0)),
+            deadline
+        )),
+        log_event(EventType.ORDER_STATUS, Int(0), Txn.sender(), Int(0), OrderStatus.COOKING),
+        Int(1)
+    )
+
+@Subroutine(TealType.uint64)
+def close_order():
+    order_status = ExtractUint64(App.localGet(Txn.sender(), LogicSigEscrow.Record.KEY), Int(LogicSigEscrow.Record.ORDER_STATUS))
+    # Only settled orders are forgotten, their escrow closes in the same group.
+    return Or(order_status == OrderStatus.COMPLETED, order_status == OrderStatus.CANCELED)
+
+def approval_program():
+    # Mode.Application specifies that this is a smart contract
+
+    handle_creation = Return(Int(1))
+    handle_optin = Return(open_order())
+    handle_closeout = Return(close_order())
+    # The application tracks every open order, so it can be neither updated nor deleted.
+    handle_updateapp = Return(Int(0))
+    handle_deleteapp = Return(Int(0))
+    handle_claim_funds = And(can_claim_funds(), settle(OrderStatus.COMPLETED))
+    handle_complete_order = And(can_complete_order(), settle(OrderStatus.COMPLETED))
+    handle_delivered = And(can_mark_as_delivered(), food_delivered())
+    handle_start_dispute = And(can_start_disput(), start_disput())
+    handle_pick_up_order = And(can_pick_up_order(), pick_up_order())
+    handle_cancel_order = And(can_cancel_order(), settle(OrderStatus.CANCELED))
+
+    action_type = Txn.application_args[LogicSigEscrow.Params.ACTION_TYPE_PARAM_INDEX]
+    action_code = ScratchVar(TealType.uint64)
+    handle_noop = Seq(
+        Assert(Len(action_type) == ActionCode.LENGTH),
+        action_code.store(Btoi(action_type)),
+        load_order(),
+        jump_table(action_code.load(), {
+            ActionCode.CANCEL: Return(handle_cancel_order),
+            ActionCode.PICK_UP_ORDER: Return(handle_pick_up_order),
+            ActionCode.START_DISPUTE: Return(handle_start_dispute),
+            ActionCode.COMPLETE_ORDER: Return(handle_complete_order),
+            ActionCode.DELIVERED: Return(handle_delivered),
+            ActionCode.CLAIM_FUNDS: Return(handle_claim_funds),
+        })
+    )
+
+    return Cond(
+        [Txn.application_id() == Int(0), handle_creation],
+        [Txn.on_completion() == OnComplete.OptIn, handle_optin],
+        [Txn.on_completion() == OnComplete.CloseOut, handle_closeout],
+        [Txn.on_completion() == OnComplete.UpdateApplication, handle_updateapp],
+        [Txn.on_completion() == OnComplete.DeleteApplication, handle_deleteapp],
+        [Txn.on_completion() == OnComplete.NoOp, handle_noop]
+    )
+
+def clear_program():
+    return Return(Int(1))
+
+if __name__ == "__main__":
+    with open("./dist/status_approval.teal", "w", encoding="UTF-8") as f:
+        f.write(compileTeal(approval_program(), mode=Mode.Application, version=6))
+    with open("./dist/status_clear_program.teal", "w", encoding="UTF-8") as f:
+        f.write(compileTeal(clear_program(), mode=Mode.Application, version=6))
@@ -1,6 +1,8 @@
 import os
 from pyteal import *
 
+from utils.event_utils import *
+
 # user type values: 1=buyer;2=store;3=courier
 
 # Opt In applications arguments array
@@ -27,30 +29,120 @@ from pyteal import *
 #  4 - review type (need to figure out all the use case)
 #  5 - review delta (1-5)
 
-def approval_program():
-    v1_key = Bytes("v1")
-    v2_key = Bytes("v2")
-    v3_key = Bytes("v3")
-    v4_key = Bytes("v4")
-    v5_key = Bytes("v5")
-    user_type = Bytes("type")
-    user_state = Bytes("state")
-    lat_key = Bytes("lat")
-    lng_key = Bytes("lng")
-
-    buyer_num_orders = Bytes("buyer_orders")
-    store_num_orders = Bytes("store_orders")
-    couri_num_deliveries = Bytes("couri_deliveries")
-
-    referer = Bytes("referer")
+# Batched store attestations: the attestor posts the Merkle root of a batch of buyer-to-store
+# attestations instead of one sto_val call per attestation, and an attestation is applied like
+# sto_val only when it is needed, by anyone sending its proof.
+#
+# Attestor update applications arguments array (creator only)
+#  0 - call text
+#  1 - attestor address
+#
+# Root posting applications arguments array (attestor only)
+#  0 - call text
+#  1 - Merkle root of the batch
+#  2 - number of attestations in the batch (for the event)
+#
+# Store attestation proof applications arguments array
+#  0 - call text
+#  1 - buyer's address
+#  2 - store's address
+#  3 - batch number
+#  4 - leaf index of the attestation in the batch
+#  5 - proof, the sibling hashes from the leaf up, HASH_LENGTH bytes each
+#
+# Accounts - [buyer_addr, store_addr]
+#
+# A leaf is sha256(ATTESTATION_LEAF_PREFIX + buyer + store) and a node sha256(left + right), the
+# prefix keeps a node from passing as a leaf. The roots of the last root_slots batches are kept,
+# a batch has to be proven before it is rotated out. A deep proof takes more than the opcode
+# budget of one call, it is sent with op_up calls in its group (plato_client/attestations.py).
+
+# Attested buyers of a store are 32-byte address slots packed into pages of BUYER_PAGE_SLOTS
+# slots ("buyers0", "buyers1", ...) as a key and its value are limited to 128 bytes.
+# Empty slots hold the zero address; the store "state" becomes 1 once the last slot is taken.
+BUYER_SLOT_CAPACITY = 5
+BUYER_PAGE_SLOTS = 3
+ADDRESS_LENGTH = 32
+
+# User types, stored under USER_TYPE_KEY
+USER_TYPE_BUYER = 1
+USER_TYPE_STORE = 2
+USER_TYPE_COURIER = 3
+
+# Router actions, application argument 0 of a NoOp call
+ACTION_STORE_ATTEST = "sto_val"
+ACTION_COURIER_ATTEST = "cou_val"
+ACTION_SET_ATTESTOR = "set_att"
+ACTION_POST_ROOT = "att_root"
+ACTION_PROVE_STORE_ATTEST = "sto_prf"
+# no-op call adding its opcode budget to the group
+ACTION_OP_UP = "op_up"
+
+# Local state keys of a user
+USER_TYPE_KEY = "type"
+USER_STATE_KEY = "state"
+LAT_KEY = "lat"
+LNG_KEY = "lng"
+REFERER_KEY = "referer"
+# courier's attested store
+COURIER_STORE_KEY = "v1"
+# followed by the page number
+BUYER_PAGE_KEY_PREFIX = "buyers"
+BUYER_NUM_ORDERS_KEY = "buyer_orders"
+STORE_NUM_ORDERS_KEY = "store_orders"
+COURIER_NUM_DELIVERIES_KEY = "couri_deliveries"
+# Optional geohash prefix of a store's location (approval_program(geohash_length=N)), for coarse
+# filtering of stores by area without parsing lat/lng. The opt-in then takes the geohash as
+# argument 6 and the local schema needs one more byte slice.
+GEOHASH_KEY = "geohash"
+
+# Global state keys of the attestation batches
+ATTESTOR_KEY = "attestor"
+BATCH_COUNT_KEY = "batches"
+# followed by the batch number modulo root_slots (itob)
+ROOT_KEY_PREFIX = "root"
+ROOT_SLOTS = 8
+ATTESTATION_LEAF_PREFIX = b"\x00"
+HASH_LENGTH = 32
+MAX_PROOF_DEPTH = 32
+
+def buyer_page_count(buyer_slot_capacity):
+    return (buyer_slot_capacity + BUYER_PAGE_SLOTS - 1) // BUYER_PAGE_SLOTS
+
+def local_schema(buyer_slot_capacity=BUYER_SLOT_CAPACITY, geohash_length=0):
+    """ (uints, byte slices) of the local state: lat, lng, referer and the buyer pages of a store, and its geohash if kept """
+    return (8, 3 + buyer_page_count(buyer_slot_capacity) + (1 if geohash_length else 0))
+
+def global_schema(root_slots=ROOT_SLOTS):
+    """ (uints, byte slices) of the global state: the batch count, the attestor and the roots """
+    return (1, 1 + root_slots)
+
+def approval_program(buyer_slot_capacity=BUYER_SLOT_CAPACITY, geohash_length=0, root_slots=ROOT_SLOTS):
+    # courier's attested store
+    v1_key = Bytes(COURIER_STORE_KEY)
+    buyer_page_keys = [Bytes(BUYER_PAGE_KEY_PREFIX + str(page)) for page in range(buyer_page_count(buyer_slot_capacity))]
+    user_type = Bytes(USER_TYPE_KEY)
+    user_state = Bytes(USER_STATE_KEY)
+    lat_key = Bytes(LAT_KEY)
+    lng_key = Bytes(LNG_KEY)
+
+    buyer_num_orders = Bytes(BUYER_NUM_ORDERS_KEY)
+    store_num_orders = Bytes(STORE_NUM_ORDERS_KEY)
+    couri_num_deliveries = Bytes(COURIER_NUM_DELIVERIES_KEY)
+
+    referer = Bytes(REFERER_KEY)
+    geohash_key = Bytes(GEOHASH_KEY)
 
     user_type_val = Btoi(Txn.application_args[1])
-    user_type_buyer = Int(1)
-    user_type_store = Int(2)
-    user_type_courier = Int(3)
+    user_type_buyer = Int(USER_TYPE_BUYER)
+    user_type_store = Int(USER_TYPE_STORE)
+    user_type_courier = Int(USER_TYPE_COURIER)
+
+    action_store_attest = Bytes(ACTION_STORE_ATTEST)
+    action_courier_attest = Bytes(ACTION_COURIER_ATTEST)
 
-    action_store_attest = Bytes("sto_val")
-    action_courier_attest = Bytes("cou_val")
+    attestor = Bytes(ATTESTOR_KEY)
+    batch_count = Bytes(BATCH_COUNT_KEY)
 
     sender_a = Txn.sender()
 
@@ -61,6 +153,7 @@ def approval_program():
             Assert(
                 Global.latest_timestamp() < on_create_start_time
             ),
+            App.globalPut(attestor, Global.creator_address()),
             Int(1),
         )
 
@@ -86,13 +179,12 @@ def approval_program():
             is_arg_user_type(Int(1), user_type_store)
         ).Then(
             Seq(
-                App.localPut(sender_a, Bytes("state"), Int(0)),
+                App.localPut(sender_a, user_state, Int(0)),
                 App.localPut(sender_a, user_type, user_type_val),
-                App.localPut(sender_a, v1_key, Global.zero_address()),
-                App.localPut(sender_a, v2_key, Global.zero_address()),
-                App.localPut(sender_a, v3_key, Global.zero_address()),
-                App.localPut(sender_a, v4_key, Global.zero_address()),
-                App.localPut(sender_a, v5_key, Global.zero_address()),
+                *[
+                    App.localPut(sender_a, page_key, BytesZero(Int(buyer_page_size(page))))
+                    for page, page_key in enumerate(buyer_page_keys)
+                ],
                 App.localPut(sender_a, lat_key, Txn.application_args[3]),
                 App.localPut(sender_a, lng_key, Txn.application_args[4]),
                 If(user_type_val == user_type_buyer).Then(
@@ -103,21 +195,28 @@ def approval_program():
                     App.localPut(sender_a, couri_num_deliveries, Int(1))
                 ),
                 App.localPut(sender_a, referer, Txn.application_args[5]),
+                *([
+                    Assert(Len(Txn.application_args[6]) == Int(geohash_length)),
+                    App.localPut(sender_a, geohash_key, Txn.application_args[6]),
+                ] if geohash_length else []),
+                log_event(EventType.USER_OPT_IN, Int(0), sender_a, new_status=user_type_store),
                 Int(1),
             )
         ).ElseIf(
             is_arg_user_type(Int(1), user_type_buyer)
         ).Then(
             Seq(
-                App.localPut(sender_a, user_type, Int(1)),
+                App.localPut(sender_a, user_type, user_type_buyer),
+                log_event(EventType.USER_OPT_IN, Int(0), sender_a, new_status=user_type_buyer),
                 Int(1),
             )
         ).ElseIf(
             is_arg_user_type(Int(1), user_type_courier)
         ).Then(
             Seq(
-                App.localPut(sender_a, user_type, Int(3)),
+                App.localPut(sender_a, user_type, user_type_courier),
                 App.localPut(sender_a, v1_key, Global.zero_address()),
+                log_event(EventType.USER_OPT_IN, Int(0), sender_a, new_status=user_type_courier),
                 Int(1),
             )
         ).Else(
@@ -125,72 +224,129 @@ def approval_program():
         )
 
     @Subroutine(TealType.uint64)
-    def store_state(store_addr, buyer_key, buyer_addr, new_state):
+    def is_store_empty(courier_addr, empty_store_addr):
+        return If(
+            App.localGet(courier_addr, v1_key) == empty_store_addr,
+        ).Then(Int(1)).Else(Int(0))
+
+    def buyer_page_size(page):
+        return ADDRESS_LENGTH * min(BUYER_PAGE_SLOTS, buyer_slot_capacity - page * BUYER_PAGE_SLOTS)
+
+    def buyer_slot(pages, slot):
+        return Extract(pages[slot // BUYER_PAGE_SLOTS].load(), Int(slot % BUYER_PAGE_SLOTS * ADDRESS_LENGTH), Int(ADDRESS_LENGTH))
+
+    def with_buyer(page, slot, buyer_addr):
+        # TEAL v5 has no "replace" opcode, so the page is rebuilt around the filled slot.
+        offset = slot % BUYER_PAGE_SLOTS * ADDRESS_LENGTH
+        page_size = buyer_page_size(slot // BUYER_PAGE_SLOTS)
+        parts = [buyer_addr]
+        if offset > 0:
+            parts.insert(0, Extract(page, Int(0), Int(offset)))
+        if offset + ADDRESS_LENGTH < page_size:
+            parts.append(Extract(page, Int(offset + ADDRESS_LENGTH), Int(page_size - offset - ADDRESS_LENGTH)))
+        return parts[0] if len(parts) == 1 else Concat(*parts)
+
+    def any_of(conditions):
+        return conditions[0] if len(conditions) == 1 else Or(*conditions)
+
+    @Subroutine(TealType.uint64)
+    def add_buyer(store_addr, buyer_addr):
+        # One read per page, the slots are compared in place; empty slots hold the zero address.
+        pages = [ScratchVar(TealType.bytes) for _ in buyer_page_keys]
+        filled_slot = ScratchVar(TealType.uint64)
+        store_state = ScratchVar(TealType.uint64)
+
+        def fill_slot(slot):
+            page = slot // BUYER_PAGE_SLOTS
+            return Seq(
+                App.localPut(store_addr, buyer_page_keys[page], with_buyer(pages[page].load(), slot, buyer_addr)),
+                filled_slot.store(Int(slot)),
+                store_state.store(Int(1 if slot == buyer_slot_capacity - 1 else 0)),
+            )
+
         return Seq(
-            App.localPut(store_addr, buyer_key, buyer_addr),
-            App.localPut(store_addr, user_state, new_state),
+            *[page.store(App.localGet(store_addr, page_key)) for page, page_key in zip(pages, buyer_page_keys)],
+            If(any_of([buyer_slot(pages, slot) == buyer_addr for slot in range(buyer_slot_capacity)])).Then(
+                Return(Int(0))
+            ),
+            Cond(*[
+                [buyer_slot(pages, slot) == Global.zero_address(), fill_slot(slot)]
+                for slot in range(buyer_slot_capacity)
+            ]),
+            App.localPut(store_addr, user_state, store_state.load()),
+            # the record has room for one address, the store and the buyer are logged one after the other
+            log_event(EventType.STORE_BUYER, Int(0), store_addr, Int(0), store_state.load(), filled_slot.load()),
+            log_event(EventType.BUYER_STORE, Int(0), buyer_addr, amount=filled_slot.load()),
             Int(1),
         )
 
-    @Subroutine(TealType.uint64)
-    def store_no_dups_buyer(store_addr, buyer_addr):
-        return And(
-            App.localGet(store_addr, v1_key) != buyer_addr,
-            App.localGet(store_addr, v2_key) != buyer_addr,
-            App.localGet(store_addr, v3_key) != buyer_addr,
-            App.localGet(store_addr, v4_key) != buyer_addr,
-            App.localGet(store_addr, v5_key) != buyer_addr,
+    def attest_buyer(buyer_addr, store_addr):
+        return Cond(
+            [And(
+                is_addr_user_type(buyer_addr, user_type_buyer),
+                is_addr_user_type(store_addr, user_type_store),
+            ), add_buyer(store_addr, buyer_addr)]
         )
 
     @Subroutine(TealType.uint64)
-    def has_empty_buyer(store_addr, empty_buyer_addr):
-        return Or(
-            App.localGet(store_addr, v1_key) == empty_buyer_addr,
-            App.localGet(store_addr, v2_key) == empty_buyer_addr,
-            App.localGet(store_addr, v3_key) == empty_buyer_addr,
-            App.localGet(store_addr, v4_key) == empty_buyer_addr,
-            App.localGet(store_addr, v5_key) == empty_buyer_addr,
-        )
+    def store_validate():
+        return attest_buyer(Txn.sender(), Txn.application_args[3])
 
-    @Subroutine(TealType.uint64)
-    def is_store_empty(courier_addr, empty_store_addr):
-        return If(
-            App.localGet(courier_addr, v1_key) == empty_store_addr,
-        ).Then(Int(1)).Else(Int(0))
+    def root_key(batch):
+        return Concat(Bytes(ROOT_KEY_PREFIX), Itob(batch % Int(root_slots)))
 
     @Subroutine(TealType.uint64)
-    def fill_empty_buyer(store_addr, buyer_addr, empty_buyer_addr):
-        return Cond(
-            [App.localGet(store_addr, v1_key) == empty_buyer_addr, store_state(store_addr, v1_key, buyer_addr, Int(0))],
-            [App.localGet(store_addr, v2_key) == empty_buyer_addr, store_state(store_addr, v2_key, buyer_addr, Int(0))],
-            [App.localGet(store_addr, v3_key) == empty_buyer_addr, store_state(store_addr, v3_key, buyer_addr, Int(0))],
-            [App.localGet(store_addr, v4_key) == empty_buyer_addr, store_state(store_addr, v4_key, buyer_addr, Int(0))],
-            [App.localGet(store_addr, v5_key) == empty_buyer_addr, store_state(store_addr, v5_key, buyer_addr, Int(1))]
+    def set_attestor():
+        return Seq(
+            Assert(is_creator()),
+            Assert(Len(Txn.application_args[1]) == Int(ADDRESS_LENGTH)),
+            App.globalPut(attestor, Txn.application_args[1]),
+            Int(1),
         )
 
     @Subroutine(TealType.uint64)
-    def store_validate():
-        buyer_addr = Txn.sender()
-        store_addr = Txn.application_args[3]
-        empty_buyer_addr = Global.zero_address()
-
-        return Cond(
-            [And(
-                is_addr_user_type(buyer_addr, user_type_buyer),
-                is_addr_user_type(store_addr, user_type_store),
-                store_no_dups_buyer(store_addr, buyer_addr),
-                has_empty_buyer(store_addr, empty_buyer_addr)
-            ),fill_empty_buyer(store_addr, buyer_addr, empty_buyer_addr)]
+    def post_root():
+        batch = ScratchVar(TealType.uint64)
+        return Seq(
+            Assert(Txn.sender() == App.globalGet(attestor)),
+            Assert(Len(Txn.application_args[1]) == Int(HASH_LENGTH)),
+            batch.store(App.globalGet(batch_count)),
+            App.globalPut(root_key(batch.load()), Txn.application_args[1]),
+            App.globalPut(batch_count, batch.load() + Int(1)),
+            log_event(EventType.ATTESTATION_BATCH, batch.load(), Txn.sender(), amount=Btoi(Txn.application_args[2])),
+            Int(1),
         )
 
     @Subroutine(TealType.uint64)
-    def fill_empty_store(store_addr, buyer_addr, empty_buyer_addr):
-        return Cond(
-            [App.localGet(store_addr, v1_key) == empty_buyer_addr, store_state(store_addr, v1_key, buyer_addr, Int(0))],
-            [App.localGet(store_addr, v2_key) == empty_buyer_addr, store_state(store_addr, v2_key, buyer_addr, Int(0))],
-            [App.localGet(store_addr, v3_key) == empty_buyer_addr, store_state(store_addr, v3_key, buyer_addr, Int(0))],
-            [App.localGet(store_addr, v4_key) == empty_buyer_addr, store_state(store_addr, v4_key, buyer_addr, Int(0))],
-            [App.localGet(store_addr, v5_key) == empty_buyer_addr, store_state(store_addr, v5_key, buyer_addr, Int(1))]
+    def store_prove():
+        buyer_addr = Txn.application_args[1]
+        store_addr = Txn.application_args[2]
+        batch = Btoi(Txn.application_args[3])
+        proof = Txn.application_args[5]
+        node = ScratchVar(TealType.bytes)
+        index = ScratchVar(TealType.uint64)
+        offset = ScratchVar(TealType.uint64)
+        depth_bytes = ScratchVar(TealType.uint64)
+
+        return Seq(
+            # the batch was posted and its root is still kept
+            Assert(batch < App.globalGet(batch_count)),
+            Assert(App.globalGet(batch_count) <= batch + Int(root_slots)),
+            depth_bytes.store(Len(proof)),
+            Assert(depth_bytes.load() % Int(HASH_LENGTH) == Int(0)),
+            Assert(depth_bytes.load() <= Int(MAX_PROOF_DEPTH * HASH_LENGTH)),
+            index.store(Btoi(Txn.application_args[4])),
+            node.store(Sha256(Concat(Bytes("base16", ATTESTATION_LEAF_PREFIX.hex()), buyer_addr, store_addr))),
+            # the bits of the index, from the lowest, tell on which side the node is at each level
+            For(offset.store(Int(0)), offset.load() < depth_bytes.load(), offset.store(offset.load() + Int(HASH_LENGTH))).Do(Seq(
+                If(index.load() & Int(1))
+                .Then(node.store(Sha256(Concat(Extract(proof, offset.load(), Int(HASH_LENGTH)), node.load()))))
+                .Else(node.store(Sha256(Concat(node.load(), Extract(proof, offset.load(), Int(HASH_LENGTH)))))),
+                index.store(index.load() >> Int(1)),
+            )),
+            Assert(index.load() == Int(0)),
+            Assert(node.load() == App.globalGet(root_key(batch))),
+            attest_buyer(buyer_addr, store_addr),
         )
 
     @Subroutine(TealType.uint64)
@@ -198,6 +354,7 @@ def approval_program():
         return Seq(
             App.localPut(courier_addr, v1_key, store_addr),
             App.localPut(courier_addr, user_state, new_state),
+            log_event(EventType.COURIER_STORE, Int(0), courier_addr, Int(0), new_state),
             Int(1),
         )        
 
@@ -218,6 +375,10 @@ def approval_program():
     router = Cond(
         [Txn.application_args[0] == action_store_attest, store_validate()],
         [Txn.application_args[0] == action_courier_attest, courier_validate()],
+        [Txn.application_args[0] == Bytes(ACTION_PROVE_STORE_ATTEST), store_prove()],
+        [Txn.application_args[0] == Bytes(ACTION_OP_UP), Int(1)],
+        [Txn.application_args[0] == Bytes(ACTION_POST_ROOT), post_root()],
+        [Txn.application_args[0] == Bytes(ACTION_SET_ATTESTOR), set_attestor()],
     )
 
     program = Cond(
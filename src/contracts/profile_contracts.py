@@ -0,0 +1,39 @@
+import argparse
+import json
+
+from avm import assemble
+from scenarios import SCENARIOS, load_programs, run_scenario
+
+# Runs every router branch of the contracts in the local AVM and reports the opcode budget used,
+# state reads/writes and inner transactions, broken down by subroutine.
+#
+# Usage: python3 src/contracts/profile_contracts.py [--contract NAME] [--path PATH] [--json]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the contracts' router branches in the local AVM.")
+    parser.add_argument("--contract", action="append", help="only profile this contract (repeatable)")
+    parser.add_argument("--path", action="append", help="only profile this router branch, e.g. CLAIM_FUNDS (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the profiles as JSON")
+    args = parser.parse_args()
+
+    scenarios = [
+        scenario for scenario in SCENARIOS
+        if (not args.contract or scenario.contract in args.contract) and (not args.path or scenario.path in args.path)
+    ]
+    profiles = {}
+    for scenario in scenarios:
+        profile = run_scenario(scenario)
+        if args.json:
+            profiles.setdefault(scenario.contract, {})[scenario.path] = profile.to_dict()
+            continue
+        program_bytes = len(assemble(load_programs(scenario.contract).approval))
+        print(f"== {scenario.contract} {scenario.path} (approval program {program_bytes} bytes)")
+        print(profile.report())
+        print()
+    if args.json:
+        print(json.dumps(profiles, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,133 @@
 from pyteal import *
 
+from utils.event_utils import *
+from utils.inner_txn_utils import *
+from utils.router_utils import *
+
+# Global state keys
+ACCOUNT_KEY = "account"
+PLTO_ID_KEY = "plto_id"
+ID_APP_KEY = "id_app"
+REWARD_TABLE_KEY = "rewards"
+
+# Local state key of a referrer opted in to the application: the rewards accrued and not claimed
+BALANCE_KEY = "balance"
+LOCAL_SCHEMA = (1, 0)
+
+# Router methods, application argument 0 of a NoOp call
+METHOD_CHECK_REWARD = "check_reward"
+METHOD_CHECK_REWARDS = "check_rewards"
+METHOD_CHECK_ACTIVE = "check_active"
+METHOD_ASSET_OPT_IN = "asset_opt_in"
+METHOD_SET_REWARDS = "set_rewards"
+METHOD_CLAIM = "claim"
+# no-op call adding its opcode budget to the group of a check_rewards call
+METHOD_OP_UP = "op_up"
+
+# Reward types, the referral a reward is checked for
+REWARD_TYPE_EATER_REFERRAL = "eater_referral"
+REWARD_TYPE_RESTO_REFERRAL = "resto_referral"
+REWARD_TYPE_COURIER_REFERRAL = "courier_referral"
+# One-byte codes of the reward types, the reward type argument is either a code or a name
+REWARD_CODES = {
+    REWARD_TYPE_EATER_REFERRAL: 1,
+    REWARD_TYPE_RESTO_REFERRAL: 2,
+    REWARD_TYPE_COURIER_REFERRAL: 3,
+}
+
+# Identity local state counter tracked for the referrals of user types 1 (buyer), 2 (store)
+# and 3 (courier)
+TRACKER_KEYS = ("buyer_orders", "store_orders", "couri_deliveries")
+
+# Reward table, held in global state under REWARD_TABLE_KEY and replaced by the creator with
+# METHOD_SET_REWARDS: the milestone of user types 0 to 3 (the counter value that earns the
+# referral reward, 0 for none) followed by the amount of reward codes 0 to 3, uint64 each.
+# Looking up an entry costs the same for every user and reward type.
+REWARD_TABLE_SLOTS = 4
+REWARD_TABLE_LENGTH = 2 * REWARD_TABLE_SLOTS * 8
+DEFAULT_MILESTONES = (0, 1, 5, 1)
+DEFAULT_AMOUNTS = (0, 10, 50, 25)
+
+
+def reward_table(milestones, amounts) -> bytes:
+    """Packs the milestone of each user type and the amount of each reward code."""
+    if len(milestones) != REWARD_TABLE_SLOTS or len(amounts) != REWARD_TABLE_SLOTS:
+        raise ValueError(f"the table holds {REWARD_TABLE_SLOTS} milestones and {REWARD_TABLE_SLOTS} amounts")
+    return b"".join(value.to_bytes(8, "big") for value in (*milestones, *amounts))
+
+# Accrual: the rewards of a referrer opted in to the application are credited to its balance
+# instead of being transferred, and it claims the total in one transfer with METHOD_CLAIM (or by
+# closing out) when it chooses, rather than paying for an inner transfer per small reward.
+# Referrers not opted in are paid right away as before.
+
+# check_rewards checks up to MAX_BATCH_REFERRALS referrals in one call, one per application
+# argument after the method and the account indexes (16 arguments at most). About 130 opcodes
+# per referral, more than the budget of one call past 4 referrals: the group carries op_up
+# calls pooling their budget with the check_rewards call, like the proofs of the identity app.
+MAX_BATCH_REFERRALS = 14
+# Txn.accounts holds the sender and up to 4 foreign accounts
+MAX_ACCOUNT_INDEX = 4
+
 
 def approval_program():
-    account_key = Bytes("account")
-    plto_id = Bytes("plto_id")
-    id_app_id = Bytes("id_app")
+    account_key = Bytes(ACCOUNT_KEY)
+    plto_id = Bytes(PLTO_ID_KEY)
+    id_app_id = Bytes(ID_APP_KEY)
+    reward_table_key = Bytes(REWARD_TABLE_KEY)
+
+    # Read once per call by loadRewardState
+    id_app = ScratchVar(TealType.uint64)
+    rewards = ScratchVar(TealType.bytes)
+
+    # TRACKER_KEYS concatenated, the key of user type t spans tracker_bounds[t] to tracker_bounds[t + 1]
+    tracker_names = Bytes("".join(TRACKER_KEYS))
+    tracker_bounds = [0, 0]
+    for tracker_key in TRACKER_KEYS:
+        tracker_bounds.append(tracker_bounds[-1] + len(tracker_key))
+    tracker_bounds = Bytes("base16", bytes(tracker_bounds).hex())
 
     user_type_eater = Int(1)
     user_type_store = Int(2)
     user_type_courier = Int(3)
 
+    balance_key = Bytes(BALANCE_KEY)
+
     # Issue reward
     @Subroutine(TealType.none)
     def issueReward(assetID: Expr, account: Expr, amount: Expr) -> Expr:
         return Seq(
-                    InnerTxnBuilder.Begin(),
-                    InnerTxnBuilder.SetFields(
-                        {
-                            TxnField.type_enum: TxnType.AssetTransfer,
-                            TxnField.xfer_asset: assetID,
-                            TxnField.asset_amount: amount,
-                            TxnField.asset_receiver: account,
-                        }
-                    ),
-                    InnerTxnBuilder.Submit(),
+            InnerTxnGroupBuilder().asset_transfer(assetID, amount, account).submit(),
+            log_event(EventType.REWARD, assetID, account, amount=amount),
+        )
+
+    # Credit a reward to the balance of an opted in account, or issue it
+    @Subroutine(TealType.none)
+    def creditReward(account: Expr, amount: Expr) -> Expr:
+        return If(App.optedIn(account, Global.current_application_id())).Then(
+            Seq(
+                App.localPut(account, balance_key, App.localGet(account, balance_key) + amount),
+                log_event(EventType.REWARD_ACCRUED, App.globalGet(plto_id), account, amount=amount),
+            )
+        ).Else(
+            issueReward(App.globalGet(plto_id), account, amount)
+        )
+
+    # Pay out the balance of the sender
+    # Foreign assets:
+    # [0]: PLTO asset ID
+    @Subroutine(TealType.uint64)
+    def claimBalance() -> Expr:
+        balance = ScratchVar(TealType.uint64)
+        return Seq(
+            balance.store(App.localGet(Txn.sender(), balance_key)),
+            If(balance.load() > Int(0)).Then(
+                Seq(
+                    App.localPut(Txn.sender(), balance_key, Int(0)),
+                    issueReward(App.globalGet(plto_id), Txn.sender(), balance.load()),
                 )
+            ),
+            Int(1),
+        )
 
     ## optInPLTO logic (opt-in to PLTO asset)
     # Foreign assets:
@@ -32,61 +135,63 @@ def approval_program():
     @Subroutine(TealType.uint64)
     def optInPLTO() -> Expr:
         return Seq(
-                    InnerTxnBuilder.Begin(),
-                    InnerTxnBuilder.SetFields(
-                        {
-                            TxnField.type_enum: TxnType.AssetTransfer,
-                            TxnField.xfer_asset: Txn.assets[0],
-                            TxnField.asset_amount: Int(0),
-                            TxnField.asset_receiver: Global.current_application_address(),
-                        }
-                    ),
-                    InnerTxnBuilder.Submit(),
+                    InnerTxnGroupBuilder().asset_opt_in(Txn.assets[0], Global.current_application_address()).submit(),
                     Int(1),
                 )
 
+    def loadRewardState() -> Expr:
+        return Seq(
+            id_app.store(Btoi(App.globalGet(id_app_id))),
+            rewards.store(App.globalGet(reward_table_key)),
+        )
+
     # Pull count reward count from account local storage on id app
     @Subroutine(TealType.uint64)
-    def getRewardNum(account: Expr, id_app: Expr, tracker_type: Expr) -> Expr:
-        query= App.localGetEx(account, Btoi(id_app), tracker_type)
+    def getRewardNum(account: Expr, tracker_type: Expr) -> Expr:
+        query = App.localGetEx(account, id_app.load(), tracker_type)
         return Seq(
                     query,
                     Assert(query.hasValue()),
                     query.value()
                 )
 
-    # Pull next milestone count from account local storage on id app
-    @Subroutine(TealType.uint64)
-    def getRewardNext(account: Expr, id_app: Expr, tracker_type: Expr) -> Expr:
-        return If(tracker_type == Bytes("buyer_orders")).Then(
-            Int(1)
-        ).ElseIf(tracker_type == Bytes("store_orders")).Then(
-            Int(5)
-        ).ElseIf(tracker_type == Bytes("couri_deliveries")).Then(
-            Int(1)
+    # User type of the given account on the id app
+    def getUserType(account: Expr) -> Expr:
+        account_type_query = App.localGetEx(account, id_app.load(), Bytes("type"))
+        return Seq(
+            account_type_query,
+            Assert(account_type_query.hasValue()),
+            account_type_query.value()
         )
 
-    
+    # Reward code of a reward type argument, a one-byte code or, for older clients, a name
+    def getRewardCode(reward_type: Expr) -> Expr:
+        return If(Len(reward_type) == Int(1)).Then(
+            Btoi(reward_type)
+        ).ElseIf(reward_type == Bytes(REWARD_TYPE_EATER_REFERRAL)).Then(
+            Int(REWARD_CODES[REWARD_TYPE_EATER_REFERRAL])
+        ).ElseIf(reward_type == Bytes(REWARD_TYPE_RESTO_REFERRAL)).Then(
+            Int(REWARD_CODES[REWARD_TYPE_RESTO_REFERRAL])
+        ).ElseIf(reward_type == Bytes(REWARD_TYPE_COURIER_REFERRAL)).Then(
+            Int(REWARD_CODES[REWARD_TYPE_COURIER_REFERRAL])
+        ).Else(
+            Int(0) # If the reward type does not match anything, its amount is 0
+        )
 
     # Return reward amount owed to the given account (0 if milestone not met)
+    # user_type is the type of the referred account, it selects the counter of the given account
+    # checked against the milestone
     @Subroutine(TealType.uint64)
-    def getRewardAmount(account: Expr, tracker_type: Expr, reward_type: Expr, id_app: Expr) -> Expr:
-        current_progress = getRewardNum(account, id_app, tracker_type)
-        next_reward = getRewardNext(account, id_app, tracker_type)
-        return If(
-            And(current_progress == next_reward, next_reward != Int(0))).Then(
-                If(reward_type == Bytes("eater_referral")).Then(
-                    Int(10)
-                ).ElseIf(reward_type == Bytes("resto_referral")).Then(
-                    Int(50)
-                ).ElseIf(reward_type == Bytes("courier_referral")).Then(
-                    Int(25)
-                ).Else(
-                    Int(0) # If the reward type does not match anything, return 0
-                )
+    def getRewardAmount(account: Expr, user_type: Expr, reward_code: Expr) -> Expr:
+        # Fails for user types without a tracker, like the table lookups for codes past its end
+        tracker_type = Substring(tracker_names, GetByte(tracker_bounds, user_type), GetByte(tracker_bounds, user_type + Int(1)))
+        next_reward = ScratchVar(TealType.uint64)
+        return Seq(next_reward.store(ExtractUint64(rewards.load(), user_type * Int(8))), If(
+            And(getRewardNum(account, tracker_type) == next_reward.load(), next_reward.load() != Int(0))).Then(
+                ExtractUint64(rewards.load(), (reward_code + Int(REWARD_TABLE_SLOTS)) * Int(8))
             ).Else(
                 Int(0) # If reward milestone is not met, return 0
-            )
+            ))
 
 
     ## on_create logic (creation steps)
@@ -102,6 +207,7 @@ def approval_program():
             App.globalPut(account_key, Txn.application_args[0]),
             App.globalPut(plto_id, Txn.assets[0]),
             App.globalPut(id_app_id, Txn.application_args[3]),
+            App.globalPut(reward_table_key, Bytes("base16", reward_table(DEFAULT_MILESTONES, DEFAULT_AMOUNTS).hex())),
             Assert(Global.latest_timestamp() < on_create_start_time),
             Int(1),
             )
@@ -125,28 +231,8 @@ def approval_program():
     def on_check():
         account_key = Txn.application_args[1]
         ref_account_key = Txn.accounts[0]
-        account_type_query = App.localGetEx(ref_account_key, Btoi(App.globalGet(id_app_id)), Bytes("type"))
-        account_type = Seq(
-                    account_type_query,
-                    Assert(account_type_query.hasValue()),
-                    account_type_query.value()
-                )
-
-        tracker_type = If(
-            account_type == Int(1)
-        ).Then(
-            Bytes("buyer_orders")
-        ).ElseIf(
-            account_type == Int(2)
-        ).Then(
-            Bytes("store_orders")
-        ).ElseIf(
-            account_type == Int(3)
-        ).Then(
-            Bytes("couri_deliveries")
-        )
         reward_type = Txn.application_args[4]
-        reward_amount = getRewardAmount(account_key, tracker_type, reward_type, App.globalGet(id_app_id))
+        reward_amount = ScratchVar(TealType.uint64)
 
         # account_key_query = App.localGetEx(ref_account_key, Btoi(App.globalGet(id_app_id)), Bytes("referer"))
         # account_key_check = Seq(
@@ -157,11 +243,13 @@ def approval_program():
 
         return Seq(
             # Assert(account_key == account_key_check),
+            loadRewardState(),
+            reward_amount.store(getRewardAmount(account_key, getUserType(ref_account_key), getRewardCode(reward_type))),
             If(
-                reward_amount > Int(0)
+                reward_amount.load() > Int(0)
             ).Then(
                 Seq(
-                    issueReward(App.globalGet(plto_id), account_key, reward_amount),
+                    creditReward(account_key, reward_amount.load()),
                     Int(1)
                 )
             ).Else(
@@ -170,6 +258,69 @@ def approval_program():
         )
             
 
+    # on_check_batch logic (check_reward for many referrals at once)
+    # Application args:
+    # [0]: method to run
+    # [1]: referrals, 2 bytes each: Txn.accounts index of the referred account
+    #      and Txn.accounts index of the referrer to pay
+    # [2 + i]: reward type of referral i
+    # Foreign apps: [id app], foreign assets: [PLTO asset ID]
+    #
+    # Amounts are summed per referrer and each referrer gets one transfer, or one credit to its balance.
+    # Referrals that did not reach their milestone are skipped.
+    @Subroutine(TealType.uint64)
+    def on_check_batch():
+        referrals = Txn.application_args[1]
+        referral_count = Txn.application_args.length() - Int(2)
+        index = ScratchVar(TealType.uint64)
+        referrer_index = ScratchVar(TealType.uint64)
+        amount = ScratchVar(TealType.uint64)
+        # amount owed to Txn.accounts[i]
+        totals = [ScratchVar(TealType.uint64) for _ in range(MAX_ACCOUNT_INDEX + 1)]
+
+        referred_account = Txn.accounts[GetByte(referrals, index.load() * Int(2))]
+        reward_type = Txn.application_args[index.load() + Int(2)]
+        return Seq(
+            Assert(Len(referrals) == referral_count * Int(2)),
+            loadRewardState(),
+            *[total.store(Int(0)) for total in totals],
+            For(index.store(Int(0)), index.load() < referral_count, index.store(index.load() + Int(1))).Do(
+                Seq(
+                    referrer_index.store(GetByte(referrals, index.load() * Int(2) + Int(1))),
+                    amount.store(getRewardAmount(
+                        Txn.accounts[referrer_index.load()],
+                        getUserType(referred_account),
+                        getRewardCode(reward_type),
+                    )),
+                    jump_table(referrer_index.load(), {
+                        account_index: total.store(total.load() + amount.load())
+                        for account_index, total in enumerate(totals)
+                    }),
+                )
+            ),
+            *[
+                If(total.load() > Int(0)).Then(
+                    creditReward(Txn.accounts[account_index], total.load())
+                )
+                for account_index, total in enumerate(totals)
+            ],
+            Int(1),
+        )
+
+    ## on_set_rewards logic (milestone and amount tuning by the creator)
+    # Application args:
+    # [0]: method to run
+    # [1]: reward table, see reward_table
+    @Subroutine(TealType.uint64)
+    def on_set_rewards():
+        return Seq(
+            Assert(Txn.sender() == Global.creator_address()),
+            Assert(Len(Txn.application_args[1]) == Int(REWARD_TABLE_LENGTH)),
+            App.globalPut(reward_table_key, Txn.application_args[1]),
+            log_event(EventType.REWARD_TABLE, Int(0), Txn.sender()),
+            Int(1),
+        )
+
     ## on_active logic (for testing)
     # Application args:
     # [0]: method to run
@@ -198,9 +349,13 @@ def approval_program():
     # Router
     on_call_method = Txn.application_args[0]
     on_call = Cond(
-        [on_call_method == Bytes("check_reward"), on_check()],
-        [on_call_method == Bytes("check_active"), on_active()],
-        [on_call_method == Bytes("asset_opt_in"), optInPLTO()],
+        [on_call_method == Bytes(METHOD_CHECK_REWARD), on_check()],
+        [on_call_method == Bytes(METHOD_CHECK_ACTIVE), on_active()],
+        [on_call_method == Bytes(METHOD_ASSET_OPT_IN), optInPLTO()],
+        [on_call_method == Bytes(METHOD_CHECK_REWARDS), on_check_batch()],
+        [on_call_method == Bytes(METHOD_SET_REWARDS), on_set_rewards()],
+        [on_call_method == Bytes(METHOD_CLAIM), claimBalance()],
+        [on_call_method == Bytes(METHOD_OP_UP), Int(1)],
         # Can add more branches for other methods
     )
 
@@ -210,7 +365,8 @@ def approval_program():
         [Txn.on_completion() == OnComplete.OptIn, opt_in()],
         [Txn.on_completion() == OnComplete.DeleteApplication, Int(0)],
         [Txn.on_completion() == OnComplete.UpdateApplication, Int(0)],
-        [Txn.on_completion() == OnComplete.CloseOut, Int(1)],
+        # the balance left is paid out
+        [Txn.on_completion() == OnComplete.CloseOut, claimBalance()],
     )
 
     return program
@@ -221,9 +377,9 @@ def clear_state_program():
 
 if __name__ == "__main__":
     with open("./dist/rewards_approval.teal", "w") as f:
-        compiled = compileTeal(approval_program(), mode=Mode.Application, version=5)
+        compiled = compileTeal(approval_program(), mode=Mode.Application, version=6)
         f.write(compiled)
 
     with open("./dist/rewards_clear_state.teal", "w") as f:
-        compiled = compileTeal(clear_state_program(), mode=Mode.Application, version=5)
+        compiled = compileTeal(clear_state_program(), mode=Mode.Application, version=6)
         f.write(compiled)
\ No newline at end of file
@@ -0,0 +1,592 @@
+import hashlib
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from avm import (
+    Ledger, Profile, Program, Transaction, assemble, evaluate_group, optimize, parse, subroutine_names, substitute,
+)
+from avm.address import logic_sig_address, sha512_256
+from avm.ledger import MIN_TXN_FEE
+from avm.opcodes import NAMED_INTS
+from build import CONTRACTS, compile_contract, load_contract_module
+
+# Representative calls of every router branch of the contracts, executed by the local AVM.
+# Each scenario builds a ledger holding the application in the state the branch expects and
+# returns the transaction group to evaluate.
+
+LATEST_TIMESTAMP = 1650000000
+ACCOUNT_BALANCE = 10000000
+ESCROW_BALANCE = 1000000
+ASA_TOTAL = 1000000
+TIPS_AMOUNT = 50
+ORDER_AMOUNT = 500000
+COURIER_REWARD_AMOUNT = 100000
+ACCEPT_DELIVERY_WINDOW = 30
+# The tips asset is the first asset created in the ledgers, so it gets the first ID
+ASA_ID = 1
+# Values of the TMPL_ variables of the contracts
+TEMPLATE_VALUES = {"TMPL_ASA_ID": ASA_ID, "TMPL_ACCEPT_DELIVERY_WINDOW": ACCEPT_DELIVERY_WINDOW}
+ORDER_ID = bytes.fromhex("0000000000000001")
+
+
+def address(name: str) -> bytes:
+    # Deterministic addresses keep the runs reproducible.
+    return sha512_256(name.encode())
+
+
+CREATOR = address("creator")
+CUSTOMER = address("customer")
+COURIER = address("courier")
+RESTAURANT = address("restaurant")
+BUYER = address("buyer")
+STORE = address("store")
+REFERRER = address("referrer")
+
+
+def itob(value: int) -> bytes:
+    return value.to_bytes(8, "big")
+
+
+class Programs(NamedTuple):
+    approval: Program
+    clear: Program
+    # "subN" label -> subroutine name
+    names: Dict[str, str]
+    teal_version: int
+
+
+@lru_cache(maxsize=None)
+def load_programs(contract_name: str, optimized: bool = True) -> Programs:
+    from pyteal import Mode, compileTeal
+
+    contract = next(contract for contract in CONTRACTS if contract.name == contract_name)
+    module = load_contract_module(contract)
+    (_, approval_function), (_, clear_function) = contract.programs
+    approval_ast = getattr(module, approval_function)()
+    approval = compileTeal(approval_ast, mode=Mode.Application, version=contract.teal_version)
+    clear = compileTeal(getattr(module, clear_function)(), mode=Mode.Application, version=contract.teal_version)
+    if optimized:
+        # like build.py does, the scenarios measure the deployed programs
+        approval, clear = optimize(approval), optimize(clear)
+    return Programs(
+        substitute(parse(approval), TEMPLATE_VALUES),
+        substitute(parse(clear), TEMPLATE_VALUES),
+        subroutine_names(approval_ast, contract.teal_version),
+        contract.teal_version,
+    )
+
+
+@lru_cache(maxsize=None)
+def load_logic_sig(contract_name: str) -> Program:
+    """The optimized logic signature of a contract, with its TMPL_ variables left in place."""
+    contract = next(contract for contract in CONTRACTS if contract.name == contract_name)
+    (file_name, _), = contract.programs
+    return parse(optimize(compile_contract(contract)[file_name]))
+
+
+class Scenario(NamedTuple):
+    contract: str
+    # router branch, e.g. "CLAIM_FUNDS" or "sto_val"
+    path: str
+    setup: Callable[[Programs], Tuple[Ledger, List[Transaction]]]
+
+
+def new_ledger(*accounts: bytes) -> Ledger:
+    ledger = Ledger(latest_timestamp=LATEST_TIMESTAMP)
+    for account in accounts:
+        ledger.fund(account, ACCOUNT_BALANCE)
+    return ledger
+
+
+def app_call(sender: bytes, app_id: int, args: List[bytes], **fields) -> Transaction:
+    return Transaction(type="appl", sender=sender, application_id=app_id, application_args=args, **fields)
+
+
+def app_create(sender: bytes, programs: Programs, args: List[bytes], global_schema, local_schema=(0, 0), **fields):
+    return Transaction(
+        type="appl",
+        sender=sender,
+        approval_program=programs.approval,
+        clear_state_program=programs.clear,
+        global_num_uint=global_schema[0],
+        global_num_byte_slice=global_schema[1],
+        local_num_uint=local_schema[0],
+        local_num_byte_slice=local_schema[1],
+        application_args=args,
+        **fields,
+    )
+
+
+# -- delivery (one escrow application per order)
+
+DELIVERY_GLOBAL_SCHEMA = (3, 2)
+# delivery/enums.py GlobalState.PackedSchema, for approval_program(packed=True)
+DELIVERY_PACKED_GLOBAL_SCHEMA = (0, 1)
+ORDER_STATUS = {"COOKING": 1, "DELIVERING": 2, "DELIVERED": 3, "DISPUTE": 4, "COMPLETED": 5, "CANCELED": 6}
+
+
+def delivery_global_state(status: str, packed: bool):
+    delivered_timestamp = LATEST_TIMESTAMP - 2 * ACCEPT_DELIVERY_WINDOW
+    if packed:
+        # delivery/enums.py GlobalState.Record
+        return {b"o": COURIER + RESTAURANT + itob(COURIER_REWARD_AMOUNT) + itob(ORDER_STATUS[status]) + itob(delivered_timestamp)}
+    return {
+        b"courierAddr": COURIER,
+        b"restaurantAddr": RESTAURANT,
+        b"courierRewardAmount": COURIER_REWARD_AMOUNT,
+        b"orderStatus": ORDER_STATUS[status],
+        b"deliveredTime": delivered_timestamp,
+    }
+
+
+def delivery_escrow(programs: Programs, status: str, asa_opted_in: bool = True, packed: bool = False):
+    ledger = new_ledger(CREATOR, COURIER, RESTAURANT)
+    # TMPL_ASA_ID is the first asset of the ledger
+    asa_id = ledger.create_asset(CREATOR, ASA_TOTAL)
+    ledger.opt_in_asset(COURIER, asa_id)
+    schema = DELIVERY_PACKED_GLOBAL_SCHEMA if packed else DELIVERY_GLOBAL_SCHEMA
+    app_id = ledger.install_app(CREATOR, programs.approval, programs.clear, schema, global_state=delivery_global_state(status, packed))
+    app_address = ledger.app(app_id).address
+    ledger.fund(app_address, ESCROW_BALANCE)
+    if asa_opted_in:
+        ledger.opt_in_asset(app_address, asa_id)
+        ledger.transfer_asset(CREATOR, app_address, asa_id, TIPS_AMOUNT)
+    return ledger, app_id, asa_id
+
+
+# delivery/enums.py ActionCode
+DELIVERY_ACTION_CODES = {
+    "CANCEL": 1, "PICK_UP_ORDER": 2, "START_DISPUTE": 3, "COMPLETE_ORDER": 4, "DELIVERED": 5, "CLAIM_FUNDS": 6,
+    "ASA_OPT_IN": 7,
+}
+
+
+def delivery_action(action: str, status: str, sender: bytes, accounts=(), asa_opted_in: bool = True,
+                    by_name: bool = False, packed: bool = False):
+    # The action is sent as its one-byte code, or as its ActionType name like older clients do.
+    action_arg = action.encode() if by_name else bytes((DELIVERY_ACTION_CODES[action],))
+
+    def setup(programs: Programs):
+        ledger, app_id, asa_id = delivery_escrow(programs, status, asa_opted_in, packed)
+        return ledger, [app_call(sender, app_id, [action_arg], accounts=list(accounts), assets=[asa_id])]
+    return setup
+
+
+def delivery_create(packed: bool = False):
+    def setup(programs: Programs):
+        ledger = new_ledger(CREATOR)
+        ledger.create_asset(CREATOR, ASA_TOTAL)
+        args = [COURIER, RESTAURANT, itob(COURIER_REWARD_AMOUNT)]
+        return ledger, [app_create(CREATOR, programs, args, DELIVERY_PACKED_GLOBAL_SCHEMA if packed else DELIVERY_GLOBAL_SCHEMA)]
+    return setup
+
+
+# -- order book (multi-order escrow)
+
+# delivery/enums.py OrderBook.Schema, a record and a state per open order
+ORDER_BOOK_GLOBAL_SCHEMA = (0, 64)
+ORDER_FEE_RESERVE = 3000
+
+
+def order_entries(status: str) -> Dict[bytes, object]:
+    """The global state entries of the order ORDER_ID, in that status."""
+    delivered_timestamp = LATEST_TIMESTAMP - 2 * ACCEPT_DELIVERY_WINDOW
+    return {
+        ORDER_ID: CUSTOMER + COURIER + RESTAURANT + itob(ORDER_AMOUNT) + itob(COURIER_REWARD_AMOUNT) + itob(TIPS_AMOUNT),
+        ORDER_ID + b"s": itob(ORDER_STATUS[status]) + itob(delivered_timestamp),
+    }
+
+
+def order_book(programs: Programs, status: str = None, asa_opted_in: bool = True):
+    ledger = new_ledger(CREATOR, CUSTOMER, COURIER, RESTAURANT)
+    asa_id = ledger.create_asset(CREATOR, ASA_TOTAL)
+    for account in (CUSTOMER, COURIER):
+        ledger.opt_in_asset(account, asa_id)
+    ledger.transfer_asset(CREATOR, CUSTOMER, asa_id, 10 * TIPS_AMOUNT)
+    app_id = ledger.install_app(CREATOR, programs.approval, programs.clear, ORDER_BOOK_GLOBAL_SCHEMA, (0, 0),
+                                order_entries(status) if status is not None else {})
+    app_address = ledger.app(app_id).address
+    ledger.fund(app_address, ESCROW_BALANCE)
+    if asa_opted_in:
+        ledger.opt_in_asset(app_address, asa_id)
+    if status is not None:
+        ledger.fund(app_address, ORDER_AMOUNT + ORDER_FEE_RESERVE)
+        ledger.transfer_asset(CUSTOMER, app_address, asa_id, TIPS_AMOUNT)
+    return ledger, app_id, asa_id
+
+
+def order_book_action(action: str, status: str, sender: bytes):
+    def setup(programs: Programs):
+        ledger, app_id, asa_id = order_book(programs, status)
+        return ledger, [app_call(sender, app_id, [action.encode(), ORDER_ID],
+                                 accounts=[CUSTOMER, COURIER, RESTAURANT], assets=[asa_id])]
+    return setup
+
+
+def order_book_place_order(programs: Programs):
+    ledger, app_id, asa_id = order_book(programs)
+    app_address = ledger.app(app_id).address
+    return ledger, [
+        Transaction(type="pay", sender=CUSTOMER, receiver=app_address, amount=ORDER_AMOUNT + ORDER_FEE_RESERVE),
+        Transaction(type="axfer", sender=CUSTOMER, asset_receiver=app_address, xfer_asset=asa_id, asset_amount=TIPS_AMOUNT),
+        app_call(CUSTOMER, app_id, [b"PLACE_ORDER", ORDER_ID, COURIER, RESTAURANT, itob(COURIER_REWARD_AMOUNT)]),
+    ]
+
+
+def order_book_opt_in(programs: Programs):
+    ledger, app_id, _ = order_book(programs)
+    return ledger, [app_call(CUSTOMER, app_id, [], on_completion=NAMED_INTS["OptIn"])]
+
+
+def order_book_claim_after_clear(programs: Programs):
+    # A customer clearing its local state takes no order with it, the courier is still paid.
+    ledger, app_id, asa_id = order_book(programs, "DELIVERED")
+    ledger.opt_in_app(CUSTOMER, app_id, {})
+    return ledger, [
+        app_call(CUSTOMER, app_id, [], on_completion=NAMED_INTS["ClearState"]),
+        app_call(COURIER, app_id, [b"CLAIM_FUNDS", ORDER_ID], accounts=[CUSTOMER, COURIER, RESTAURANT], assets=[asa_id]),
+    ]
+
+
+def order_book_asa_opt_in(programs: Programs):
+    ledger, app_id, asa_id = order_book(programs, asa_opted_in=False)
+    return ledger, [app_call(CREATOR, app_id, [b"ASA_OPT_IN"], assets=[asa_id])]
+
+
+# -- status app (orders held by logic signature escrows)
+# The scenarios measure the status app calls: their escrow is the fixed ESCROW address, whose
+# logic signature is not evaluated, unless they are built with logic_sig=True.
+
+ESCROW = address("escrow")
+STATUS_LOCAL_SCHEMA = (0, 1)
+DEADLINE_ROUND = 100
+# delivery/enums.py LogicSigEscrow.Params, the settlement group
+SETTLEMENT_GROUP_SIZE = 4
+
+
+def status_record(status: str) -> bytes:
+    delivered_timestamp = LATEST_TIMESTAMP - 2 * ACCEPT_DELIVERY_WINDOW
+    return (COURIER + RESTAURANT + CREATOR + itob(ORDER_STATUS[status]) + itob(delivered_timestamp)
+            + itob(DEADLINE_ROUND))
+
+
+class Escrow(NamedTuple):
+    address: bytes
+    # signs the transactions of the escrow, None for ESCROW
+    logic_sig: Optional[Program] = None
+
+
+def status_escrow(app_id: int) -> Escrow:
+    """The logic signature escrow of the order of status_record, for the status app app_id."""
+    program = substitute(load_logic_sig("delivery_logicsig"), {
+        **TEMPLATE_VALUES,
+        "TMPL_STATUS_APP_ID": app_id,
+        "TMPL_COURIER_ADDRESS": COURIER,
+        "TMPL_RESTAURANT_ADDRESS": RESTAURANT,
+        "TMPL_CUSTOMER_ADDRESS": CREATOR,
+        "TMPL_COURIER_REWARD_AMOUNT": COURIER_REWARD_AMOUNT,
+        "TMPL_DEADLINE": DEADLINE_ROUND,
+        "TMPL_ORDER_ID": ORDER_ID,
+    })
+    return Escrow(logic_sig_address(assemble(program)), program)
+
+
+def delivery_status(programs: Programs, status: str = None, logic_sig: bool = False):
+    ledger = new_ledger(CREATOR, COURIER, RESTAURANT)
+    asa_id = ledger.create_asset(CREATOR, ASA_TOTAL)
+    ledger.opt_in_asset(COURIER, asa_id)
+    app_id = ledger.install_app(CREATOR, programs.approval, programs.clear, (0, 0), STATUS_LOCAL_SCHEMA)
+    escrow = status_escrow(app_id) if logic_sig else Escrow(ESCROW)
+    ledger.fund(escrow.address, ESCROW_BALANCE)
+    if status is not None:
+        ledger.opt_in_asset(escrow.address, asa_id)
+        ledger.transfer_asset(CREATOR, escrow.address, asa_id, TIPS_AMOUNT)
+        ledger.opt_in_app(escrow.address, app_id, {b"o": status_record(status)})
+    return ledger, app_id, asa_id, escrow
+
+
+def delivery_status_action(action: str, status: str, sender: bytes, logic_sig: bool = False):
+    def setup(programs: Programs):
+        ledger, app_id, asa_id, escrow = delivery_status(programs, status, logic_sig)
+        call = app_call(sender, app_id, [bytes((DELIVERY_ACTION_CODES[action],))], accounts=[escrow.address])
+        if action not in ("CANCEL", "COMPLETE_ORDER", "CLAIM_FUNDS"):
+            return ledger, [call]
+        # CANCEL refunds the customer, the other settlements pay the courier and close to the restaurant
+        payee, close_to, amount = (CREATOR, CREATOR, 0) if action == "CANCEL" else (COURIER, RESTAURANT, COURIER_REWARD_AMOUNT)
+        call.fee = SETTLEMENT_GROUP_SIZE * MIN_TXN_FEE
+        signed = {"sender": escrow.address, "logic_sig": escrow.logic_sig, "fee": 0}
+        return ledger, [
+            call,
+            Transaction(type="appl", application_id=app_id, on_completion=NAMED_INTS["CloseOut"], **signed),
+            Transaction(type="axfer", asset_receiver=payee, xfer_asset=asa_id, asset_close_to=payee, **signed),
+            Transaction(type="pay", receiver=payee, amount=amount, close_remainder_to=close_to, **signed),
+        ]
+    return setup
+
+
+def delivery_status_opt_in(programs: Programs):
+    ledger, app_id, asa_id, _ = delivery_status(programs)
+    ledger.opt_in_asset(ESCROW, asa_id)
+    args = [COURIER, RESTAURANT, CREATOR, itob(DEADLINE_ROUND)]
+    return ledger, [app_call(ESCROW, app_id, args, on_completion=NAMED_INTS["OptIn"])]
+
+
+# -- identity
+
+# identity/app.py global_schema() and local_schema()
+IDENTITY_GLOBAL_SCHEMA = (1, 9)
+IDENTITY_LOCAL_SCHEMA = (8, 5)
+USER_TYPE = {"buyer": 1, "store": 2, "courier": 3}
+STORE_LAT = b"45.5017"
+STORE_LNG = b"-73.5673"
+# batch number of the attestation scenarios
+ATTESTATION_BATCH = 3
+
+
+def identity_app(programs: Programs, global_state=None, **local_states):
+    ledger = new_ledger(CREATOR, BUYER, STORE, COURIER, REFERRER)
+    app_id = ledger.install_app(CREATOR, programs.approval, programs.clear, IDENTITY_GLOBAL_SCHEMA, IDENTITY_LOCAL_SCHEMA,
+                                global_state or {b"attestor": CREATOR})
+    for name, local_state in local_states.items():
+        ledger.opt_in_app(address(name), app_id, local_state)
+    return ledger, app_id
+
+
+def store_local_state(filled_slots: int = 0) -> Dict[bytes, object]:
+    from identity.app import BUYER_PAGE_SLOTS, BUYER_SLOT_CAPACITY, buyer_page_count
+
+    state = {b"type": USER_TYPE["store"], b"state": 0, b"lat": STORE_LAT, b"lng": STORE_LNG,
+             b"store_orders": 5, b"referer": REFERRER}
+    slots = [address(f"buyer{slot}") if slot < filled_slots else bytes(32) for slot in range(BUYER_SLOT_CAPACITY)]
+    for page in range(buyer_page_count(BUYER_SLOT_CAPACITY)):
+        state[f"buyers{page}".encode()] = b"".join(slots[page * BUYER_PAGE_SLOTS:(page + 1) * BUYER_PAGE_SLOTS])
+    return state
+
+
+def identity_create(programs: Programs):
+    ledger = new_ledger(CREATOR)
+    args = [itob(LATEST_TIMESTAMP + 1000)]
+    return ledger, [app_create(CREATOR, programs, args, IDENTITY_GLOBAL_SCHEMA, IDENTITY_LOCAL_SCHEMA)]
+
+
+def identity_opt_in(user_type: str):
+    def setup(programs: Programs):
+        ledger, app_id = identity_app(programs)
+        sender = address(user_type)
+        args = [sender, itob(USER_TYPE[user_type]), itob(LATEST_TIMESTAMP), STORE_LAT, STORE_LNG, REFERRER]
+        return ledger, [app_call(sender, app_id, args, on_completion=NAMED_INTS["OptIn"])]
+    return setup
+
+
+def identity_store_validate(filled_slots: int):
+    def setup(programs: Programs):
+        ledger, app_id = identity_app(programs, buyer={b"type": USER_TYPE["buyer"]}, store=store_local_state(filled_slots))
+        args = [b"sto_val", itob(USER_TYPE["buyer"]), itob(LATEST_TIMESTAMP), STORE]
+        return ledger, [app_call(BUYER, app_id, args, accounts=[STORE])]
+    return setup
+
+
+def attestation_root(buyer: bytes, store: bytes, index: int, siblings: List[bytes]) -> bytes:
+    node = hashlib.sha256(b"\x00" + buyer + store).digest()
+    for sibling in siblings:
+        node = hashlib.sha256(sibling + node if index & 1 else node + sibling).digest()
+        index >>= 1
+    return node
+
+
+def identity_post_root(programs: Programs):
+    ledger, app_id = identity_app(programs, {b"attestor": CREATOR, b"batches": ATTESTATION_BATCH})
+    root = address("root")
+    return ledger, [app_call(CREATOR, app_id, [b"att_root", root, itob(1 << 20)])]
+
+
+def identity_store_prove(depth: int, op_ups: int):
+    # The attestation of BUYER by STORE in a batch of 2^depth attestations, its proof exceeds the
+    # budget of one call past a few levels and the group carries op_up calls.
+    def setup(programs: Programs):
+        index = (1 << depth) - 1
+        siblings = [address(f"sibling{level}") for level in range(depth)]
+        root = attestation_root(BUYER, STORE, index, siblings)
+        root_key = b"root" + itob(ATTESTATION_BATCH % 8)
+        ledger, app_id = identity_app(
+            programs, {b"attestor": CREATOR, b"batches": ATTESTATION_BATCH + 1, root_key: root},
+            buyer={b"type": USER_TYPE["buyer"]}, store=store_local_state(),
+        )
+        args = [b"sto_prf", BUYER, STORE, itob(ATTESTATION_BATCH), itob(index), b"".join(siblings)]
+        op_up_calls = [app_call(CREATOR, app_id, [b"op_up"], note=bytes([call])) for call in range(op_ups)]
+        return ledger, [app_call(CREATOR, app_id, args, accounts=[BUYER, STORE])] + op_up_calls
+    return setup
+
+
+def identity_courier_validate(programs: Programs):
+    ledger, app_id = identity_app(programs, store=store_local_state(), courier={b"type": USER_TYPE["courier"], b"v1": bytes(32)})
+    args = [b"cou_val", itob(USER_TYPE["store"]), itob(LATEST_TIMESTAMP), COURIER]
+    return ledger, [app_call(STORE, app_id, args, accounts=[COURIER])]
+
+
+# -- reward
+
+REWARD_GLOBAL_SCHEMA = (3, 3)
+REWARD_LOCAL_SCHEMA = (1, 0)
+# balance of the referrers opted in to the reward application
+ACCRUED_BALANCE = 30
+REWARD_POOL = 100000
+# reward/app.py reward_table(DEFAULT_MILESTONES, DEFAULT_AMOUNTS)
+REWARD_TABLE = b"".join(itob(value) for value in (0, 1, 5, 1, 0, 10, 50, 25))
+
+
+def reward_app(programs: Programs, asa_opted_in: bool = True, accruing=()):
+    ledger = new_ledger(CREATOR, BUYER, REFERRER)
+    plto_id = ledger.create_asset(CREATOR, ASA_TOTAL)
+    identity_id = ledger.install_app(CREATOR, load_programs("identity").approval, load_programs("identity").clear,
+                                     IDENTITY_GLOBAL_SCHEMA, IDENTITY_LOCAL_SCHEMA)
+    ledger.opt_in_app(BUYER, identity_id, {b"type": USER_TYPE["buyer"]})
+    ledger.opt_in_app(REFERRER, identity_id, {b"type": USER_TYPE["buyer"], b"buyer_orders": 1})
+    ledger.opt_in_asset(REFERRER, plto_id)
+    app_id = ledger.install_app(CREATOR, programs.approval, programs.clear, REWARD_GLOBAL_SCHEMA, REWARD_LOCAL_SCHEMA, global_state={
+        b"account": CREATOR,
+        b"plto_id": plto_id,
+        b"id_app": itob(identity_id),
+        b"rewards": REWARD_TABLE,
+    })
+    app_address = ledger.app(app_id).address
+    ledger.fund(app_address, ESCROW_BALANCE)
+    if asa_opted_in:
+        ledger.opt_in_asset(app_address, plto_id)
+        ledger.transfer_asset(CREATOR, app_address, plto_id, REWARD_POOL)
+    for referrer in accruing:
+        ledger.opt_in_app(referrer, app_id, {b"balance": ACCRUED_BALANCE})
+    return ledger, app_id, plto_id, identity_id
+
+
+def reward_create(programs: Programs):
+    ledger = new_ledger(CREATOR)
+    plto_id = ledger.create_asset(CREATOR, ASA_TOTAL)
+    args = [CREATOR, itob(plto_id), itob(LATEST_TIMESTAMP + 1000), itob(plto_id + 1)]
+    return ledger, [app_create(CREATOR, programs, args, REWARD_GLOBAL_SCHEMA, assets=[plto_id])]
+
+
+def reward_check_reward(by_name: bool = False, accrue: bool = False):
+    # The reward type is sent as its one-byte code, or as its name like older clients do.
+    # With accrue, the referrer opted in to the application and the reward goes to its balance.
+    reward_type = b"eater_referral" if by_name else bytes((1,))
+
+    def setup(programs: Programs):
+        ledger, app_id, plto_id, identity_id = reward_app(programs, accruing=[REFERRER] if accrue else [])
+        args = [b"check_reward", REFERRER, BUYER, itob(LATEST_TIMESTAMP), reward_type]
+        return ledger, [app_call(BUYER, app_id, args, accounts=[REFERRER], applications=[identity_id], assets=[plto_id])]
+    return setup
+
+
+def reward_check_rewards(accrue: bool = False, batch: int = 4, op_ups: int = 0):
+    # Referrals of buyers paid to two referrers: Txn.accounts is [BUYER, REFERRER, RESTAURANT, CUSTOMER, COURIER].
+    # Past 4 referrals the budget of the call is pooled with op_up calls.
+    def setup(programs: Programs):
+        ledger, app_id, plto_id, identity_id = reward_app(programs)
+        ledger.opt_in_app(RESTAURANT, identity_id, {b"type": USER_TYPE["buyer"], b"buyer_orders": 1})
+        ledger.opt_in_asset(RESTAURANT, plto_id)
+        if accrue:
+            for referrer in (REFERRER, RESTAURANT):
+                ledger.opt_in_app(referrer, app_id, {b"balance": ACCRUED_BALANCE})
+        for referred in (CUSTOMER, COURIER):
+            ledger.fund(referred, ACCOUNT_BALANCE)
+            ledger.opt_in_app(referred, identity_id, {b"type": USER_TYPE["buyer"]})
+        pairs = [(0, 1), (3, 1), (4, 2), (0, 2)]
+        referrals = bytes(index for number in range(batch) for index in pairs[number % len(pairs)])
+        args = [b"check_rewards", referrals] + [bytes((1,))] * batch
+        op_up_calls = [app_call(BUYER, app_id, [b"op_up"], note=bytes([call])) for call in range(op_ups)]
+        return ledger, [app_call(BUYER, app_id, args, accounts=[REFERRER, RESTAURANT, CUSTOMER, COURIER],
+                                 applications=[identity_id], assets=[plto_id])] + op_up_calls
+    return setup
+
+
+def reward_claim(programs: Programs):
+    ledger, app_id, plto_id, _ = reward_app(programs, accruing=[REFERRER])
+    return ledger, [app_call(REFERRER, app_id, [b"claim"], assets=[plto_id], fee=2 * MIN_TXN_FEE)]
+
+
+def reward_set_rewards(programs: Programs):
+    ledger, app_id, _, _ = reward_app(programs)
+    return ledger, [app_call(CREATOR, app_id, [b"set_rewards", REWARD_TABLE])]
+
+
+def reward_check_active(programs: Programs):
+    ledger, app_id, _, _ = reward_app(programs)
+    args = [b"check_active", BUYER, itob(USER_TYPE["buyer"]), itob(LATEST_TIMESTAMP)]
+    return ledger, [app_call(BUYER, app_id, args)]
+
+
+def reward_asset_opt_in(programs: Programs):
+    ledger, app_id, plto_id, _ = reward_app(programs, asa_opted_in=False)
+    return ledger, [app_call(CREATOR, app_id, [b"asset_opt_in"], assets=[plto_id], fee=2 * MIN_TXN_FEE)]
+
+
+SCENARIOS = (
+    Scenario("delivery", "create", delivery_create()),
+    Scenario("delivery", "CANCEL", delivery_action("CANCEL", "COOKING", COURIER, [CREATOR])),
+    Scenario("delivery", "PICK_UP_ORDER", delivery_action("PICK_UP_ORDER", "COOKING", COURIER)),
+    Scenario("delivery", "START_DISPUTE", delivery_action("START_DISPUTE", "DELIVERED", CREATOR)),
+    Scenario("delivery", "COMPLETE_ORDER", delivery_action("COMPLETE_ORDER", "DELIVERED", CREATOR, [COURIER, RESTAURANT])),
+    Scenario("delivery", "DELIVERED", delivery_action("DELIVERED", "DELIVERING", COURIER)),
+    Scenario("delivery", "CLAIM_FUNDS", delivery_action("CLAIM_FUNDS", "DELIVERED", COURIER, [RESTAURANT])),
+    Scenario("delivery", "ASA_OPT_IN", delivery_action("ASA_OPT_IN", "COOKING", CREATOR, asa_opted_in=False)),
+    Scenario("delivery", "CANCEL:by_name", delivery_action("CANCEL", "COOKING", COURIER, [CREATOR], by_name=True)),
+    Scenario("delivery", "ASA_OPT_IN:by_name",
+             delivery_action("ASA_OPT_IN", "COOKING", CREATOR, asa_opted_in=False, by_name=True)),
+    Scenario("delivery_packed", "create", delivery_create(packed=True)),
+    Scenario("delivery_packed", "CANCEL", delivery_action("CANCEL", "COOKING", COURIER, [CREATOR], packed=True)),
+    Scenario("delivery_packed", "PICK_UP_ORDER", delivery_action("PICK_UP_ORDER", "COOKING", COURIER, packed=True)),
+    Scenario("delivery_packed", "START_DISPUTE", delivery_action("START_DISPUTE", "DELIVERED", CREATOR, packed=True)),
+    Scenario("delivery_packed", "COMPLETE_ORDER",
+             delivery_action("COMPLETE_ORDER", "DELIVERED", CREATOR, [COURIER, RESTAURANT], packed=True)),
+    Scenario("delivery_packed", "DELIVERED", delivery_action("DELIVERED", "DELIVERING", COURIER, packed=True)),
+    Scenario("delivery_packed", "CLAIM_FUNDS", delivery_action("CLAIM_FUNDS", "DELIVERED", COURIER, [RESTAURANT], packed=True)),
+    Scenario("order_book", "opt_in", order_book_opt_in),
+    Scenario("order_book", "PLACE_ORDER", order_book_place_order),
+    Scenario("order_book", "CANCEL", order_book_action("CANCEL", "COOKING", COURIER)),
+    Scenario("order_book", "PICK_UP_ORDER", order_book_action("PICK_UP_ORDER", "COOKING", COURIER)),
+    Scenario("order_book", "START_DISPUTE", order_book_action("START_DISPUTE", "DELIVERED", CUSTOMER)),
+    Scenario("order_book", "COMPLETE_ORDER", order_book_action("COMPLETE_ORDER", "DELIVERED", CUSTOMER)),
+    Scenario("order_book", "DELIVERED", order_book_action("DELIVERED", "DELIVERING", COURIER)),
+    Scenario("order_book", "CLAIM_FUNDS", order_book_action("CLAIM_FUNDS", "DELIVERED", COURIER)),
+    Scenario("order_book", "CLAIM_FUNDS:after_clear", order_book_claim_after_clear),
+    Scenario("order_book", "ASA_OPT_IN", order_book_asa_opt_in),
+    Scenario("delivery_status", "opt_in", delivery_status_opt_in),
+    Scenario("delivery_status", "CANCEL", delivery_status_action("CANCEL", "COOKING", COURIER)),
+    Scenario("delivery_status", "PICK_UP_ORDER", delivery_status_action("PICK_UP_ORDER", "COOKING", COURIER)),
+    Scenario("delivery_status", "START_DISPUTE", delivery_status_action("START_DISPUTE", "DELIVERED", CREATOR)),
+    Scenario("delivery_status", "COMPLETE_ORDER", delivery_status_action("COMPLETE_ORDER", "DELIVERED", CREATOR)),
+    Scenario("delivery_status", "DELIVERED", delivery_status_action("DELIVERED", "DELIVERING", COURIER)),
+    Scenario("delivery_status", "CLAIM_FUNDS", delivery_status_action("CLAIM_FUNDS", "DELIVERED", COURIER)),
+    Scenario("identity", "create", identity_create),
+    Scenario("identity", "opt_in:buyer", identity_opt_in("buyer")),
+    Scenario("identity", "opt_in:store", identity_opt_in("store")),
+    Scenario("identity", "opt_in:courier", identity_opt_in("courier")),
+    Scenario("identity", "sto_val", identity_store_validate(0)),
+    Scenario("identity", "sto_val:last_slot", identity_store_validate(4)),
+    Scenario("identity", "cou_val", identity_courier_validate),
+    Scenario("identity", "att_root", identity_post_root),
+    Scenario("identity", "sto_prf:depth_4", identity_store_prove(4, 0)),
+    Scenario("identity", "sto_prf:depth_20", identity_store_prove(20, 2)),
+    Scenario("reward", "create", reward_create),
+    Scenario("reward", "check_reward", reward_check_reward()),
+    Scenario("reward", "check_reward:by_name", reward_check_reward(by_name=True)),
+    Scenario("reward", "check_rewards", reward_check_rewards()),
+    Scenario("reward", "check_reward:accrue", reward_check_reward(accrue=True)),
+    Scenario("reward", "check_rewards:accrue", reward_check_rewards(accrue=True)),
+    Scenario("reward", "check_rewards:batch_14", reward_check_rewards(batch=14, op_ups=2)),
+    Scenario("reward", "claim", reward_claim),
+    Scenario("reward", "set_rewards", reward_set_rewards),
+    Scenario("reward", "check_active", reward_check_active),
+    Scenario("reward", "asset_opt_in", reward_asset_opt_in),
+)
+
+
+def run_scenario(scenario: Scenario) -> Profile:
+    """Evaluates the scenario's transaction group and returns the profile of its application calls.
+    Raises avm.LogicError or avm.LedgerError if the group is rejected."""
+    programs = load_programs(scenario.contract)
+    ledger, txns = scenario.setup(programs)
+    profile = Profile(programs.names)
+    evaluate_group(ledger, txns, profile)
+    return profile
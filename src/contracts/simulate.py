@@ -0,0 +1,329 @@
+import argparse
+import json
+from typing import Dict, List, NamedTuple, Tuple
+
+from avm import LedgerError, LogicError, Profile, evaluate_group
+from avm.ledger import APP_PAGE_MIN_BALANCE, MIN_TXN_FEE, SCHEMA_BYTES_MIN_BALANCE, SCHEMA_UINT_MIN_BALANCE
+from scenarios import (
+    ACCEPT_DELIVERY_WINDOW, COURIER, CREATOR, DELIVERY_GLOBAL_SCHEMA,
+    DELIVERY_PACKED_GLOBAL_SCHEMA, ORDER_STATUS, RESTAURANT, delivery_action, load_programs,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Capacity and cost planning of the delivery escrows (one application per order).
+#
+# The transition rules are not written down here, they are read from delivery/app.py: every
+# action is sent from every order status to the compiled approval program in the local AVM,
+# which gives the status each accepted action leads to, its inner transactions and its opcode
+# cost, and the escrow minimum balance. Synthetic orders are then pushed through these rules as
+# NumPy arrays, one step of the lifecycle of every open order at a time, and the events are
+# binned per second into throughput, fee and locked balance curves.
+#
+# The behaviour of the parties (cooking and delivery times, cancels, disputes, how fast
+# customers confirm) is the input of the model; the AVM only decides what the contract accepts.
+# The accept delivery window is not in the rules table: CLAIM_FUNDS is only sent once the window
+# after DELIVERED has passed, as can_claim_funds requires.
+#
+# Usage: python3 src/contracts/simulate.py [--orders-per-second N] [--duration S] [--packed] [--json]
+#        python3 src/contracts/simulate.py --rules   (the derived rules, does not need numpy)
+
+# The sender and accounts of every action, as sent by the clients
+ACTION_CALLS = {
+    "CANCEL": (COURIER, [CREATOR]),
+    "PICK_UP_ORDER": (COURIER, []),
+    "START_DISPUTE": (CREATOR, []),
+    "COMPLETE_ORDER": (CREATOR, [COURIER, RESTAURANT]),
+    "DELIVERED": (COURIER, []),
+    "CLAIM_FUNDS": (COURIER, [RESTAURANT]),
+}
+# application create, then payment, ASA_OPT_IN and tips transfer in one group
+PLACE_ORDER_TXNS = 4
+# the inner transactions paid by the escrow, funded when the order is placed
+ESCROW_FEE_RESERVE = 3 * MIN_TXN_FEE
+NO_STATUS = 0
+
+
+class Rules(NamedTuple):
+    statuses: Dict[str, int]
+    actions: Tuple[str, ...]
+    # [action index][status] -> status after the action, NO_STATUS if the contract rejects it
+    next_status: List[List[int]]
+    inner_txns: Dict[str, int]
+    costs: Dict[str, int]
+    # minimum balance of the escrow account and of the application, held by its creator
+    escrow_min_balance: int
+    app_min_balance: int
+    place_order_inner_txns: int
+
+    def terminal_statuses(self) -> List[int]:
+        return [
+            status for status in self.statuses.values()
+            if all(row[status] == NO_STATUS for row in self.next_status)
+        ]
+
+    def to_dict(self) -> dict:
+        names = {status: name for name, status in self.statuses.items()}
+        return {
+            "transitions": {
+                action: {names[status]: names[row[status]] for status in names if row[status] != NO_STATUS}
+                for action, row in zip(self.actions, self.next_status)
+            },
+            "inner_txns": self.inner_txns,
+            "costs": self.costs,
+            "escrow_min_balance": self.escrow_min_balance,
+            "app_min_balance": self.app_min_balance,
+            "place_order_inner_txns": self.place_order_inner_txns,
+        }
+
+
+def order_status(ledger, app_id: int, packed: bool) -> int:
+    global_state = ledger.app(app_id).global_state
+    if packed:
+        # delivery/enums.py GlobalState.Record, the status follows two addresses and the reward
+        return int.from_bytes(global_state[b"o"][72:80], "big")
+    return global_state[b"orderStatus"]
+
+
+def derive_rules(packed: bool = False) -> Rules:
+    """Sends every action from every status to the approval program in the local AVM."""
+    programs = load_programs("delivery_packed" if packed else "delivery")
+    actions = tuple(ACTION_CALLS)
+    next_status = [[NO_STATUS] * (max(ORDER_STATUS.values()) + 1) for _ in actions]
+    inner_txns, costs = {}, {}
+    for action_index, action in enumerate(actions):
+        sender, accounts = ACTION_CALLS[action]
+        for status_name, status in ORDER_STATUS.items():
+            ledger, txns = delivery_action(action, status_name, sender, accounts, packed=packed)(programs)
+            profile = Profile(programs.names)
+            try:
+                evaluate_group(ledger, txns, profile)
+            except (LogicError, LedgerError):
+                continue
+            next_status[action_index][status] = order_status(ledger, txns[0].application_id, packed)
+            inner_txns[action] = len(profile.inner_txns)
+            costs[action] = profile.cost
+    ledger, txns = delivery_action("ASA_OPT_IN", "COOKING", CREATOR, asa_opted_in=False, packed=packed)(programs)
+    profile = Profile(programs.names)
+    evaluate_group(ledger, txns, profile)
+    global_schema = DELIVERY_PACKED_GLOBAL_SCHEMA if packed else DELIVERY_GLOBAL_SCHEMA
+    return Rules(
+        statuses=dict(ORDER_STATUS),
+        actions=actions,
+        next_status=next_status,
+        inner_txns=inner_txns,
+        costs=costs,
+        escrow_min_balance=ledger.min_balance(ledger.app(txns[0].application_id).address),
+        app_min_balance=(APP_PAGE_MIN_BALANCE + SCHEMA_UINT_MIN_BALANCE * global_schema[0]
+                         + SCHEMA_BYTES_MIN_BALANCE * global_schema[1]),
+        place_order_inner_txns=len(profile.inner_txns),
+    )
+
+
+class Model(NamedTuple):
+    """Behaviour of the parties, times in seconds and amounts in micro units."""
+    orders_per_second: float = 50.0
+    duration: int = 3600
+    accept_delivery_window: int = ACCEPT_DELIVERY_WINDOW
+    cook_mean: float = 600.0
+    delivery_mean: float = 900.0
+    # share of the orders canceled by the courier or the restaurant while cooking
+    cancel_rate: float = 0.03
+    # share of the customers confirming the delivery, the courier claims the others
+    confirm_rate: float = 0.7
+    confirm_mean: float = 20.0
+    # share of the confirming customers opening a dispute instead
+    dispute_rate: float = 0.01
+    dispute_mean: float = 3600.0
+    # how long a courier takes to claim once the window has passed
+    claim_delay_mean: float = 5.0
+    # how long the customer takes to delete the settled application, releasing its minimum balance
+    delete_delay: float = 60.0
+    order_amount: int = 500000
+    tips_amount: int = 50
+    seed: int = 0
+
+
+def choose_actions(rules: Rules, model: Model, status, rng):
+    """(action index, delay) of the next action of open orders, by status."""
+    index = {action: action_index for action_index, action in enumerate(rules.actions)}
+    actions = np.full(len(status), -1, dtype=np.int8)
+    delays = np.zeros(len(status))
+
+    def pick(mask, action, delay):
+        actions[mask] = index[action]
+        delays[mask] = delay[mask] if np.ndim(delay) else delay
+
+    size = len(status)
+    cooking = status == rules.statuses["COOKING"]
+    canceled = cooking & (rng.random(size) < model.cancel_rate)
+    cook_time = rng.exponential(model.cook_mean, size)
+    pick(cooking & ~canceled, "PICK_UP_ORDER", cook_time)
+    pick(canceled, "CANCEL", cook_time)
+
+    pick(status == rules.statuses["DELIVERING"], "DELIVERED", rng.exponential(model.delivery_mean, size))
+
+    # The customer acts if they do so before the courier may claim, the window has to pass first.
+    delivered = status == rules.statuses["DELIVERED"]
+    confirm_time = np.where(rng.random(size) < model.confirm_rate, rng.exponential(model.confirm_mean, size), np.inf)
+    claim_time = model.accept_delivery_window + rng.exponential(model.claim_delay_mean, size)
+    customer_first = delivered & (confirm_time < claim_time)
+    disputed = customer_first & (rng.random(size) < model.dispute_rate)
+    pick(customer_first & ~disputed, "COMPLETE_ORDER", confirm_time)
+    pick(disputed, "START_DISPUTE", confirm_time)
+    pick(delivered & ~customer_first, "CLAIM_FUNDS", claim_time)
+
+    pick(status == rules.statuses["DISPUTE"], "COMPLETE_ORDER", rng.exponential(model.dispute_mean, size))
+    return actions, delays
+
+
+class Simulation(NamedTuple):
+    orders: int
+    # per second
+    txns: "np.ndarray"
+    inner_txns: "np.ndarray"
+    open_orders: "np.ndarray"
+    # micro Algos held in escrows and in application minimum balances, micro PLATO held in escrows
+    locked_algos: "np.ndarray"
+    locked_min_balance: "np.ndarray"
+    locked_tips: "np.ndarray"
+    action_counts: Dict[str, int]
+    rejected: int
+    fees: int
+    # seconds from DELIVERED to the release of the funds
+    settle_delays: "np.ndarray"
+
+
+def simulate(rules: Rules, model: Model) -> Simulation:
+    if np is None:
+        raise SystemExit("simulate.py requires numpy, e.g. pip install numpy")
+    rng = np.random.default_rng(model.seed)
+    arrivals = rng.poisson(model.orders_per_second, model.duration)
+    placed = np.repeat(np.arange(model.duration, dtype=np.float64), arrivals) + rng.random(arrivals.sum())
+    orders = len(placed)
+    next_status = np.array(rules.next_status, dtype=np.int8)
+    terminal = np.isin(np.arange(next_status.shape[1]), rules.terminal_statuses())
+    inner_txns = np.array([rules.inner_txns.get(action, 0) for action in rules.actions])
+
+    status = np.full(orders, rules.statuses["COOKING"], dtype=np.int8)
+    time = placed.copy()
+    delivered_at = np.full(orders, np.nan)
+    settled = np.full(orders, np.inf)
+    event_times, event_actions = [], []
+    rejected = 0
+    open_orders = np.arange(orders)
+    while len(open_orders):
+        actions, delays = choose_actions(rules, model, status[open_orders], rng)
+        acted = actions >= 0
+        open_orders, actions, delays = open_orders[acted], actions[acted], delays[acted]
+        time[open_orders] += delays
+        after = next_status[actions, status[open_orders]]
+        accepted = after != NO_STATUS
+        rejected += int((~accepted).sum())
+        open_orders, actions, after = open_orders[accepted], actions[accepted], after[accepted]
+        event_times.append(time[open_orders])
+        event_actions.append(actions)
+        just_delivered = after == rules.statuses["DELIVERED"]
+        delivered_at[open_orders[just_delivered]] = time[open_orders[just_delivered]]
+        status[open_orders] = after
+        done = terminal[after]
+        settled[open_orders[done]] = time[open_orders[done]]
+        open_orders = open_orders[~done]
+
+    event_times = np.concatenate(event_times)
+    event_actions = np.concatenate(event_actions)
+    deleted = settled + model.delete_delay
+    horizon = int(np.ceil(deleted[np.isfinite(deleted)].max(initial=model.duration))) + 1
+
+    def per_second(times, weights=None):
+        return np.bincount(np.minimum(times, horizon - 1).astype(np.int64), weights, minlength=horizon)
+
+    def held_between(start, end):
+        return np.cumsum(per_second(start) - per_second(end[np.isfinite(end)]))
+
+    # placing an order is PLACE_ORDER_TXNS outer transactions, deleting the application one more
+    txns = per_second(event_times) + per_second(placed) * PLACE_ORDER_TXNS + per_second(deleted[np.isfinite(deleted)])
+    inner = per_second(event_times, inner_txns[event_actions]) + per_second(placed) * rules.place_order_inner_txns
+    open_curve = held_between(placed, settled)
+    app_curve = held_between(placed, deleted)
+    escrow_algos = model.order_amount + rules.escrow_min_balance + ESCROW_FEE_RESERVE
+    counts = np.bincount(event_actions, minlength=len(rules.actions))
+    released = np.isfinite(settled) & ~np.isnan(delivered_at)
+    return Simulation(
+        orders=orders,
+        txns=txns,
+        inner_txns=inner,
+        open_orders=open_curve,
+        locked_algos=open_curve * escrow_algos + app_curve * rules.app_min_balance,
+        locked_min_balance=open_curve * rules.escrow_min_balance + app_curve * rules.app_min_balance,
+        locked_tips=open_curve * model.tips_amount,
+        action_counts={action: int(count) for action, count in zip(rules.actions, counts)},
+        rejected=rejected,
+        fees=int((txns.sum() + inner.sum()) * MIN_TXN_FEE),
+        settle_delays=settled[released] - delivered_at[released],
+    )
+
+
+def summary(simulation: Simulation) -> dict:
+    def peak(curve):
+        return int(curve.max()) if len(curve) else 0
+
+    delays = simulation.settle_delays
+    return {
+        "orders": simulation.orders,
+        "actions": simulation.action_counts,
+        "rejected": simulation.rejected,
+        "txns": int(simulation.txns.sum()),
+        "inner_txns": int(simulation.inner_txns.sum()),
+        "peak_tps": peak(simulation.txns + simulation.inner_txns),
+        "fees": simulation.fees,
+        "peak_open_orders": peak(simulation.open_orders),
+        "peak_locked_algos": peak(simulation.locked_algos),
+        "peak_locked_min_balance": peak(simulation.locked_min_balance),
+        "peak_locked_tips": peak(simulation.locked_tips),
+        "settle_delay_p50": float(np.percentile(delays, 50)) if len(delays) else None,
+        "settle_delay_p99": float(np.percentile(delays, 99)) if len(delays) else None,
+    }
+
+
+def main():
+    defaults = Model()
+    parser = argparse.ArgumentParser(description="Simulate the lifecycle of delivery orders for capacity and cost planning.")
+    parser.add_argument("--rules", action="store_true", help="print the rules derived from the contract and exit")
+    parser.add_argument("--packed", action="store_true", help="escrows keeping the order in the packed global state record")
+    parser.add_argument("--json", action="store_true", help="print the summary and the per second curves as JSON")
+    for name, default in defaults._asdict().items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(default), default=default)
+    args = parser.parse_args()
+
+    rules = derive_rules(args.packed)
+    if args.rules:
+        print(json.dumps(rules.to_dict(), indent=2))
+        return
+    model = Model(**{name: getattr(args, name) for name in Model._fields})
+    simulation = simulate(rules, model)
+    result = summary(simulation)
+    if args.json:
+        result["curves"] = {
+            name: getattr(simulation, name).astype(np.int64).tolist()
+            for name in ("txns", "inner_txns", "open_orders", "locked_algos", "locked_min_balance", "locked_tips")
+        }
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['orders']} orders over {model.duration} s, {result['rejected']} actions rejected by the contract")
+    print("actions: " + ", ".join(f"{action} {count}" for action, count in result["actions"].items()))
+    print(f"{result['txns']} transactions and {result['inner_txns']} inner transactions, "
+          f"peak {result['peak_tps']} per second, {result['fees'] / 1e6:.3f} Algos of fees")
+    print(f"peak {result['peak_open_orders']} open orders, {result['peak_locked_algos'] / 1e6:.3f} Algos locked "
+          f"of which {result['peak_locked_min_balance'] / 1e6:.3f} minimum balance, "
+          f"{result['peak_locked_tips']} base units of tips")
+    if result["settle_delay_p50"] is not None:
+        print(f"DELIVERED to release of the funds: p50 {result['settle_delay_p50']:.1f} s, "
+              f"p99 {result['settle_delay_p99']:.1f} s (accept delivery window {model.accept_delivery_window} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from pyteal import *
+
+# Events logged by the contracts on every state transition, so that indexers learn what changed
+# from the transaction results (plato_client/events.py) instead of reading the state back.
+# Every event is one fixed-layout record of EVENT_LENGTH bytes per Log, fields big-endian:
+#   type        1   EventType
+#   id          8   order ID (the application ID for the applications holding a single order,
+#                   0 for the status app), the asset ID of a reward, 0 otherwise
+#   account     32  the account holding the state that changed (escrow, customer, store, ...)
+#   old status  1   OrderStatus for orders, the user state for identities, 0 when not relevant
+#   new status  1
+#   amount      8   micro units paid out or escrowed by the transition, 0 when none
+EVENT_FIELDS = (
+    ("TYPE", 1),
+    ("ID", 8),
+    ("ACCOUNT", 32),
+    ("OLD_STATUS", 1),
+    ("NEW_STATUS", 1),
+    ("AMOUNT", 8),
+)
+EVENT_LENGTH = sum(size for _, size in EVENT_FIELDS)
+
+class EventType:
+    """ type byte of an event record """
+    # an order changed status, old status 0 when it was placed
+    ORDER_STATUS = 1
+    # a user opted in to the identity application, new status is the user type
+    USER_OPT_IN = 2
+    # a store attested a buyer, the account is the store, amount the buyer slot filled and new
+    # status the store state, 1 once the last slot is taken; followed by the BUYER_STORE event
+    STORE_BUYER = 3
+    # a courier was attested by a store, the account is the courier and new status its state
+    COURIER_STORE = 4
+    # a reward was issued to the account, id is the asset
+    REWARD = 5
+    # the creator replaced the reward table of the reward application
+    REWARD_TABLE = 6
+    # the attestor posted the Merkle root of a batch of store attestations, id is the batch number
+    # and amount the number of attestations in the batch
+    ATTESTATION_BATCH = 7
+    # a reward was credited to the balance of the account in the reward application instead of
+    # being issued, id is the asset; it is issued (REWARD) when the account claims its balance
+    REWARD_ACCRUED = 8
+    # the buyer of the STORE_BUYER event logged just before, the account is the buyer and amount
+    # the slot it fills in the store state
+    BUYER_STORE = 9
+
+def event_bytes(value: Expr, size: int) -> Expr:
+    # Constants are laid out at compile time, which saves the conversion of most status fields.
+    if isinstance(value, Int):
+        return Bytes("base16", value.value.to_bytes(size, "big").hex())
+    if value.type_of() == TealType.bytes:
+        return value
+    if size == 8:
+        return Itob(value)
+    return Extract(Itob(value), Int(8 - size), Int(size))
+
+def log_event(event_type: int, id: Expr, account: Expr, old_status: Expr = Int(0), new_status: Expr = Int(0),
+              amount: Expr = Int(0)) -> Expr:
+    """ Logs an event record; id is a uint or 8 bytes, account 32 bytes and the others uints """
+    return Log(Concat(
+        Bytes("base16", bytes([event_type]).hex()),
+        event_bytes(id, 8),
+        account,
+        event_bytes(old_status, 1),
+        event_bytes(new_status, 1),
+        event_bytes(amount, 8),
+    ))
@@ -1,49 +1,60 @@
 from pyteal import *
 
-@Subroutine(TealType.none)
-def inner_asset_opt_in(asset_id: TealType.uint64, asset_receiver: TealType.bytes) -> Expr:
-    return Seq([
-        InnerTxnBuilder.Begin(),
-        InnerTxnBuilder.SetFields({
-            #TxnField.note: Bytes("TUT_ITXN_AT"),
-            TxnField.type_enum: TxnType.AssetTransfer,
-            TxnField.asset_amount: Int(0),
-            TxnField.xfer_asset: asset_id,
-            TxnField.asset_receiver: asset_receiver
-            }),
-        InnerTxnBuilder.Submit()
-    ])
-
-@Subroutine(TealType.none)
-def inner_asset_transfer_txn(
-    asset_id: TealType.uint64,
-    asset_amount: TealType.uint64,
-    asset_receiver: TealType.bytes,
-    close_to: TealType.bytes):
-    return Seq([
-        InnerTxnBuilder.Begin(),
-        InnerTxnBuilder.SetFields({
+class InnerTxnGroupBuilder:
+    """Inner transactions chained with InnerTxnBuilder.Next and submitted once, as one group.
+
+    Legs are added in order with asset_opt_in, asset_transfer and payment, then submit()
+    returns the expression that sends them. Groups of more than one leg need TEAL v6
+    (and PyTeal 0.10 or later for InnerTxnBuilder.Next).
+
+    Fees: by default a leg gets the fee assigned by the AVM, which is zero as long as the outer
+    transactions overpaid enough to cover it (TEAL v6 fee pooling) and the minimum fee paid by
+    the application account otherwise. With pool_fees=True every leg is sent with a zero fee,
+    the outer transactions have to pay for the whole group and the application account never
+    spends its balance on fees.
+    """
+
+    def __init__(self, pool_fees: bool = False):
+        self.pool_fees = pool_fees
+        self.legs = []
+
+    def asset_opt_in(self, asset_id: Expr, asset_receiver: Expr) -> "InnerTxnGroupBuilder":
+        return self.asset_transfer(asset_id, Int(0), asset_receiver)
+
+    def asset_transfer(self, asset_id: Expr, asset_amount: Expr, asset_receiver: Expr, close_to: Expr = None) -> "InnerTxnGroupBuilder":
+        fields = {
             TxnField.type_enum: TxnType.AssetTransfer,
             TxnField.xfer_asset: asset_id,
             TxnField.asset_amount: asset_amount,
             TxnField.asset_receiver: asset_receiver,
-            TxnField.asset_close_to: close_to
-            }),
-        InnerTxnBuilder.Submit()
-    ])
-
-@Subroutine(TealType.none)
-def inner_payment_txn(
-    amount: TealType.uint64,
-    receiver: TealType.bytes,
-    close_to: TealType.bytes):
-    return Seq([
-        InnerTxnBuilder.Begin(),
-        InnerTxnBuilder.SetFields({
+        }
+        if close_to is not None:
+            fields[TxnField.asset_close_to] = close_to
+        return self.add(fields)
+
+    def payment(self, amount: Expr, receiver: Expr, close_to: Expr = None) -> "InnerTxnGroupBuilder":
+        fields = {
             TxnField.type_enum: TxnType.Payment,
             TxnField.amount: amount,
             TxnField.receiver: receiver,
-            TxnField.close_remainder_to: close_to
-            }),
-        InnerTxnBuilder.Submit()
-    ])
+        }
+        if close_to is not None:
+            fields[TxnField.close_remainder_to] = close_to
+        return self.add(fields)
+
+    def add(self, fields) -> "InnerTxnGroupBuilder":
+        if self.pool_fees:
+            fields = {**fields, TxnField.fee: Int(0)}
+        self.legs.append(fields)
+        return self
+
+    def submit(self) -> Expr:
+        if not self.legs:
+            raise TealInputError("An inner transaction group needs at least one transaction")
+        steps = [InnerTxnBuilder.Begin()]
+        for index, fields in enumerate(self.legs):
+            if index > 0:
+                steps.append(InnerTxnBuilder.Next())
+            steps.append(InnerTxnBuilder.SetFields(fields))
+        steps.append(InnerTxnBuilder.Submit())
+        return Seq(steps)
@@ -0,0 +1,29 @@
+from pyteal import *
+
+def jump_table(index: Expr, branches) -> Expr:
+    """Dispatches to branches[code] for an integer code, e.g. a one-byte action code.
+
+    TEAL v6 has no computed branch (switch and match come with v8, which PyTeal 0.10.1 cannot
+    target), so this is a balanced binary search over the sorted codes: every code costs about
+    log2(len(branches)) comparisons, where a Cond costs one per preceding arm. Codes missing from
+    the table fail the program; only the leaves whose range is not narrowed down to their own
+    code by the search need a check. index is evaluated once per level, it should be a scratch
+    load or another cheap expression.
+    """
+    codes = sorted(branches)
+
+    def node(low, high, lower_bound, upper_bound):
+        # codes[low:high] are left and index is in [lower_bound, upper_bound)
+        if high - low == 1:
+            code = codes[low]
+            if lower_bound == code and upper_bound == code + 1:
+                return branches[code]
+            return Seq(Assert(index == Int(code)), branches[code])
+        middle = (low + high) // 2
+        return If(index < Int(codes[middle])).Then(
+            node(low, middle, lower_bound, codes[middle])
+        ).Else(
+            node(middle, high, codes[middle], upper_bound)
+        )
+
+    return node(0, len(codes), 0, 2 ** 64)
@@ -1,15 +1,16 @@
-import { promises as fs } from "fs";
 import AlgoAppManager from "../algo/AlgoAppManager";
 import AlgoClient from "../algo/AlogClient";
-import { APP_ID, EATER_MNEMONIC } from "./consts";
+import ProgramTemplate from "../algo/ProgramTemplate";
+import { deliveryTemplateValues } from "../plato/delivery/types";
+import { APP_ID, ASA_ID, EATER_MNEMONIC } from "./consts";
 
-const APPROVAL_PROGRAM_FILE_PATH = "./dist/escrow_approval.teal";
-const CLEAR_PROGRAM_FILE_PATH = "./dist/escrow_clear_program.teal";
+const APPROVAL_PROGRAM_FILE_PATH = "./dist/escrow_approval.template.json";
+const CLEAR_PROGRAM_FILE_PATH = "./dist/escrow_clear_program.template.json";
 
 (async () => {
-  const [approvalProgramSource, clearProgramSource] = await Promise.all([
-    fs.readFile(APPROVAL_PROGRAM_FILE_PATH, "utf8"),
-    fs.readFile(CLEAR_PROGRAM_FILE_PATH, "utf8"),
+  const [approvalTemplate, clearTemplate] = await Promise.all([
+    ProgramTemplate.load(APPROVAL_PROGRAM_FILE_PATH),
+    ProgramTemplate.load(CLEAR_PROGRAM_FILE_PATH),
   ]);
   const algoAppManager = new AlgoAppManager(new AlgoClient());
 
@@ -17,8 +18,10 @@ const CLEAR_PROGRAM_FILE_PATH = "./dist/escrow_clear_program.teal";
   await algoAppManager.update({
     creatorMnemonic: EATER_MNEMONIC,
     appId: APP_ID,
-    approvalProgramSource,
-    clearProgramSource,
+    approvalProgramSource: approvalTemplate.instantiate(
+      deliveryTemplateValues(ASA_ID)
+    ),
+    clearProgramSource: clearTemplate.instantiate(),
   });
   console.log("updated");
 })();
@@ -1,8 +1,8 @@
 import { mnemonicToSecretKey } from "algosdk";
 import AlgoAppManager from "../../algo/AlgoAppManager";
 import AlgoClient from "../../algo/AlogClient";
-import StringAppArgument from "../../algo/types/app/arguments/StringAppArgument";
-import { DeliveryActionType } from "./types";
+import ByteAppArgument from "../../algo/types/app/arguments/ByteAppArgument";
+import { DeliveryActionType, DELIVERY_ACTION_CODES } from "./types";
 
 export default class CourierDeliveryClient {
   private readonly algoAppManager: AlgoAppManager;
@@ -23,7 +23,7 @@ export default class CourierDeliveryClient {
     await this.algoAppManager.invoke({
       senderMnemonic: this.courierMnemonic,
       appId: this.appId,
-      appArgs: [new StringAppArgument(actionType)],
+      appArgs: [new ByteAppArgument(DELIVERY_ACTION_CODES[actionType])],
     });
   }
 
@@ -32,7 +32,7 @@ export default class CourierDeliveryClient {
     await this.algoAppManager.invoke({
       senderMnemonic: this.courierMnemonic,
       appId: this.appId,
-      appArgs: [new StringAppArgument(actionType)],
+      appArgs: [new ByteAppArgument(DELIVERY_ACTION_CODES[actionType])],
     });
   }
 
@@ -42,7 +42,7 @@ export default class CourierDeliveryClient {
     await this.algoAppManager.invoke({
       senderMnemonic: this.courierMnemonic,
       appId: this.appId,
-      appArgs: [new StringAppArgument(actionType)],
+      appArgs: [new ByteAppArgument(DELIVERY_ACTION_CODES[actionType])],
       foreignAssets: [this.tipsAsaId],
       accounts: [courierAccount.addr, this.merchantAddress],
     });
@@ -53,7 +53,7 @@ export default class CourierDeliveryClient {
     await this.algoAppManager.invoke({
       senderMnemonic: this.courierMnemonic,
       appId: this.appId,
-      appArgs: [new StringAppArgument(actionType)],
+      appArgs: [new ByteAppArgument(DELIVERY_ACTION_CODES[actionType])],
       foreignAssets: [this.tipsAsaId],
       accounts: [this.customerAddress],
     });
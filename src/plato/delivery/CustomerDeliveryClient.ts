@@ -1,18 +1,22 @@
 import { ALGORAND_MIN_TX_FEE, getApplicationAddress } from "algosdk";
-import { promises as fs } from "fs";
 import AlgoMonetaryManager from "../../algo/AlgoMonetaryManager";
 import AlgoAppManager from "../../algo/AlgoAppManager";
+import ProgramTemplate from "../../algo/ProgramTemplate";
 import AddressAppArgument from "../../algo/types/app/arguments/AddressAppArgument";
 import NumberAppArgument from "../../algo/types/app/arguments/NumberAppArgument";
-import { DeliveryActionType } from "./types";
-import StringAppArgument from "../../algo/types/app/arguments/StringAppArgument";
+import {
+  DeliveryActionType,
+  DELIVERY_ACTION_CODES,
+  deliveryTemplateValues,
+} from "./types";
+import ByteAppArgument from "../../algo/types/app/arguments/ByteAppArgument";
 import AlgoClient from "../../algo/AlogClient";
 import { TransactionWrapperFactory } from "../../algo/types/transactions/types";
 import { StateSchema } from "../../algo/types/app/types";
 import { ALGO_MIN_ACCOUNT_BALANCE } from "../../algo/constants";
 
-const APPROVAL_PROGRAM_FILE_PATH = "./dist/escrow_approval.teal";
-const CLEAR_PROGRAM_FILE_PATH = "./dist/escrow_clear_program.teal";
+const APPROVAL_PROGRAM_FILE_PATH = "./dist/escrow_approval.template.json";
+const CLEAR_PROGRAM_FILE_PATH = "./dist/escrow_clear_program.template.json";
 
 export default class CustomerDeliveryClient {
   private readonly algoAppManager: AlgoAppManager;
@@ -58,10 +62,14 @@ export default class CustomerDeliveryClient {
     }
     const algoAppManager = new AlgoAppManager(algoClient);
     const algoMonetaryManager = new AlgoMonetaryManager(algoClient);
-    const [approvalProgramSource, clearProgramSource] = await Promise.all([
-      fs.readFile(APPROVAL_PROGRAM_FILE_PATH, "utf8"),
-      fs.readFile(CLEAR_PROGRAM_FILE_PATH, "utf8"),
+    // The programs are assembled at build time, deploying only patches the template values in.
+    const templateValues = deliveryTemplateValues(tips.asaId);
+    const [approvalTemplate, clearTemplate] = await Promise.all([
+      ProgramTemplate.load(APPROVAL_PROGRAM_FILE_PATH),
+      ProgramTemplate.load(CLEAR_PROGRAM_FILE_PATH),
     ]);
+    const approvalProgram = approvalTemplate.instantiate(templateValues);
+    const clearProgram = clearTemplate.instantiate();
     const localState: StateSchema = { ints: 0, bytes: 0 };
     const globalState: StateSchema = { ints: 3, bytes: 2 };
     const numberOfInternalAppTransactions = 3;
@@ -73,8 +81,8 @@ export default class CustomerDeliveryClient {
     ];
     const escrow = await algoAppManager.create({
       creatorMnemonic: customerMnemonic,
-      approvalProgramSource,
-      clearProgramSource,
+      approvalProgramSource: approvalProgram,
+      clearProgramSource: clearProgram,
       localState,
       globalState,
       appArgs,
@@ -116,7 +124,7 @@ export default class CustomerDeliveryClient {
     await this.algoAppManager.invoke({
       senderMnemonic: this.customerMnemonic,
       appId: this.appId,
-      appArgs: [new StringAppArgument(actionType)],
+      appArgs: [new ByteAppArgument(DELIVERY_ACTION_CODES[actionType])],
       foreignAssets: [this.tipsAsaId],
       accounts: [this.courierAddress, this.merchantAddress],
     });
@@ -127,7 +135,7 @@ export default class CustomerDeliveryClient {
     await this.algoAppManager.invoke({
       senderMnemonic: this.customerMnemonic,
       appId: this.appId,
-      appArgs: [new StringAppArgument(actionType)],
+      appArgs: [new ByteAppArgument(DELIVERY_ACTION_CODES[actionType])],
       foreignAssets: [this.tipsAsaId],
     });
   }
@@ -136,7 +144,7 @@ export default class CustomerDeliveryClient {
     await this.algoAppManager.invoke({
       senderMnemonic: this.customerMnemonic,
       appId: this.appId,
-      appArgs: [new StringAppArgument(actionType)],
+      appArgs: [new ByteAppArgument(DELIVERY_ACTION_CODES[actionType])],
     });
   }
 
@@ -145,7 +153,7 @@ export default class CustomerDeliveryClient {
     return this.algoAppManager.createAppInvokeTransaction({
       senderMnemonic: this.customerMnemonic,
       appId: this.appId,
-      appArgs: [new StringAppArgument(actionType)],
+      appArgs: [new ByteAppArgument(DELIVERY_ACTION_CODES[actionType])],
       foreignAssets: [this.tipsAsaId],
     });
   }
@@ -0,0 +1,233 @@
+import { ALGORAND_MIN_TX_FEE, getApplicationAddress } from "algosdk";
+import AlgoMonetaryManager from "../../algo/AlgoMonetaryManager";
+import AlgoAppManager from "../../algo/AlgoAppManager";
+import ProgramTemplate from "../../algo/ProgramTemplate";
+import AddressAppArgument from "../../algo/types/app/arguments/AddressAppArgument";
+import NumberAppArgument from "../../algo/types/app/arguments/NumberAppArgument";
+import StringAppArgument from "../../algo/types/app/arguments/StringAppArgument";
+import AlgoClient from "../../algo/AlogClient";
+import { TransactionWrapperFactory } from "../../algo/types/transactions/types";
+import { StateSchema } from "../../algo/types/app/types";
+import { ALGO_MIN_ACCOUNT_BALANCE } from "../../algo/constants";
+import {
+  DeliveryActionType,
+  DeliveryOrder,
+  deliveryTemplateValues,
+} from "./types";
+
+const APPROVAL_PROGRAM_FILE_PATH = "./dist/order_book_approval.template.json";
+const CLEAR_PROGRAM_FILE_PATH = "./dist/order_book_clear_program.template.json";
+
+/**
+ * Inner transaction fees of the most expensive settlement (tips, courier reward, merchant payment).
+ * Must match `OrderBook.Params.FEE_RESERVE` of the contract.
+ */
+const ORDER_FEE_RESERVE = 3 * ALGORAND_MIN_TX_FEE;
+
+/**
+ * Orders open at the same time in one escrow, must match `OrderBook.Schema.MAX_OPEN_ORDERS`.
+ */
+export const MAX_OPEN_ORDERS = 32;
+
+/**
+ * Client of the long-lived delivery escrow which holds many concurrent orders.
+ * Unlike `CustomerDeliveryClient` no application is created per order:
+ * placing an order is a single atomic group of a payment, a tips transfer and an app call.
+ * Customers do not opt in, the orders are kept in the escrow's global state.
+ */
+export default class OrderBookClient {
+  private readonly algoAppManager: AlgoAppManager;
+  private readonly algoMonetaryManager: AlgoMonetaryManager;
+
+  constructor(
+    private readonly algoClient: AlgoClient,
+    private readonly appId: number,
+    private readonly tipsAsaId: number
+  ) {
+    this.algoAppManager = new AlgoAppManager(algoClient);
+    this.algoMonetaryManager = new AlgoMonetaryManager(algoClient);
+  }
+
+  get applicationId(): number {
+    return this.appId;
+  }
+
+  get escrowAddress(): string {
+    return getApplicationAddress(this.appId);
+  }
+
+  /**
+   * Deploys the escrow once, funds its minimum balance and opts it in to the tips ASA.
+   */
+  static async deploy(
+    algoClient: AlgoClient,
+    creatorMnemonic: string,
+    tipsAsaId: number
+  ): Promise<OrderBookClient> {
+    const algoAppManager = new AlgoAppManager(algoClient);
+    const algoMonetaryManager = new AlgoMonetaryManager(algoClient);
+    // The programs are assembled at build time, deploying only patches the template values in.
+    const templateValues = deliveryTemplateValues(tipsAsaId);
+    const [approvalTemplate, clearTemplate] = await Promise.all([
+      ProgramTemplate.load(APPROVAL_PROGRAM_FILE_PATH),
+      ProgramTemplate.load(CLEAR_PROGRAM_FILE_PATH),
+    ]);
+    const approvalProgram = approvalTemplate.instantiate(templateValues);
+    const clearProgram = clearTemplate.instantiate();
+    // The orders are held in global state, a record and a status per open order.
+    const localState: StateSchema = { ints: 0, bytes: 0 };
+    const globalState: StateSchema = { ints: 0, bytes: 2 * MAX_OPEN_ORDERS };
+    const numberOfInternalAppTransactions = 1;
+    const numberOfHoldingAssets = 2; // Algo Coin + Plato token
+    const escrow = await algoAppManager.create({
+      creatorMnemonic,
+      approvalProgramSource: approvalProgram,
+      clearProgramSource: clearProgram,
+      localState,
+      globalState,
+    });
+    const app = new OrderBookClient(algoClient, escrow.id, tipsAsaId);
+    const escrowBalance =
+      ALGO_MIN_ACCOUNT_BALANCE * numberOfHoldingAssets +
+      numberOfInternalAppTransactions * ALGORAND_MIN_TX_FEE;
+    const algoTransferTxn = algoMonetaryManager.createAlgoTransferTransaction(
+      creatorMnemonic,
+      escrow.address,
+      escrowBalance
+    );
+    const optInAsaTxn = app.createOrderActionTransaction(
+      creatorMnemonic,
+      "ASA_OPT_IN"
+    );
+    await algoClient.sendAtomicTransaction(algoTransferTxn, optInAsaTxn);
+    return app;
+  }
+
+  async placeOrder(
+    customerMnemonic: string,
+    order: DeliveryOrder,
+    orderTotalPrice: number,
+    courierRewardAmount: number,
+    tipsAmount: number
+  ): Promise<void> {
+    if (orderTotalPrice <= 0) {
+      throw new Error("orderTotalPrice should be greater than zero");
+    }
+    if (courierRewardAmount <= 0) {
+      throw new Error("courierRewardAmount should be greater than zero");
+    }
+    if (courierRewardAmount >= orderTotalPrice) {
+      throw new Error(
+        "orderTotalPrice should be greater than courierRewardAmount"
+      );
+    }
+    const actionType: DeliveryActionType = "PLACE_ORDER";
+    const algoTransferTxn =
+      this.algoMonetaryManager.createAlgoTransferTransaction(
+        customerMnemonic,
+        this.escrowAddress,
+        orderTotalPrice + ORDER_FEE_RESERVE
+      );
+    const asaTransferTxn =
+      this.algoMonetaryManager.createAssetTransferTransaction(
+        customerMnemonic,
+        this.escrowAddress,
+        this.tipsAsaId,
+        tipsAmount
+      );
+    const placeOrderTxn = this.algoAppManager.createAppInvokeTransaction({
+      senderMnemonic: customerMnemonic,
+      appId: this.appId,
+      appArgs: [
+        new StringAppArgument(actionType),
+        new NumberAppArgument(order.id),
+        new AddressAppArgument(order.courierAddress),
+        new AddressAppArgument(order.merchantAddress),
+        new NumberAppArgument(courierRewardAmount),
+      ],
+    });
+    await this.algoClient.sendAtomicTransaction(
+      algoTransferTxn,
+      asaTransferTxn,
+      placeOrderTxn
+    );
+  }
+
+  async pickUpOrder(
+    courierMnemonic: string,
+    order: DeliveryOrder
+  ): Promise<void> {
+    await this.invokeOrderAction(courierMnemonic, "PICK_UP_ORDER", order);
+  }
+
+  async delivered(
+    courierMnemonic: string,
+    order: DeliveryOrder
+  ): Promise<void> {
+    await this.invokeOrderAction(courierMnemonic, "DELIVERED", order);
+  }
+
+  async claimFunds(
+    courierMnemonic: string,
+    order: DeliveryOrder
+  ): Promise<void> {
+    await this.invokeOrderAction(courierMnemonic, "CLAIM_FUNDS", order);
+  }
+
+  /**
+   * Cancels an order which is still cooking. Can be sent by the courier or the merchant.
+   */
+  async cancelOrder(
+    senderMnemonic: string,
+    order: DeliveryOrder
+  ): Promise<void> {
+    await this.invokeOrderAction(senderMnemonic, "CANCEL", order);
+  }
+
+  async completeOrder(
+    customerMnemonic: string,
+    order: DeliveryOrder
+  ): Promise<void> {
+    await this.invokeOrderAction(customerMnemonic, "COMPLETE_ORDER", order);
+  }
+
+  async startDispute(
+    customerMnemonic: string,
+    order: DeliveryOrder
+  ): Promise<void> {
+    await this.invokeOrderAction(customerMnemonic, "START_DISPUTE", order);
+  }
+
+  private async invokeOrderAction(
+    senderMnemonic: string,
+    actionType: DeliveryActionType,
+    order: DeliveryOrder
+  ): Promise<void> {
+    await this.algoAppManager.invoke({
+      senderMnemonic,
+      appId: this.appId,
+      appArgs: [
+        new StringAppArgument(actionType),
+        new NumberAppArgument(order.id),
+      ],
+      accounts: [
+        order.customerAddress,
+        order.courierAddress,
+        order.merchantAddress,
+      ],
+      foreignAssets: [this.tipsAsaId],
+    });
+  }
+
+  private createOrderActionTransaction(
+    senderMnemonic: string,
+    actionType: DeliveryActionType
+  ): TransactionWrapperFactory {
+    return this.algoAppManager.createAppInvokeTransaction({
+      senderMnemonic,
+      appId: this.appId,
+      appArgs: [new StringAppArgument(actionType)],
+      foreignAssets: [this.tipsAsaId],
+    });
+  }
+}
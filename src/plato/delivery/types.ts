@@ -1,3 +1,5 @@
+import { TemplateValues } from "../../algo/ProgramTemplate";
+
 export type DeliveryActionType =
   | "COMPLETE_ORDER"
   | "DELIVERED"
@@ -5,4 +7,54 @@ export type DeliveryActionType =
   | "ASA_OPT_IN"
   | "START_DISPUTE"
   | "CANCEL"
-  | "PICK_UP_ORDER";
+  | "PICK_UP_ORDER"
+  | "PLACE_ORDER";
+
+/**
+ * One-byte codes of the escrow application actions (ActionCode in delivery/enums.py).
+ * The escrow routes them through a jump table; it still accepts the action names.
+ */
+export const DELIVERY_ACTION_CODES: Record<
+  Exclude<DeliveryActionType, "PLACE_ORDER">,
+  number
+> = {
+  CANCEL: 1,
+  PICK_UP_ORDER: 2,
+  START_DISPUTE: 3,
+  COMPLETE_ORDER: 4,
+  DELIVERED: 5,
+  CLAIM_FUNDS: 6,
+  ASA_OPT_IN: 7,
+};
+
+/**
+ * Seconds the customer has to confirm a delivery before the courier can claim the funds
+ * (TMPL_ACCEPT_DELIVERY_WINDOW of the escrow programs).
+ */
+export const DEFAULT_ACCEPT_DELIVERY_WINDOW = 30;
+
+/**
+ * Values of the `TMPL_` variables of the escrow programs (AppParams in delivery/enums.py).
+ */
+export function deliveryTemplateValues(
+  tipsAsaId: number,
+  acceptDeliveryWindow = DEFAULT_ACCEPT_DELIVERY_WINDOW
+): TemplateValues {
+  return {
+    TMPL_ASA_ID: tipsAsaId,
+    TMPL_ACCEPT_DELIVERY_WINDOW: acceptDeliveryWindow,
+  };
+}
+
+/**
+ * Reference to an order held by the multi-order escrow application.
+ */
+export type DeliveryOrder = {
+  /**
+   * Unique (per customer) order ID, encoded as an 8-byte integer
+   */
+  id: number;
+  customerAddress: string;
+  courierAddress: string;
+  merchantAddress: string;
+};
@@ -23,7 +23,8 @@ const CLEAR_PROGRAM_FILE_PATH = "../../../dist/identity_clear_program.teal";
 export default class IdentityClient {
   private readonly algoAppManager: AlgoAppManager;
 
-  static readonly OPT_IN_COST = 728000;
+  // 100000 + 8 * 28500 (ints) + 5 * 50000 (bytes), see the local schema below
+  static readonly OPT_IN_COST = 578000;
 
   constructor(algoClient: AlgoClient, readonly appId: number) {
     this.algoAppManager = new AlgoAppManager(algoClient);
@@ -38,8 +39,10 @@ export default class IdentityClient {
       fs.readFile(APPROVAL_PROGRAM_FILE_PATH, "utf8"),
       fs.readFile(CLEAR_PROGRAM_FILE_PATH, "utf8"),
     ]);
-    const localState: StateSchema = { ints: 8, bytes: 8 };
-    const globalState: StateSchema = { ints: 1, bytes: 1 };
+    // bytes: lat, lng, referer and the two packed buyer slot pages of a store
+    const localState: StateSchema = { ints: 8, bytes: 5 };
+    // ints: the attestation batch count; bytes: the attestor and the roots of the last 8 batches
+    const globalState: StateSchema = { ints: 1, bytes: 9 };
     const startTime = getFutureTime();
     const appArgs = [new NumberAppArgument(startTime)];
     const { id } = await algoAppManager.create({
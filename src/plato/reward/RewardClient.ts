@@ -14,11 +14,38 @@ import { ALGO_MIN_ACCOUNT_BALANCE } from "../../algo/constants";
 import { TransactionWrapperFactory } from "../../algo/types/transactions/types";
 import { StateSchema } from "../../algo/types/app/types";
 import { getFutureTime } from "../../utils/date";
-import { RewardActionType, RewardType } from "./types";
+import BytesAppArgument from "../../algo/types/app/arguments/BytesAppArgument";
+import { Referral, RewardActionType, RewardType } from "./types";
 
 const APPROVAL_PROGRAM_FILE_PATH = "../../../dist/rewards_approval.teal";
 const CLEAR_PROGRAM_FILE_PATH = "../../../dist/rewards_clear_state.teal";
 
+/**
+ * Referrals checked by one `check_rewards` call (MAX_BATCH_REFERRALS of reward/app.py).
+ */
+export const MAX_BATCH_REFERRALS = 14;
+/**
+ * Opcode cost of a `check_rewards` call, its base and per referral, and of an `op_up` call
+ * (BATCH_BASE_COST, REFERRAL_COST and OP_UP_COST of src/plato_client).
+ */
+const APP_CALL_BUDGET = 700;
+const BATCH_BASE_COST = 200;
+const REFERRAL_COST = 120;
+const OP_UP_COST = 50;
+
+/**
+ * The `op_up` calls to group with a `check_rewards` call of that many referrals,
+ * they pool their opcode budget with it.
+ */
+export function opUpCalls(referralCount: number): number {
+  const missing =
+    BATCH_BASE_COST + REFERRAL_COST * referralCount - APP_CALL_BUDGET;
+  return Math.max(0, Math.ceil(missing / (APP_CALL_BUDGET - OP_UP_COST)));
+}
+const MAX_FOREIGN_ACCOUNTS = 4;
+// local state key of the rewards accrued by a referrer (BALANCE_KEY of reward/app.py)
+const BALANCE_KEY = "balance";
+
 export default class RewardClient {
   private readonly algoAppManager: AlgoAppManager;
   private readonly algoMonetaryManager: AlgoMonetaryManager;
@@ -53,7 +80,8 @@ export default class RewardClient {
       fs.readFile(APPROVAL_PROGRAM_FILE_PATH, "utf8"),
       fs.readFile(CLEAR_PROGRAM_FILE_PATH, "utf8"),
     ]);
-    const localState: StateSchema = { ints: 0, bytes: 0 };
+    // ints: the reward balance of a referrer accruing its rewards
+    const localState: StateSchema = { ints: 1, bytes: 0 };
     const globalState: StateSchema = { ints: 3, bytes: 3 };
     const { addr: ownerAddress } = mnemonicToSecretKey(ownerMnemonic);
     const startTime = getFutureTime();
@@ -158,6 +186,113 @@ export default class RewardClient {
     });
   }
 
+  /**
+   * Checks many referrals in a single app call; the reward app sums the amounts owed
+   * per referrer and pays each referrer with one transfer.
+   * The referred and referrer accounts other than the sender must fit in the
+   * 4 foreign accounts of a transaction. The `op_up` calls the referrals need
+   * are sent in the same group.
+   */
+  async checkRewards(
+    senderMnemonic: string,
+    referrals: Referral[],
+    identityAppId: number
+  ): Promise<void> {
+    if (referrals.length === 0 || referrals.length > MAX_BATCH_REFERRALS) {
+      throw new Error(
+        `Between 1 and ${MAX_BATCH_REFERRALS} referrals can be checked at once.`
+      );
+    }
+    const actionType: RewardActionType = "check_rewards";
+    const { addr: senderAddress } = mnemonicToSecretKey(senderMnemonic);
+    // Txn.accounts index 0 is the sender, foreign accounts follow
+    const accounts: string[] = [];
+    const accountIndex = (address: string): number => {
+      if (address === senderAddress) {
+        return 0;
+      }
+      if (!accounts.includes(address)) {
+        accounts.push(address);
+      }
+      return accounts.indexOf(address) + 1;
+    };
+    const indexes: number[] = [];
+    referrals.forEach((referral) =>
+      indexes.push(
+        accountIndex(referral.referredAddress),
+        accountIndex(referral.referrerAddress)
+      )
+    );
+    if (accounts.length > MAX_FOREIGN_ACCOUNTS) {
+      throw new Error(
+        `Referrals of one call can involve at most ${MAX_FOREIGN_ACCOUNTS} accounts besides the sender.`
+      );
+    }
+    const checkTxn = this.algoAppManager.createAppInvokeTransaction({
+      senderMnemonic,
+      appId: this.appId,
+      appArgs: [
+        new StringAppArgument(actionType),
+        new BytesAppArgument(new Uint8Array(indexes)),
+        ...referrals.map(
+          (referral) => new StringAppArgument(referral.rewardType)
+        ),
+      ],
+      accounts,
+      foreignApps: [identityAppId],
+      foreignAssets: [this.platoAsaId],
+    });
+    const opUpActionType: RewardActionType = "op_up";
+    const opUpTxns: TransactionWrapperFactory[] = [];
+    for (let call = 0; call < opUpCalls(referrals.length); call++) {
+      // the note tells the op_up calls of the group apart
+      opUpTxns.push(
+        this.algoAppManager.createAppInvokeTransaction({
+          senderMnemonic,
+          appId: this.appId,
+          appArgs: [new StringAppArgument(opUpActionType)],
+          note: new BytesAppArgument(new Uint8Array([call])),
+        })
+      );
+    }
+    await this.algoClient.sendAtomicTransaction(checkTxn, ...opUpTxns);
+  }
+
+  /**
+   * Opts a referrer in: its rewards are then credited to its balance on the reward app
+   * instead of being transferred, until it claims them.
+   */
+  async optIn(referrerMnemonic: string): Promise<void> {
+    await this.algoAppManager.optIn({
+      senderMnemonic: referrerMnemonic,
+      appId: this.appId,
+    });
+  }
+
+  /**
+   * Pays out the balance of the referrer in one transfer
+   */
+  async claim(referrerMnemonic: string): Promise<void> {
+    const actionType: RewardActionType = "claim";
+    await this.algoAppManager.invoke({
+      senderMnemonic: referrerMnemonic,
+      appId: this.appId,
+      appArgs: [new StringAppArgument(actionType)],
+      foreignAssets: [this.platoAsaId],
+    });
+  }
+
+  /**
+   * Rewards accrued by a referrer and not claimed yet
+   */
+  async balance(referrerAddress: string): Promise<number> {
+    const localState = await this.algoClient.applicationLocalState(
+      referrerAddress,
+      this.appId
+    );
+    return (localState[BALANCE_KEY] as number) || 0;
+  }
+
   private createOptInAsaTransaction(
     ownerMnemonic: string,
     asaId: number
@@ -1,6 +1,27 @@
-export type RewardActionType = "asset_opt_in" | "check_reward" | "check_active";
+export type RewardActionType =
+  | "asset_opt_in"
+  | "check_reward"
+  | "check_rewards"
+  | "check_active"
+  | "claim"
+  | "op_up";
 
 export type RewardType =
   | "eater_referral"
   | "resto_referral"
   | "courier_referral";
+
+/**
+ * A referral checked by `RewardClient.checkRewards`
+ */
+export type Referral = {
+  /**
+   * Account whose progress on the identity app is checked
+   */
+  referredAddress: string;
+  /**
+   * Account paid when the referred account reached its milestone
+   */
+  referrerAddress: string;
+  rewardType: RewardType;
+};
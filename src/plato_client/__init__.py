@@ -0,0 +1,40 @@
+# asyncio clients of the Plato applications for services driving many orders at once.
+#
+# All clients share one AsyncAlgodClient, which keeps a pool of keep-alive connections to algod,
+# caches the suggested params and follows every pending transaction from a single task, so
+# hundreds of operations can be awaited concurrently (e.g. with asyncio.gather). Point it at any
+# algod URL, including the fake algod of fake_algod.py, to test without a node; loadgen.py
+# drives it with the order lifecycles and reports latency percentiles and throughput.
+
+from .account import Account
+from .algod import AsyncAlgodClient, ConfirmationTimeout, TransactionRejected, decode_state
+from .delivery import DeliveryClient
+from .events import Event, decode_event, decode_events, iter_events, transaction_events
+from .identity import IdentityClient
+from .indexer import OrderKey, StateIndex
+from .layouts import DeliveryLayout, EventLayout, IdentityLayout, LogicSigLayout, OrderBookLayout, RewardLayout
+from .logicsig import LogicSigDeliveryClient, LogicSigOrder
+from .pool import ConnectionPool, HttpError, Response
+from .reward import Referral, RewardClient, RewardTable
+from .sweeper import Sweeper, SweepResult
+
+# The modules run with python -m are imported on first use of their names, running one would
+# otherwise import it twice (once as a submodule of the package, once as __main__).
+LAZY_EXPORTS = {
+    "Attestation": "attestations",
+    "AttestationProof": "attestations",
+    "AttestationTree": "attestations",
+    "read_attestations": "attestations",
+    "FakeAlgod": "fake_algod",
+    "Onboarding": "onboarding",
+    "OnboardingCall": "onboarding",
+    "OnboardingResult": "onboarding",
+    "read_calls": "onboarding",
+}
+
+
+def __getattr__(name):
+    if name not in LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    return getattr(import_module(f".{LAZY_EXPORTS[name]}", __name__), name)
@@ -0,0 +1,16 @@
+from typing import NamedTuple
+
+from algosdk import account, mnemonic
+
+
+class Account(NamedTuple):
+    address: str
+    private_key: str
+
+    @staticmethod
+    def from_mnemonic(words: str) -> "Account":
+        private_key = mnemonic.to_private_key(words)
+        return Account(account.address_from_private_key(private_key), private_key)
+
+    def sign(self, txn):
+        return txn.sign(self.private_key)
@@ -0,0 +1,295 @@
+import asyncio
+import base64
+import json
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import quote
+
+import msgpack
+from algosdk import encoding, transaction
+
+from .pool import ConnectionPool, HttpError
+
+# asyncio algod v2 client over a keep-alive connection pool.
+#
+# Everything many concurrent operations ask for is shared: suggested params are cached for
+# params_ttl seconds and fetched once however many callers miss the cache at the same time, and
+# all transactions waiting for confirmation are followed by a single watcher task that reads each
+# new block once and picks the awaited transactions out of it, as ConfirmationTracker.ts does, so
+# the requests grow with the rounds rather than with the transactions awaited.
+
+DEFAULT_ALGOD_URL = "http://localhost:4001"
+TOKEN_HEADER = "X-Algo-API-Token"
+
+# blocks whose transactions are remembered, for transactions awaited after their block was read
+RECENT_ROUNDS = 8
+# blocks requested at once while catching up with the chain
+BLOCKS_AHEAD = 16
+
+StateValue = Union[int, bytes]
+
+
+class TransactionRejected(Exception):
+    """A transaction was dropped from the pool of pending transactions."""
+
+
+class ConfirmationTimeout(Exception):
+    """A transaction was not confirmed within the given number of rounds."""
+
+
+class Waiter(NamedTuple):
+    future: asyncio.Future
+    max_rounds: int
+    # first valid round of the transaction, None when unknown
+    first_round: Optional[int]
+
+
+def as_bytes(value: Union[str, bytes]) -> bytes:
+    """Returns msgpack strings decoded with "surrogateescape" as the bytes they were."""
+    return value.encode("utf-8", "surrogateescape") if isinstance(value, str) else value
+
+
+def block_txid(block: dict, signed_txn: dict) -> str:
+    """The ID of a transaction of a block."""
+    # Transactions in a block omit the genesis hash and, unless "hgi" is set, the genesis ID,
+    # both are part of the transaction ID
+    fields = dict(signed_txn["txn"], gh=block.get("gh"))
+    if signed_txn.get("hgi"):
+        fields["gen"] = block.get("gen")
+    message = b"TX" + msgpack.packb(dict(sorted(fields.items())), use_bin_type=True)
+    return base64.b32encode(encoding.checksum(message)).decode().rstrip("=")
+
+
+def confirmed_transaction(signed_txn: dict, round_number: int) -> dict:
+    """The pending transaction information of a transaction of a block: its confirmed round,
+    created application, logs and inner transactions."""
+    delta = signed_txn.get("dt", {})
+    info = {"confirmed-round": round_number, "pool-error": ""}
+    if signed_txn.get("apid"):
+        info["application-index"] = signed_txn["apid"]
+    if delta.get("lg"):
+        info["logs"] = [base64.b64encode(as_bytes(log)).decode() for log in delta["lg"]]
+    if delta.get("itx"):
+        info["inner-txns"] = [confirmed_transaction(inner_txn, round_number) for inner_txn in delta["itx"]]
+    return info
+
+
+def decode_state(key_values: Iterable[dict]) -> Dict[bytes, StateValue]:
+    """Decodes a TEAL key-value store of the algod REST API, e.g. the global state of an application."""
+    state = {}
+    for entry in key_values:
+        value = entry["value"]
+        # type 1 is bytes and 2 is uint
+        state[base64.b64decode(entry["key"])] = base64.b64decode(value.get("bytes", "")) if value["type"] == 1 else value.get("uint", 0)
+    return state
+
+
+class AsyncAlgodClient:
+    def __init__(self, url: str = DEFAULT_ALGOD_URL, token: str = "", max_connections: int = 32, params_ttl: float = 5, timeout: float = 30):
+        headers = {TOKEN_HEADER: token} if token else {}
+        self.pool = ConnectionPool(url, max_connections, headers, timeout)
+        self.params_ttl = params_ttl
+        self.params: Optional[transaction.SuggestedParams] = None
+        self.params_time = 0.0
+        self.params_task: Optional[asyncio.Task] = None
+        self.waiters: Dict[str, Waiter] = {}
+        self.watcher: Optional[asyncio.Task] = None
+        # next block to read
+        self.next_round = 0
+        # txid -> confirmed transaction, of the last RECENT_ROUNDS blocks read
+        self.recent: Dict[str, dict] = {}
+        self.recent_rounds: Deque[Tuple[int, List[str]]] = deque()
+
+    async def __aenter__(self) -> "AsyncAlgodClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self.watcher is not None:
+            self.watcher.cancel()
+        await self.pool.close()
+
+    async def get(self, path: str) -> dict:
+        response = await self.pool.request("GET", path)
+        return json.loads(response.body)
+
+    async def status(self) -> dict:
+        return await self.get("/v2/status")
+
+    async def wait_for_block_after(self, round_number: int) -> dict:
+        return await self.get(f"/v2/status/wait-for-block-after/{round_number}")
+
+    async def block(self, round_number: int) -> dict:
+        """The block of a round decoded from msgpack, with its transactions and their state deltas."""
+        response = await self.pool.request("GET", f"/v2/blocks/{round_number}?format=msgpack")
+        # Local state deltas are keyed by account index, state keys and byte values are
+        # msgpack strings that may not be UTF-8 (see as_bytes)
+        return msgpack.unpackb(response.body, raw=False, strict_map_key=False, unicode_errors="surrogateescape")["block"]
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        if self.params is not None and time.monotonic() - self.params_time < self.params_ttl:
+            return self.params
+        if self.params_task is None:
+            self.params_task = asyncio.ensure_future(self.fetch_params())
+        task = self.params_task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done() and self.params_task is task:
+                self.params_task = None
+
+    async def fetch_params(self) -> transaction.SuggestedParams:
+        data = await self.get("/v2/transactions/params")
+        self.params = transaction.SuggestedParams(
+            fee=data["fee"],
+            first=data["last-round"],
+            last=data["last-round"] + 1000,
+            gh=data["genesis-hash"],
+            gen=data["genesis-id"],
+            flat_fee=False,
+            consensus_version=data.get("consensus-version"),
+            min_fee=data["min-fee"],
+        )
+        self.params_time = time.monotonic()
+        return self.params
+
+    async def send_transactions(self, signed_transactions) -> str:
+        """Sends signed transactions, a group when there are several, and returns the first transaction ID."""
+        return await self.send_raw_transactions(
+            b"".join(base64.b64decode(encoding.msgpack_encode(txn)) for txn in signed_transactions)
+        )
+
+    async def send_raw_transactions(self, body: bytes) -> str:
+        """Sends msgpack-encoded signed transactions laid end to end, e.g. a group signed in another process."""
+        response = await self.pool.request("POST", "/v2/transactions", body, {"Content-Type": "application/x-binary"})
+        return json.loads(response.body)["txId"]
+
+    async def compile(self, source: str) -> bytes:
+        """Assembles a TEAL program with algod's compile endpoint."""
+        response = await self.pool.request("POST", "/v2/teal/compile", source.encode(), {"Content-Type": "text/plain"})
+        return base64.b64decode(json.loads(response.body)["result"])
+
+    async def pending_transaction(self, txid: str) -> dict:
+        return await self.get(f"/v2/transactions/pending/{quote(txid)}")
+
+    async def wait_for_confirmation(self, txid: str, max_rounds: int = 10, first_round: Optional[int] = None) -> dict:
+        """Returns the pending transaction information once the transaction is confirmed.
+
+        Blocks read before the transaction was awaited are remembered for RECENT_ROUNDS rounds, a
+        transaction that may be in an older block (first_round unknown or earlier) is looked up
+        once. It fails after max_rounds rounds without the transaction."""
+        confirmed = self.recent.get(txid)
+        if confirmed is not None:
+            return confirmed
+        waiter = self.waiters.get(txid)
+        if waiter is None:
+            waiter = Waiter(asyncio.get_running_loop().create_future(), max_rounds, first_round)
+            self.waiters[txid] = waiter
+        if self.watcher is None or self.watcher.done():
+            self.watcher = asyncio.ensure_future(self.watch())
+        # callers of the same transaction share the future, cancelling one does not cancel the others
+        return await asyncio.shield(waiter.future)
+
+    async def send_and_confirm(self, signed_transactions, max_rounds: int = 10) -> dict:
+        if self.watcher is not None and not self.watcher.done():
+            # the blocks read before the transactions are sent do not hold them
+            first_round = self.next_round
+        else:
+            first_round = signed_transactions[0].transaction.first_valid_round
+        txid = await self.send_transactions(signed_transactions)
+        return await self.wait_for_confirmation(txid, max_rounds, first_round)
+
+    async def watch(self):
+        try:
+            await self.follow_blocks()
+        except Exception as error:
+            # algod is unreachable, nobody would be woken up
+            for waiter in self.waiters.values():
+                if not waiter.future.done():
+                    waiter.future.set_exception(error)
+            self.waiters.clear()
+
+    async def follow_blocks(self):
+        last_round = (await self.status())["last-round"]
+        if self.next_round <= last_round - RECENT_ROUNDS:
+            # the remembered blocks are too old to be followed on from
+            self.recent.clear()
+            self.recent_rounds.clear()
+            self.next_round = last_round - RECENT_ROUNDS + 1
+        first_rounds = [waiter.first_round or 0 for waiter in self.waiters.values()]
+        self.next_round = max(min(first_rounds + [last_round]), self.next_round)
+        # txid -> last round the transaction is awaited
+        last_rounds: Dict[str, int] = {}
+        while self.waiters:
+            added = [txid for txid in self.waiters if txid not in last_rounds]
+            # the blocks from oldest on are read or remembered
+            oldest = self.recent_rounds[0][0] if self.recent_rounds else self.next_round
+            for txid in added:
+                waiter = self.waiters[txid]
+                last_rounds[txid] = max(waiter.first_round or 0, self.next_round - 1) + waiter.max_rounds
+            lookups = [txid for txid in added if (self.waiters[txid].first_round or 0) < oldest]
+            for txid, result in zip(lookups, await asyncio.gather(*map(self.pending_transaction, lookups), return_exceptions=True)):
+                if not isinstance(result, Exception) and result.get("confirmed-round"):
+                    self.resolve(txid, result)
+            if self.next_round > last_round:
+                last_round = (await self.wait_for_block_after(last_round))["last-round"]
+                continue
+            # blocks are requested ahead while the watcher is behind, and read in order
+            rounds = range(self.next_round, min(last_round, self.next_round + BLOCKS_AHEAD - 1) + 1)
+            for round_number, block in zip(rounds, await asyncio.gather(*map(self.block, rounds))):
+                self.read_block(round_number, block)
+            self.next_round = rounds[-1] + 1
+            expired = [txid for txid in self.waiters if last_rounds.get(txid, self.next_round) < self.next_round]
+            # explains the timeout: dropped from the pool or not confirmed in time
+            for txid, result in zip(expired, await asyncio.gather(*map(self.pending_transaction, expired), return_exceptions=True)):
+                waiter = self.waiters[txid]
+                # a transaction algod does not know of has timed out too
+                result = {} if isinstance(result, Exception) else result
+                if result.get("confirmed-round"):
+                    self.resolve(txid, result)
+                elif result.get("pool-error"):
+                    self.resolve(txid, error=TransactionRejected(f"transaction {txid} rejected: {result['pool-error']}"))
+                else:
+                    self.resolve(txid, error=ConfirmationTimeout(f"transaction {txid} not confirmed after {waiter.max_rounds} rounds"))
+            for txid in list(last_rounds):
+                if txid not in self.waiters:
+                    del last_rounds[txid]
+
+    def read_block(self, round_number: int, block: dict):
+        txids = []
+        for signed_txn in block.get("txns", []):
+            txid = block_txid(block, signed_txn)
+            txids.append(txid)
+            self.recent[txid] = confirmed_transaction(signed_txn, round_number)
+            if txid in self.waiters:
+                self.resolve(txid, self.recent[txid])
+        self.recent_rounds.append((round_number, txids))
+        if len(self.recent_rounds) > RECENT_ROUNDS:
+            for txid in self.recent_rounds.popleft()[1]:
+                self.recent.pop(txid, None)
+
+    def resolve(self, txid: str, result: Optional[dict] = None, error: Optional[Exception] = None):
+        waiter = self.waiters.pop(txid, None)
+        if waiter is None or waiter.future.done():
+            return
+        if error is None:
+            waiter.future.set_result(result)
+        else:
+            waiter.future.set_exception(error)
+
+    async def application_global_state(self, app_id: int) -> Dict[bytes, StateValue]:
+        application = await self.get(f"/v2/applications/{app_id}")
+        return decode_state(application["params"].get("global-state", []))
+
+    async def account_local_state(self, address: str, app_id: int) -> Dict[bytes, StateValue]:
+        """The local state of an account in an application, empty if the account did not opt in."""
+        try:
+            info = await self.get(f"/v2/accounts/{address}/applications/{app_id}")
+        except HttpError as error:
+            if error.status == 404:
+                return {}
+            raise
+        return decode_state(info.get("app-local-state", {}).get("key-value", []))
@@ -0,0 +1,278 @@
+import argparse
+import base64
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Union
+
+from .identity import identity_layout, op_up_calls
+
+from avm.address import sha512_256  # noqa: E402, after layouts put src/contracts on sys.path
+
+# Merkle trees of batched store attestations (identity/app.py, att_root and sto_prf).
+#
+# The attestor builds the tree of a batch of buyer-to-store attestations, posts its root with
+# IdentityClient.post_attestation_root and keeps the tree; when an attestation is needed on
+# chain, e.g. before a reward is checked, its proof is read from the tree and sent with
+# IdentityClient.prove_store_attestation. A leaf is sha256(ATTESTATION_LEAF_PREFIX + buyer +
+# store) and a node sha256(left + right), a lone last node of a level being paired with itself.
+#
+# The tree is built level by level into flat buffers of 32-byte hashes, 64 bytes per attestation
+# in all. Decoding the addresses and hashing the leaves is the costly part, it runs in a process
+# pool over chunks of the input, a bounded window of chunks at a time, like the onboarding. A
+# tree file is the leaf count followed by the levels from the leaves up; it is mapped rather
+# than read, so a proof costs a few page reads whatever the size of the batch.
+#
+# Usage: PYTHONPATH=src python3 -m plato_client.attestations build attestations.csv --out batch.tree
+#        PYTHONPATH=src python3 -m plato_client.attestations prove batch.tree BUYER_ADDRESS STORE_ADDRESS
+
+# attestations whose leaves are hashed by a worker at a time
+CHUNK_SIZE = 1 << 16
+# leaf count of a tree file
+TREE_HEADER = struct.Struct(">Q")
+# Algorand base32 alphabet -> digits of int(..., 32)
+BASE32_DIGITS = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", "0123456789abcdefghijklmnopqrstuv")
+ADDRESS_LENGTH = 58
+CHECKSUM_LENGTH = 4
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+class Attestation(NamedTuple):
+    buyer_address: str
+    store_address: str
+
+
+class AttestationProof(NamedTuple):
+    index: int
+    # sibling hashes from the leaf up
+    siblings: bytes
+
+    @property
+    def depth(self) -> int:
+        return len(self.siblings) // identity_layout().hash_length
+
+
+@lru_cache(maxsize=1 << 16)
+def decode_address(address: str) -> bytes:
+    """The public key of an address, like algosdk's decode_address several times faster."""
+    if len(address) != ADDRESS_LENGTH:
+        raise ValueError(f"invalid address {address!r}")
+    # 58 base32 characters hold the key and its checksum followed by two zero bits
+    raw = (int(address.translate(BASE32_DIGITS), 32) >> 2).to_bytes(identity_layout().address_length + CHECKSUM_LENGTH, "big")
+    public_key, checksum = raw[:-CHECKSUM_LENGTH], raw[-CHECKSUM_LENGTH:]
+    if sha512_256(public_key)[-CHECKSUM_LENGTH:] != checksum:
+        raise ValueError(f"invalid address {address!r}")
+    return public_key
+
+
+def leaf_hash(attestation: Attestation) -> bytes:
+    layout = identity_layout()
+    return hashlib.sha256(
+        layout.attestation_leaf_prefix + decode_address(attestation.buyer_address) + decode_address(attestation.store_address)
+    ).digest()
+
+
+def leaf_hashes(attestations: Sequence[Attestation]) -> bytes:
+    """The leaves of the attestations back to back, run in the worker processes."""
+    return b"".join([leaf_hash(attestation) for attestation in attestations])
+
+
+def parent_level(level: memoryview) -> bytes:
+    hash_length = identity_layout().hash_length
+    paired = len(level) // (2 * hash_length) * 2 * hash_length
+    sha256 = hashlib.sha256
+    parents = [sha256(level[offset:offset + 2 * hash_length]).digest() for offset in range(0, paired, 2 * hash_length)]
+    if paired < len(level):
+        parents.append(sha256(bytes(level[paired:]) * 2).digest())
+    return b"".join(parents)
+
+
+def level_counts(leaf_count: int) -> List[int]:
+    """Number of nodes of each level, from the leaves to the root."""
+    counts = [leaf_count]
+    while counts[-1] > 1:
+        counts.append((counts[-1] + 1) // 2)
+    return counts
+
+
+def proof_root(attestation: Attestation, proof: AttestationProof) -> bytes:
+    """The root the proof of an attestation leads to, computed the way sto_prf does."""
+    hash_length = identity_layout().hash_length
+    node, index = leaf_hash(attestation), proof.index
+    for offset in range(0, len(proof.siblings), hash_length):
+        sibling = proof.siblings[offset:offset + hash_length]
+        node = hashlib.sha256(sibling + node if index & 1 else node + sibling).digest()
+        index >>= 1
+    return node if index == 0 else b""
+
+
+def verify_proof(root: bytes, attestation: Attestation, proof: AttestationProof) -> bool:
+    return proof_root(attestation, proof) == root
+
+
+def read_attestations(path: str) -> Iterator[Attestation]:
+    """The attestations of a .csv file with "buyer" and "store" columns or of a JSONL file, read lazily."""
+    with open(path, newline="", encoding="UTF-8") as f:
+        if path.endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for index, record in enumerate(records):
+            if not record.get("buyer") or not record.get("store"):
+                raise ValueError(f"record {index}: buyer or store missing")
+            yield Attestation(record["buyer"], record["store"])
+
+
+def chunks(attestations: Iterable[Attestation], size: int = CHUNK_SIZE) -> Iterator[List[Attestation]]:
+    chunk = []
+    for attestation in attestations:
+        chunk.append(attestation)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class AttestationTree:
+    def __init__(self, buffer: Buffer):
+        # TREE_HEADER and the levels, as written to a tree file
+        self.buffer = buffer
+        (leaf_count,) = TREE_HEADER.unpack_from(buffer)
+        if leaf_count == 0:
+            raise ValueError("a tree holds at least one attestation")
+        hash_length = identity_layout().hash_length
+        self.counts = level_counts(leaf_count)
+        # start of each level in the buffer
+        self.offsets = [TREE_HEADER.size]
+        for count in self.counts[:-1]:
+            self.offsets.append(self.offsets[-1] + count * hash_length)
+        if len(buffer) != self.offsets[-1] + hash_length:
+            raise ValueError("truncated attestation tree")
+        if self.depth > identity_layout().max_proof_depth:
+            raise ValueError(f"a tree holds at most 2^{identity_layout().max_proof_depth} attestations")
+
+    @staticmethod
+    def build(attestations: Iterable[Attestation], jobs: Optional[int] = None) -> "AttestationTree":
+        """Builds the tree of the attestations, the leaf index of an attestation being its position."""
+        jobs = jobs or os.cpu_count() or 1
+        leaves = []
+        if jobs == 1:
+            leaves = [leaf_hashes(chunk) for chunk in chunks(attestations)]
+        else:
+            # Loaded before the workers fork, so that they inherit the layout instead of importing PyTeal.
+            identity_layout()
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                pending = deque()
+                for chunk in chunks(attestations):
+                    pending.append(executor.submit(leaf_hashes, chunk))
+                    if len(pending) >= 4 * jobs:
+                        leaves.append(pending.popleft().result())
+                leaves.extend(future.result() for future in pending)
+        levels = [b"".join(leaves)]
+        del leaves
+        if not levels[0]:
+            raise ValueError("a tree holds at least one attestation")
+        while len(levels[-1]) > identity_layout().hash_length:
+            levels.append(parent_level(memoryview(levels[-1])))
+        leaf_count = len(levels[0]) // identity_layout().hash_length
+        return AttestationTree(TREE_HEADER.pack(leaf_count) + b"".join(levels))
+
+    @staticmethod
+    def load(path: str) -> "AttestationTree":
+        with open(path, "rb") as f:
+            return AttestationTree(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(self.buffer)
+
+    def __len__(self) -> int:
+        return self.counts[0]
+
+    @property
+    def depth(self) -> int:
+        return len(self.counts) - 1
+
+    @property
+    def root(self) -> bytes:
+        return self.node(self.depth, 0)
+
+    def node(self, level: int, index: int) -> bytes:
+        hash_length = identity_layout().hash_length
+        start = self.offsets[level] + index * hash_length
+        return self.buffer[start:start + hash_length]
+
+    def index(self, attestation: Attestation) -> int:
+        """The leaf index of an attestation, found by scanning the leaves."""
+        hash_length = identity_layout().hash_length
+        leaf = leaf_hash(attestation)
+        start, end = self.offsets[0], self.offsets[0] + len(self) * hash_length
+        while True:
+            found = self.buffer.find(leaf, start, end)
+            if found < 0:
+                raise KeyError(f"{attestation} is not in the tree")
+            if (found - self.offsets[0]) % hash_length == 0:
+                return (found - self.offsets[0]) // hash_length
+            start = found + 1
+
+    def proof(self, index: int) -> AttestationProof:
+        if not 0 <= index < len(self):
+            raise IndexError(f"leaf index {index} out of range")
+        siblings = []
+        position = index
+        for level, count in enumerate(self.counts[:-1]):
+            sibling = position ^ 1
+            siblings.append(self.node(level, sibling if sibling < count else position))
+            position >>= 1
+        return AttestationProof(index, b"".join(siblings))
+
+
+def run_build(args):
+    tree = AttestationTree.build(read_attestations(args.input), args.jobs)
+    tree.save(args.out)
+    print(json.dumps({
+        "root": base64.b64encode(tree.root).decode(),
+        "attestations": len(tree),
+        "depth": tree.depth,
+        "op_up_calls": op_up_calls(tree.depth),
+    }))
+
+
+def run_prove(args):
+    tree = AttestationTree.load(args.tree)
+    attestation = Attestation(args.buyer, args.store)
+    proof = tree.proof(tree.index(attestation))
+    print(json.dumps({
+        "index": proof.index,
+        "siblings": base64.b64encode(proof.siblings).decode(),
+        "root": base64.b64encode(tree.root).decode(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the Merkle tree of a batch of store attestations and read proofs from it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build the tree of a .csv (buyer,store) or JSONL file")
+    build_parser.add_argument("input")
+    build_parser.add_argument("--out", required=True, help="tree file to write")
+    build_parser.add_argument("--jobs", type=int, default=None, help="number of hashing processes")
+    build_parser.set_defaults(run=run_build)
+    prove_parser = commands.add_parser("prove", help="print the proof of an attestation")
+    prove_parser.add_argument("tree")
+    prove_parser.add_argument("buyer", help="buyer address")
+    prove_parser.add_argument("store", help="store address")
+    prove_parser.set_defaults(run=run_prove)
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import os
+from functools import lru_cache
+from typing import Dict, Optional
+
+from algosdk import constants, encoding, logic, transaction
+
+from .account import Account
+from .algod import AsyncAlgodClient, StateValue
+from .layouts import DeliveryLayout
+
+from avm.template import Template, instantiate  # noqa: E402, after layouts put src/contracts on sys.path
+
+# Delivery escrow applications, one per order (src/contracts/delivery/app.py).
+# Actions are sent as their one-byte ActionCode with the same accounts and assets as the
+# TypeScript clients in src/plato/delivery.
+
+APPROVAL_TEMPLATE_FILE_NAME = "escrow_approval.template.json"
+PACKED_APPROVAL_TEMPLATE_FILE_NAME = "escrow_packed_approval.template.json"
+CLEAR_TEMPLATE_FILE_NAME = "escrow_clear_program.template.json"
+PACKED_CLEAR_TEMPLATE_FILE_NAME = "escrow_packed_clear_program.template.json"
+DEFAULT_ACCEPT_DELIVERY_WINDOW = 30 # seconds
+ALGO_MIN_ACCOUNT_BALANCE = 100000
+# ASA opt-in and the two legs of the release or refund group
+NUMBER_OF_INNER_TRANSACTIONS = 3
+# Algo and the tips ASA
+NUMBER_OF_HOLDING_ASSETS = 2
+
+
+@lru_cache(maxsize=None)
+def delivery_layout() -> DeliveryLayout:
+    return DeliveryLayout.load()
+
+
+@lru_cache(maxsize=None)
+def load_template(path: str) -> Template:
+    with open(path, encoding="UTF-8") as f:
+        return Template.from_json(f.read())
+
+
+class DeliveryClient:
+    def __init__(self, algod: AsyncAlgodClient, app_id: int, tips_asa_id: int):
+        self.algod = algod
+        self.app_id = app_id
+        self.tips_asa_id = tips_asa_id
+        self.layout = delivery_layout()
+
+    @property
+    def escrow_address(self) -> str:
+        return logic.get_application_address(self.app_id)
+
+    @staticmethod
+    async def deploy(
+        algod: AsyncAlgodClient,
+        customer: Account,
+        merchant_address: str,
+        courier_address: str,
+        order_total_price: int,
+        courier_reward_amount: int,
+        tips_amount: int,
+        tips_asa_id: int,
+        accept_delivery_window: int = DEFAULT_ACCEPT_DELIVERY_WINDOW,
+        dist_dir: str = "./dist",
+        packed: bool = False,
+    ) -> "DeliveryClient":
+        """Creates and funds the escrow of an order, programs are instantiated from the build templates.
+
+        packed deploys the escrow keeping the order in one global state record (GlobalState.Record)."""
+        if order_total_price <= 0:
+            raise ValueError("order_total_price should be greater than zero")
+        if courier_reward_amount <= 0:
+            raise ValueError("courier_reward_amount should be greater than zero")
+        if courier_reward_amount >= order_total_price:
+            raise ValueError("order_total_price should be greater than courier_reward_amount")
+        layout = delivery_layout()
+        approval_template_file_name = PACKED_APPROVAL_TEMPLATE_FILE_NAME if packed else APPROVAL_TEMPLATE_FILE_NAME
+        clear_template_file_name = PACKED_CLEAR_TEMPLATE_FILE_NAME if packed else CLEAR_TEMPLATE_FILE_NAME
+        approval_program = instantiate(load_template(os.path.join(dist_dir, approval_template_file_name)), {
+            "TMPL_ASA_ID": tips_asa_id,
+            "TMPL_ACCEPT_DELIVERY_WINDOW": accept_delivery_window,
+        })
+        clear_program = instantiate(load_template(os.path.join(dist_dir, clear_template_file_name)), {})
+        app_args = [None] * len(layout.creation_args)
+        app_args[layout.creation_args["courier_address"]] = encoding.decode_address(courier_address)
+        app_args[layout.creation_args["restaurant_address"]] = encoding.decode_address(merchant_address)
+        app_args[layout.creation_args["courier_reward_amount"]] = courier_reward_amount
+        create_txn = transaction.ApplicationCreateTxn(
+            customer.address,
+            await algod.suggested_params(),
+            transaction.OnComplete.NoOpOC,
+            approval_program,
+            clear_program,
+            transaction.StateSchema(*(layout.packed_global_schema if packed else layout.global_schema)),
+            transaction.StateSchema(0, 0),
+            app_args,
+        )
+        created = await algod.send_and_confirm([customer.sign(create_txn)])
+        client = DeliveryClient(algod, created["application-index"], tips_asa_id)
+
+        escrow_balance = (
+            ALGO_MIN_ACCOUNT_BALANCE * NUMBER_OF_HOLDING_ASSETS
+            + NUMBER_OF_INNER_TRANSACTIONS * constants.MIN_TXN_FEE
+            + order_total_price
+        )
+        params = await algod.suggested_params()
+        group = [
+            transaction.PaymentTxn(customer.address, params, client.escrow_address, escrow_balance),
+            client.action_txn(customer.address, params, "ASA_OPT_IN", assets=True),
+            transaction.AssetTransferTxn(customer.address, params, client.escrow_address, tips_amount, tips_asa_id),
+        ]
+        transaction.assign_group_id(group)
+        await algod.send_and_confirm([customer.sign(txn) for txn in group])
+        return client
+
+    def action_txn(self, sender: str, params: transaction.SuggestedParams, action: str, accounts=(), assets: bool = False):
+        app_args = [None] * (self.layout.action_arg_index + 1)
+        app_args[self.layout.action_arg_index] = bytes([self.layout.action_codes[action]])
+        return transaction.ApplicationNoOpTxn(
+            sender,
+            params,
+            self.app_id,
+            app_args,
+            accounts=list(accounts) or None,
+            foreign_assets=[self.tips_asa_id] if assets else None,
+        )
+
+    async def call(self, sender: Account, action: str, accounts=(), assets: bool = False) -> dict:
+        """Sends an action and returns the confirmed transaction."""
+        txn = self.action_txn(sender.address, await self.algod.suggested_params(), action, accounts, assets)
+        return await self.algod.send_and_confirm([sender.sign(txn)])
+
+    # customer actions
+
+    async def complete_order(self, customer: Account, courier_address: str, merchant_address: str) -> dict:
+        return await self.call(customer, "COMPLETE_ORDER", [courier_address, merchant_address], assets=True)
+
+    async def start_dispute(self, customer: Account) -> dict:
+        return await self.call(customer, "START_DISPUTE")
+
+    async def cancel_order(self, sender: Account, customer_address: Optional[str] = None) -> dict:
+        """Cancels the order, the courier and the restaurant pass the address of the refunded customer."""
+        accounts = [customer_address] if customer_address is not None else []
+        return await self.call(sender, "CANCEL", accounts, assets=True)
+
+    # courier actions
+
+    async def pick_up_order(self, courier: Account) -> dict:
+        return await self.call(courier, "PICK_UP_ORDER")
+
+    async def delivered(self, courier: Account) -> dict:
+        return await self.call(courier, "DELIVERED")
+
+    async def claim_funds(self, courier: Account, merchant_address: str) -> dict:
+        return await self.call(courier, "CLAIM_FUNDS", [courier.address, merchant_address], assets=True)
+
+    async def order_state(self) -> Dict[str, StateValue]:
+        """The global state of the escrow by GlobalState.Variables name, the status by OrderStatus name."""
+        global_state = await self.algod.application_global_state(self.app_id)
+        if self.layout.record_key in global_state:
+            global_state = self.layout.unpack_record(global_state[self.layout.record_key])
+        state = {
+            self.layout.state_keys[key]: value
+            for key, value in global_state.items()
+            if key in self.layout.state_keys
+        }
+        if "ORDER_STATUS" in state:
+            state["ORDER_STATUS"] = self.layout.order_statuses.get(state["ORDER_STATUS"], state["ORDER_STATUS"])
+        return state
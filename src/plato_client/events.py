@@ -0,0 +1,90 @@
+import base64
+import struct
+from functools import lru_cache
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+from algosdk import encoding
+
+from .indexer import as_bytes
+from .layouts import EventLayout
+
+# Decoder of the events the contracts log on every state transition (src/contracts/utils/event_utils.py).
+#
+# An event is a fixed-layout record, so it is unpacked in place with one struct call: nothing is
+# sliced or copied out of the log, and a buffer holding many records back to back (e.g. logs
+# archived by an indexer) is decoded as it is streamed. Logs that are not events, like the return
+# value of an ABI method, are skipped by their length and type byte.
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# struct format of the record fields by size, big-endian
+FIELD_FORMATS = {1: "B", 8: "Q", 32: "32s"}
+
+
+@lru_cache(maxsize=None)
+def event_layout() -> EventLayout:
+    return EventLayout.load()
+
+
+@lru_cache(maxsize=None)
+def event_struct() -> struct.Struct:
+    return struct.Struct(">" + "".join(FIELD_FORMATS[size] for _, size in event_layout().fields))
+
+
+class Event(NamedTuple):
+    type: int
+    # order ID (the application ID of a delivery escrow), asset ID of a reward, or 0
+    id: int
+    account: bytes
+    old_status: int
+    new_status: int
+    amount: int
+
+    @property
+    def type_name(self) -> str:
+        return next((name for name, value in event_layout().event_types.items() if value == self.type), str(self.type))
+
+    @property
+    def address(self) -> str:
+        return encoding.encode_address(self.account)
+
+
+def is_event(log: Buffer) -> bool:
+    return len(log) == event_layout().length and log[0] in event_layout().event_types.values()
+
+
+def decode_event(log: Buffer) -> Optional[Event]:
+    """The event logged as log, None if the log is not an event."""
+    if not is_event(log):
+        return None
+    return Event._make(event_struct().unpack_from(log))
+
+
+def iter_events(buffer: Buffer) -> Iterator[Event]:
+    """The events stored back to back in buffer, decoded in place."""
+    return map(Event._make, event_struct().iter_unpack(memoryview(buffer)))
+
+
+def decode_events(logs: Iterable[Buffer]) -> Iterator[Event]:
+    """The events among the logs of a transaction, skipping other logs."""
+    for log in logs:
+        if is_event(log):
+            yield Event._make(event_struct().unpack_from(log))
+
+
+def transaction_events(result: dict) -> Iterator[Event]:
+    """The events logged by a transaction, then those of each of its inner transactions.
+
+    result is either the JSON of algod's pending transaction information ("logs" in base64,
+    "inner-txns") or a transaction of a msgpack block ("dt" apply data with "lg" and "itx").
+    """
+    if "dt" in result:
+        delta = result["dt"]
+        logs = [as_bytes(log) for log in delta.get("lg", [])]
+        inner_txns = delta.get("itx", [])
+    else:
+        logs = [base64.b64decode(log) for log in result.get("logs", [])]
+        inner_txns = result.get("inner-txns", [])
+    yield from decode_events(logs)
+    for inner_txn in inner_txns:
+        yield from transaction_events(inner_txn)
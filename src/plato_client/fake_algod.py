@@ -0,0 +1,636 @@
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+import msgpack
+from algosdk import encoding
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from .algod import TOKEN_HEADER
+from .indexer import DELETE, SET_BYTES, SET_UINT
+from .layouts import CONTRACTS_DIR  # noqa: F401, puts src/contracts on sys.path
+
+from avm import AssemblerError, Ledger, LedgerError, LogicError, Transaction, assemble_source, disassemble, evaluate_group  # noqa: E402
+from avm.address import sha512_256  # noqa: E402
+from avm.interpreter import MAX_GROUP_SIZE  # noqa: E402
+
+# A stand-in for algod evaluating the transactions it receives with the local AVM
+# (src/contracts/avm), to run the clients end to end without a node or a sandbox.
+#
+# It serves the endpoints AsyncAlgodClient uses: status and wait-for-block-after, transaction
+# params, raw transaction submission, pending transaction information, blocks in msgpack, account,
+# account application and application information, and TEAL compilation. A group is evaluated against the
+# in-memory ledger when it is received, as algod checks it against its pool, and is confirmed
+# when the round ends every round_time seconds. With a round_time of 0 it is confirmed right
+# away, so that throughput is not capped by a block time: the round ends as soon as a client
+# waits for the next block, and every second otherwise to keep LatestTimestamp moving. Programs are run from their
+# bytecode (avm.disassemble), those instantiated offline from the build templates included.
+# Blocks hold the confirmed transactions with the apply data of their logs, inner transactions,
+# created application and state deltas. The changes a group makes to the state of an application
+# are reported on its last call in the group rather than split between its calls.
+#
+# Transactions are signed by the key of their sender or by a logic signature, whose program is
+# run by the AVM with the group and whose address must be the sender. Rekeyed accounts, delegated
+# logic signatures, multisignatures and asset configuration are not supported; accounts and
+# assets are set up with the genesis arguments instead (assets get IDs 1, 2, ... in order).
+#
+# Faults can be injected: error_rate answers a submission with a 503 before evaluating it,
+# drop_rate accepts it and reports a pool error instead of confirming it, and latency delays
+# every response.
+#
+# Usage: PYTHONPATH=src python3 -m plato_client.fake_algod [--port 4001] [--round-time 0] [--fund ADDRESS=AMOUNT]
+
+DEFAULT_PORT = 4001
+GENESIS_ID = "fake-v1"
+GENESIS_HASH = base64.b64encode(sha512_256(GENESIS_ID.encode())).decode()
+CONSENSUS_VERSION = "fake"
+MIN_FEE = 1000
+# seconds per round when transactions are confirmed on receipt
+INSTANT_ROUND_TIME = 1.0
+# rounds a transaction stays valid, as AsyncAlgodClient.fetch_params sets last valid
+MAX_TXN_LIFE = 1000
+# algod answers wait-for-block-after after a minute at the latest
+WAIT_FOR_BLOCK_TIMEOUT = 60
+# pending transaction information kept for the most recent transactions
+MAX_RETAINED_TRANSACTIONS = 100000
+# blocks kept for the most recent rounds
+MAX_RETAINED_BLOCKS = 1000
+
+# msgpack keys of a transaction -> avm Transaction attributes
+TXN_FIELDS = {
+    "type": "type",
+    "snd": "sender",
+    "fv": "first_valid",
+    "lv": "last_valid",
+    "note": "note",
+    "lx": "lease",
+    "rekey": "rekey_to",
+    "rcv": "receiver",
+    "amt": "amount",
+    "close": "close_remainder_to",
+    "xaid": "xfer_asset",
+    "aamt": "asset_amount",
+    "asnd": "asset_sender",
+    "arcv": "asset_receiver",
+    "aclose": "asset_close_to",
+    "apid": "application_id",
+    "apan": "on_completion",
+    "apaa": "application_args",
+    "apat": "accounts",
+    "apfa": "applications",
+    "apas": "assets",
+    "apep": "extra_program_pages",
+}
+ADDRESS_KEYS = frozenset(("snd", "rcv", "close", "asnd", "arcv", "aclose", "rekey", "sgnr"))
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def b64(value: bytes) -> str:
+    return base64.b64encode(value).decode()
+
+
+def state_json(state: Mapping[bytes, object]) -> List[dict]:
+    """A TEAL key-value store as algod returns it, see algod.decode_state."""
+    return [
+        {"key": b64(key), "value": {"type": 1, "bytes": b64(value), "uint": 0}} if isinstance(value, bytes)
+        else {"key": b64(key), "value": {"type": 2, "bytes": "", "uint": value}}
+        for key, value in state.items()
+    ]
+
+
+def msgpack_json(value, key: str = ""):
+    """A decoded msgpack transaction in algod's JSON: addresses in base32, other bytes in base64."""
+    if isinstance(value, dict):
+        return {name: msgpack_json(item, name) for name, item in value.items()}
+    if isinstance(value, list):
+        return [msgpack_json(item, key) for item in value]
+    if isinstance(value, bytes):
+        return encoding.encode_address(value) if key in ADDRESS_KEYS or key == "apat" else b64(value)
+    return value
+
+
+def inner_txn_fields(txn: Transaction) -> dict:
+    """The msgpack fields of an inner transaction."""
+    fields = {"type": txn.type, "snd": txn.sender, "fee": txn.fee}
+    if txn.type == "pay":
+        fields.update(rcv=txn.receiver, amt=txn.amount)
+        if any(txn.close_remainder_to):
+            fields["close"] = txn.close_remainder_to
+    elif txn.type == "axfer":
+        fields.update(xaid=txn.xfer_asset, aamt=txn.asset_amount, arcv=txn.asset_receiver)
+        if any(txn.asset_close_to):
+            fields["aclose"] = txn.asset_close_to
+    return fields
+
+
+def inner_txn_json(txn: Transaction) -> dict:
+    return {"txn": msgpack_json({"txn": inner_txn_fields(txn)})}
+
+
+def app_states(ledger: Ledger, calls: Sequence[Tuple[int, Sequence[bytes]]]) -> Dict[Tuple[int, bytes], dict]:
+    """Copies of the states of (app ID, accounts) calls: the global state of an application under
+    (app ID, b""), the local states of the accounts opted in under (app ID, address)."""
+    states = {}
+    for app_id, addresses in calls:
+        app = ledger.apps.get(app_id)
+        if app is None:
+            continue
+        states[(app_id, b"")] = dict(app.global_state)
+        for address in addresses:
+            account = ledger.accounts.get(address)
+            if account is not None and app_id in account.local_states:
+                states[(app_id, address)] = dict(account.local_states[app_id])
+    return states
+
+
+def state_changes(before: Mapping[bytes, object], after: Mapping[bytes, object]) -> dict:
+    """The state delta from before to after, empty values omitted as algod does."""
+    changes = {}
+    for key, value in after.items():
+        if key not in before or before[key] != value:
+            if isinstance(value, int):
+                changes[key] = {"at": SET_UINT, "ui": value} if value else {"at": SET_UINT}
+            else:
+                changes[key] = {"at": SET_BYTES, "bs": value} if value else {"at": SET_BYTES}
+    for key in before.keys() - after.keys():
+        changes[key] = {"at": DELETE}
+    return changes
+
+
+def state_deltas(txns: Sequence[Transaction], app_ids: Sequence[int], before: dict, after: dict) -> List[dict]:
+    """The "gd", "ld" and "sa" apply data of the transactions of a group, given their called
+    application IDs and the app_states of their calls before and after the group."""
+    last_calls = {app_id: index for index, app_id in enumerate(app_ids) if app_id}
+    deltas: List[dict] = [{} for _ in txns]
+    for app_id, address in after:
+        changes = state_changes(before.get((app_id, address), {}), after[(app_id, address)])
+        if not changes:
+            continue
+        index = last_calls[app_id]
+        delta = deltas[index]
+        if not address:
+            delta["gd"] = changes
+            continue
+        accounts = [txns[index].sender, *txns[index].accounts]
+        if address not in accounts:
+            shared = delta.setdefault("sa", [])
+            if address not in shared:
+                shared.append(address)
+            accounts += shared
+        delta.setdefault("ld", {})[accounts.index(address)] = changes
+    return deltas
+
+
+def evaluate_with_deltas(ledger: Ledger, txns: List[Transaction]) -> Tuple[list, List[dict]]:
+    """Evaluates a group, returns its results and the state deltas of its transactions (see state_deltas)."""
+    calls = [(txn.application_id, (txn.sender, *txn.accounts)) if txn.type == "appl" else (0, ()) for txn in txns]
+    before = app_states(ledger, calls)
+    results = evaluate_group(ledger, txns)
+    # applications created by the group are known once evaluated
+    calls = [
+        (app_id or result.app_id if txn.type == "appl" else 0, addresses)
+        for (app_id, addresses), txn, result in zip(calls, txns, results)
+    ]
+    return results, state_deltas(txns, [app_id for app_id, _ in calls], before, app_states(ledger, calls))
+
+
+def block_txn(signed_txn: dict, txn: Transaction, result, state_delta: dict) -> dict:
+    """A transaction as a block holds it, without its genesis hash and ID and with its apply data."""
+    fields = dict(signed_txn["txn"])
+    entry = dict(signed_txn, txn=fields)
+    fields.pop("gh", None)
+    if fields.pop("gen", None) is not None:
+        entry["hgi"] = True
+    if txn.type == "appl" and txn.application_id == 0:
+        entry["apid"] = result.app_id
+    delta = dict(state_delta)
+    if result.logs:
+        delta["lg"] = list(result.logs)
+    if result.inner_txns:
+        delta["itx"] = [{"txn": inner_txn_fields(inner_txn)} for inner_txn in result.inner_txns]
+    if delta:
+        entry["dt"] = delta
+    return entry
+
+
+def avm_transaction(signed_txn: dict) -> Transaction:
+    """The avm Transaction of a msgpack signed transaction, with its logic signature if any."""
+    fields = signed_txn["txn"]
+    # msgpack omits zero values, a pooled fee of 0 included
+    txn = Transaction(**{attribute: fields[key] for key, attribute in TXN_FIELDS.items() if key in fields}, fee=fields.get("fee", 0))
+    if "lsig" in signed_txn:
+        txn.logic_sig = signed_txn["lsig"].get("l", b"")
+        txn.logic_sig_args = list(signed_txn["lsig"].get("arg", []))
+    for key, attribute in (("apap", "approval_program"), ("apsu", "clear_state_program")):
+        if key in fields:
+            try:
+                setattr(txn, attribute, disassemble(fields[key]))
+            except AssemblerError as error:
+                raise ApiError(400, f"invalid program: {error}") from error
+    for key, prefix in (("apgs", "global"), ("apls", "local")):
+        schema = fields.get(key, {})
+        setattr(txn, f"{prefix}_num_uint", schema.get("nui", 0))
+        setattr(txn, f"{prefix}_num_byte_slice", schema.get("nbs", 0))
+    return txn
+
+
+class FakeAlgod:
+    def __init__(
+        self,
+        round_time: float = 0,
+        genesis: Optional[Mapping[str, int]] = None,
+        assets: Sequence[Tuple[str, int]] = (),
+        error_rate: float = 0,
+        drop_rate: float = 0,
+        latency: float = 0,
+        verify_signatures: bool = True,
+        token: str = "",
+        seed: Optional[int] = None,
+    ):
+        """genesis maps addresses to their initial balance, assets are (creator address, total) pairs."""
+        self.ledger = Ledger(latest_timestamp=int(time.time()))
+        for address, amount in (genesis or {}).items():
+            self.ledger.fund(encoding.decode_address(address), amount)
+        for creator, total in assets:
+            self.ledger.create_asset(encoding.decode_address(creator), total)
+        self.genesis_round = self.ledger.round
+        self.round_time = round_time
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.latency = latency
+        self.verify_signatures = verify_signatures
+        self.token = token
+        self.random = random.Random(seed)
+        self.round_start = time.monotonic()
+        # txid -> pending transaction information, of the open round and of the last confirmed ones
+        self.transactions: "OrderedDict[str, dict]" = OrderedDict()
+        self.open_round: List[dict] = []
+        # transactions of the open round, as its block holds them, confirmed and evaluated
+        self.block_txns: List[dict] = []
+        self.open_block: List[dict] = []
+        self.blocks: "OrderedDict[int, dict]" = OrderedDict()
+        # app ID -> (approval, clear) bytecode as received
+        self.programs: Dict[int, Tuple[bytes, bytes]] = {}
+        self.round_ended: Optional[asyncio.Condition] = None
+        # wait-for-block-after requests in progress
+        self.block_waiters = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.ticker: Optional[asyncio.Task] = None
+        self.connections: Set[asyncio.Task] = set()
+        self.routes = (
+            ("GET", re.compile(r"/v2/status"), self.status),
+            ("GET", re.compile(r"/v2/status/wait-for-block-after/(\d+)"), self.wait_for_block_after),
+            ("GET", re.compile(r"/v2/transactions/params"), self.params),
+            ("POST", re.compile(r"/v2/transactions"), self.send),
+            ("GET", re.compile(r"/v2/transactions/pending/([A-Z2-7]+)"), self.pending),
+            ("GET", re.compile(r"/v2/blocks/(\d+)"), self.block),
+            ("POST", re.compile(r"/v2/teal/compile"), self.compile),
+            ("GET", re.compile(r"/v2/accounts/([A-Z2-7]{58})"), self.account),
+            ("GET", re.compile(r"/v2/accounts/([A-Z2-7]{58})/applications/(\d+)"), self.account_application),
+            ("GET", re.compile(r"/v2/applications/(\d+)"), self.application),
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> str:
+        """Starts serving and returns the URL, port 0 picks a free port."""
+        self.round_ended = asyncio.Condition()
+        self.server = await asyncio.start_server(self.serve, host, port)
+        self.ticker = asyncio.ensure_future(self.tick())
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def close(self):
+        if self.ticker is not None:
+            self.ticker.cancel()
+        if self.server is not None:
+            self.server.close()
+            for connection in self.connections:
+                connection.cancel()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+
+    async def __aenter__(self) -> "FakeAlgod":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # rounds
+
+    async def tick(self):
+        while True:
+            await asyncio.sleep(self.round_time or INSTANT_ROUND_TIME)
+            await self.end_round()
+
+    def confirm(self):
+        for info in self.open_round:
+            info["confirmed-round"] = self.ledger.round
+        self.open_round = []
+        self.block_txns.extend(self.open_block)
+        self.open_block = []
+
+    async def end_round(self):
+        """Confirms the transactions of the open round and starts the next one."""
+        self.confirm()
+        self.blocks[self.ledger.round] = {
+            "rnd": self.ledger.round,
+            "ts": self.ledger.latest_timestamp,
+            "gh": base64.b64decode(GENESIS_HASH),
+            "gen": GENESIS_ID,
+            "txns": self.block_txns,
+        }
+        self.block_txns = []
+        while len(self.blocks) > MAX_RETAINED_BLOCKS:
+            self.blocks.popitem(last=False)
+        self.ledger.round += 1
+        self.ledger.latest_timestamp = max(self.ledger.latest_timestamp, int(time.time()))
+        self.round_start = time.monotonic()
+        async with self.round_ended:
+            self.round_ended.notify_all()
+
+    @property
+    def last_round(self) -> int:
+        return self.ledger.round - 1
+
+    # HTTP
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = asyncio.current_task()
+        self.connections.add(connection)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, content_type, payload = await self.respond(method, target, headers, body)
+                writer.write((
+                    f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                    f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n\r\n"
+                ).encode("latin-1") + payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            # the client went away or the server is closing
+            pass
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> Tuple[int, str, bytes]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        path = target.split("?", 1)[0]
+        try:
+            if self.token and headers.get(TOKEN_HEADER.lower()) != self.token:
+                raise ApiError(401, "invalid API token")
+            for route_method, pattern, handler in self.routes:
+                match = pattern.fullmatch(path)
+                if match and route_method == method:
+                    result = await handler(*match.groups(), body=body)
+                    if isinstance(result, bytes):
+                        return 200, "application/msgpack", result
+                    return 200, "application/json", json.dumps(result).encode()
+            raise ApiError(404, f"no route for {method} {path}")
+        except ApiError as error:
+            return error.status, "application/json", json.dumps({"message": str(error)}).encode()
+
+    # endpoints
+
+    async def status(self, body: bytes = b"") -> dict:
+        return {
+            "last-round": self.last_round,
+            "last-version": CONSENSUS_VERSION,
+            "time-since-last-round": int((time.monotonic() - self.round_start) * 1e9),
+            "catchup-time": 0,
+        }
+
+    async def wait_for_block_after(self, round_number: str, body: bytes = b"") -> dict:
+        if self.round_time <= 0 and self.block_txns:
+            # transactions were confirmed on receipt, their block is the one waited for
+            await self.end_round()
+        self.block_waiters += 1
+        try:
+            async with self.round_ended:
+                await asyncio.wait_for(
+                    self.round_ended.wait_for(lambda: self.last_round > int(round_number)), WAIT_FOR_BLOCK_TIMEOUT
+                )
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.block_waiters -= 1
+        return await self.status()
+
+    async def params(self, body: bytes = b"") -> dict:
+        return {
+            "consensus-version": CONSENSUS_VERSION,
+            "fee": 0,
+            "genesis-hash": GENESIS_HASH,
+            "genesis-id": GENESIS_ID,
+            "last-round": self.last_round,
+            "min-fee": MIN_FEE,
+        }
+
+    async def send(self, body: bytes = b"") -> dict:
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise ApiError(503, "injected error")
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+        unpacker.feed(body)
+        signed_txns = list(unpacker)
+        if not 0 < len(signed_txns) <= MAX_GROUP_SIZE:
+            raise ApiError(400, f"a group holds 1 to {MAX_GROUP_SIZE} transactions")
+        txids = [self.check(signed_txn) for signed_txn in signed_txns]
+        infos = [{"confirmed-round": 0, "pool-error": "", "txn": msgpack_json(signed_txn)} for signed_txn in signed_txns]
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            for info in infos:
+                info["pool-error"] = "injected drop"
+        else:
+            txns = [avm_transaction(signed_txn) for signed_txn in signed_txns]
+            try:
+                results, deltas = evaluate_with_deltas(self.ledger, txns)
+            except (LogicError, LedgerError) as error:
+                raise ApiError(400, f"TransactionPool.Remember: transaction {txids[0]}: {error}") from error
+            for signed_txn, txn, result, info, state_delta in zip(signed_txns, txns, results, infos, deltas):
+                self.open_block.append(block_txn(signed_txn, txn, result, state_delta))
+                if txn.type == "appl":
+                    if txn.application_id == 0:
+                        info["application-index"] = result.app_id
+                    if "apap" in signed_txn["txn"]:
+                        self.programs[result.app_id] = (signed_txn["txn"]["apap"], signed_txn["txn"].get("apsu", b""))
+                if result.logs:
+                    info["logs"] = [b64(log) for log in result.logs]
+                if result.inner_txns:
+                    info["inner-txns"] = [inner_txn_json(inner_txn) for inner_txn in result.inner_txns]
+            self.open_round.extend(infos)
+        for txid, info in zip(txids, infos):
+            self.transactions[txid] = info
+        while len(self.transactions) > MAX_RETAINED_TRANSACTIONS:
+            self.transactions.popitem(last=False)
+        if self.round_time <= 0:
+            if self.block_waiters:
+                await self.end_round()
+            else:
+                self.confirm()
+        return {"txId": txids[0]}
+
+    def check(self, signed_txn: dict) -> str:
+        """Checks the signature and validity of a transaction and returns its ID."""
+        if "txn" not in signed_txn or ("sig" not in signed_txn) == ("lsig" not in signed_txn):
+            raise ApiError(400, "only transactions signed by a single key or by a logic signature are supported")
+        fields = signed_txn["txn"]
+        message = b"TX" + msgpack.packb(fields, use_bin_type=True)
+        txid = base64.b32encode(sha512_256(message)).decode().rstrip("=")
+        if "lsig" in signed_txn:
+            # the AVM checks that the sender is the address of the program when it runs it
+            if "sig" in signed_txn["lsig"] or "msig" in signed_txn["lsig"]:
+                raise ApiError(400, f"transaction {txid}: delegated logic signatures are not supported")
+        elif self.verify_signatures:
+            if signed_txn.get("sgnr", fields.get("snd")) != fields.get("snd"):
+                raise ApiError(400, f"transaction {txid}: signed by another key than the sender, rekeyed accounts are not supported")
+            try:
+                VerifyKey(fields.get("snd", bytes(32))).verify(message, signed_txn["sig"])
+            except (BadSignatureError, ValueError, TypeError) as error:
+                raise ApiError(400, f"transaction {txid}: invalid signature") from error
+        if fields.get("gh") not in (None, base64.b64decode(GENESIS_HASH)):
+            raise ApiError(400, f"transaction {txid}: genesis hash mismatch")
+        if fields.get("gen") not in (None, GENESIS_ID):
+            raise ApiError(400, f"transaction {txid}: genesis ID mismatch")
+        next_round = self.ledger.round
+        if fields.get("lv", 0) < next_round:
+            raise ApiError(400, f"transaction {txid}: txn dead, round {next_round} outside of {fields.get('fv', 0)}--{fields.get('lv', 0)}")
+        if fields.get("fv", 0) > next_round:
+            raise ApiError(400, f"transaction {txid}: round {next_round} before first valid {fields['fv']}")
+        if fields.get("lv", 0) - fields.get("fv", 0) > MAX_TXN_LIFE:
+            raise ApiError(400, f"transaction {txid}: validity window longer than {MAX_TXN_LIFE} rounds")
+        if txid in self.transactions and not self.transactions[txid]["pool-error"]:
+            raise ApiError(400, f"transaction {txid}: transaction already in ledger")
+        return txid
+
+    async def pending(self, txid: str, body: bytes = b"") -> dict:
+        if txid not in self.transactions:
+            raise ApiError(404, f"transaction {txid} not found")
+        return self.transactions[txid]
+
+    async def block(self, round_number: str, body: bytes = b"") -> bytes:
+        round_number = int(round_number)
+        if self.round_time <= 0 and self.block_txns and round_number == self.ledger.round:
+            # transactions confirmed on receipt report the open round, its block is ended when asked for
+            await self.end_round()
+        block = self.blocks.get(round_number)
+        if block is None and round_number < self.genesis_round:
+            # the rounds before the server started are empty
+            block = {"rnd": round_number, "ts": 0, "gh": base64.b64decode(GENESIS_HASH), "gen": GENESIS_ID, "txns": []}
+        if block is None:
+            raise ApiError(404, f"ledger does not have entry {round_number}")
+        return msgpack.packb({"block": block}, use_bin_type=True)
+
+    async def compile(self, body: bytes = b"") -> dict:
+        try:
+            bytecode = assemble_source(body.decode())
+        except (AssemblerError, UnicodeDecodeError) as error:
+            raise ApiError(400, str(error)) from error
+        return {"hash": encoding.encode_address(sha512_256(b"Program" + bytecode)), "result": b64(bytecode)}
+
+    async def account(self, address: str, body: bytes = b"") -> dict:
+        account = self.ledger.accounts.get(encoding.decode_address(address))
+        if account is None:
+            return {"address": address, "amount": 0, "min-balance": 0, "round": self.last_round, "status": "Offline"}
+        return {
+            "address": address,
+            "amount": account.balance,
+            "min-balance": self.ledger.min_balance(account.address),
+            "round": self.last_round,
+            "status": "Offline",
+            "assets": [
+                {"asset-id": asset_id, "amount": holding.amount, "is-frozen": holding.frozen}
+                for asset_id, holding in account.assets.items()
+            ],
+            "apps-local-state": [
+                {"id": app_id, "key-value": state_json(state)} for app_id, state in account.local_states.items()
+            ],
+        }
+
+    async def account_application(self, address: str, app_id: str, body: bytes = b"") -> dict:
+        account = self.ledger.accounts.get(encoding.decode_address(address))
+        if account is None or int(app_id) not in account.local_states:
+            raise ApiError(404, "account application info not found")
+        return {
+            "round": self.last_round,
+            "app-local-state": {"id": int(app_id), "key-value": state_json(account.local_states[int(app_id)])},
+        }
+
+    async def application(self, app_id: str, body: bytes = b"") -> dict:
+        app = self.ledger.apps.get(int(app_id))
+        if app is None:
+            raise ApiError(404, "application does not exist")
+        params = {
+            "creator": encoding.encode_address(app.creator),
+            "global-state": state_json(app.global_state),
+            "global-state-schema": {"num-uint": app.global_schema[0], "num-byte-slice": app.global_schema[1]},
+            "local-state-schema": {"num-uint": app.local_schema[0], "num-byte-slice": app.local_schema[1]},
+            "extra-program-pages": app.extra_pages,
+        }
+        if app.id in self.programs:
+            approval, clear = self.programs[app.id]
+            params.update({"approval-program": b64(approval), "clear-state-program": b64(clear)})
+        return {"id": app.id, "params": params}
+
+
+def parse_assignment(value: str) -> Tuple[str, int]:
+    name, _, amount = value.partition("=")
+    return name, int(amount)
+
+
+async def run(args):
+    algod = FakeAlgod(
+        args.round_time, dict(args.fund), args.asset, args.error_rate, args.drop_rate, args.latency, token=args.token,
+    )
+    url = await algod.start(args.host, args.port)
+    print(f"fake algod listening on {url}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await algod.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake algod evaluating transactions with the local AVM.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port, 0 for any (default: {DEFAULT_PORT})")
+    parser.add_argument("--round-time", type=float, default=0, help="seconds per round, 0 to confirm on receipt")
+    parser.add_argument("--fund", type=parse_assignment, action="append", default=[], metavar="ADDRESS=AMOUNT",
+                        help="initial balance of an account, repeatable")
+    parser.add_argument("--asset", type=parse_assignment, action="append", default=[], metavar="CREATOR=TOTAL",
+                        help="asset created at genesis, IDs start at 1, repeatable")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of submissions answered with a 503")
+    parser.add_argument("--drop-rate", type=float, default=0, help="share of accepted groups dropped from the pool")
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every response")
+    parser.add_argument("--token", default="", help="API token to require")
+    try:
+        asyncio.run(run(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
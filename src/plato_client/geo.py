@@ -0,0 +1,184 @@
+import heapq
+import math
+from typing import Dict, List, Optional, Tuple
+
+# Spatial index of the store locations, the "lat" and "lng" of their identity local state.
+#
+# Stores are bucketed in a grid of cell_degrees x cell_degrees cells. A radius query only looks
+# at the cells overlapping the bounding box of the circle, a nearest query looks at rings of
+# cells around the point until the stores found are provably closer than anything in the next
+# ring, so queries stay well under a millisecond with tens of thousands of stores.
+# Longitudes do not wrap around the antimeridian.
+
+EARTH_RADIUS_M = 6371008.8
+# length of one degree of latitude
+DEGREE_M = EARTH_RADIUS_M * math.pi / 180
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+Location = Tuple[float, float]
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters (haversine)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    half_chord = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, half_chord)))
+
+
+def geohash(lat: float, lng: float, precision: int = 6) -> str:
+    """The geohash of a location, 6 characters are a cell of about 1.2 km x 0.6 km."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def parse_location(lat: Optional[bytes], lng: Optional[bytes]) -> Optional[Location]:
+    """Parses the decimal degrees stored by the identity opt-in, None unless both are valid."""
+    try:
+        location = float(lat.decode()), float(lng.decode())
+    except (AttributeError, UnicodeDecodeError, ValueError):
+        return None
+    if not (-90 <= location[0] <= 90 and -180 <= location[1] <= 180):
+        return None
+    return location
+
+
+def ring_cells(row: int, column: int, ring: int) -> List[Tuple[int, int]]:
+    """The cells at a Chebyshev distance of ring from a cell."""
+    if ring == 0:
+        return [(row, column)]
+    cells = []
+    for offset in range(-ring, ring + 1):
+        cells.append((row - ring, column + offset))
+        cells.append((row + ring, column + offset))
+    for offset in range(-ring + 1, ring):
+        cells.append((row + offset, column - ring))
+        cells.append((row + offset, column + ring))
+    return cells
+
+
+class Grid:
+    def __init__(self, cell_degrees: float):
+        self.cell_degrees = cell_degrees
+        self.cells: Dict[Tuple[int, int], Dict[str, Location]] = {}
+
+    def cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def add(self, address: str, location: Location):
+        self.cells.setdefault(self.cell(*location), {})[address] = location
+
+    def remove(self, address: str, location: Location):
+        cell = self.cell(*location)
+        del self.cells[cell][address]
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def nearest(self, lat: float, lng: float, count: int, max_rings: int) -> Optional[List[Tuple[float, str]]]:
+        """The count nearest stores found in rings of cells around the location, None if it takes more than max_rings."""
+        row, column = self.cell(lat, lng)
+        # distance from the location to the nearest side of its cell, in cells
+        lat_margin = lat / self.cell_degrees - row
+        lng_margin = lng / self.cell_degrees - column
+        lat_margin = min(lat_margin, 1 - lat_margin)
+        lng_margin = min(lng_margin, 1 - lng_margin)
+        found = []
+        for ring in range(max_rings + 1):
+            for cell in ring_cells(row, column, ring):
+                for address, (store_lat, store_lng) in self.cells.get(cell, {}).items():
+                    found.append((distance_m(lat, lng, store_lat, store_lng), address))
+            if len(found) >= count:
+                found.sort()
+                # stores outside the rings searched are at least this far away
+                cleared_m = min(
+                    (ring + lat_margin) * self.cell_degrees * DEGREE_M,
+                    (ring + lng_margin) * self.cell_degrees * DEGREE_M * math.cos(math.radians(min(89.9, abs(lat) + (ring + 1) * self.cell_degrees))),
+                )
+                if found[count - 1][0] <= cleared_m:
+                    return found[:count]
+        return None
+
+
+class StoreGeoIndex:
+    # A fine grid sized for dense areas answers most queries within a few rings, a coarse grid of
+    # COARSE_FACTOR x COARSE_FACTOR larger cells answers the nearest queries in sparse areas.
+    COARSE_FACTOR = 16
+    MAX_FINE_RINGS = 3
+    MAX_COARSE_RINGS = 8
+
+    def __init__(self, cell_degrees: float = 0.01):
+        self.fine = Grid(cell_degrees)
+        self.coarse = Grid(cell_degrees * self.COARSE_FACTOR)
+        self.locations: Dict[str, Location] = {}
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def add(self, address: str, lat: float, lng: float):
+        self.remove(address)
+        self.locations[address] = (lat, lng)
+        self.fine.add(address, (lat, lng))
+        self.coarse.add(address, (lat, lng))
+
+    def remove(self, address: str):
+        location = self.locations.pop(address, None)
+        if location is not None:
+            self.fine.remove(address, location)
+            self.coarse.remove(address, location)
+
+    def within(self, lat: float, lng: float, radius_m: float) -> List[Tuple[float, str]]:
+        """(distance in meters, address) of the stores within radius_m of a location, nearest first."""
+        lat_span = radius_m / DEGREE_M
+        # the longitude span is widest at the latitude of the box closest to a pole
+        widest_lat = min(89.9, abs(lat) + lat_span)
+        lng_span = radius_m / (DEGREE_M * math.cos(math.radians(widest_lat)))
+        grid = self.fine
+        low_row, low_column = grid.cell(lat - lat_span, lng - lng_span)
+        high_row, high_column = grid.cell(lat + lat_span, lng + lng_span)
+        if (high_row - low_row + 1) * (high_column - low_column + 1) > len(grid.cells):
+            candidates = self.locations.items()
+        else:
+            candidates = [
+                store
+                for row in range(low_row, high_row + 1)
+                for column in range(low_column, high_column + 1)
+                for store in grid.cells.get((row, column), {}).items()
+            ]
+        found = []
+        for address, (store_lat, store_lng) in candidates:
+            distance = distance_m(lat, lng, store_lat, store_lng)
+            if distance <= radius_m:
+                found.append((distance, address))
+        found.sort()
+        return found
+
+    def nearest(self, lat: float, lng: float, count: int) -> List[Tuple[float, str]]:
+        """(distance in meters, address) of the count stores nearest to a location, nearest first."""
+        count = min(count, len(self.locations))
+        if count <= 0:
+            return []
+        found = self.fine.nearest(lat, lng, count, self.MAX_FINE_RINGS)
+        if found is None:
+            found = self.coarse.nearest(lat, lng, count, self.MAX_COARSE_RINGS)
+        if found is None:
+            # far from every store
+            found = heapq.nsmallest(count, ((distance_m(lat, lng, *location), address) for address, location in self.locations.items()))
+        return found
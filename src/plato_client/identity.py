@@ -0,0 +1,142 @@
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+
+from algosdk import constants, encoding, transaction
+
+from .account import Account
+from .algod import AsyncAlgodClient, StateValue
+from .layouts import IdentityLayout
+
+# Identity application (src/contracts/identity/app.py), the arguments are laid out the same
+# way as by IdentityClient in src/plato/identity.
+
+AppArg = Union[bytes, int]
+
+APP_CALL_BUDGET = 700
+# Opcode cost of a store attestation proof (sto_prf) and of an op_up call, as measured by the
+# identity scenarios of src/contracts/benchmark.py, with a margin for the store's buyer slots.
+PROOF_BASE_COST = 250
+PROOF_LEVEL_COST = 60
+OP_UP_COST = 50
+
+
+@lru_cache(maxsize=None)
+def identity_layout() -> IdentityLayout:
+    return IdentityLayout.load()
+
+
+def future_time(seconds_ahead: int = 10) -> int:
+    return int(time.time()) + seconds_ahead
+
+
+def opt_in_args(address: str, user_type: str, latitude: str = "", longitude: str = "", referer_address: str = constants.ZERO_ADDRESS, geohash: Optional[str] = None) -> List[AppArg]:
+    """The application arguments of an opt-in, in the order the opt_in branch reads them."""
+    app_args = [
+        encoding.decode_address(address),
+        identity_layout().user_types[user_type],
+        future_time(),
+        latitude.encode(),
+        longitude.encode(),
+        encoding.decode_address(referer_address),
+    ]
+    if geohash is not None:
+        app_args.append(geohash.encode())
+    return app_args
+
+
+def validate_args(action: bytes, target_address: str) -> List[AppArg]:
+    """The application arguments of a store (sto_val) or courier (cou_val) attestation of target_address."""
+    return [action, identity_layout().user_types["BUYER"], future_time(), encoding.decode_address(target_address)]
+
+
+def op_up_calls(depth: int) -> int:
+    """The op_up calls to group with the proof of an attestation in a tree of that depth."""
+    missing = PROOF_BASE_COST + PROOF_LEVEL_COST * depth - APP_CALL_BUDGET
+    return max(0, -(-missing // (APP_CALL_BUDGET - OP_UP_COST)))
+
+
+class IdentityClient:
+    def __init__(self, algod: AsyncAlgodClient, app_id: int):
+        self.algod = algod
+        self.app_id = app_id
+        self.layout = identity_layout()
+
+    async def opt_in(self, user: Account, user_type: str, latitude: str = "", longitude: str = "", referer_address: str = constants.ZERO_ADDRESS, geohash: Optional[str] = None) -> dict:
+        """Registers a user of a user type ("BUYER", "STORE" or "COURIER").
+
+        geohash is the location prefix of a store, for identity apps built with a geohash_length."""
+        app_args = opt_in_args(user.address, user_type, latitude, longitude, referer_address, geohash)
+        txn = transaction.ApplicationOptInTxn(user.address, await self.algod.suggested_params(), self.app_id, app_args)
+        return await self.algod.send_and_confirm([user.sign(txn)])
+
+    async def validate(self, sender: Account, action: bytes, target_address: str) -> dict:
+        txn = transaction.ApplicationNoOpTxn(
+            sender.address,
+            await self.algod.suggested_params(),
+            self.app_id,
+            validate_args(action, target_address),
+            accounts=[target_address],
+        )
+        return await self.algod.send_and_confirm([sender.sign(txn)])
+
+    async def validate_store(self, buyer: Account, store_address: str) -> dict:
+        """Attests that a buyer ordered from a store."""
+        return await self.validate(buyer, self.layout.action_store_attest, store_address)
+
+    async def validate_courier(self, store: Account, courier_address: str) -> dict:
+        """Attests that a courier delivers for a store."""
+        return await self.validate(store, self.layout.action_courier_attest, courier_address)
+
+    async def set_attestor(self, creator: Account, attestor_address: str) -> dict:
+        """Authorizes the account posting the roots of the attestation batches, the creator by default."""
+        txn = transaction.ApplicationNoOpTxn(
+            creator.address,
+            await self.algod.suggested_params(),
+            self.app_id,
+            [self.layout.action_set_attestor, encoding.decode_address(attestor_address)],
+        )
+        return await self.algod.send_and_confirm([creator.sign(txn)])
+
+    async def post_attestation_root(self, attestor: Account, root: bytes, count: int) -> dict:
+        """Posts the Merkle root of a batch of count store attestations.
+
+        The batch number is the id of the ATTESTATION_BATCH event of the transaction."""
+        txn = transaction.ApplicationNoOpTxn(
+            attestor.address,
+            await self.algod.suggested_params(),
+            self.app_id,
+            [self.layout.action_post_root, root, count],
+        )
+        return await self.algod.send_and_confirm([attestor.sign(txn)])
+
+    async def prove_store_attestation(self, sender: Account, batch: int, buyer_address: str, store_address: str, index: int, siblings: bytes) -> dict:
+        """Applies the attestation of a buyer by a store from a posted batch, as sto_val would.
+
+        index and siblings are the proof of the attestation in the batch (plato_client.attestations);
+        any account can send it, the op_up calls its depth needs are added to the group."""
+        params = await self.algod.suggested_params()
+        app_args = [
+            self.layout.action_prove_store_attest,
+            encoding.decode_address(buyer_address),
+            encoding.decode_address(store_address),
+            batch,
+            index,
+            siblings,
+        ]
+        group = [transaction.ApplicationNoOpTxn(sender.address, params, self.app_id, app_args, accounts=[buyer_address, store_address])]
+        # the note tells the op_up calls of the group apart
+        group += [
+            transaction.ApplicationNoOpTxn(sender.address, params, self.app_id, [self.layout.action_op_up], note=bytes([call]))
+            for call in range(op_up_calls(len(siblings) // self.layout.hash_length))
+        ]
+        if len(group) > 1:
+            transaction.assign_group_id(group)
+        return await self.algod.send_and_confirm([sender.sign(txn) for txn in group])
+
+    async def user_state(self, address: str) -> Dict[str, StateValue]:
+        """The local state of a user by key constant name, e.g. "LAT_KEY"; buyer pages keep their key."""
+        state = {}
+        for key, value in (await self.algod.account_local_state(address, self.app_id)).items():
+            state[self.layout.state_keys.get(key, key.decode(errors="replace"))] = value
+        return state
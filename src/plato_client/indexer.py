@@ -0,0 +1,404 @@
+import asyncio
+import bisect
+import sqlite3
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from algosdk import encoding
+
+from .algod import AsyncAlgodClient, StateValue, as_bytes
+from .delivery import DEFAULT_ACCEPT_DELIVERY_WINDOW, delivery_layout
+from .geo import StoreGeoIndex, parse_location
+from .identity import identity_layout
+from .layouts import OrderBookLayout, unpack_fields
+from .logicsig import logicsig_layout
+
+# Off-chain index of the delivery orders and of the identity users, kept up to date from the
+# state deltas of each block instead of reading every application's state from algod.
+#
+# Every application call of a block carries the changes it made to the global and local states
+# ("gd" and "ld" of its apply data). Applying them round after round keeps a copy of the orders
+# and of the users' identity local state, together with the indexes the queries need: orders by
+# status, DELIVERED orders sorted by delivery time, the stores with an empty buyer slot and the
+# store locations (geo.py). The orders are read from the three layouts of the contracts:
+#
+# - a delivery escrow application holds one order in its global state, keyed or packed in one
+#   record, and is recognized by its order status or record key;
+# - an order book (order_book_app.py) holds the record of each order in its global state under
+#   the order ID and its state under the order ID followed by "s", and is recognized by the
+#   length of those keys and values;
+# - the status app (status_app.py) holds the record of each order in the local state of its
+#   logic signature escrow, it is given by its ID like the identity application.
+#
+# The fields of every order are indexed under the keys of the keyed escrow layout
+# (GlobalState.Variables), those it has no key for under their name, e.g. b"DEADLINE". The index
+# can be saved to SQLite and loaded back to resume after a restart from the round it was saved at.
+
+# Actions of a state delta
+SET_BYTES = 1
+SET_UINT = 2
+DELETE = 3
+
+# OnCompletion of an application call
+CLOSE_OUT = 2
+CLEAR_STATE = 3
+DELETE_APPLICATION = 5
+
+State = Dict[bytes, StateValue]
+
+
+class OrderKey(NamedTuple):
+    app_id: int
+    # the order ID in an order book, the escrow address in the status app, empty for a delivery
+    # escrow whose application holds a single order
+    order: bytes = b""
+
+
+class OrderOrigin(NamedTuple):
+    # customer who placed the order
+    creator: bytes
+    # timestamp of the block the order was created in
+    created_time: int
+
+
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS order_state (app_id INTEGER NOT NULL, order_id BLOB NOT NULL, key BLOB NOT NULL, value BLOB NOT NULL, is_uint INTEGER NOT NULL, PRIMARY KEY (app_id, order_id, key));
+CREATE TABLE IF NOT EXISTS order_origin (app_id INTEGER NOT NULL, order_id BLOB NOT NULL, creator BLOB NOT NULL, created_time INTEGER NOT NULL, PRIMARY KEY (app_id, order_id));
+CREATE TABLE IF NOT EXISTS user_state (address BLOB NOT NULL, key BLOB NOT NULL, value BLOB NOT NULL, is_uint INTEGER NOT NULL, PRIMARY KEY (address, key));
+"""
+
+
+def key_of(state_keys: Dict[bytes, str], name: str) -> bytes:
+    return next(key for key, key_name in state_keys.items() if key_name == name)
+
+
+@lru_cache(maxsize=None)
+def order_book_layout() -> OrderBookLayout:
+    return OrderBookLayout.load()
+
+
+class StateIndex:
+    def __init__(self, identity_app_id: int, round_number: int = 0, status_app_id: int = 0):
+        self.identity_app_id = identity_app_id
+        self.status_app_id = status_app_id
+        # last round applied and its timestamp
+        self.round = round_number
+        self.timestamp = 0
+        self.orders: Dict[OrderKey, State] = {}
+        # orders placed while the index was followed
+        self.origins: Dict[OrderKey, OrderOrigin] = {}
+        # IDs of the order books seen
+        self.order_books: Set[int] = set()
+        self.users: Dict[bytes, State] = {}
+        self.orders_by_status: Dict[int, Set[OrderKey]] = {}
+        # (delivered timestamp, order) of the DELIVERED orders, sorted
+        self.delivered: List[Tuple[int, OrderKey]] = []
+        self.stores_with_empty_slot: Set[bytes] = set()
+        self.store_locations = StoreGeoIndex()
+
+        delivery = delivery_layout()
+        self.field_keys = {name: key for key, name in delivery.state_keys.items()}
+        self.unpack_record = delivery.unpack_record
+        self.record_key = delivery.record_key
+        self.statuses = {name: value for value, name in delivery.order_statuses.items()}
+        self.status_key = key_of(delivery.state_keys, "ORDER_STATUS")
+        self.delivered_time_key = key_of(delivery.state_keys, "DELIVERED_TIMESTAMP")
+        self.customer_key = self.field_key("CUSTOMER_ADDRESS")
+        self.order_book = order_book_layout()
+        escrow = logicsig_layout()
+        self.escrow_record_key = escrow.record_key
+        self.escrow_record_fields = escrow.record_fields
+        identity = identity_layout()
+        self.user_type_key = key_of(identity.state_keys, "USER_TYPE_KEY")
+        self.lat_key = key_of(identity.state_keys, "LAT_KEY")
+        self.lng_key = key_of(identity.state_keys, "LNG_KEY")
+        self.user_type_store = identity.user_types["STORE"]
+        self.buyer_page_key_prefix = identity.buyer_page_key_prefix
+        self.empty_slot = bytes(identity.address_length)
+
+    # queries
+
+    def orders_with_status(self, status: str) -> Set[OrderKey]:
+        """The orders in an OrderStatus, e.g. "COOKING"."""
+        return self.orders_by_status.get(self.statuses[status], set())
+
+    def claimable_orders(self, now: Optional[int] = None, window: int = DEFAULT_ACCEPT_DELIVERY_WINDOW) -> List[OrderKey]:
+        """The orders DELIVERED at least window seconds before now, the last block time by default.
+
+        Their couriers can claim the funds, the oldest deliveries come first."""
+        cutoff = (self.timestamp if now is None else now) - window
+        # timestamps are whole seconds, (cutoff + 1,) sorts before the deliveries after cutoff
+        end = bisect.bisect_left(self.delivered, (cutoff + 1,))
+        return [order_key for _, order_key in self.delivered[:end]]
+
+    def stores_with_free_slot(self) -> List[str]:
+        """Addresses of the stores with an empty buyer slot."""
+        return [encoding.encode_address(address) for address in self.stores_with_empty_slot]
+
+    def nearest_stores(self, lat: float, lng: float, count: int) -> List[Tuple[float, str]]:
+        """(distance in meters, address) of the count stores nearest to a location."""
+        return self.store_locations.nearest(lat, lng, count)
+
+    def stores_within(self, lat: float, lng: float, radius_m: float) -> List[Tuple[float, str]]:
+        """(distance in meters, address) of the stores within radius_m of a location, nearest first."""
+        return self.store_locations.within(lat, lng, radius_m)
+
+    def stale_orders(self, status: str, max_age: int, now: Optional[int] = None) -> List[OrderKey]:
+        """The orders in a status placed more than max_age seconds before now, the last block time by default."""
+        cutoff = (self.timestamp if now is None else now) - max_age
+        return [
+            order_key for order_key in self.orders_with_status(status)
+            if order_key in self.origins and self.origins[order_key].created_time < cutoff
+        ]
+
+    def order(self, order_key: OrderKey) -> Optional[State]:
+        return self.orders.get(order_key)
+
+    def user(self, address: str) -> Optional[State]:
+        return self.users.get(encoding.decode_address(address))
+
+    # block deltas
+
+    def apply_block(self, block: dict):
+        """Applies the state deltas of the next block, as returned by AsyncAlgodClient.block."""
+        self.round = block.get("rnd", 0)
+        self.timestamp = block.get("ts", 0)
+        for signed_txn in block.get("txns", []):
+            self.apply_transaction(signed_txn)
+
+    def apply_transaction(self, signed_txn: dict):
+        txn = signed_txn["txn"]
+        delta = signed_txn.get("dt", {})
+        if txn.get("type") == "appl":
+            # apply data holds the ID of a created application
+            app_id = txn.get("apid") or signed_txn.get("apid", 0)
+            # local deltas refer to the sender, the foreign accounts and then the shared accounts
+            accounts = [txn["snd"], *txn.get("apat", []), *delta.get("sa", [])]
+            if "gd" in delta:
+                self.apply_global_delta(app_id, delta["gd"])
+                if not txn.get("apid") and OrderKey(app_id) in self.orders:
+                    self.origins[OrderKey(app_id)] = OrderOrigin(txn["snd"], self.timestamp)
+            for index, changes in delta.get("ld", {}).items():
+                self.apply_local_delta(app_id, accounts[index], changes)
+            on_completion = txn.get("apan", 0)
+            if on_completion in (CLOSE_OUT, CLEAR_STATE) and app_id == self.identity_app_id:
+                self.set_user(txn["snd"], None)
+            elif on_completion in (CLOSE_OUT, CLEAR_STATE) and app_id == self.status_app_id:
+                self.set_order(OrderKey(app_id, txn["snd"]), None)
+            elif on_completion == DELETE_APPLICATION:
+                for order_key in [order_key for order_key in self.orders if order_key.app_id == app_id]:
+                    self.set_order(order_key, None)
+        for inner_txn in delta.get("itx", []):
+            self.apply_transaction(inner_txn)
+
+    def apply_global_delta(self, app_id: int, changes: dict):
+        if app_id in (self.identity_app_id, self.status_app_id):
+            return
+        changes = {as_bytes(key): change for key, change in changes.items()}
+        if app_id in self.order_books or self.is_order_book_delta(changes):
+            self.order_books.add(app_id)
+            self.apply_order_book_delta(app_id, changes)
+            return
+        order = self.orders.get(OrderKey(app_id))
+        if order is None:
+            if not (self.status_key in changes or self.record_key in changes):
+                return
+            order = {}
+        order = apply_delta(order, changes)
+        record = order.pop(self.record_key, None)
+        if record is not None:
+            # orders of packed escrows are indexed under the keys of the keyed layout
+            order.update(self.unpack_record(record))
+        self.set_order(OrderKey(app_id), order)
+
+    def is_order_book_delta(self, changes: Dict[bytes, dict]) -> bool:
+        """Whether changes set the state of an order of an order book."""
+        book = self.order_book
+        return any(
+            len(key) == book.order_id_length + len(book.state_key_suffix) and key.endswith(book.state_key_suffix)
+            and change.get("at") == SET_BYTES and len(as_bytes(change.get("bs", b""))) == book.state_length
+            for key, change in changes.items()
+        )
+
+    def apply_order_book_delta(self, app_id: int, changes: Dict[bytes, dict]):
+        book = self.order_book
+        suffix = book.state_key_suffix
+        # order ID -> [change of its record, change of its state]
+        order_changes: Dict[bytes, List[Optional[dict]]] = {}
+        for key, change in changes.items():
+            if len(key) == book.order_id_length:
+                order_changes.setdefault(key, [None, None])[0] = change
+            elif len(key) == book.order_id_length + len(suffix) and key.endswith(suffix):
+                order_changes.setdefault(key[:-len(suffix)], [None, None])[1] = change
+        for order_id, (record_change, state_change) in order_changes.items():
+            order_key = OrderKey(app_id, order_id)
+            # a settled order has its record and its state deleted
+            if DELETE in ((record_change or {}).get("at"), (state_change or {}).get("at")):
+                self.set_order(order_key, None)
+                continue
+            order = dict(self.orders.get(order_key, {}))
+            for change, fields, length in (
+                (record_change, book.record_fields, book.record_length),
+                (state_change, book.state_fields, book.state_length),
+            ):
+                value = as_bytes(change.get("bs", b"")) if change is not None and change.get("at") == SET_BYTES else b""
+                if len(value) == length:
+                    order.update(self.order_fields(value, fields))
+            if self.status_key in order:
+                self.place_order(order_key, order)
+
+    def apply_local_delta(self, app_id: int, address: bytes, changes: dict):
+        if app_id == self.identity_app_id:
+            self.set_user(address, apply_delta(self.users.get(address, {}), changes))
+        elif app_id == self.status_app_id:
+            record = apply_delta({}, changes).get(self.escrow_record_key)
+            if isinstance(record, bytes):
+                self.place_order(OrderKey(app_id, address), self.order_fields(record, self.escrow_record_fields))
+            elif any(as_bytes(key) == self.escrow_record_key for key in changes):
+                self.set_order(OrderKey(app_id, address), None)
+
+    def place_order(self, order_key: OrderKey, order: State):
+        """Sets an order of an order book or of the status app, its customer is in its record."""
+        if order_key not in self.orders and self.customer_key in order:
+            self.origins[order_key] = OrderOrigin(order[self.customer_key], self.timestamp)
+        self.set_order(order_key, order)
+
+    def field_key(self, name: str) -> bytes:
+        return self.field_keys.get(name, name.encode())
+
+    def order_fields(self, record: bytes, fields: Dict[str, Tuple[int, int, bool]]) -> State:
+        return {self.field_key(name): value for name, value in unpack_fields(record, fields).items()}
+
+    def set_order(self, order_key: OrderKey, state: Optional[State]):
+        previous = self.orders.pop(order_key, None)
+        if state is None:
+            self.origins.pop(order_key, None)
+        if previous is not None:
+            status = previous.get(self.status_key)
+            self.orders_by_status[status].discard(order_key)
+            if status == self.statuses["DELIVERED"]:
+                self.delivered.remove((previous.get(self.delivered_time_key, 0), order_key))
+        if state is not None:
+            self.orders[order_key] = state
+            status = state.get(self.status_key)
+            self.orders_by_status.setdefault(status, set()).add(order_key)
+            if status == self.statuses["DELIVERED"]:
+                bisect.insort(self.delivered, (state.get(self.delivered_time_key, 0), order_key))
+
+    def set_user(self, address: bytes, state: Optional[State]):
+        if state is None:
+            self.users.pop(address, None)
+        else:
+            self.users[address] = state
+        is_store = state is not None and state.get(self.user_type_key) == self.user_type_store
+        if is_store and self.has_empty_slot(state):
+            self.stores_with_empty_slot.add(address)
+        else:
+            self.stores_with_empty_slot.discard(address)
+        location = parse_location(state.get(self.lat_key), state.get(self.lng_key)) if is_store else None
+        if location is not None:
+            self.store_locations.add(encoding.encode_address(address), *location)
+        else:
+            self.store_locations.remove(encoding.encode_address(address))
+
+    def has_empty_slot(self, state: State) -> bool:
+        slot_length = len(self.empty_slot)
+        for key, page in state.items():
+            if key.startswith(self.buyer_page_key_prefix) and isinstance(page, bytes):
+                if any(page[offset:offset + slot_length] == self.empty_slot for offset in range(0, len(page), slot_length)):
+                    return True
+        return False
+
+    # snapshots
+
+    def save(self, path: str):
+        """Writes the index to a SQLite database, replacing its previous content."""
+        db = sqlite3.connect(path)
+        try:
+            with db:
+                # the tables are created again, in case they were saved by a version with other columns
+                for table in ("meta", "order_state", "order_origin", "user_state"):
+                    db.execute(f"DROP TABLE IF EXISTS {table}")
+                db.executescript(SNAPSHOT_SCHEMA)
+                db.executemany("INSERT INTO meta VALUES (?, ?)", [
+                    ("round", self.round),
+                    ("timestamp", self.timestamp),
+                    ("identity_app_id", self.identity_app_id),
+                    ("status_app_id", self.status_app_id),
+                ])
+                db.executemany("INSERT INTO order_state VALUES (?, ?, ?, ?, ?)", (
+                    (*order_key, key, *encode_value(value)) for order_key, state in self.orders.items() for key, value in state.items()
+                ))
+                db.executemany("INSERT INTO order_origin VALUES (?, ?, ?, ?)", (
+                    (*order_key, origin.creator, origin.created_time) for order_key, origin in self.origins.items()
+                ))
+                db.executemany("INSERT INTO user_state VALUES (?, ?, ?, ?)", (
+                    (address, key, *encode_value(value)) for address, state in self.users.items() for key, value in state.items()
+                ))
+        finally:
+            db.close()
+
+    @staticmethod
+    def load(path: str) -> "StateIndex":
+        db = sqlite3.connect(path)
+        try:
+            meta = dict(db.execute("SELECT name, value FROM meta"))
+            index = StateIndex(meta["identity_app_id"], meta["round"], meta["status_app_id"])
+            index.timestamp = meta["timestamp"]
+            orders: Dict[OrderKey, State] = {}
+            for app_id, order_id, key, value, is_uint in db.execute("SELECT * FROM order_state"):
+                orders.setdefault(OrderKey(app_id, order_id), {})[key] = decode_value(value, is_uint)
+            for app_id, order_id, creator, created_time in db.execute("SELECT * FROM order_origin"):
+                index.origins[OrderKey(app_id, order_id)] = OrderOrigin(creator, created_time)
+            users: Dict[bytes, State] = {}
+            for address, key, value, is_uint in db.execute("SELECT * FROM user_state"):
+                users.setdefault(address, {})[key] = decode_value(value, is_uint)
+        finally:
+            db.close()
+        for order_key, state in orders.items():
+            index.set_order(order_key, state)
+            if order_key.order and order_key.app_id != index.status_app_id:
+                index.order_books.add(order_key.app_id)
+        for address, state in users.items():
+            index.set_user(address, state)
+        return index
+
+
+def apply_delta(state: State, changes: dict) -> State:
+    """Returns a copy of state with the changes of a state delta applied."""
+    state = dict(state)
+    for key, change in changes.items():
+        key = as_bytes(key)
+        action = change.get("at")
+        if action == SET_BYTES:
+            state[key] = as_bytes(change.get("bs", b""))
+        elif action == SET_UINT:
+            state[key] = change.get("ui", 0)
+        elif action == DELETE:
+            state.pop(key, None)
+    return state
+
+
+def encode_value(value: StateValue) -> Tuple[bytes, int]:
+    # uint64 values do not all fit in a SQLite integer
+    if isinstance(value, int):
+        return value.to_bytes(8, "big"), 1
+    return value, 0
+
+
+def decode_value(value: bytes, is_uint: int) -> StateValue:
+    return int.from_bytes(value, "big") if is_uint else value
+
+
+async def follow(index: StateIndex, algod: AsyncAlgodClient, snapshot_path: Optional[str] = None, snapshot_rounds: int = 1000):
+    """Applies the blocks after index.round as they are produced, saving a snapshot every snapshot_rounds rounds."""
+    while True:
+        last_round = (await algod.wait_for_block_after(index.round))["last-round"]
+        while index.round < last_round:
+            # blocks are requested ahead and applied in order
+            rounds = range(index.round + 1, min(last_round, index.round + 16) + 1)
+            for block in await asyncio.gather(*(algod.block(round_number) for round_number in rounds)):
+                index.apply_block(block)
+                if snapshot_path is not None and index.round % snapshot_rounds == 0:
+                    index.save(snapshot_path)
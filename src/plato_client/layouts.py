@@ -0,0 +1,266 @@
+import os
+import sys
+from typing import Dict, NamedTuple, Tuple, Union
+
+# Argument layouts and state keys of the contracts, read from the contract sources in
+# src/contracts (delivery/enums.py, identity/app.py and reward/app.py) rather than copied,
+# so the client follows the contracts when they change.
+
+CONTRACTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "contracts")
+if CONTRACTS_DIR not in sys.path:
+    sys.path.insert(0, CONTRACTS_DIR)
+
+from avm.assembler import parse_string  # noqa: E402
+from build import CONTRACTS, Contract, load_contract_module  # noqa: E402
+
+
+def teal_bytes(expr) -> bytes:
+    """Returns the value of a PyTeal Bytes constant."""
+    if expr.base == "base16":
+        return bytes.fromhex(expr.byte_str)
+    if expr.base == "base32":
+        raise ValueError("base32 constants are not supported")
+    return parse_string(expr.byte_str)
+
+
+def teal_int(expr) -> int:
+    """Returns the value of a PyTeal Int constant."""
+    return expr.value
+
+
+def contract_module(name: str):
+    return load_contract_module(next(contract for contract in CONTRACTS if contract.name == name))
+
+
+class DeliveryLayout(NamedTuple):
+    # action name -> one-byte action code
+    action_codes: Dict[str, int]
+    # order status value -> name
+    order_statuses: Dict[int, str]
+    # global state key -> name of the GlobalState.Variables attribute
+    state_keys: Dict[bytes, str]
+    # (ints, byte slices) of the global state schema
+    global_schema: Tuple[int, int]
+    # packed layout (approval_program(packed=True)): the global state schema, the key of the
+    # record and GlobalState.Variables name -> (offset, size, is uint) of its fields
+    packed_global_schema: Tuple[int, int]
+    record_key: bytes
+    record_fields: Dict[str, Tuple[int, int, bool]]
+    # creation application arguments, by name
+    creation_args: Dict[str, int]
+    action_arg_index: int
+
+    @staticmethod
+    def load() -> "DeliveryLayout":
+        enums = load_contract_module(Contract("delivery_enums", "delivery/enums.py", (), ()))
+        return DeliveryLayout(
+            action_codes=constants(enums.ActionCode, int),
+            order_statuses={teal_int(value): name for name, value in constants(enums.OrderStatus).items()},
+            state_keys={teal_bytes(value): name for name, value in constants(enums.GlobalState.Variables).items()},
+            global_schema=(
+                teal_int(enums.GlobalState.Schema.NUM_UINTS),
+                teal_int(enums.GlobalState.Schema.NUM_BYTESLICES),
+            ),
+            packed_global_schema=(
+                teal_int(enums.GlobalState.PackedSchema.NUM_UINTS),
+                teal_int(enums.GlobalState.PackedSchema.NUM_BYTESLICES),
+            ),
+            record_key=teal_bytes(enums.GlobalState.Record.KEY),
+            record_fields={
+                name: (getattr(enums.GlobalState.Record, name), size, field_type == enums.TealType.uint64)
+                for name, field_type, size in enums.ORDER_FIELDS
+            },
+            creation_args={
+                "courier_address": enums.AppParams.COURIER_ADDRESS_INDEX,
+                "restaurant_address": enums.AppParams.RESTAURANT_ADDRESS_INDEX,
+                "courier_reward_amount": enums.AppParams.COURIER_REWARD_AMOUNT_INDEX,
+            },
+            action_arg_index=enums.AppParams.ACTION_TYPE_PARAM_INDEX,
+        )
+
+    def unpack_record(self, record: bytes) -> Dict[bytes, Union[int, bytes]]:
+        """The fields of a packed order record under their GlobalState.Variables keys, like the keyed layout stores them."""
+        names = {name: key for key, name in self.state_keys.items()}
+        return {names[name]: value for name, value in unpack_fields(record, self.record_fields).items()}
+
+
+class OrderBookLayout(NamedTuple):
+    order_id_length: int
+    # field name -> (offset, size, is uint) in the record of an order, stored in global state under its order ID
+    record_fields: Dict[str, Tuple[int, int, bool]]
+    record_length: int
+    # the state of an order is stored under its order ID followed by state_key_suffix
+    state_key_suffix: bytes
+    state_fields: Dict[str, Tuple[int, int, bool]]
+    state_length: int
+    global_schema: Tuple[int, int]
+
+    @staticmethod
+    def load() -> "OrderBookLayout":
+        enums = load_contract_module(Contract("delivery_enums", "delivery/enums.py", (), ()))
+        book = enums.OrderBook
+        return OrderBookLayout(
+            order_id_length=teal_int(book.Params.ORDER_ID_LENGTH),
+            record_fields={
+                name: (getattr(book.Record, name), size, field_type == enums.TealType.uint64)
+                for name, field_type, size in enums.ORDER_BOOK_RECORD_FIELDS
+            },
+            record_length=book.Record.LENGTH,
+            state_key_suffix=teal_bytes(book.State.KEY_SUFFIX),
+            state_fields={
+                name: (getattr(book.State, name), size, field_type == enums.TealType.uint64)
+                for name, field_type, size in enums.ORDER_BOOK_STATE_FIELDS
+            },
+            state_length=book.State.LENGTH,
+            global_schema=(teal_int(book.Schema.NUM_UINTS), teal_int(book.Schema.NUM_BYTESLICES)),
+        )
+
+
+class LogicSigLayout(NamedTuple):
+    # template variable of the escrow logic signature -> name of the LogicSigEscrow.Template attribute
+    template_variables: Dict[str, str]
+    # (ints, byte slices) of the local state schema of an escrow in the status app
+    local_schema: Tuple[int, int]
+    record_key: bytes
+    # field name -> (offset, size, is uint) in the record of an order
+    record_fields: Dict[str, Tuple[int, int, bool]]
+    # (name, index) of the status app opt-in arguments
+    opt_in_args: Dict[str, int]
+    settlement_group_size: int
+
+    @staticmethod
+    def load() -> "LogicSigLayout":
+        enums = load_contract_module(Contract("delivery_enums", "delivery/enums.py", (), ()))
+        escrow = enums.LogicSigEscrow
+        return LogicSigLayout(
+            template_variables={value.name: name for name, value in constants(escrow.Template).items()},
+            local_schema=(teal_int(escrow.Schema.NUM_UINTS), teal_int(escrow.Schema.NUM_BYTESLICES)),
+            record_key=teal_bytes(escrow.Record.KEY),
+            record_fields={
+                name: (getattr(escrow.Record, name), size, field_type == enums.TealType.uint64)
+                for name, field_type, size in enums.STATUS_RECORD_FIELDS
+            },
+            opt_in_args={
+                "courier_address": escrow.Params.COURIER_ADDRESS_INDEX,
+                "restaurant_address": escrow.Params.RESTAURANT_ADDRESS_INDEX,
+                "customer_address": escrow.Params.CUSTOMER_ADDRESS_INDEX,
+                "deadline": escrow.Params.DEADLINE_INDEX,
+            },
+            settlement_group_size=escrow.Params.SETTLEMENT_GROUP_SIZE,
+        )
+
+
+class IdentityLayout(NamedTuple):
+    # user type name ("BUYER", "STORE", "COURIER") -> value
+    user_types: Dict[str, int]
+    action_store_attest: bytes
+    action_courier_attest: bytes
+    # local state key -> name of the module constant, e.g. b"lat" -> "LAT_KEY"
+    state_keys: Dict[bytes, str]
+    buyer_page_key_prefix: bytes
+    address_length: int
+    # batched store attestations
+    action_set_attestor: bytes
+    action_post_root: bytes
+    action_prove_store_attest: bytes
+    action_op_up: bytes
+    root_key_prefix: bytes
+    root_slots: int
+    attestation_leaf_prefix: bytes
+    hash_length: int
+    max_proof_depth: int
+    global_schema: Tuple[int, int]
+    local_schema: Tuple[int, int]
+
+    @staticmethod
+    def load() -> "IdentityLayout":
+        app = contract_module("identity")
+        return IdentityLayout(
+            user_types={name[len("USER_TYPE_"):]: value for name, value in module_constants(app, "USER_TYPE_", int).items()},
+            action_store_attest=app.ACTION_STORE_ATTEST.encode(),
+            action_courier_attest=app.ACTION_COURIER_ATTEST.encode(),
+            state_keys={value.encode(): name for name, value in module_constants(app, "", str).items() if name.endswith("_KEY")},
+            buyer_page_key_prefix=app.BUYER_PAGE_KEY_PREFIX.encode(),
+            address_length=app.ADDRESS_LENGTH,
+            action_set_attestor=app.ACTION_SET_ATTESTOR.encode(),
+            action_post_root=app.ACTION_POST_ROOT.encode(),
+            action_prove_store_attest=app.ACTION_PROVE_STORE_ATTEST.encode(),
+            action_op_up=app.ACTION_OP_UP.encode(),
+            root_key_prefix=app.ROOT_KEY_PREFIX.encode(),
+            root_slots=app.ROOT_SLOTS,
+            attestation_leaf_prefix=app.ATTESTATION_LEAF_PREFIX,
+            hash_length=app.HASH_LENGTH,
+            max_proof_depth=app.MAX_PROOF_DEPTH,
+            global_schema=app.global_schema(),
+            local_schema=app.local_schema(),
+        )
+
+
+class RewardLayout(NamedTuple):
+    # method name ("CHECK_REWARD", ...) -> application argument 0
+    methods: Dict[str, bytes]
+    reward_types: Tuple[bytes, ...]
+    # reward type -> one-byte code
+    reward_codes: Dict[bytes, int]
+    # global state key -> name of the module constant
+    state_keys: Dict[bytes, str]
+    max_batch_referrals: int
+    max_account_index: int
+    # milestones and amounts in the reward table
+    reward_table_slots: int
+    # of the referrers accruing their rewards
+    local_schema: Tuple[int, int]
+
+    @staticmethod
+    def load() -> "RewardLayout":
+        app = contract_module("reward")
+        return RewardLayout(
+            methods={name[len("METHOD_"):]: value.encode() for name, value in module_constants(app, "METHOD_", str).items()},
+            reward_types=tuple(value.encode() for value in module_constants(app, "REWARD_TYPE_", str).values()),
+            reward_codes={name.encode(): code for name, code in app.REWARD_CODES.items()},
+            state_keys={value.encode(): name for name, value in module_constants(app, "", str).items() if name.endswith("_KEY")},
+            max_batch_referrals=app.MAX_BATCH_REFERRALS,
+            max_account_index=app.MAX_ACCOUNT_INDEX,
+            reward_table_slots=app.REWARD_TABLE_SLOTS,
+            local_schema=app.LOCAL_SCHEMA,
+        )
+
+
+class EventLayout(NamedTuple):
+    # (field name, size) of an event record, in order
+    fields: Tuple[Tuple[str, int], ...]
+    length: int
+    # event type name ("ORDER_STATUS", ...) -> type byte
+    event_types: Dict[str, int]
+
+    @staticmethod
+    def load() -> "EventLayout":
+        events = load_contract_module(Contract("event_utils", "utils/event_utils.py", (), ()))
+        return EventLayout(
+            fields=tuple(events.EVENT_FIELDS),
+            length=events.EVENT_LENGTH,
+            event_types=constants(events.EventType, int),
+        )
+
+
+def unpack_fields(record: bytes, fields: Dict[str, Tuple[int, int, bool]]) -> Dict[str, Union[int, bytes]]:
+    """The fields of a record by name, given their (offset, size, is uint)."""
+    return {
+        name: int.from_bytes(record[offset:offset + size], "big") if is_uint else record[offset:offset + size]
+        for name, (offset, size, is_uint) in fields.items()
+    }
+
+
+def constants(cls, value_type=None):
+    """Public class attributes, optionally only those of value_type."""
+    return {
+        name: value for name, value in vars(cls).items()
+        if not name.startswith("_") and name.isupper() and (value_type is None or type(value) is value_type)
+    }
+
+
+def module_constants(module, prefix: str, value_type):
+    return {
+        name: value for name, value in vars(module).items()
+        if name.startswith(prefix) and name.isupper() and type(value) is value_type
+    }
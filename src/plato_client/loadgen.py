@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from algosdk import account, transaction
+
+from .account import Account
+from .algod import AsyncAlgodClient, ConfirmationTimeout, TransactionRejected
+from .delivery import DeliveryClient
+from .identity import IdentityClient, future_time, identity_layout
+from .logicsig import PLACE_ORDER_GROUP_SIZE, SETTLEMENT_ACTIONS, LogicSigDeliveryClient, LogicSigOrder, logicsig_layout
+from .pool import HttpError
+
+from build import CONTRACTS, build  # noqa: E402, after layouts put src/contracts on sys.path
+from simulate import Model  # noqa: E402
+
+# Load generator of the client stack, against a fake algod (fake_algod.py) started in a child
+# process so that the contracts are evaluated off the event loop of the clients.
+#
+# Every participant opts in to the identity application, then orders go through the delivery
+# lifecycles with DeliveryClient, an escrow application per order, or with --logicsig with
+# LogicSigDeliveryClient, logic signature escrows tracked by one status application, up to
+# concurrency of them at a time. The share of each
+# lifecycle comes from the behaviour model of simulate.py: cancelled while cooking, completed
+# by the customer, disputed, or claimed by the courier once the accept window passed. The
+# latency of every client call is recorded from submission to confirmation and reported as
+# p50/p99 by operation, with the confirmed transactions per second of the order phase.
+#
+# Usage: PYTHONPATH=src python3 -m plato_client.loadgen [--orders 500] [--concurrency 32] [--round-time 0] [--logicsig] [--json]
+
+ALGO = 1000000
+ASA_TOTAL = 10 ** 15
+TIPS_AMOUNT = 10
+ORDER_AMOUNT = 500000
+COURIER_REWARD_AMOUNT = 100000
+# the escrows of a load test are claimable as soon as they are delivered
+ACCEPT_DELIVERY_WINDOW = 0
+# round after which the customer of a logic signature order could cancel it, never reached
+LOGICSIG_DEADLINE = 2 ** 32
+STORE_LOCATION = ("45.0703", "7.6869")
+# sends of the setup, which has to go through the injected faults
+SETUP_ATTEMPTS = 10
+
+# actions after the escrow is created, and the party sending each
+LIFECYCLES = {
+    "cancel": ("CANCEL",),
+    "complete": ("PICK_UP_ORDER", "DELIVERED", "COMPLETE_ORDER"),
+    "dispute": ("PICK_UP_ORDER", "DELIVERED", "START_DISPUTE"),
+    "claim": ("PICK_UP_ORDER", "DELIVERED", "CLAIM_FUNDS"),
+}
+# transactions confirmed by each operation
+OPERATION_TXNS = {"deploy": 4, "identity_opt_in": 1, "place_order": PLACE_ORDER_GROUP_SIZE}
+
+
+class LoadConfig(NamedTuple):
+    orders: int = 500
+    concurrency: int = 32
+    customers: int = 50
+    couriers: int = 20
+    restaurants: int = 10
+    round_time: float = 0.0
+    error_rate: float = 0.0
+    drop_rate: float = 0.0
+    latency: float = 0.0
+    packed: bool = False
+    logicsig: bool = False
+    dist_dir: str = "./dist"
+    seed: int = 0
+
+
+class OperationStats(NamedTuple):
+    count: int
+    errors: int
+    p50_ms: float
+    p99_ms: float
+
+
+class LoadReport(NamedTuple):
+    operations: Dict[str, OperationStats]
+    orders: int
+    failed_orders: int
+    transactions: int
+    seconds: float
+
+    @property
+    def tps(self) -> float:
+        return self.transactions / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        lines = [f"{'operation':<20} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9}"]
+        for name, stats in sorted(self.operations.items()):
+            lines.append(f"{name:<20} {stats.count:>7} {stats.errors:>7} {stats.p50_ms:>9.1f} {stats.p99_ms:>9.1f}")
+        lines.append(
+            f"{self.orders} orders ({self.failed_orders} failed), {self.transactions} transactions "
+            f"in {self.seconds:.1f} s: {self.tps:.1f} TPS"
+        )
+        return "\n".join(lines)
+
+
+def lifecycle_mix(model: Model) -> Dict[str, float]:
+    """Share of the orders going through each lifecycle, from the rates of the behaviour model."""
+    placed = 1 - model.cancel_rate
+    return {
+        "cancel": model.cancel_rate,
+        "complete": placed * model.confirm_rate * (1 - model.dispute_rate),
+        "dispute": placed * model.confirm_rate * model.dispute_rate,
+        "claim": placed * (1 - model.confirm_rate),
+    }
+
+
+def percentile(sorted_values: Sequence[float], share: float) -> float:
+    """Nearest-rank percentile of sorted values, 0 when there are none."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values))) - 1))]
+
+
+def new_account() -> Account:
+    private_key, address = account.generate_account()
+    return Account(address, private_key)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.transactions = 0
+
+    async def measure(self, operation: str, call, transactions: Optional[int] = None):
+        """Awaits call and records its latency, transactions defaults to those of the operation."""
+        start = time.perf_counter()
+        try:
+            result = await call
+        except (HttpError, TransactionRejected, ConfirmationTimeout, ConnectionError, asyncio.TimeoutError):
+            self.errors[operation] += 1
+            raise
+        self.latencies[operation].append(time.perf_counter() - start)
+        self.transactions += transactions or OPERATION_TXNS.get(operation, 1)
+        return result
+
+    def stats(self) -> Dict[str, OperationStats]:
+        stats = {}
+        for operation in set(self.latencies) | set(self.errors):
+            latencies = sorted(self.latencies[operation])
+            stats[operation] = OperationStats(
+                len(latencies) + self.errors[operation],
+                self.errors[operation],
+                percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000,
+            )
+        return stats
+
+
+async def start_fake_algod(config: LoadConfig, genesis: Dict[str, int], assets: Sequence[Tuple[str, int]]):
+    """Starts fake_algod.py in a child process and returns it with its URL."""
+    args = [
+        sys.executable, "-m", "plato_client.fake_algod", "--port", "0",
+        "--round-time", str(config.round_time), "--error-rate", str(config.error_rate),
+        "--drop-rate", str(config.drop_rate), "--latency", str(config.latency),
+    ]
+    args += [f"--fund={address}={amount}" for address, amount in genesis.items()]
+    args += [f"--asset={creator}={total}" for creator, total in assets]
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (package_dir, os.environ.get("PYTHONPATH")))))
+    process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, env=env)
+    line = (await process.stdout.readline()).decode()
+    if not line:
+        raise RuntimeError("the fake algod exited before listening")
+    return process, line.rsplit(" ", 1)[1].strip()
+
+
+async def retrying(send):
+    """Calls send() again until what it sends is confirmed, the injected faults are transient."""
+    for attempt in range(SETUP_ATTEMPTS):
+        try:
+            return await send()
+        except HttpError as error:
+            if error.status < 500 or attempt + 1 == SETUP_ATTEMPTS:
+                raise
+        except TransactionRejected:
+            if attempt + 1 == SETUP_ATTEMPTS:
+                raise
+
+
+async def send_retrying(algod: AsyncAlgodClient, signed_transactions) -> dict:
+    """Sends a group of the setup again until it is confirmed."""
+    return await retrying(lambda: algod.send_and_confirm(signed_transactions))
+
+
+async def deploy_identity(algod: AsyncAlgodClient, creator: Account, dist_dir: str) -> int:
+    identity = next(contract for contract in CONTRACTS if contract.name == "identity")
+    programs = []
+    for file_name, _ in identity.programs:
+        with open(os.path.join(dist_dir, file_name), encoding="UTF-8") as f:
+            programs.append(await algod.compile(f.read()))
+    txn = transaction.ApplicationCreateTxn(
+        creator.address,
+        await algod.suggested_params(),
+        transaction.OnComplete.NoOpOC,
+        programs[0],
+        programs[1],
+        transaction.StateSchema(*identity_layout().global_schema),
+        transaction.StateSchema(*identity_layout().local_schema),
+        [future_time()],
+    )
+    return (await send_retrying(algod, [creator.sign(txn)]))["application-index"]
+
+
+async def set_up(algod: AsyncAlgodClient, creator: Account, customers, couriers, restaurants, tips_asa_id: int):
+    """Opts the participants in to the tips ASA and sends tips tokens to the customers."""
+    params = await algod.suggested_params()
+    await asyncio.gather(*(
+        send_retrying(algod, [party.sign(transaction.AssetOptInTxn(party.address, params, tips_asa_id))])
+        for party in (*customers, *couriers, *restaurants)
+    ))
+    await asyncio.gather(*(
+        send_retrying(algod, [creator.sign(
+            transaction.AssetTransferTxn(creator.address, params, customer.address, ASA_TOTAL // len(customers) // 2, tips_asa_id)
+        )])
+        for customer in customers
+    ))
+
+
+async def run_order(algod: AsyncAlgodClient, recorder: Recorder, config: LoadConfig, index: int, lifecycle: str,
+                    customer: Account, courier: Account, restaurant: Account, tips_asa_id: int):
+    # the amounts tell the orders apart, two orders of the same parties would have the same creation txid
+    client = await recorder.measure("deploy", DeliveryClient.deploy(
+        algod, customer, restaurant.address, courier.address, ORDER_AMOUNT + index, COURIER_REWARD_AMOUNT + index, TIPS_AMOUNT,
+        tips_asa_id, ACCEPT_DELIVERY_WINDOW, config.dist_dir, config.packed,
+    ))
+    for action in LIFECYCLES[lifecycle]:
+        if action == "CANCEL":
+            call = client.cancel_order(courier, customer.address)
+        elif action == "PICK_UP_ORDER":
+            call = client.pick_up_order(courier)
+        elif action == "DELIVERED":
+            call = client.delivered(courier)
+        elif action == "COMPLETE_ORDER":
+            call = client.complete_order(customer, courier.address, restaurant.address)
+        elif action == "START_DISPUTE":
+            call = client.start_dispute(customer)
+        else:
+            call = client.claim_funds(courier, restaurant.address)
+        await recorder.measure(action, call)
+
+
+async def run_logicsig_order(client: LogicSigDeliveryClient, recorder: Recorder, index: int, lifecycle: str,
+                             customer: Account, courier: Account, restaurant: Account):
+    # the order ID tells the escrows of the same parties apart
+    order = LogicSigOrder(
+        courier.address, restaurant.address, customer.address, COURIER_REWARD_AMOUNT, LOGICSIG_DEADLINE, index.to_bytes(8, "big"),
+    )
+    await recorder.measure("place_order", client.place_order(customer, order, ORDER_AMOUNT, TIPS_AMOUNT))
+    for action in LIFECYCLES[lifecycle]:
+        # the customer completes and disputes, the courier sends the other actions
+        sender = customer if action in ("COMPLETE_ORDER", "START_DISPUTE") else courier
+        transactions = logicsig_layout().settlement_group_size if action in SETTLEMENT_ACTIONS else 1
+        await recorder.measure(action, client.call(sender, order, action), transactions)
+
+
+async def run_load(config: LoadConfig) -> LoadReport:
+    rng = random.Random(config.seed)
+    build(config.dist_dir)
+    creator = new_account()
+    customers = [new_account() for _ in range(config.customers)]
+    couriers = [new_account() for _ in range(config.couriers)]
+    restaurants = [new_account() for _ in range(config.restaurants)]
+    genesis = {party.address: 10 ** 6 * ALGO for party in (creator, *customers, *couriers, *restaurants)}
+    process, url = await start_fake_algod(config, genesis, [(creator.address, ASA_TOTAL)])
+    # the first asset of the genesis
+    tips_asa_id = 1
+    recorder = Recorder()
+    try:
+        async with AsyncAlgodClient(url, max_connections=config.concurrency) as algod:
+            await set_up(algod, creator, customers, couriers, restaurants, tips_asa_id)
+            identity = IdentityClient(algod, await deploy_identity(algod, creator, config.dist_dir))
+            await asyncio.gather(
+                *(recorder.measure("identity_opt_in", identity.opt_in(customer, "BUYER")) for customer in customers),
+                *(recorder.measure("identity_opt_in", identity.opt_in(courier, "COURIER")) for courier in couriers),
+                *(recorder.measure("identity_opt_in", identity.opt_in(restaurant, "STORE", *STORE_LOCATION)) for restaurant in restaurants),
+                return_exceptions=True,
+            )
+
+            if config.logicsig:
+                status_client = await retrying(lambda: LogicSigDeliveryClient.deploy(
+                    algod, creator, tips_asa_id, ACCEPT_DELIVERY_WINDOW, config.dist_dir,
+                ))
+            mix = lifecycle_mix(Model())
+            orders_in_flight = asyncio.Semaphore(config.concurrency)
+            failed_orders = 0
+            recorder.transactions = 0
+
+            async def order(index: int, lifecycle: str, customer: Account, courier: Account, restaurant: Account):
+                nonlocal failed_orders
+                async with orders_in_flight:
+                    try:
+                        if config.logicsig:
+                            await run_logicsig_order(status_client, recorder, index, lifecycle, customer, courier, restaurant)
+                        else:
+                            await run_order(algod, recorder, config, index, lifecycle, customer, courier, restaurant, tips_asa_id)
+                    except (HttpError, TransactionRejected, ConfirmationTimeout, ConnectionError, asyncio.TimeoutError):
+                        failed_orders += 1
+
+            lifecycles = rng.choices(list(mix), weights=list(mix.values()), k=config.orders)
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                order(index, lifecycle, rng.choice(customers), rng.choice(couriers), rng.choice(restaurants))
+                for index, lifecycle in enumerate(lifecycles)
+            ))
+            seconds = time.perf_counter() - start
+    finally:
+        process.terminate()
+        await process.wait()
+    return LoadReport(recorder.stats(), config.orders, failed_orders, recorder.transactions, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the clients against a fake algod.")
+    defaults = LoadConfig()
+    for name, default in defaults._asdict().items():
+        flag = "--" + name.replace("_", "-")
+        if isinstance(default, bool):
+            parser.add_argument(flag, action="store_true")
+        else:
+            parser.add_argument(flag, type=type(default), default=default, help=f"(default: {default})")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = vars(parser.parse_args())
+    as_json = args.pop("json")
+    report = asyncio.run(run_load(LoadConfig(**args)))
+    if as_json:
+        print(json.dumps({
+            "operations": {name: stats._asdict() for name, stats in report.operations.items()},
+            "orders": report.orders,
+            "failed_orders": report.failed_orders,
+            "transactions": report.transactions,
+            "seconds": report.seconds,
+            "tps": report.tps,
+        }, indent=2))
+    else:
+        print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
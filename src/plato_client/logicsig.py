@@ -0,0 +1,211 @@
+import os
+from functools import lru_cache
+from typing import Dict, NamedTuple
+
+from algosdk import constants, encoding, transaction
+
+from .account import Account
+from .algod import AsyncAlgodClient, StateValue
+from .delivery import ALGO_MIN_ACCOUNT_BALANCE, DEFAULT_ACCEPT_DELIVERY_WINDOW, delivery_layout, load_template
+from .layouts import LogicSigLayout
+
+from avm.template import instantiate  # noqa: E402, after layouts put src/contracts on sys.path
+
+# Orders held by logic signature escrows and tracked by the shared status app
+# (src/contracts/delivery/escrow_logicsig.py and status_app.py), the alternative to an escrow
+# application per order.
+#
+# The escrow of an order is the address of its logic signature, instantiated offline from the
+# build template: placing an order is one group funding that address and opting it in, nothing
+# is created or compiled. The customer pays the fees of that group and the sender of an action
+# pays the fees of its group, the escrow never pays fees.
+
+LOGICSIG_TEMPLATE_FILE_NAME = "escrow_logicsig.template.json"
+STATUS_APPROVAL_TEMPLATE_FILE_NAME = "status_approval.template.json"
+STATUS_CLEAR_TEMPLATE_FILE_NAME = "status_clear_program.template.json"
+# minimum balance of an application opt-in and of a byte slice of its local state
+APP_OPT_IN_MIN_BALANCE = 100000
+BYTE_SLICE_MIN_BALANCE = 50000
+# place order group: payment, asset opt-in, status app opt-in, tips
+PLACE_ORDER_GROUP_SIZE = 4
+SETTLEMENT_ACTIONS = ("CANCEL", "COMPLETE_ORDER", "CLAIM_FUNDS")
+
+
+@lru_cache(maxsize=None)
+def logicsig_layout() -> LogicSigLayout:
+    return LogicSigLayout.load()
+
+
+class LogicSigOrder(NamedTuple):
+    courier_address: str
+    restaurant_address: str
+    customer_address: str
+    courier_reward_amount: int
+    # round after which the customer can cancel the order if nobody picked it up
+    deadline: int
+    # 8 bytes, tells apart the orders of the same parties and amount
+    order_id: bytes
+
+
+class LogicSigDeliveryClient:
+    def __init__(self, algod: AsyncAlgodClient, status_app_id: int, tips_asa_id: int, dist_dir: str = "./dist"):
+        self.algod = algod
+        self.status_app_id = status_app_id
+        self.tips_asa_id = tips_asa_id
+        self.template = load_template(os.path.join(dist_dir, LOGICSIG_TEMPLATE_FILE_NAME))
+        self.layout = logicsig_layout()
+        self.action_codes = delivery_layout().action_codes
+        self.order_statuses = delivery_layout().order_statuses
+
+    @staticmethod
+    async def deploy(
+        algod: AsyncAlgodClient,
+        creator: Account,
+        tips_asa_id: int,
+        accept_delivery_window: int = DEFAULT_ACCEPT_DELIVERY_WINDOW,
+        dist_dir: str = "./dist",
+    ) -> "LogicSigDeliveryClient":
+        """Creates the status app, once for every order."""
+        approval_program = instantiate(load_template(os.path.join(dist_dir, STATUS_APPROVAL_TEMPLATE_FILE_NAME)), {
+            "TMPL_ACCEPT_DELIVERY_WINDOW": accept_delivery_window,
+        })
+        clear_program = instantiate(load_template(os.path.join(dist_dir, STATUS_CLEAR_TEMPLATE_FILE_NAME)), {})
+        create_txn = transaction.ApplicationCreateTxn(
+            creator.address,
+            await algod.suggested_params(),
+            transaction.OnComplete.NoOpOC,
+            approval_program,
+            clear_program,
+            transaction.StateSchema(0, 0),
+            transaction.StateSchema(*logicsig_layout().local_schema),
+        )
+        created = await algod.send_and_confirm([creator.sign(create_txn)])
+        return LogicSigDeliveryClient(algod, created["application-index"], tips_asa_id, dist_dir)
+
+    def escrow(self, order: LogicSigOrder) -> transaction.LogicSigAccount:
+        """The logic signature of the escrow of an order, instantiated without compiling anything."""
+        if len(order.order_id) != 8:
+            raise ValueError("order_id should be 8 bytes")
+        values = {
+            "STATUS_APP_ID": self.status_app_id,
+            "COURIER_ADDRESS": encoding.decode_address(order.courier_address),
+            "RESTAURANT_ADDRESS": encoding.decode_address(order.restaurant_address),
+            "CUSTOMER_ADDRESS": encoding.decode_address(order.customer_address),
+            "COURIER_REWARD_AMOUNT": order.courier_reward_amount,
+            "DEADLINE": order.deadline,
+            "ORDER_ID": order.order_id,
+        }
+        program = instantiate(self.template, {
+            "TMPL_ASA_ID": self.tips_asa_id,
+            **{variable: values[name] for variable, name in self.layout.template_variables.items()},
+        })
+        return transaction.LogicSigAccount(program)
+
+    def escrow_address(self, order: LogicSigOrder) -> str:
+        return self.escrow(order).address()
+
+    async def place_order(self, customer: Account, order: LogicSigOrder, order_total_price: int, tips_amount: int) -> dict:
+        """Funds the escrow of an order and opts it in to the tips ASA and to the status app."""
+        if order.courier_reward_amount <= 0:
+            raise ValueError("courier_reward_amount should be greater than zero")
+        if order.courier_reward_amount >= order_total_price:
+            raise ValueError("order_total_price should be greater than courier_reward_amount")
+        escrow = self.escrow(order)
+        escrow_address = escrow.address()
+        params = await self.pooled_params(PLACE_ORDER_GROUP_SIZE)
+        escrow_params = await self.pooled_params(0)
+        opt_in_args = [None] * len(self.layout.opt_in_args)
+        opt_in_args[self.layout.opt_in_args["courier_address"]] = encoding.decode_address(order.courier_address)
+        opt_in_args[self.layout.opt_in_args["restaurant_address"]] = encoding.decode_address(order.restaurant_address)
+        opt_in_args[self.layout.opt_in_args["customer_address"]] = encoding.decode_address(order.customer_address)
+        opt_in_args[self.layout.opt_in_args["deadline"]] = order.deadline.to_bytes(8, "big")
+        escrow_balance = (
+            ALGO_MIN_ACCOUNT_BALANCE * 2
+            + APP_OPT_IN_MIN_BALANCE
+            + BYTE_SLICE_MIN_BALANCE * self.layout.local_schema[1]
+            + order_total_price
+        )
+        group = [
+            transaction.PaymentTxn(customer.address, params, escrow_address, escrow_balance),
+            transaction.AssetOptInTxn(escrow_address, escrow_params, self.tips_asa_id),
+            transaction.ApplicationOptInTxn(escrow_address, escrow_params, self.status_app_id, opt_in_args),
+            transaction.AssetTransferTxn(customer.address, escrow_params, escrow_address, tips_amount, self.tips_asa_id),
+        ]
+        transaction.assign_group_id(group)
+        return await self.algod.send_and_confirm([
+            customer.sign(group[0]),
+            transaction.LogicSigTransaction(group[1], escrow),
+            transaction.LogicSigTransaction(group[2], escrow),
+            customer.sign(group[3]),
+        ])
+
+    async def call(self, sender: Account, order: LogicSigOrder, action: str) -> dict:
+        """Sends an action, with the settlement of the escrow for CANCEL, COMPLETE_ORDER and CLAIM_FUNDS."""
+        escrow = self.escrow(order)
+        escrow_address = escrow.address()
+        settles = action in SETTLEMENT_ACTIONS
+        params = await self.pooled_params(self.layout.settlement_group_size if settles else 1)
+        action_txn = transaction.ApplicationNoOpTxn(
+            sender.address, params, self.status_app_id, [bytes([self.action_codes[action]])], accounts=[escrow_address],
+        )
+        if not settles:
+            return await self.algod.send_and_confirm([sender.sign(action_txn)])
+        if action == "CANCEL":
+            payee, amount, close_to = order.customer_address, 0, order.customer_address
+        else:
+            payee, amount, close_to = order.courier_address, order.courier_reward_amount, order.restaurant_address
+        escrow_params = await self.pooled_params(0)
+        group = [
+            action_txn,
+            transaction.ApplicationCloseOutTxn(escrow_address, escrow_params, self.status_app_id),
+            transaction.AssetTransferTxn(escrow_address, escrow_params, payee, 0, self.tips_asa_id, close_assets_to=payee),
+            transaction.PaymentTxn(escrow_address, escrow_params, payee, amount, close_remainder_to=close_to),
+        ]
+        transaction.assign_group_id(group)
+        return await self.algod.send_and_confirm(
+            [sender.sign(action_txn)] + [transaction.LogicSigTransaction(txn, escrow) for txn in group[1:]]
+        )
+
+    async def pooled_params(self, transactions: int) -> transaction.SuggestedParams:
+        """Suggested params paying the minimum fee of a number of transactions."""
+        params = transaction.SuggestedParams(**vars(await self.algod.suggested_params()))
+        params.flat_fee = True
+        params.fee = transactions * (params.min_fee or constants.MIN_TXN_FEE)
+        return params
+
+    # customer actions
+
+    async def complete_order(self, customer: Account, order: LogicSigOrder) -> dict:
+        return await self.call(customer, order, "COMPLETE_ORDER")
+
+    async def start_dispute(self, customer: Account, order: LogicSigOrder) -> dict:
+        return await self.call(customer, order, "START_DISPUTE")
+
+    async def cancel_order(self, sender: Account, order: LogicSigOrder) -> dict:
+        """Cancels the order and refunds the customer, sent by the courier, the restaurant or,
+        after the deadline, the customer."""
+        return await self.call(sender, order, "CANCEL")
+
+    # courier actions
+
+    async def pick_up_order(self, courier: Account, order: LogicSigOrder) -> dict:
+        return await self.call(courier, order, "PICK_UP_ORDER")
+
+    async def delivered(self, courier: Account, order: LogicSigOrder) -> dict:
+        return await self.call(courier, order, "DELIVERED")
+
+    async def claim_funds(self, courier: Account, order: LogicSigOrder) -> dict:
+        return await self.call(courier, order, "CLAIM_FUNDS")
+
+    async def order_state(self, order: LogicSigOrder) -> Dict[str, StateValue]:
+        """The record of an open order by field name, the status by OrderStatus name; empty once settled."""
+        local_state = await self.algod.account_local_state(self.escrow_address(order), self.status_app_id)
+        record = local_state.get(self.layout.record_key)
+        if not isinstance(record, bytes):
+            return {}
+        state = {
+            name: int.from_bytes(record[offset:offset + size], "big") if is_uint else encoding.encode_address(record[offset:offset + size])
+            for name, (offset, size, is_uint) in self.layout.record_fields.items()
+        }
+        state["ORDER_STATUS"] = self.order_statuses.get(state["ORDER_STATUS"], state["ORDER_STATUS"])
+        return state
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import base64
+import csv
+import json
+import os
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from algosdk import account, constants, encoding, mnemonic, transaction
+
+from .algod import AsyncAlgodClient, ConfirmationTimeout, DEFAULT_ALGOD_URL, TransactionRejected
+from .identity import identity_layout, opt_in_args, validate_args
+from .pool import HttpError
+
+# Bulk onboarding of identity users: the opt-ins of a city's buyers, stores and couriers and the
+# store (sto_val) and courier (cou_val) attestations, read from a CSV or JSONL file.
+#
+# Calls are streamed from the file, packed into atomic groups of up to MAX_GROUP_SIZE calls that
+# do not share an account, and the groups are built and signed in a process pool, so ed25519
+# signing runs on every core. Only a bounded window of groups is held at a time (read, being
+# signed, or being sent), memory does not grow with the input. The signed groups are either
+# written to disk, one "goal clerk rawsend" file per group, or submitted with bounded
+# concurrency; a group touching an account of a group still in flight, e.g. the attestation of
+# a store whose opt-in is being confirmed, waits for it. Rejected groups are split in two and
+# signed again until the calls that fail are isolated, like the Sweeper does.
+#
+# Each record holds the action ("opt_in" by default, "sto_val" or "cou_val"), the key of the
+# sender ("private_key" or "mnemonic") and the arguments of its action: "user_type", "lat",
+# "lng", "referer" and "geohash" for an opt-in, "target" (the store or courier address) for an
+# attestation. Every sender pays the fee of its own call.
+#
+# Usage: PYTHONPATH=src python3 -m plato_client.onboarding users.csv --app-id N [--out DIR] [--algod URL]
+
+MAX_GROUP_SIZE = 16
+OPT_IN = "opt_in"
+GROUP_FILE_NAME = "group-{:08d}.stxn"
+
+
+class OnboardingCall(NamedTuple):
+    # position of the record in the input, starting at 0
+    index: int
+    action: str
+    private_key: str
+    user_type: str = ""
+    latitude: str = ""
+    longitude: str = ""
+    referer_address: str = constants.ZERO_ADDRESS
+    geohash: Optional[str] = None
+    target_address: str = ""
+
+    @property
+    def address(self) -> str:
+        return account.address_from_private_key(self.private_key)
+
+    def accounts(self) -> Tuple[str, ...]:
+        """The accounts whose local state the call reads or writes."""
+        return (self.address, self.target_address) if self.target_address else (self.address,)
+
+
+class SignedGroup(NamedTuple):
+    txids: Tuple[str, ...]
+    # msgpack-encoded signed transactions laid end to end
+    blob: bytes
+
+
+class OnboardingResult(NamedTuple):
+    confirmed: int
+    # record index -> error of the calls that could not be confirmed
+    failed: Dict[int, Exception]
+
+
+def call_from_record(index: int, record: Dict[str, str]) -> OnboardingCall:
+    """The call of a CSV row or JSONL object, empty fields taking their default."""
+    record = {key: value for key, value in record.items() if value not in (None, "")}
+    action = record.get("action", OPT_IN)
+    layout = identity_layout()
+    if action == OPT_IN:
+        if record.get("user_type") not in layout.user_types:
+            raise ValueError(f"record {index}: user_type should be one of {', '.join(layout.user_types)}")
+    elif action.encode() not in (layout.action_store_attest, layout.action_courier_attest):
+        raise ValueError(f"record {index}: unknown action {action!r}")
+    elif "target" not in record:
+        raise ValueError(f"record {index}: {action} needs a target address")
+    if "private_key" in record:
+        private_key = record["private_key"]
+    elif "mnemonic" in record:
+        private_key = mnemonic.to_private_key(record["mnemonic"])
+    else:
+        raise ValueError(f"record {index}: private_key or mnemonic missing")
+    return OnboardingCall(
+        index,
+        action,
+        private_key,
+        record.get("user_type", ""),
+        record.get("lat", ""),
+        record.get("lng", ""),
+        record.get("referer", constants.ZERO_ADDRESS),
+        record.get("geohash"),
+        record.get("target", ""),
+    )
+
+
+def read_calls(path: str) -> Iterator[OnboardingCall]:
+    """The calls of a .csv file with a header row or of a JSONL file, read lazily."""
+    with open(path, newline="", encoding="UTF-8") as f:
+        if path.endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for index, record in enumerate(records):
+            yield call_from_record(index, record)
+
+
+def pack_groups(calls: Iterable[OnboardingCall], group_size: int = MAX_GROUP_SIZE) -> Iterator[List[OnboardingCall]]:
+    """Consecutive calls packed into groups of up to group_size calls sharing no account."""
+    group, accounts = [], set()
+    for call in calls:
+        call_accounts = call.accounts()
+        if len(group) == group_size or accounts.intersection(call_accounts):
+            yield group
+            group, accounts = [], set()
+        group.append(call)
+        accounts.update(call_accounts)
+    if group:
+        yield group
+
+
+def call_txn(app_id: int, params: transaction.SuggestedParams, call: OnboardingCall) -> transaction.Transaction:
+    if call.action == OPT_IN:
+        app_args = opt_in_args(
+            call.address, call.user_type, call.latitude, call.longitude, call.referer_address, call.geohash
+        )
+        return transaction.ApplicationOptInTxn(call.address, params, app_id, app_args)
+    return transaction.ApplicationNoOpTxn(
+        call.address, params, app_id, validate_args(call.action.encode(), call.target_address),
+        accounts=[call.target_address],
+    )
+
+
+def sign_group(app_id: int, params: transaction.SuggestedParams, calls: Sequence[OnboardingCall]) -> SignedGroup:
+    """Builds and signs the transactions of a group, run in the worker processes."""
+    txns = [call_txn(app_id, params, call) for call in calls]
+    if len(txns) > 1:
+        transaction.assign_group_id(txns)
+    signed = [txn.sign(call.private_key) for txn, call in zip(txns, calls)]
+    return SignedGroup(
+        tuple(txn.get_txid() for txn in txns),
+        b"".join(base64.b64decode(encoding.msgpack_encode(txn)) for txn in signed),
+    )
+
+
+class Onboarding:
+    def __init__(self, app_id: int, group_size: int = MAX_GROUP_SIZE, jobs: Optional[int] = None, window: Optional[int] = None):
+        if not 0 < group_size <= MAX_GROUP_SIZE:
+            raise ValueError(f"group_size must be between 1 and {MAX_GROUP_SIZE}")
+        self.app_id = app_id
+        self.group_size = group_size
+        self.jobs = jobs or os.cpu_count() or 1
+        # groups submitted to the pool and not consumed yet
+        self.window = window or 4 * self.jobs
+
+    def executor(self) -> Executor:
+        # Loaded before the workers fork, so that they inherit the layout instead of importing PyTeal.
+        identity_layout()
+        return ProcessPoolExecutor(max_workers=self.jobs)
+
+    def signed_groups(self, calls: Iterable[OnboardingCall], params: transaction.SuggestedParams) -> Iterator[Tuple[List[OnboardingCall], SignedGroup]]:
+        """The groups of the calls and their signed transactions, in order."""
+        with self.executor() as executor:
+            pending = deque()
+            for group in pack_groups(calls, self.group_size):
+                pending.append((group, executor.submit(sign_group, self.app_id, params, group)))
+                if len(pending) >= self.window:
+                    group, signed = pending.popleft()
+                    yield group, signed.result()
+            while pending:
+                group, signed = pending.popleft()
+                yield group, signed.result()
+
+    def write(self, calls: Iterable[OnboardingCall], params: transaction.SuggestedParams, out_dir: str) -> int:
+        """Writes the signed groups to out_dir and returns their number.
+
+        The groups are valid from round params.first to params.last, they have to be sent by then."""
+        os.makedirs(out_dir, exist_ok=True)
+        groups = 0
+        for groups, (_, signed) in enumerate(self.signed_groups(calls, params), 1):
+            with open(os.path.join(out_dir, GROUP_FILE_NAME.format(groups - 1)), "wb") as f:
+                f.write(signed.blob)
+        return groups
+
+    async def submit(self, algod: AsyncAlgodClient, calls: Iterable[OnboardingCall], concurrency: int = 8, attempts: int = 3) -> OnboardingResult:
+        """Signs the groups of the calls and sends them, up to concurrency groups at a time."""
+        groups_in_flight = asyncio.Semaphore(concurrency)
+        accounts_in_flight = Counter()
+        released = asyncio.Condition()
+        confirmed, failed = 0, {}
+        tasks = set()
+
+        async def send(group: List[OnboardingCall], accounts: Tuple[str, ...]):
+            nonlocal confirmed
+            try:
+                result = await self.send_group(algod, executor, group, attempts)
+                confirmed += result.confirmed
+                failed.update(result.failed)
+            finally:
+                accounts_in_flight.subtract(accounts)
+                groups_in_flight.release()
+                async with released:
+                    released.notify_all()
+
+        with self.executor() as executor:
+            for group in pack_groups(calls, self.group_size):
+                accounts = tuple(address for call in group for address in call.accounts())
+                await groups_in_flight.acquire()
+                async with released:
+                    await released.wait_for(lambda: not any(accounts_in_flight[address] for address in accounts))
+                accounts_in_flight.update(accounts)
+                task = asyncio.ensure_future(send(group, accounts))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                # drop the counts of the accounts with nothing in flight, the counter stays small
+                accounts_in_flight += Counter()
+            await asyncio.gather(*tasks)
+        return OnboardingResult(confirmed, failed)
+
+    async def send_group(self, algod: AsyncAlgodClient, executor: Executor, group: List[OnboardingCall], attempts: int) -> OnboardingResult:
+        error = None
+        for attempt in range(attempts):
+            try:
+                params = await algod.suggested_params()
+                signed = await asyncio.wrap_future(executor.submit(sign_group, self.app_id, params, group))
+                await algod.send_raw_transactions(signed.blob)
+                await algod.wait_for_confirmation(signed.txids[0], first_round=params.first)
+                return OnboardingResult(len(group), {})
+            except HttpError as rejected:
+                error = rejected
+                if rejected.status < 500:
+                    # rejected by the ledger or by the program, sending it again would not help
+                    break
+            except (ConnectionError, asyncio.TimeoutError, TransactionRejected, ConfirmationTimeout) as transient:
+                error = transient
+            if attempt + 1 < attempts:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        if len(group) == 1:
+            return OnboardingResult(0, {group[0].index: error})
+        middle = len(group) // 2
+        halves = await asyncio.gather(
+            self.send_group(algod, executor, group[:middle], attempts),
+            self.send_group(algod, executor, group[middle:], attempts),
+        )
+        return OnboardingResult(
+            halves[0].confirmed + halves[1].confirmed,
+            {**halves[0].failed, **halves[1].failed},
+        )
+
+
+async def run(args) -> None:
+    onboarding = Onboarding(args.app_id, args.group_size, args.jobs)
+    async with AsyncAlgodClient(args.algod, args.token) as algod:
+        if args.out:
+            params = await algod.suggested_params()
+            groups = onboarding.write(read_calls(args.input), params, args.out)
+            print(f"{groups} groups written to {args.out}, valid until round {params.last}")
+            return
+        result = await onboarding.submit(algod, read_calls(args.input), args.concurrency)
+    print(f"{result.confirmed} calls confirmed, {len(result.failed)} failed")
+    for index, error in sorted(result.failed.items()):
+        print(f"  record {index}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sign and send the identity opt-ins and attestations of a CSV or JSONL file.")
+    parser.add_argument("input", help="users, a .csv file with a header row or JSON lines")
+    parser.add_argument("--app-id", type=int, required=True, help="identity application ID")
+    parser.add_argument("--out", help="write the signed groups to this directory instead of sending them")
+    parser.add_argument("--algod", default=DEFAULT_ALGOD_URL, help=f"algod URL (default: {DEFAULT_ALGOD_URL})")
+    parser.add_argument("--token", default="", help="algod API token")
+    parser.add_argument("--group-size", type=int, default=MAX_GROUP_SIZE, help="calls per atomic group")
+    parser.add_argument("--jobs", type=int, default=None, help="number of signing processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="groups in flight when sending")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import asyncio
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+# A minimal asyncio HTTP/1.1 client keeping its connections to one host alive.
+# algod speaks plain HTTP/1.1 with keep-alive, so a few pooled connections carry any number of
+# concurrent requests: a request borrows an idle connection or opens a new one while fewer than
+# max_connections are open, and waits for a connection to be returned otherwise.
+
+# methods sent again when a reused connection turns out to be closed
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD"))
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, reason: str, body: bytes):
+        super().__init__(f"HTTP {status} {reason}: {body[:200].decode(errors='replace')}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+class Response(NamedTuple):
+    status: int
+    reason: str
+    # header names are lower case
+    headers: Dict[str, str]
+    body: bytes
+
+
+class Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        # set once the server asked to close the connection or a request failed midway
+        self.closed = False
+        # set once the connection served a request
+        self.reused = False
+
+    async def request(self, head: bytes, body: bytes) -> Response:
+        self.writer.write(head + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by the server")
+        # "HTTP/1.1 200 OK", the reason phrase may be empty
+        status_parts = status_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        status = int(status_parts[1])
+        reason = status_parts[2] if len(status_parts) > 2 else ""
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self.read_chunked()
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            # no framing, the body ends with the connection
+            body = await self.reader.read()
+            self.closed = True
+        if headers.get("connection", "").lower() == "close":
+            self.closed = True
+        self.reused = True
+        return Response(status, reason, headers, body)
+
+    async def read_chunked(self) -> bytes:
+        body = bytearray()
+        while True:
+            size = int((await self.reader.readline()).split(b";", 1)[0], 16)
+            if size == 0:
+                # trailers
+                while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return bytes(body)
+            body += await self.reader.readexactly(size)
+            await self.reader.readexactly(2)
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+class ConnectionPool:
+    def __init__(self, url: str, max_connections: int = 32, headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported URL {url}")
+        self.ssl = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.headers = {
+            "Host": parts.netloc,
+            "Connection": "keep-alive",
+            **(headers or {}),
+        }
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max_connections)
+        self.idle: List[Connection] = []
+
+    async def request(self, method: str, path: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> Response:
+        """Sends a request and returns its response, raising HttpError for a status of 400 or above."""
+        head = self.encode_head(method, path, body, headers)
+        async with self.slots:
+            connection, response = await asyncio.wait_for(self.send(method, head, body), self.timeout)
+            if connection.closed:
+                connection.close()
+            else:
+                self.idle.append(connection)
+        if response.status >= 400:
+            raise HttpError(response.status, response.reason, response.body)
+        return response
+
+    async def send(self, method: str, head: bytes, body: bytes) -> Tuple[Connection, Response]:
+        while True:
+            connection = await self.borrow()
+            try:
+                return connection, await connection.request(head, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection.close()
+                # the server may close an idle keep-alive connection at any time, a request that
+                # failed on a reused connection is sent again on another one; unless it is a POST,
+                # which the server may have acted on before the connection was lost
+                if not connection.reused or method not in IDEMPOTENT_METHODS:
+                    raise
+            except BaseException:
+                # e.g. cancelled midway, the response may still be pending on the connection
+                connection.close()
+                raise
+
+    async def borrow(self) -> Connection:
+        while self.idle:
+            connection = self.idle.pop()
+            if not connection.reader.at_eof():
+                return connection
+            # closed by the server while idle
+            connection.close()
+        return await self.connect()
+
+    async def connect(self) -> Connection:
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        return Connection(reader, writer)
+
+    def encode_head(self, method: str, path: str, body: bytes, headers: Optional[Dict[str, str]]) -> bytes:
+        lines = [f"{method} {self.base_path}{path} HTTP/1.1"]
+        for name, value in {**self.headers, **(headers or {}), "Content-Length": str(len(body))}.items():
+            lines.append(f"{name}: {value}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def close(self):
+        while self.idle:
+            self.idle.pop().close()
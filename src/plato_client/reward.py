@@ -0,0 +1,156 @@
+from functools import lru_cache
+from typing import NamedTuple, Sequence, Tuple
+
+from algosdk import encoding, transaction
+
+from .account import Account
+from .algod import AsyncAlgodClient
+from .identity import APP_CALL_BUDGET, OP_UP_COST, future_time
+from .indexer import key_of
+from .layouts import RewardLayout
+
+# Reward application (src/contracts/reward/app.py), the arguments are laid out the same way
+# as by RewardClient in src/plato/reward.
+
+# Opcode cost of a check_rewards call, its base and per referral, as measured by the reward
+# scenarios of src/contracts/benchmark.py with a margin.
+BATCH_BASE_COST = 200
+REFERRAL_COST = 120
+
+
+@lru_cache(maxsize=None)
+def reward_layout() -> RewardLayout:
+    return RewardLayout.load()
+
+
+def op_up_calls(referral_count: int) -> int:
+    """The op_up calls to group with a check_rewards call of that many referrals."""
+    missing = BATCH_BASE_COST + REFERRAL_COST * referral_count - APP_CALL_BUDGET
+    return max(0, -(-missing // (APP_CALL_BUDGET - OP_UP_COST)))
+
+
+class Referral(NamedTuple):
+    # account whose progress on the identity app is checked
+    referred_address: str
+    # account paid when the referred account reached its milestone
+    referrer_address: str
+    reward_type: str
+
+
+class RewardTable(NamedTuple):
+    # milestone of each user type, by user type value (0 for no reward)
+    milestones: Tuple[int, ...]
+    # amount of each reward type, by reward code
+    amounts: Tuple[int, ...]
+
+
+class RewardClient:
+    def __init__(self, algod: AsyncAlgodClient, app_id: int, plato_asa_id: int, identity_app_id: int):
+        self.algod = algod
+        self.app_id = app_id
+        self.plato_asa_id = plato_asa_id
+        self.identity_app_id = identity_app_id
+        self.layout = reward_layout()
+
+    def reward_type(self, reward_type: str) -> bytes:
+        """The one-byte code of a reward type."""
+        if reward_type.encode() not in self.layout.reward_codes:
+            raise ValueError(f"unknown reward type {reward_type}")
+        return bytes([self.layout.reward_codes[reward_type.encode()]])
+
+    async def call(self, sender: Account, app_args, accounts) -> dict:
+        txn = transaction.ApplicationNoOpTxn(
+            sender.address,
+            await self.algod.suggested_params(),
+            self.app_id,
+            app_args,
+            accounts=accounts or None,
+            foreign_apps=[self.identity_app_id],
+            foreign_assets=[self.plato_asa_id],
+        )
+        return await self.algod.send_and_confirm([sender.sign(txn)])
+
+    async def check_reward(self, sender: Account, referred_address: str, reward_type: str) -> dict:
+        return await self.call(sender, [
+            self.layout.methods["CHECK_REWARD"],
+            encoding.decode_address(sender.address),
+            encoding.decode_address(referred_address),
+            future_time(),
+            self.reward_type(reward_type),
+        ], [referred_address])
+
+    async def check_rewards(self, sender: Account, referrals: Sequence[Referral]) -> dict:
+        """Checks up to max_batch_referrals referrals in one call, each referrer is paid once.
+
+        The op_up calls the referrals need are added to the group."""
+        if not 0 < len(referrals) <= self.layout.max_batch_referrals:
+            raise ValueError(f"between 1 and {self.layout.max_batch_referrals} referrals can be checked at once")
+        # Txn.accounts index 0 is the sender, foreign accounts follow
+        accounts = []
+
+        def account_index(address: str) -> int:
+            if address == sender.address:
+                return 0
+            if address not in accounts:
+                accounts.append(address)
+            return accounts.index(address) + 1
+
+        indexes = bytes(
+            index
+            for referral in referrals
+            for index in (account_index(referral.referred_address), account_index(referral.referrer_address))
+        )
+        if len(accounts) > self.layout.max_account_index:
+            raise ValueError(f"referrals of one call can involve at most {self.layout.max_account_index} accounts besides the sender")
+        params = await self.algod.suggested_params()
+        app_args = [
+            self.layout.methods["CHECK_REWARDS"],
+            indexes,
+            *(self.reward_type(referral.reward_type) for referral in referrals),
+        ]
+        group = [transaction.ApplicationNoOpTxn(
+            sender.address, params, self.app_id, app_args, accounts=accounts or None,
+            foreign_apps=[self.identity_app_id], foreign_assets=[self.plato_asa_id],
+        )]
+        # the note tells the op_up calls of the group apart
+        group += [
+            transaction.ApplicationNoOpTxn(sender.address, params, self.app_id, [self.layout.methods["OP_UP"]], note=bytes([call]))
+            for call in range(op_up_calls(len(referrals)))
+        ]
+        if len(group) > 1:
+            transaction.assign_group_id(group)
+        return await self.algod.send_and_confirm([sender.sign(txn) for txn in group])
+
+    async def set_rewards(self, creator: Account, table: RewardTable) -> dict:
+        """Replaces the milestones and amounts of the rewards, sent by the creator of the application."""
+        slots = self.layout.reward_table_slots
+        if len(table.milestones) != slots or len(table.amounts) != slots:
+            raise ValueError(f"the table holds {slots} milestones and {slots} amounts")
+        txn = transaction.ApplicationNoOpTxn(
+            creator.address,
+            await self.algod.suggested_params(),
+            self.app_id,
+            [self.layout.methods["SET_REWARDS"], b"".join(value.to_bytes(8, "big") for value in (*table.milestones, *table.amounts))],
+        )
+        return await self.algod.send_and_confirm([creator.sign(txn)])
+
+    async def opt_in(self, referrer: Account) -> dict:
+        """Opts a referrer in, its rewards are then credited to its balance instead of being transferred."""
+        txn = transaction.ApplicationOptInTxn(referrer.address, await self.algod.suggested_params(), self.app_id)
+        return await self.algod.send_and_confirm([referrer.sign(txn)])
+
+    async def claim(self, referrer: Account) -> dict:
+        """Pays out the balance of a referrer in one transfer."""
+        return await self.call(referrer, [self.layout.methods["CLAIM"]], [])
+
+    async def balance(self, address: str) -> int:
+        """The rewards accrued by a referrer and not claimed yet."""
+        state = await self.algod.account_local_state(address, self.app_id)
+        return state.get(key_of(self.layout.state_keys, "BALANCE_KEY"), 0)
+
+    async def rewards(self) -> RewardTable:
+        """The milestones and amounts of the rewards."""
+        table = (await self.algod.application_global_state(self.app_id)).get(key_of(self.layout.state_keys, "REWARD_TABLE_KEY"), b"")
+        values = tuple(int.from_bytes(table[offset:offset + 8], "big") for offset in range(0, len(table), 8))
+        slots = self.layout.reward_table_slots
+        return RewardTable(values[:slots], values[slots:])
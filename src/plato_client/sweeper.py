@@ -0,0 +1,127 @@
+import asyncio
+import copy
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from algosdk import constants, encoding, transaction
+
+from .account import Account
+from .algod import AsyncAlgodClient, ConfirmationTimeout, TransactionRejected
+from .delivery import DEFAULT_ACCEPT_DELIVERY_WINDOW, DeliveryClient, delivery_layout
+from .indexer import StateIndex, key_of
+from .pool import HttpError
+
+# Settles many orders at once: CLAIM_FUNDS for the orders whose accept window passed and CANCEL
+# for orders left COOKING, found with a StateIndex. Only the orders of delivery escrows are
+# settled, those of an order book or of the status app are left to their own calls.
+#
+# The calls of one sender are packed into atomic groups of up to MAX_GROUP_SIZE transactions
+# sent concurrently. Fees are pooled: the first call of a group pays for every call of the group
+# and for their inner transactions, the others are sent with a zero fee, so the escrows never
+# pay fees from their balance. A group is all or nothing, when algod rejects one it is split in
+# two and each half is sent again until the calls that fail are isolated; transient errors
+# (connection, timeout, dropped transaction) are retried as they are.
+
+MAX_GROUP_SIZE = 16
+# release_funds and refund both submit a group of two inner transactions
+SETTLEMENT_INNER_TRANSACTIONS = 2
+
+
+class Settlement(NamedTuple):
+    app_id: int
+    # Txn.accounts of the call, besides the sender
+    accounts: Tuple[str, ...]
+
+
+class SweepResult(NamedTuple):
+    settled: List[int]
+    # app ID -> error of the orders that could not be settled
+    failed: Dict[int, Exception]
+
+
+class Sweeper:
+    def __init__(self, algod: AsyncAlgodClient, index: StateIndex, tips_asa_id: int, group_size: int = MAX_GROUP_SIZE, concurrency: int = 8, attempts: int = 3):
+        if not 0 < group_size <= MAX_GROUP_SIZE:
+            raise ValueError(f"group_size must be between 1 and {MAX_GROUP_SIZE}")
+        self.algod = algod
+        self.index = index
+        self.tips_asa_id = tips_asa_id
+        self.group_size = group_size
+        self.groups_in_flight = asyncio.Semaphore(concurrency)
+        self.attempts = attempts
+        layout = delivery_layout()
+        self.courier_key = key_of(layout.state_keys, "COURIER_ADDRESS")
+        self.restaurant_key = key_of(layout.state_keys, "RESTAURANT_ADDRESS")
+
+    async def claim_funds(self, courier: Account, window: int = DEFAULT_ACCEPT_DELIVERY_WINDOW) -> SweepResult:
+        """Claims the funds of every order of a courier delivered more than window seconds ago."""
+        courier_address = encoding.decode_address(courier.address)
+        settlements = [
+            Settlement(order_key.app_id, (courier.address, encoding.encode_address(order[self.restaurant_key])))
+            for order_key, order in ((order_key, self.index.order(order_key)) for order_key in self.index.claimable_orders(window=window))
+            if not order_key.order and order.get(self.courier_key) == courier_address
+        ]
+        return await self.sweep(courier, "CLAIM_FUNDS", settlements)
+
+    async def cancel_stale_orders(self, sender: Account, max_age: int) -> SweepResult:
+        """Cancels the orders still COOKING max_age seconds after their creation, sent by their courier or restaurant.
+
+        The customers are refunded."""
+        sender_address = encoding.decode_address(sender.address)
+        settlements = []
+        for order_key in self.index.stale_orders("COOKING", max_age):
+            order = self.index.order(order_key)
+            if not order_key.order and sender_address in (order.get(self.courier_key), order.get(self.restaurant_key)):
+                customer = encoding.encode_address(self.index.origins[order_key].creator)
+                settlements.append(Settlement(order_key.app_id, (customer,)))
+        return await self.sweep(sender, "CANCEL", settlements)
+
+    async def sweep(self, sender: Account, action: str, settlements: Sequence[Settlement]) -> SweepResult:
+        groups = [settlements[start:start + self.group_size] for start in range(0, len(settlements), self.group_size)]
+        results = await asyncio.gather(*(self.send_group(sender, action, group) for group in groups))
+        return SweepResult(
+            [app_id for result in results for app_id in result.settled],
+            {app_id: error for result in results for app_id, error in result.failed.items()},
+        )
+
+    async def send_group(self, sender: Account, action: str, settlements: Sequence[Settlement]) -> SweepResult:
+        error = None
+        for attempt in range(self.attempts):
+            try:
+                async with self.groups_in_flight:
+                    await self.algod.send_and_confirm(await self.signed_group(sender, action, settlements))
+                return SweepResult([settlement.app_id for settlement in settlements], {})
+            except HttpError as rejected:
+                error = rejected
+                if rejected.status < 500:
+                    # rejected by the ledger or by a program, sending it again would not help
+                    break
+            except (ConnectionError, asyncio.TimeoutError, TransactionRejected, ConfirmationTimeout) as transient:
+                error = transient
+            if attempt + 1 < self.attempts:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        if len(settlements) == 1:
+            return SweepResult([], {settlements[0].app_id: error})
+        middle = len(settlements) // 2
+        halves = await asyncio.gather(
+            self.send_group(sender, action, settlements[:middle]),
+            self.send_group(sender, action, settlements[middle:]),
+        )
+        return SweepResult(
+            halves[0].settled + halves[1].settled,
+            {**halves[0].failed, **halves[1].failed},
+        )
+
+    async def signed_group(self, sender: Account, action: str, settlements: Sequence[Settlement]):
+        params = copy.copy(await self.algod.suggested_params())
+        params.flat_fee = True
+        params.fee = 0
+        txns = [
+            DeliveryClient(self.algod, settlement.app_id, self.tips_asa_id).action_txn(
+                sender.address, params, action, settlement.accounts, assets=True
+            )
+            for settlement in settlements
+        ]
+        txns[0].fee = len(txns) * (1 + SETTLEMENT_INNER_TRANSACTIONS) * (params.min_fee or constants.MIN_TXN_FEE)
+        if len(txns) > 1:
+            transaction.assign_group_id(txns)
+        return [sender.sign(txn) for txn in txns]
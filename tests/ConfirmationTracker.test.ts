@@ -0,0 +1,252 @@
+import * as assert from "assert";
+import algosdk, { Algodv2, SuggestedParams, Transaction } from "algosdk";
+import ConfirmationTracker from "../src/algo/ConfirmationTracker";
+
+// Follows a stub algod whose chain advances one round each time the tracker
+// waits for the next block, as the Python fake algod does with a round time
+// of 0.
+// Usage: yarn test
+const GENESIS_ID = "fake-v1";
+const GENESIS_HASH = Buffer.alloc(32, 7).toString("base64");
+
+class StubAlgod {
+  lastRound = 10;
+  /**
+   * Encoded signed transactions of the blocks to come, by round
+   */
+  readonly queued = new Map<number, Record<string, any>[]>();
+  readonly blocks = new Map<number, Record<string, any>>();
+  /**
+   * Pending transaction information by transaction ID, as algod answers it
+   */
+  readonly pending = new Map<string, Record<string, any>>();
+  readonly requests: string[] = [];
+
+  status() {
+    return this.request("status", async () => ({
+      "last-round": this.lastRound,
+    }));
+  }
+
+  statusAfterBlock(round: number) {
+    return this.request(`statusAfterBlock ${round}`, async () => {
+      if (this.lastRound <= round) {
+        this.endRound();
+      }
+      return { "last-round": this.lastRound };
+    });
+  }
+
+  block(round: number) {
+    return this.request(`block ${round}`, async () => {
+      if (round > this.lastRound) {
+        throw new Error(`ledger does not have entry ${round}`);
+      }
+      return {
+        block: this.blocks.get(round) || {
+          rnd: round,
+          gh: Buffer.from(GENESIS_HASH, "base64"),
+          gen: GENESIS_ID,
+          txns: [],
+        },
+      };
+    });
+  }
+
+  pendingTransactionInformation(txId: string) {
+    return this.request(`pending ${txId}`, async () => {
+      const info = this.pending.get(txId);
+      if (!info) {
+        throw new Error(`transaction ${txId} not found`);
+      }
+      return info;
+    });
+  }
+
+  /**
+   * Confirms the transactions in the block of a round to come
+   */
+  confirmIn(round: number, ...transactions: Transaction[]): void {
+    for (const transaction of transactions) {
+      // blocks omit the genesis hash and ID of their transactions
+      const { gh, gen, ...txn } = transaction.get_obj_for_encoding();
+      this.queued.set(round, [
+        ...(this.queued.get(round) || []),
+        { txn, hgi: true },
+      ]);
+      this.pending.set(transaction.txID().toString(), {
+        "confirmed-round": round,
+        "pool-error": "",
+      });
+    }
+  }
+
+  endRound(): void {
+    this.lastRound += 1;
+    this.blocks.set(this.lastRound, {
+      rnd: this.lastRound,
+      gh: Buffer.from(GENESIS_HASH, "base64"),
+      gen: GENESIS_ID,
+      txns: this.queued.get(this.lastRound) || [],
+    });
+  }
+
+  count(prefix: string): number {
+    return this.requests.filter((request) => request.startsWith(prefix))
+      .length;
+  }
+
+  private request<T>(name: string, answer: () => Promise<T>) {
+    this.requests.push(name);
+    return { do: answer };
+  }
+}
+
+const sender = algosdk.generateAccount().addr;
+const receiver = algosdk.generateAccount().addr;
+
+function payment(stub: StubAlgod, amount: number): Transaction {
+  const params: SuggestedParams = {
+    fee: 1000,
+    flatFee: true,
+    firstRound: stub.lastRound,
+    lastRound: stub.lastRound + 1000,
+    genesisID: GENESIS_ID,
+    genesisHash: GENESIS_HASH,
+  };
+  return algosdk.makePaymentTxnWithSuggestedParams(
+    sender,
+    receiver,
+    amount,
+    undefined,
+    undefined,
+    params
+  );
+}
+
+function tracker(stub: StubAlgod, rounds: number[] = []): ConfirmationTracker {
+  return new ConfirmationTracker(stub as unknown as Algodv2, (round) =>
+    rounds.push(round)
+  );
+}
+
+async function rejection(promise: Promise<unknown>): Promise<Error> {
+  try {
+    await promise;
+  } catch (error) {
+    return error as Error;
+  }
+  throw new Error("the promise was not rejected");
+}
+
+async function oneFollowForManyTransactions(): Promise<void> {
+  const stub = new StubAlgod();
+  const rounds: number[] = [];
+  const confirmations = tracker(stub, rounds);
+  const transactions = [1, 2, 3, 4, 5, 6].map((amount) =>
+    payment(stub, amount)
+  );
+  stub.confirmIn(11, ...transactions.slice(0, 3));
+  stub.confirmIn(13, ...transactions.slice(3));
+  const confirmed = await Promise.all(
+    transactions.map((transaction) => confirmations.wait(transaction, 10))
+  );
+  assert.deepStrictEqual(confirmed, [11, 11, 11, 13, 13, 13]);
+  // each block is read once and no transaction is looked up
+  assert.strictEqual(stub.count("pending"), 0);
+  for (const round of [10, 11, 12, 13]) {
+    assert.strictEqual(stub.count(`block ${round}`), 1);
+  }
+  assert.strictEqual(stub.count("block 14"), 0);
+  // the last round is asked for once, the tracker then waits for each block
+  assert.strictEqual(
+    stub.requests.filter((request) => request === "status").length,
+    1
+  );
+  // the rounds observed are reported, e.g. to refresh the suggested params
+  assert.deepStrictEqual(rounds, [10, 11, 12, 13]);
+}
+
+async function confirmedBeforeTheWait(): Promise<void> {
+  const stub = new StubAlgod();
+  const confirmations = tracker(stub);
+  const [earlier, later] = [1, 2].map((amount) => payment(stub, amount));
+  stub.confirmIn(11, earlier, later);
+  assert.strictEqual(await confirmations.wait(earlier, 10), 11);
+  // read in a recent block, no request is needed
+  const requests = stub.requests.length;
+  assert.strictEqual(await confirmations.wait(later, 10), 11);
+  assert.strictEqual(stub.requests.length, requests);
+}
+
+async function olderThanTheRecentRounds(): Promise<void> {
+  const stub = new StubAlgod();
+  const transaction = payment(stub, 1);
+  stub.confirmIn(11, transaction);
+  for (let round = 0; round < 20; round += 1) {
+    stub.endRound();
+  }
+  // its block is before the rounds the tracker reads, it is looked up once
+  assert.strictEqual(await tracker(stub).wait(transaction, 30), 11);
+  assert.strictEqual(stub.count("pending"), 1);
+  assert.strictEqual(stub.count("block 11"), 0);
+}
+
+async function droppedTransaction(): Promise<void> {
+  const stub = new StubAlgod();
+  const transaction = payment(stub, 1);
+  stub.pending.set(transaction.txID().toString(), {
+    "confirmed-round": 0,
+    "pool-error": "overspend",
+  });
+  const error = await rejection(tracker(stub).wait(transaction, 2));
+  assert.match(error.message, /rejected: overspend/);
+}
+
+async function confirmationTimeout(): Promise<void> {
+  const stub = new StubAlgod();
+  const transaction = payment(stub, 1);
+  const error = await rejection(tracker(stub).wait(transaction, 2));
+  assert.match(error.message, /not confirmed after 2 rounds/);
+  // the chain is followed for the rounds of the wait only
+  assert.ok(stub.lastRound <= 13);
+}
+
+async function algodErrorRejectsTheWaits(): Promise<void> {
+  const stub = new StubAlgod();
+  stub.block = () => ({
+    do: async () => {
+      throw new Error("connection refused");
+    },
+  });
+  const transactions = [1, 2].map((amount) => payment(stub, amount));
+  const confirmations = tracker(stub);
+  const errors = await Promise.all(
+    transactions.map((transaction) =>
+      rejection(confirmations.wait(transaction, 10))
+    )
+  );
+  errors.forEach((error) =>
+    assert.match(error.message, /connection refused/)
+  );
+}
+
+async function main(): Promise<void> {
+  const cases = [
+    oneFollowForManyTransactions,
+    confirmedBeforeTheWait,
+    olderThanTheRecentRounds,
+    droppedTransaction,
+    confirmationTimeout,
+    algodErrorRejectsTheWaits,
+  ];
+  for (const testCase of cases) {
+    await testCase();
+  }
+  console.log(`ConfirmationTracker: ${cases.length} cases passed`);
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -0,0 +1,80 @@
+import * as assert from "assert";
+import { promises as fs } from "fs";
+import * as path from "path";
+import ProgramTemplate, { TemplateValues } from "../src/algo/ProgramTemplate";
+
+// Instantiates the template of fixtures/program_template.json, whose programs
+// test_avm_template.py checks against the Python assembler.
+// Usage: yarn test
+const FIXTURE_FILE_PATH = path.join(__dirname, "fixtures", "program_template.json");
+
+type FixtureCase = {
+  ints: Record<string, number>;
+  bytes: Record<string, string>;
+  program: string;
+};
+
+function fixtureValues(fixtureCase: FixtureCase): TemplateValues {
+  const values: TemplateValues = { ...fixtureCase.ints };
+  for (const name of Object.keys(fixtureCase.bytes)) {
+    values[name] = new Uint8Array(
+      Buffer.from(fixtureCase.bytes[name], "base64")
+    );
+  }
+  return values;
+}
+
+function base64(program: Uint8Array): string {
+  return Buffer.from(program).toString("base64");
+}
+
+async function main(): Promise<void> {
+  const fixture = JSON.parse(await fs.readFile(FIXTURE_FILE_PATH, "utf8"));
+  const template = new ProgramTemplate(
+    new Uint8Array(Buffer.from(fixture.template.bytecode, "base64")),
+    fixture.template.variables
+  );
+  const cases: FixtureCase[] = fixture.cases;
+
+  // same bytes as the Python assembler, varint boundaries up to 2^53 - 1 included
+  for (const fixtureCase of cases) {
+    const values = fixtureValues(fixtureCase);
+    assert.strictEqual(base64(template.instantiate(values)), fixtureCase.program);
+    // cached per values
+    assert.strictEqual(template.instantiate(values), template.instantiate(values));
+  }
+
+  const values = fixtureValues(cases[0]);
+  // numbers from 2^53 on are not exact, the value could not be the one meant
+  assert.throws(
+    () => template.instantiate({ ...values, TMPL_AMOUNT: 2 ** 53 }),
+    /Invalid value of template variable TMPL_AMOUNT/
+  );
+  assert.throws(
+    () => template.instantiate({ ...values, TMPL_AMOUNT: -1 }),
+    /Invalid value/
+  );
+  assert.throws(
+    () => template.instantiate({ ...values, TMPL_AMOUNT: 1.5 }),
+    /Invalid value/
+  );
+  assert.throws(
+    () => template.instantiate({ ...values, TMPL_NOTE: 1 }),
+    /TMPL_NOTE must be bytes/
+  );
+  assert.throws(
+    () => template.instantiate({ ...values, TMPL_OTHER: 1 }),
+    /Unknown template variable TMPL_OTHER/
+  );
+  const { TMPL_WINDOW, ...missing } = values;
+  assert.throws(
+    () => template.instantiate(missing),
+    /No value for template variable TMPL_WINDOW/
+  );
+  console.log(`ProgramTemplate: ${cases.length} cases passed`);
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -0,0 +1,134 @@
+import * as assert from "assert";
+import { Algodv2, SuggestedParams } from "algosdk";
+import SuggestedParamsCache from "../src/algo/SuggestedParamsCache";
+
+// Fetches the params from a stub algod counting the requests, with the clock
+// under the test's control.
+// Usage: yarn test
+const ROUND_TIME_MS = 4000;
+
+class StubAlgod {
+  lastRound = 10;
+  requests = 0;
+  /**
+   * Error the next request fails with, if any
+   */
+  failure?: Error;
+
+  getTransactionParams() {
+    return {
+      do: async (): Promise<SuggestedParams> => {
+        this.requests += 1;
+        // answered after the callers of the same tick asked for the params
+        await new Promise((resolve) => setImmediate(resolve));
+        const failure = this.failure;
+        if (failure) {
+          this.failure = undefined;
+          throw failure;
+        }
+        return {
+          fee: 0,
+          firstRound: this.lastRound,
+          lastRound: this.lastRound + 1000,
+          genesisID: "fake-v1",
+          genesisHash: Buffer.alloc(32).toString("base64"),
+        };
+      },
+    };
+  }
+}
+
+let now = 1650000000000;
+Date.now = () => now;
+
+function cache(stub: StubAlgod): SuggestedParamsCache {
+  return new SuggestedParamsCache(stub as unknown as Algodv2);
+}
+
+async function concurrentCallersShareOneRequest(): Promise<void> {
+  const stub = new StubAlgod();
+  const params = cache(stub);
+  const answers = await Promise.all(
+    Array.from({ length: 10 }, () => params.get())
+  );
+  assert.strictEqual(stub.requests, 1);
+  answers.forEach((answer) => assert.strictEqual(answer.firstRound, 10));
+  await params.get();
+  assert.strictEqual(stub.requests, 1);
+}
+
+async function callersGetCopies(): Promise<void> {
+  const stub = new StubAlgod();
+  const params = cache(stub);
+  const answer = await params.get();
+  answer.fee = 5000;
+  answer.flatFee = true;
+  const next = await params.get();
+  assert.strictEqual(next.fee, 0);
+  assert.strictEqual(next.flatFee, undefined);
+}
+
+async function refreshedOnANewRound(): Promise<void> {
+  const stub = new StubAlgod();
+  const params = cache(stub);
+  await params.get();
+  // the round the params were fetched in is not newer
+  params.observeRound(10);
+  await params.get();
+  assert.strictEqual(stub.requests, 1);
+  stub.lastRound = 11;
+  params.observeRound(11);
+  assert.strictEqual((await params.get()).firstRound, 11);
+  assert.strictEqual(stub.requests, 2);
+}
+
+async function refreshedAfterARoundTime(): Promise<void> {
+  const stub = new StubAlgod();
+  const params = cache(stub);
+  await params.get();
+  now += ROUND_TIME_MS - 1;
+  await params.get();
+  assert.strictEqual(stub.requests, 1);
+  now += 1;
+  stub.lastRound = 12;
+  assert.strictEqual((await params.get()).firstRound, 12);
+  assert.strictEqual(stub.requests, 2);
+}
+
+async function failedRequestIsNotCached(): Promise<void> {
+  const stub = new StubAlgod();
+  const params = cache(stub);
+  stub.failure = new Error("connection refused");
+  const answers = await Promise.all(
+    [params.get(), params.get()].map((answer) =>
+      answer.then(
+        () => "fulfilled",
+        () => "rejected"
+      )
+    )
+  );
+  // the callers sharing the request share its failure
+  assert.deepStrictEqual(answers, ["rejected", "rejected"]);
+  assert.strictEqual(stub.requests, 1);
+  assert.strictEqual((await params.get()).firstRound, 10);
+  assert.strictEqual(stub.requests, 2);
+}
+
+async function main(): Promise<void> {
+  const cases = [
+    concurrentCallersShareOneRequest,
+    callersGetCopies,
+    refreshedOnANewRound,
+    refreshedAfterARoundTime,
+    failedRequestIsNotCached,
+  ];
+  for (const testCase of cases) {
+    await testCase();
+  }
+  console.log(`SuggestedParamsCache: ${cases.length} cases passed`);
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
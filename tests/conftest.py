@@ -0,0 +1,41 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# The contracts (src/contracts: avm, build, scenarios) and the client (src: plato_client) are run
+# from the source tree rather than installed, they are put on the path the way env.sample does.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT_DIR, "src"), os.path.join(ROOT_DIR, "src", "contracts")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture(scope="session")
+def dist_dir(tmp_path_factory) -> str:
+    """The contracts built once for the clients, which instantiate their programs from the build output."""
+    from build import build
+
+    out_dir = str(tmp_path_factory.mktemp("dist"))
+    build(out_dir)
+    return out_dir
+
+
+@pytest.fixture
+def with_fake_algod():
+    """Runs client_test(algod, fake) against a fake algod created with the given FakeAlgod arguments."""
+    from plato_client import AsyncAlgodClient
+    from plato_client.fake_algod import FakeAlgod
+
+    def run(client_test, **fake_options):
+        async def main():
+            fake = FakeAlgod(**fake_options)
+            url = await fake.start(port=0)
+            try:
+                async with AsyncAlgodClient(url) as algod:
+                    return await client_test(algod, fake)
+            finally:
+                await fake.close()
+        return asyncio.run(main())
+    return run
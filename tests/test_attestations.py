@@ -0,0 +1,169 @@
+import hashlib
+
+import pytest
+from algosdk import encoding
+
+from avm import LogicError, evaluate_group
+from avm.address import sha512_256
+from identity.app import ROOT_SLOTS
+from plato_client.attestations import Attestation, AttestationProof, AttestationTree, leaf_hash, proof_root, verify_proof
+from plato_client.events import decode_events
+from plato_client.identity import op_up_calls
+from scenarios import BUYER, CREATOR, STORE, USER_TYPE, app_call, identity_app, itob, load_programs, store_local_state
+
+# the attestation proven on chain, BUYER and STORE are opted in to the identity application
+ATTESTATION = Attestation(encoding.encode_address(BUYER), encoding.encode_address(STORE))
+
+
+def other_attestation(number: int) -> Attestation:
+    return Attestation(encoding.encode_address(sha512_256(b"buyer%d" % number)), encoding.encode_address(sha512_256(b"store%d" % number)))
+
+
+def attestations(count: int, index: int = 0):
+    """count attestations, ATTESTATION at index."""
+    return [ATTESTATION if number == index else other_attestation(number) for number in range(count)]
+
+
+def sha256(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def tampered(proof: AttestationProof, offset: int) -> AttestationProof:
+    siblings = bytearray(proof.siblings)
+    siblings[offset] ^= 1
+    return AttestationProof(proof.index, bytes(siblings))
+
+
+# -- trees
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 8, 9])
+def test_every_proof_verifies(count):
+    batch = attestations(count)
+    tree = AttestationTree.build(batch, jobs=1)
+    assert len(tree) == count
+    for index, attestation in enumerate(batch):
+        proof = tree.proof(index)
+        assert proof.depth == tree.depth
+        assert verify_proof(tree.root, attestation, proof)
+
+
+def test_odd_leaf_count():
+    batch = attestations(3)
+    tree = AttestationTree.build(batch, jobs=1)
+    leaves = [leaf_hash(attestation) for attestation in batch]
+    # the lone last leaf is paired with itself
+    assert tree.root == sha256(sha256(leaves[0] + leaves[1]) + sha256(leaves[2] + leaves[2]))
+    assert tree.proof(2).siblings == leaves[2] + sha256(leaves[0] + leaves[1])
+
+
+def test_single_leaf_tree():
+    tree = AttestationTree.build([ATTESTATION], jobs=1)
+    assert tree.depth == 0
+    assert tree.root == leaf_hash(ATTESTATION)
+    assert tree.proof(0) == AttestationProof(0, b"")
+    assert verify_proof(tree.root, ATTESTATION, tree.proof(0))
+
+
+def test_tampered_sibling():
+    tree = AttestationTree.build(attestations(5, index=2), jobs=1)
+    proof = tree.proof(2)
+    for level in range(proof.depth):
+        assert not verify_proof(tree.root, ATTESTATION, tampered(proof, level * 32))
+
+
+def test_wrong_index():
+    tree = AttestationTree.build(attestations(5, index=2), jobs=1)
+    proof = tree.proof(2)
+    assert not verify_proof(tree.root, ATTESTATION, AttestationProof(3, proof.siblings))
+    # an index past the leaves of the tree leads to no root
+    assert proof_root(ATTESTATION, AttestationProof(2 + (1 << proof.depth), proof.siblings)) == b""
+    assert not verify_proof(tree.root, other_attestation(1), proof)
+
+
+def test_save_and_load(tmp_path):
+    tree = AttestationTree.build(attestations(9, index=6), jobs=1)
+    tree.save(str(tmp_path / "batch.tree"))
+    loaded = AttestationTree.load(str(tmp_path / "batch.tree"))
+    assert (loaded.root, len(loaded)) == (tree.root, len(tree))
+    assert loaded.index(ATTESTATION) == 6
+    assert loaded.proof(6) == tree.proof(6)
+    with pytest.raises(KeyError):
+        loaded.index(other_attestation(100))
+    with pytest.raises(IndexError):
+        loaded.proof(9)
+
+
+def test_empty_tree():
+    with pytest.raises(ValueError, match="at least one"):
+        AttestationTree.build([], jobs=1)
+
+
+# -- the identity application
+
+def identity_ledger():
+    return identity_app(load_programs("identity"), buyer={b"type": USER_TYPE["buyer"]}, store=store_local_state())
+
+
+def post_root(ledger, app_id: int, tree: AttestationTree):
+    evaluate_group(ledger, [app_call(CREATOR, app_id, [b"att_root", tree.root, itob(len(tree))])])
+
+
+def prove(ledger, app_id: int, batch: int, proof: AttestationProof):
+    args = [b"sto_prf", BUYER, STORE, itob(batch), itob(proof.index), proof.siblings]
+    calls = [app_call(CREATOR, app_id, [b"op_up"], note=bytes([call])) for call in range(op_up_calls(proof.depth))]
+    return evaluate_group(ledger, [app_call(CREATOR, app_id, args, accounts=[BUYER, STORE])] + calls)[0]
+
+
+def attested(ledger, app_id: int) -> bool:
+    return BUYER in ledger.account(STORE).local_states[app_id][b"buyers0"]
+
+
+@pytest.mark.parametrize("count,index", [(1, 0), (3, 2), (9, 8), (1000, 517)])
+def test_contract_accepts_proofs(count, index):
+    ledger, app_id = identity_ledger()
+    tree = AttestationTree.build(attestations(count, index), jobs=1)
+    post_root(ledger, app_id, tree)
+    prove(ledger, app_id, 0, tree.proof(index))
+    assert attested(ledger, app_id)
+
+
+def test_contract_logs_the_store_and_the_buyer():
+    ledger, app_id = identity_ledger()
+    tree = AttestationTree.build(attestations(3, index=1), jobs=1)
+    post_root(ledger, app_id, tree)
+    events = list(decode_events(prove(ledger, app_id, 0, tree.proof(1)).logs))
+    assert [(event.type_name, event.account, event.amount) for event in events] == [
+        ("STORE_BUYER", STORE, 0),
+        ("BUYER_STORE", BUYER, 0),
+    ]
+
+
+@pytest.mark.parametrize("change", ["sibling", "index", "overflowing_index", "truncated"])
+def test_contract_rejects_bad_proofs(change):
+    ledger, app_id = identity_ledger()
+    tree = AttestationTree.build(attestations(5, index=2), jobs=1)
+    post_root(ledger, app_id, tree)
+    proof = tree.proof(2)
+    proof = {
+        "sibling": tampered(proof, 40),
+        "index": AttestationProof(3, proof.siblings),
+        "overflowing_index": AttestationProof(2 + (1 << proof.depth), proof.siblings),
+        "truncated": AttestationProof(2, proof.siblings[:-1]),
+    }[change]
+    with pytest.raises(LogicError):
+        prove(ledger, app_id, 0, proof)
+    assert not attested(ledger, app_id)
+
+
+def test_contract_rejects_rotated_batches():
+    ledger, app_id = identity_ledger()
+    trees = [AttestationTree.build(attestations(4, index=batch % 4), jobs=1) for batch in range(ROOT_SLOTS + 1)]
+    for tree in trees:
+        post_root(ledger, app_id, tree)
+    # the root of batch 0 was overwritten by the one of batch ROOT_SLOTS
+    with pytest.raises(LogicError):
+        prove(ledger, app_id, 0, trees[0].proof(0))
+    with pytest.raises(LogicError):
+        prove(ledger, app_id, ROOT_SLOTS + 1, trees[0].proof(0))
+    prove(ledger, app_id, 1, trees[1].proof(1))
+    assert attested(ledger, app_id)
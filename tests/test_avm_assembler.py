@@ -0,0 +1,93 @@
+import pytest
+
+from avm import AssemblerError, assemble, assemble_source, disassemble, parse
+from avm.assembler import decode_varint, encode_varint
+from build import CONTRACTS
+from scenarios import load_programs
+
+# Programs and the bytecode "goal clerk compile" assembles them to: single-use constants become
+# pushint/pushbytes, the others go into the constant blocks by decreasing frequency.
+GOAL_ASSEMBLED = [
+    ("#pragma version 5\nint 1\nreturn", "05810143"),
+    ("#pragma version 6\nint 1", "068101"),
+    # intcblock 7, intc_0, intc_0, +, pushint 300, ==
+    ("#pragma version 5\nint 7\nint 7\n+\nint 300\n==", "0520010722220881ac0212"),
+    # branches are int16 offsets from the end of the instruction
+    (
+        "#pragma version 5\ntxn OnCompletion\nbnz skip\nint 1\nreturn\nskip:\nint 0\nreturn",
+        "053119400003810143810043",
+    ),
+    # bytecblock "ab", bytec_0, bytec_0, concat, callsub f, len, return, f: pushbytes 0x01, concat, retsub
+    (
+        '#pragma version 5\nbyte "ab"\nbyte "ab"\nconcat\ncallsub f\nlen\nreturn\nf:\nbyte 0x01\nconcat\nretsub',
+        "05260102616228285088000215438001015089",
+    ),
+    ("#pragma version 5\ntxn Sender\nglobal CreatorAddress\n==", "053100320912"),
+    # the fifth constant of a block is referenced with intc 4
+    (
+        "#pragma version 5\n" + "\n".join(f"int {value}\nint {value}" for value in (10, 11, 12, 13, 14)) + "\n" + "+\n" * 9,
+        "0520050a0b0c0d0e" + "2222232324242525" + "21042104" + "08" * 9,
+    ),
+    ("#pragma version 6\nitxn_begin\nint pay\nitxn_field TypeEnum\nitxn_submit", "06b18101b210b3"),
+    ('#pragma version 5\nbyte "x"\nlog\nint 1\nextract 1 2', "05800178b08101570102"),
+]
+
+VARINTS = [
+    (0, "00"),
+    (127, "7f"),
+    (128, "8001"),
+    (300, "ac02"),
+    (2 ** 32, "8080808010"),
+    (2 ** 64 - 1, "ffffffffffffffffff01"),
+]
+
+
+@pytest.mark.parametrize("source,bytecode", GOAL_ASSEMBLED)
+def test_assemble_like_goal(source, bytecode):
+    assert assemble_source(source).hex() == bytecode
+
+
+@pytest.mark.parametrize("value,encoded", VARINTS)
+def test_varint(value, encoded):
+    assert encode_varint(value).hex() == encoded
+    assert decode_varint(bytes.fromhex(encoded), 0) == (value, len(encoded) // 2)
+    assert assemble_source(f"#pragma version 5\nint {value}").hex() == "0581" + encoded
+
+
+@pytest.mark.parametrize("source,bytecode", GOAL_ASSEMBLED)
+def test_disassemble_round_trip(source, bytecode):
+    assert assemble(disassemble(bytes.fromhex(bytecode))).hex() == bytecode
+
+
+@pytest.mark.parametrize("contract", [contract.name for contract in CONTRACTS if not contract.signature])
+def test_contract_round_trip(contract):
+    programs = load_programs(contract)
+    for program in (programs.approval, programs.clear):
+        bytecode = assemble(program)
+        assert assemble(disassemble(bytecode)) == bytecode
+
+
+def test_constants():
+    program = parse('#pragma version 5\nint 0x10\nint 010\nint NoOp\nint appl\nbyte base64(AQI=)\nbyte b32 AEBA\nbyte "\\x01\\n"')
+    assert [instruction.immediates[0] for instruction in program.instructions] == [16, 8, 0, 6, b"\x01\x02", b"\x01\x02", b"\x01\n"]
+
+
+@pytest.mark.parametrize("source", [
+    "#pragma version 5\nint 18446744073709551616",
+    "#pragma version 5\nb missing",
+    "#pragma version 5\nnot_an_op",
+    "#pragma version 5\ntxn NotAField",
+    "#pragma version 5\nextract 1",
+])
+def test_assembler_errors(source):
+    with pytest.raises(AssemblerError):
+        assemble_source(source)
+
+
+def test_disassemble_errors():
+    with pytest.raises(AssemblerError, match="unknown opcode"):
+        disassemble(bytes.fromhex("05ff"))
+    with pytest.raises(AssemblerError, match="middle of an instruction"):
+        disassemble(bytes.fromhex("05420001810143"))
+    with pytest.raises(AssemblerError, match="truncated"):
+        disassemble(bytes.fromhex("0581"))
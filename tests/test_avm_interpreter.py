@@ -0,0 +1,343 @@
+import hashlib
+
+import pytest
+
+from avm import Ledger, LogicError, Transaction, TransactionRejected, assemble, evaluate_group, parse
+from avm.address import application_address, logic_sig_address
+from avm.interpreter import APP_CALL_BUDGET, LOGIC_SIG_BUDGET, MAX_INNER_TXNS, MAX_LOG_CALLS, MAX_LOG_SIZE
+from avm.ledger import MIN_TXN_FEE
+
+CREATOR = b"\x01" * 32
+SENDER = b"\x02" * 32
+FUNDS = 10 ** 9
+
+
+def install(ledger: Ledger, source: str, version: int = 6) -> int:
+    app_id = ledger.install_app(CREATOR, parse(f"#pragma version {version}\n{source}"), parse(f"#pragma version {version}\nint 1"))
+    ledger.fund(application_address(app_id), FUNDS)
+    return app_id
+
+
+def call(app_id: int, **fields) -> Transaction:
+    return Transaction(type="appl", sender=SENDER, application_id=app_id, **fields)
+
+
+def new_ledger() -> Ledger:
+    ledger = Ledger()
+    ledger.fund(CREATOR, FUNDS)
+    ledger.fund(SENDER, FUNDS)
+    return ledger
+
+
+def run(source: str, version: int = 6, **fields):
+    """Result of one call to an application whose approval program is source."""
+    ledger = new_ledger()
+    return evaluate_group(ledger, [call(install(ledger, source, version), **fields)])[0]
+
+
+def logged(source: str) -> bytes:
+    """The bytes left on the stack by source."""
+    return run(f"{source}\nlog\nint 1").logs[0]
+
+
+def uint(source: str) -> int:
+    """The uint64 left on the stack by source."""
+    return int.from_bytes(logged(f"{source}\nitob"), "big")
+
+
+# -- opcode semantics
+
+@pytest.mark.parametrize("source,value", [
+    ("int 2\nint 3\n+", 5),
+    ("int 7\nint 3\n-", 4),
+    ("int 7\nint 2\n/", 3),
+    ("int 7\nint 3\n*", 21),
+    ("int 7\nint 3\n%", 1),
+    ("int 1\nint 63\nshl", 2 ** 63),
+    ("int 256\nint 4\nshr", 16),
+    ("int 2\nint 10\nexp", 1024),
+    ("int 17\nsqrt", 4),
+    ("int 255\nbitlen", 8),
+    ("int 3\nint 5\n<", 1),
+    ("int 3\nint 5\n>=", 0),
+    ("int 0\nint 1\n||", 1),
+    ("int 2\nint 0\n&&", 0),
+    ("int 0\n!", 1),
+    ("int 12\nint 10\n&", 8),
+    ("int 12\nint 10\n|", 14),
+    ("int 12\nint 10\n^", 6),
+    ("int 0\n~", 2 ** 64 - 1),
+    ("byte 0x0102\nbtoi", 258),
+    ("byte 0x\nbtoi", 0),
+    ('byte "abc"\nlen', 3),
+    ('byte "abc"\nint 1\ngetbyte', ord("b")),
+    ("byte 0x80\nint 0\ngetbit", 1),
+    ("int 1\nint 2\nint 0\nselect", 1),
+    ("int 1\nint 2\nint 5\nselect", 2),
+    ("int 5\nint 2\ndig 1\n+\n+", 12),
+    ("int 1\nint 2\nswap\npop", 2),
+    ("int 1\nint 2\nint 3\ncover 2\npop\npop", 3),
+    ("int 1\nint 2\nint 3\nuncover 2\nswap\npop\nswap\npop", 1),
+    ("byte 0x00000000000000ff000000000000000a\nint 8\nextract_uint64", 10),
+    ("byte 0x0001\nint 0\nextract_uint16", 1),
+    ("int 3\nstore 7\nload 7", 3),
+    ("int 5\nint 7\nstore 5\nloads", 7),
+    ("byte 0x01\nbyte 0x01\n==", 1),
+    ("byte 0x01\nint 1\nitob\n!=", 1),
+    ("global GroupSize", 1),
+    ("global MinTxnFee", MIN_TXN_FEE),
+    ("txn Fee", MIN_TXN_FEE),
+    (f"int {2 ** 64 - 1}\nint 2\nmulw\npop", 1),
+    (f"int {2 ** 64 - 1}\nint 2\nmulw\nswap\npop", 2 ** 64 - 2),
+    (f"int {2 ** 64 - 1}\nint 3\naddw\npop", 1),
+    (f"int {2 ** 64 - 1}\nint 3\naddw\nswap\npop", 2),
+])
+def test_uint_ops(source, value):
+    assert uint(source) == value
+
+
+@pytest.mark.parametrize("source,value", [
+    ("int 1\nitob", (1).to_bytes(8, "big")),
+    ('byte "ab"\nbyte "cd"\nconcat', b"abcd"),
+    ('byte "abcdef"\nsubstring 1 3', b"bc"),
+    ('byte "abcdef"\nint 2\nint 5\nsubstring3', b"cde"),
+    ('byte "abcdef"\nextract 1 2', b"bc"),
+    ('byte "abcdef"\nextract 2 0', b"cdef"),
+    ('byte "abcdef"\nint 4\nint 2\nextract3', b"ef"),
+    ("byte 0x00\nint 0\nint 255\nsetbyte", b"\xff"),
+    ("byte 0x00\nint 7\nint 1\nsetbit", b"\x01"),
+    ("int 3\nbzero", b"\x00\x00\x00"),
+    ('byte "abc"\nsha256', hashlib.sha256(b"abc").digest()),
+    ('byte "abc"\nsha512_256', hashlib.new("sha512_256", b"abc").digest()),
+    ("byte 0xff\nbyte 0x01\nb+", b"\x01\x00"),
+    ("byte 0x0100\nbyte 0x01\nb-", b"\xff"),
+    ("byte 0x0a\nbyte 0x03\nb*", b"\x1e"),
+    ("byte 0x0a\nbyte 0x03\nb/", b"\x03"),
+    ("byte 0x0f\nbyte 0xf0\nb|", b"\xff"),
+    ("byte 0x0f\nbyte 0x00ff\nb&", b"\x00\x0f"),
+    ("byte 0x00\nb~", b"\xff"),
+    ('method "add(uint64,uint64)uint128"', bytes.fromhex("8aa3b61f")),
+])
+def test_bytes_ops(source, value):
+    assert logged(source) == value
+
+
+@pytest.mark.parametrize("source,error", [
+    (f"int {2 ** 64 - 1}\nint 1\n+", "overflow"),
+    ("int 0\nint 1\n-", "underflow"),
+    (f"int {2 ** 32}\nint {2 ** 32}\n*", "overflow"),
+    ("int 1\nint 0\n/", "/ 0"),
+    ("int 1\nint 0\n%", "% 0"),
+    ("int 2\nint 64\nexp", "overflow"),
+    ("byte 0x010203040506070809\nbtoi", "btoi"),
+    ('byte "abc"\nextract 2 5', "beyond length"),
+    ('byte "abc"\nsubstring 2 1', "end before start"),
+    ('byte "abc"\nint 1\n+', "uint64 expected"),
+    ("int 1\nint 1\nconcat", "bytes expected"),
+    ("int 0\nassert\nint 1", "assert failed"),
+    ("err", "err opcode"),
+    ("pop", "stack underflow"),
+    ("int 1\nint 1", "stack finished with 2 values"),
+    ("int 4097\nbzero", "too large"),
+    ("byte 0x01\nint 4096\nbzero\nconcat", "too big"),
+    ("byte 0x00\nbyte 0x00\nb/", "zero"),
+    ("retsub", "retsub"),
+])
+def test_failing_ops(source, error):
+    with pytest.raises(LogicError, match=error):
+        run(source)
+
+
+def test_version_gate():
+    # itxn_next is a TEAL v6 opcode, log a v5 one
+    with pytest.raises(LogicError, match="not available in TEAL v5"):
+        run("itxn_begin\nitxn_next\nint 1", version=5)
+    with pytest.raises(LogicError, match="not available in TEAL v4"):
+        run('byte "x"\nlog\nint 1', version=4)
+
+
+def test_return_and_reject():
+    assert run("int 5\nint 1\nreturn\nerr").cost == 3
+    with pytest.raises(TransactionRejected):
+        run("int 0")
+
+
+def test_subroutines():
+    assert uint("int 3\ncallsub double\ncallsub double\nb end\ndouble:\nint 2\n*\nretsub\nend:") == 12
+
+
+def test_state():
+    source = 'byte "k"\nint 5\napp_global_put\nint 0\nbyte "k"\napp_global_get_ex\nassert\nbyte "k"\napp_global_get\n==\n'
+    ledger = new_ledger()
+    app_id = install(ledger, source)
+    ledger.app(app_id).global_schema = (1, 0)
+    evaluate_group(ledger, [call(app_id)])
+    assert ledger.app(app_id).global_state == {b"k": 5}
+
+
+def test_state_schema():
+    with pytest.raises(LogicError, match="exceeds schema"):
+        run('byte "k"\nint 5\napp_global_put\nint 1')
+
+
+def test_failed_group_leaves_ledger_untouched():
+    ledger = new_ledger()
+    app_id = install(ledger, 'itxn_begin\nint pay\nitxn_field TypeEnum\ntxn Sender\nitxn_field Receiver\nint 5\nitxn_field Amount\nitxn_submit\nint 0')
+    balances = {address: account.balance for address, account in ledger.accounts.items()}
+    with pytest.raises(TransactionRejected):
+        evaluate_group(ledger, [call(app_id)])
+    assert {address: account.balance for address, account in ledger.accounts.items()} == balances
+    assert not ledger.snapshots
+
+
+# -- opcode budget
+
+def costing(cost: int) -> str:
+    """A program of the given opcode cost (odd, at least 1)."""
+    return "int 1\npop\n" * ((cost - 1) // 2) + "int 1"
+
+
+def test_budget_of_one_call():
+    assert run(costing(APP_CALL_BUDGET - 1)).cost == APP_CALL_BUDGET - 1
+    with pytest.raises(LogicError, match="budget exceeded"):
+        run(costing(APP_CALL_BUDGET + 1))
+
+
+def test_budget_is_pooled_across_the_group():
+    ledger = new_ledger()
+    expensive, cheap = install(ledger, costing(APP_CALL_BUDGET + 301)), install(ledger, costing(1))
+    results = evaluate_group(ledger, [call(expensive), call(cheap)])
+    assert [result.cost for result in results] == [APP_CALL_BUDGET + 301, 1]
+    # the second call only has what the first left of the pooled budget
+    second = install(ledger, costing(APP_CALL_BUDGET - 299))
+    with pytest.raises(LogicError, match="budget exceeded"):
+        evaluate_group(ledger, [call(expensive), call(second)])
+
+
+def test_payments_add_no_budget():
+    ledger = new_ledger()
+    app_id = install(ledger, costing(APP_CALL_BUDGET + 1))
+    payment = Transaction(type="pay", sender=SENDER, receiver=CREATOR, amount=1)
+    with pytest.raises(LogicError, match="budget exceeded"):
+        evaluate_group(ledger, [call(app_id), payment])
+
+
+# -- inner transactions
+
+def payments(count: int, amount: int = 1, grouped: bool = False) -> str:
+    """count inner payments to the sender, one itxn group when grouped."""
+    payment = f"int pay\nitxn_field TypeEnum\ntxn Sender\nitxn_field Receiver\nint {amount}\nitxn_field Amount\n"
+    if grouped:
+        return "itxn_begin\n" + "itxn_next\n".join([payment] * count) + "itxn_submit\nint 1"
+    return f"itxn_begin\n{payment}itxn_submit\n" * count + "int 1"
+
+
+def app_balance_change(source: str, version: int = 6, fee: int = MIN_TXN_FEE) -> int:
+    ledger = new_ledger()
+    app_id = install(ledger, source, version)
+    evaluate_group(ledger, [call(app_id, fee=fee)])
+    return ledger.account(application_address(app_id)).balance - FUNDS
+
+
+def test_inner_fee_paid_by_the_app():
+    assert app_balance_change(payments(1, 5)) == -5 - MIN_TXN_FEE
+
+
+def test_inner_fee_covered_by_the_outer_fee():
+    # from TEAL v6 the inner fee defaults to what the fees of the group do not already cover
+    assert app_balance_change(payments(1, 5), fee=2 * MIN_TXN_FEE) == -5
+    assert app_balance_change(payments(3, 5, grouped=True), fee=3 * MIN_TXN_FEE) == -15 - MIN_TXN_FEE
+    # before v6 the app always pays the minimum fee
+    assert app_balance_change(payments(1, 5), version=5, fee=2 * MIN_TXN_FEE) == -5 - MIN_TXN_FEE
+
+
+def test_inner_fee_too_small():
+    source = "itxn_begin\nint pay\nitxn_field TypeEnum\ntxn Sender\nitxn_field Receiver\nint 0\nitxn_field Fee\nitxn_submit\nint 1"
+    assert app_balance_change(source, fee=2 * MIN_TXN_FEE) == 0
+    with pytest.raises(LogicError, match="fee too small"):
+        app_balance_change(source)
+
+
+def test_inner_transaction_limit():
+    assert len(run(payments(MAX_INNER_TXNS)).inner_txns) == MAX_INNER_TXNS
+    assert len(run(payments(MAX_INNER_TXNS, grouped=True)).inner_txns) == MAX_INNER_TXNS
+    with pytest.raises(LogicError, match="too many inner transactions"):
+        run(payments(MAX_INNER_TXNS + 1))
+    with pytest.raises(LogicError, match="too many inner transactions"):
+        run(payments(MAX_INNER_TXNS + 1, grouped=True))
+
+
+def test_inner_receiver_must_be_available():
+    source = "itxn_begin\nint pay\nitxn_field TypeEnum\nglobal CreatorAddress\nitxn_field Receiver\nitxn_submit\nint 1"
+    with pytest.raises(LogicError, match="invalid Account reference"):
+        run(source)
+    assert len(run(source, accounts=[CREATOR]).inner_txns) == 1
+
+
+def test_inner_transfer_below_min_balance():
+    with pytest.raises(LogicError, match="below min"):
+        run(payments(1, FUNDS - 50000))
+
+
+# -- logs
+
+def test_log_limits():
+    assert len(run('byte "x"\nlog\n' * MAX_LOG_CALLS + "int 1").logs) == MAX_LOG_CALLS
+    with pytest.raises(LogicError, match="too many log calls"):
+        run('byte "x"\nlog\n' * (MAX_LOG_CALLS + 1) + "int 1")
+    assert run(f"int {MAX_LOG_SIZE}\nbzero\nlog\nint 1").logs == [bytes(MAX_LOG_SIZE)]
+    with pytest.raises(LogicError, match="log size exceeded"):
+        run(f"int {MAX_LOG_SIZE - 1}\nbzero\nlog\nbyte 0x0000\nlog\nint 1")
+
+
+# -- logic signatures
+
+def signed_payment(ledger: Ledger, source: str, **fields) -> Transaction:
+    """A payment to the creator from the funded address of the logic signature source."""
+    program = parse(f"#pragma version 6\n{source}")
+    sender = logic_sig_address(assemble(program))
+    ledger.fund(sender, FUNDS)
+    return Transaction(type="pay", sender=sender, receiver=CREATOR, amount=1, logic_sig=program, **fields)
+
+
+def test_logic_sig_approves_its_transaction():
+    ledger = new_ledger()
+    payment = signed_payment(ledger, "arg 0\nbtoi\ntxn Amount\n==\nglobal GroupSize\nint 1\n==\n&&", logic_sig_args=[b"\x01"])
+    evaluate_group(ledger, [payment])
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        evaluate_group(ledger, [payment.copy(amount=2)])
+    with pytest.raises(LogicError, match="cannot load arg"):
+        evaluate_group(ledger, [payment.copy(logic_sig_args=[])])
+
+
+def test_logic_sig_sender_is_its_address():
+    ledger = new_ledger()
+    payment = signed_payment(ledger, "int 1")
+    with pytest.raises(LogicError, match="address of its logic signature"):
+        evaluate_group(ledger, [payment.copy(sender=SENDER)])
+
+
+@pytest.mark.parametrize("source", [
+    'byte "x"\nlog\nint 1',
+    "txn Sender\nbalance",
+    "global CurrentApplicationID",
+])
+def test_logic_sig_mode(source):
+    ledger = new_ledger()
+    with pytest.raises(LogicError, match="only available to applications"):
+        evaluate_group(ledger, [signed_payment(ledger, source)])
+
+
+def test_arg_is_only_available_to_logic_sigs():
+    with pytest.raises(LogicError, match="only available to logic signatures"):
+        run("arg 0")
+
+
+def test_logic_sig_budget():
+    ledger = new_ledger()
+    app_id = install(ledger, costing(1))
+    # each logic signature has its own budget, which the application calls do not share
+    payment = signed_payment(ledger, costing(LOGIC_SIG_BUDGET - 1))
+    assert [result.cost for result in evaluate_group(ledger, [payment, call(app_id)])] == [0, 1]
+    with pytest.raises(LogicError, match="budget exceeded"):
+        evaluate_group(ledger, [signed_payment(ledger, costing(LOGIC_SIG_BUDGET + 1))])
@@ -0,0 +1,204 @@
+import pytest
+
+from avm import AssemblerError, Ledger, LedgerError, LogicError, Transaction, evaluate_group, optimize, optimize_with_report, parse
+from avm import optimizer
+from avm.address import application_address
+from scenarios import SCENARIOS, load_programs
+
+CREATOR = b"\x01" * 32
+SENDER = b"\x02" * 32
+FUNDS = 10 ** 9
+# txn Fee values the programs are run with, to take both sides of their branches
+FEES = (0, 1000, 2000)
+
+
+def program(source: str) -> str:
+    return f"#pragma version 6\n{source}"
+
+
+def optimized_lines(source: str):
+    """The optimized program without its pragma."""
+    return optimize(program(source)).splitlines()[1:]
+
+
+def outcome(teal: str, fee: int):
+    ledger = Ledger()
+    ledger.fund(SENDER, FUNDS)
+    app_id = ledger.install_app(CREATOR, parse(teal), parse(program("int 1")))
+    ledger.fund(application_address(app_id), FUNDS)
+    try:
+        evaluate_group(ledger, [Transaction(type="appl", sender=SENDER, application_id=app_id, fee=fee)])
+    except (LogicError, LedgerError) as e:
+        return type(e)
+    return "approved"
+
+
+def assert_equivalent(source: str):
+    for fee in FEES:
+        assert outcome(optimize(program(source)), fee) == outcome(program(source), fee)
+
+
+# -- constant folding
+
+@pytest.mark.parametrize("source,lines", [
+    ("int 2\nint 3\n+\nreturn", ["int 5", "return"]),
+    ("int 0\n!\nreturn", ["int 1", "return"]),
+    ('byte "abc"\nlen\nreturn', ["int 3", "return"]),
+    ('byte "ab"\nbyte "cd"\nconcat\nlen\nreturn', ["int 4", "return"]),
+    ("txn Sender\ntxn Sender\n==\nreturn", ["txn Sender", "dup", "==", "return"]),
+])
+def test_fold(source, lines):
+    assert optimized_lines(source) == lines
+    assert_equivalent(source)
+
+
+@pytest.mark.parametrize("source", [
+    f"int {2 ** 64 - 1}\nint 1\n+\nreturn",
+    f"int {2 ** 63}\nint 2\n*\nreturn",
+    "int 1\nint 2\n-\nreturn",
+    "int 1\nint 0\n/\nreturn",
+    "int 1\nint 0\n%\nreturn",
+])
+def test_no_fold_of_failing_ops(source):
+    # the program must still fail at run time, not be folded into a constant
+    assert optimized_lines(source)[-2] == source.splitlines()[-2]
+    assert_equivalent(source)
+    assert outcome(optimize(program(source)), 1000) is LogicError
+
+
+def test_no_fold_of_template_variables():
+    assert optimized_lines("int TMPL_X\nint 1\n+\nreturn") == ["int TMPL_X", "int 1", "+", "return"]
+
+
+# -- branches
+
+@pytest.mark.parametrize("source,lines", [
+    # If(c, Int(1), Int(0)) is c != 0, or c itself after a boolean op
+    ("txn Fee\nbnz l1\nint 0\nb l2\nl1:\nint 1\nl2:\nreturn", ["txn Fee", "int 0", "!=", "return"]),
+    ("txn Fee\nint 1000\n>\nbnz l1\nint 0\nb l2\nl1:\nint 1\nl2:\nreturn", ["txn Fee", "int 1000", ">", "return"]),
+])
+def test_collapse_boolean_if(source, lines):
+    assert optimized_lines(source) == lines
+    assert_equivalent(source)
+
+
+@pytest.mark.parametrize("source,lines", [
+    # a branch to an unconditional branch goes to its target
+    ("txn Fee\nbnz a\nint 1\nreturn\na:\nb c\nint 7\nc:\nint 2\nreturn", ["txn Fee", "bnz c", "int 1", "return", "c:", "int 2", "return"]),
+    # b to a return is the return
+    ("txn Fee\nb end\nint 3\nend:\nreturn", ["txn Fee", "return"]),
+    # conditional branches on constants
+    ("int 1\nbnz a\nerr\na:\nint 1\nreturn", ["int 1", "return"]),
+    ("int 0\nbnz a\nint 1\nreturn\na:\nerr", ["int 1", "return"]),
+    # a conditional branch to the next instruction only pops its condition
+    ("txn Fee\nbz a\na:\nint 1\nreturn", ["txn Fee", "pop", "int 1", "return"]),
+])
+def test_simplify_branches(source, lines):
+    assert optimized_lines(source) == lines
+    assert_equivalent(source)
+
+
+def test_remove_dead_code():
+    source = "int 1\nreturn\nint 2\npop\nunused:\nint 3\nreturn"
+    assert optimized_lines(source) == ["int 1", "return"]
+
+
+def test_keep_reachable_labels():
+    source = "txn Fee\nbz zero\nint 1\nreturn\nzero:\nint 2\nreturn"
+    assert optimized_lines(source) == source.splitlines()
+    assert_equivalent(source)
+
+
+# -- subroutines
+
+SUBROUTINE_BODY = "dup\nbnz {0}_1\nint 5\n+\nint 6\n*\n{0}_1:\nint 3\n+\nretsub"
+
+
+def test_inline_short_subroutine():
+    source = "txn Fee\ncallsub f\nreturn\nf:\nint 2\n+\nretsub"
+    assert optimized_lines(source) == ["txn Fee", "int 2", "+", "return"]
+    assert_equivalent(source)
+
+
+def test_merge_duplicate_subroutines():
+    source = "\n".join([
+        "txn Fee\ncallsub f\ntxn FirstValid\ncallsub g\n+\nreturn",
+        "f:", SUBROUTINE_BODY.format("f"),
+        "g:", SUBROUTINE_BODY.format("g"),
+    ])
+    lines = optimized_lines(source)
+    assert lines.count("callsub f") == 2
+    assert "g:" not in lines and "g_1:" not in lines
+    assert "f_1:" in lines
+    assert_equivalent(source)
+
+
+def test_no_merge_of_subroutines_entered_from_outside():
+    # g_1 is a branch target outside of g, so g must stay
+    source = "\n".join([
+        "txn Fee\nbz g_1\ntxn Fee\ncallsub f\ntxn FirstValid\ncallsub g\n+\nreturn",
+        "f:", SUBROUTINE_BODY.format("f"),
+        "g:", SUBROUTINE_BODY.format("g"),
+    ])
+    lines = optimized_lines(source)
+    assert "g:" in lines and "g_1:" in lines
+    assert_equivalent(source)
+
+
+# -- report
+
+def test_report():
+    teal, report = optimize_with_report(program("int 2\nint 3\n+\nreturn"))
+    assert teal == optimize(program("int 2\nint 3\n+\nreturn"))
+    assert (report.opcodes_before, report.opcodes_after) == (4, 2)
+    assert report.bytes_after < report.bytes_before
+
+
+def test_report_falls_back_to_the_original(monkeypatch):
+    source = program("int 2\nint 3\n+\nreturn")
+    monkeypatch.setattr(optimizer, "optimize", lambda teal: program("b missing"))
+    teal, report = optimize_with_report(source)
+    assert teal == source
+    assert (report.bytes_before, report.opcodes_before) == (report.bytes_after, report.opcodes_after)
+
+
+def test_report_of_a_broken_program():
+    with pytest.raises(AssemblerError):
+        optimize_with_report(program("b missing"))
+
+
+# -- scenarios
+
+def ledger_state(ledger: Ledger):
+    return (
+        {
+            address: (
+                account.balance,
+                {asset_id: (holding.amount, holding.frozen) for asset_id, holding in account.assets.items()},
+                account.local_states,
+            )
+            for address, account in ledger.accounts.items()
+        },
+        {app_id: app.global_state for app_id, app in ledger.apps.items()},
+        sorted(ledger.assets),
+    )
+
+
+def scenario_outcome(scenario, optimized: bool):
+    ledger, txns = scenario.setup(load_programs(scenario.contract, optimized))
+    try:
+        results = evaluate_group(ledger, txns)
+    except (LogicError, LedgerError) as e:
+        return type(e)
+    return (
+        [result.logs for result in results],
+        [[vars(txn) for txn in result.inner_txns] for result in results],
+        ledger_state(ledger),
+    )
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS, ids=lambda scenario: f"{scenario.contract}:{scenario.path}")
+def test_scenario_equivalence(scenario, monkeypatch):
+    # The optimized programs cost less, the budget is lifted so that only their effects are compared.
+    monkeypatch.setattr("avm.interpreter.APP_CALL_BUDGET", 10 ** 6)
+    assert scenario_outcome(scenario, True) == scenario_outcome(scenario, False)
@@ -0,0 +1,82 @@
+import base64
+import json
+import os
+
+import pytest
+
+from avm import AssemblerError, Template, assemble, assemble_template_source, instantiate, parse, substitute
+from avm.assembler import create_constant_blocks
+from build import CONTRACTS, build_contract, template_file_name
+
+# Shared with tests/ProgramTemplate.test.ts, which instantiates the same template in TypeScript.
+FIXTURE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "program_template.json")
+
+with open(FIXTURE_FILE, encoding="UTF-8") as f:
+    FIXTURE = json.load(f)
+
+
+def fixture_values(case):
+    values = dict(case["ints"])
+    values.update({name: base64.b64decode(value) for name, value in case["bytes"].items()})
+    return values
+
+
+def assembled(source: str, values) -> bytes:
+    """The substituted program assembled with the constant blocks of its template.
+
+    A template keeps its variables in the intcblock/bytecblock even when they are used once, so
+    the reference is the substituted TEAL with those blocks written out, which goal assembles
+    as is, rather than the TEAL where single-use values would become pushint/pushbytes."""
+    return assemble(substitute(create_constant_blocks(parse(source)), values))
+
+
+def test_fixture_template():
+    assert json.loads(assemble_template_source(FIXTURE["source"]).to_json()) == FIXTURE["template"]
+
+
+@pytest.mark.parametrize("case", FIXTURE["cases"])
+def test_fixture_cases(case):
+    template = Template.from_json(json.dumps(FIXTURE["template"]))
+    program = instantiate(template, fixture_values(case))
+    assert program == base64.b64decode(case["program"])
+    assert program == assembled(FIXTURE["source"], fixture_values(case))
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 16383, 16384, 2 ** 32 - 1, 2 ** 32, 2 ** 53, 2 ** 64 - 1])
+def test_int_boundaries(value):
+    source = "#pragma version 6\nint TMPL_A\nint 2\n+\nint 2\n==\nbnz ok\nerr\nok:\nint 1"
+    assert instantiate(assemble_template_source(source), {"TMPL_A": value}) == assembled(source, {"TMPL_A": value})
+
+
+@pytest.mark.parametrize("length", [0, 1, 127, 128, 300])
+def test_bytes_boundaries(length):
+    source = "#pragma version 6\nbyte TMPL_B\nlen\nbyte 0x01\nbyte 0x01\n==\nbnz ok\nerr\nok:\npop\nint 1"
+    value = bytes(range(256)) * 2
+    assert instantiate(assemble_template_source(source), {"TMPL_B": value[:length]}) == assembled(source, {"TMPL_B": value[:length]})
+
+
+@pytest.mark.parametrize("contract", [contract for contract in CONTRACTS if contract.templates], ids=lambda contract: contract.name)
+def test_contract_templates(contract):
+    files, _ = build_contract(contract)
+    for file_name, _ in contract.programs:
+        template = Template.from_json(files[template_file_name(file_name)])
+        values = {
+            variable.name: 2 ** 40 + index if variable.type == "int" else bytes([index]) * 32
+            for index, variable in enumerate(template.variables)
+        }
+        assert instantiate(template, values) == assembled(files[file_name], values)
+
+
+def test_instantiate_errors():
+    template = Template.from_json(json.dumps(FIXTURE["template"]))
+    values = fixture_values(FIXTURE["cases"][0])
+    with pytest.raises(AssemblerError, match="no value"):
+        instantiate(template, {name: value for name, value in values.items() if name != "TMPL_NOTE"})
+    with pytest.raises(AssemblerError, match="unknown template variables"):
+        instantiate(template, dict(values, TMPL_OTHER=1))
+    with pytest.raises(AssemblerError, match="must be a uint64"):
+        instantiate(template, dict(values, TMPL_AMOUNT=2 ** 64))
+    with pytest.raises(AssemblerError, match="must be bytes"):
+        instantiate(template, dict(values, TMPL_NOTE=1))
+    with pytest.raises(AssemblerError, match="both as an int and as bytes"):
+        assemble_template_source("#pragma version 6\nint TMPL_X\nbyte TMPL_X\npop")
@@ -0,0 +1,27 @@
+import ast
+import os
+
+import pytest
+
+from build import CONTRACTS, CONTRACTS_DIR
+
+
+def local_imports(source: str):
+    """The local modules a contract source imports, relative to CONTRACTS_DIR."""
+    source_dir = os.path.dirname(source)
+    with open(os.path.join(CONTRACTS_DIR, source), encoding="UTF-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module:
+            path = node.module.replace(".", "/") + ".py"
+            # siblings are imported by bare name ("from enums import *"), see build.load_contract_module
+            for candidate in (os.path.join(source_dir, path), path):
+                if os.path.isfile(os.path.join(CONTRACTS_DIR, candidate)):
+                    yield candidate
+                    break
+
+
+@pytest.mark.parametrize("contract", CONTRACTS, ids=lambda contract: contract.name)
+def test_dependencies_cover_local_imports(contract):
+    # a module missing from the dependencies would not invalidate the build manifest when it changes
+    assert set(local_imports(contract.source)) <= set(contract.dependencies)
@@ -0,0 +1,328 @@
+import asyncio
+
+import pytest
+from algosdk import account, encoding, transaction
+
+from plato_client import (
+    ConfirmationTimeout, DeliveryClient, HttpError, IdentityClient, LogicSigDeliveryClient, LogicSigOrder, Referral, RewardClient,
+    TransactionRejected,
+)
+from plato_client.account import Account
+from plato_client.algod import RECENT_ROUNDS
+from plato_client.events import transaction_events
+from plato_client.loadgen import deploy_identity
+from scenarios import REWARD_GLOBAL_SCHEMA, REWARD_LOCAL_SCHEMA, REWARD_TABLE, itob, load_programs
+
+FUNDS = 10 ** 12
+ASSET_TOTAL = 10 ** 9
+# the first asset of the genesis
+ASSET_ID = 1
+ORDER_AMOUNT = 500000
+COURIER_REWARD_AMOUNT = 100000
+TIPS_AMOUNT = 10
+
+
+def new_account() -> Account:
+    private_key, address = account.generate_account()
+    return Account(address, private_key)
+
+
+def genesis(*accounts: Account):
+    """FakeAlgod arguments funding the accounts, the first one holds the asset of the genesis."""
+    return {"genesis": {party.address: FUNDS for party in accounts}, "assets": [(accounts[0].address, ASSET_TOTAL)]}
+
+
+async def opt_in_asset(algod, *parties: Account):
+    params = await algod.suggested_params()
+    await asyncio.gather(*(
+        algod.send_and_confirm([party.sign(transaction.AssetOptInTxn(party.address, params, ASSET_ID))])
+        for party in parties
+    ))
+
+
+def balance(fake, party: Account) -> int:
+    return fake.ledger.account(encoding.decode_address(party.address)).balance
+
+
+def requested_paths(fake):
+    """Records the paths the fake algod is asked for."""
+    paths = []
+    respond = fake.respond
+
+    async def recording_respond(method, target, headers, body):
+        paths.append(target.split("?", 1)[0])
+        return await respond(method, target, headers, body)
+
+    fake.respond = recording_respond
+    return paths
+
+
+# -- confirmations
+
+def test_confirmations_read_blocks(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        paths = requested_paths(fake)
+        params = await algod.suggested_params()
+        payments = [transaction.PaymentTxn(sender.address, params, receiver.address, amount) for amount in range(1, 21)]
+        results = await asyncio.gather(*(algod.send_and_confirm([sender.sign(txn)]) for txn in payments))
+        assert all(result["confirmed-round"] for result in results)
+        assert not [path for path in paths if path.startswith("/v2/transactions/pending/")]
+        assert len([path for path in paths if path.startswith("/v2/blocks/")]) <= fake.last_round + 1
+
+    with_fake_algod(client_test, **genesis(sender, receiver))
+
+
+def test_confirmation_before_the_wait(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        txn = transaction.PaymentTxn(sender.address, await algod.suggested_params(), receiver.address, 1)
+        txid = await algod.send_transactions([sender.sign(txn)])
+        for _ in range(RECENT_ROUNDS + 2):
+            await fake.end_round()
+        # the transaction may be in a block older than those read, it is looked up once
+        paths = requested_paths(fake)
+        assert (await algod.wait_for_confirmation(txid))["confirmed-round"] == fake.last_round - RECENT_ROUNDS - 1
+        assert paths.count(f"/v2/transactions/pending/{txid}") == 1
+        assert "/v2/blocks/1" not in paths
+
+    with_fake_algod(client_test, **genesis(sender, receiver))
+
+
+def test_dropped_transaction(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        txn = transaction.PaymentTxn(sender.address, await algod.suggested_params(), receiver.address, 1)
+        with pytest.raises(TransactionRejected, match="injected drop"):
+            await algod.send_and_confirm([sender.sign(txn)], max_rounds=2)
+        fake.drop_rate = 0
+        txn = transaction.PaymentTxn(sender.address, await algod.suggested_params(), receiver.address, 2)
+        await algod.send_and_confirm([sender.sign(txn)])
+
+    with_fake_algod(client_test, round_time=0.05, drop_rate=1, **genesis(sender, receiver))
+
+
+def test_confirmation_timeout(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        txn = transaction.PaymentTxn(sender.address, await algod.suggested_params(), receiver.address, 1)
+        txid = await algod.send_transactions([sender.sign(txn)])
+        # no longer pending nor confirmed, e.g. forgotten by the node
+        del fake.transactions[txid]
+        fake.open_round.clear()
+        fake.open_block.clear()
+        fake.block_txns.clear()
+        with pytest.raises(ConfirmationTimeout):
+            await algod.wait_for_confirmation(txid, max_rounds=2, first_round=txn.first_valid_round)
+
+    with_fake_algod(client_test, round_time=0.05, **genesis(sender, receiver))
+
+
+def test_rejected_transaction(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        txn = transaction.PaymentTxn(sender.address, await algod.suggested_params(), receiver.address, 2 * FUNDS)
+        with pytest.raises(HttpError) as error:
+            await algod.send_and_confirm([sender.sign(txn)])
+        assert error.value.status == 400
+
+    with_fake_algod(client_test, **genesis(sender, receiver))
+
+
+# -- delivery
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_delivery_order(with_fake_algod, dist_dir, packed):
+    customer, courier, restaurant = new_account(), new_account(), new_account()
+
+    async def client_test(algod, fake):
+        await opt_in_asset(algod, courier, restaurant)
+        client = await DeliveryClient.deploy(
+            algod, customer, restaurant.address, courier.address, ORDER_AMOUNT, COURIER_REWARD_AMOUNT, TIPS_AMOUNT,
+            ASSET_ID, dist_dir=dist_dir, packed=packed,
+        )
+        assert (await client.order_state())["ORDER_STATUS"] == "COOKING"
+        await client.pick_up_order(courier)
+        await client.delivered(courier)
+        assert (await client.order_state())["ORDER_STATUS"] == "DELIVERED"
+        courier_balance, restaurant_balance = balance(fake, courier), balance(fake, restaurant)
+        result = await client.complete_order(customer, courier.address, restaurant.address)
+        assert [event.type_name for event in transaction_events(result)] == ["ORDER_STATUS"]
+        assert balance(fake, courier) == courier_balance + COURIER_REWARD_AMOUNT
+        # the escrow closes to the restaurant, its reserve included
+        assert balance(fake, restaurant) > restaurant_balance + ORDER_AMOUNT - COURIER_REWARD_AMOUNT
+
+    with_fake_algod(client_test, **genesis(customer, courier, restaurant))
+
+
+def test_delivery_cancelled_by_the_courier(with_fake_algod, dist_dir):
+    customer, courier, restaurant = new_account(), new_account(), new_account()
+
+    async def client_test(algod, fake):
+        client = await DeliveryClient.deploy(
+            algod, customer, restaurant.address, courier.address, ORDER_AMOUNT, COURIER_REWARD_AMOUNT, TIPS_AMOUNT,
+            ASSET_ID, dist_dir=dist_dir,
+        )
+        customer_balance = balance(fake, customer)
+        await client.cancel_order(courier, customer.address)
+        # the escrow closes to the customer, its reserve included
+        assert balance(fake, customer) > customer_balance + ORDER_AMOUNT
+
+    with_fake_algod(client_test, **genesis(customer, courier, restaurant))
+
+
+def test_delivery_action_out_of_order(with_fake_algod, dist_dir):
+    customer, courier, restaurant = new_account(), new_account(), new_account()
+
+    async def client_test(algod, fake):
+        client = await DeliveryClient.deploy(
+            algod, customer, restaurant.address, courier.address, ORDER_AMOUNT, COURIER_REWARD_AMOUNT, TIPS_AMOUNT,
+            ASSET_ID, dist_dir=dist_dir,
+        )
+        with pytest.raises(HttpError) as error:
+            await client.delivered(courier)
+        assert error.value.status == 400
+        assert (await client.order_state())["ORDER_STATUS"] == "COOKING"
+
+    with_fake_algod(client_test, **genesis(customer, courier, restaurant))
+
+
+def logicsig_order(customer: Account, courier: Account, restaurant: Account, order_id: int = 1) -> LogicSigOrder:
+    return LogicSigOrder(courier.address, restaurant.address, customer.address, COURIER_REWARD_AMOUNT, 10 ** 6, itob(order_id))
+
+
+def test_logicsig_order(with_fake_algod, dist_dir):
+    customer, courier, restaurant = new_account(), new_account(), new_account()
+
+    async def client_test(algod, fake):
+        await opt_in_asset(algod, customer, courier, restaurant)
+        client = await LogicSigDeliveryClient.deploy(algod, customer, ASSET_ID, dist_dir=dist_dir)
+        order = logicsig_order(customer, courier, restaurant)
+        # the escrow signs its asset and status app opt-ins
+        await client.place_order(customer, order, ORDER_AMOUNT, TIPS_AMOUNT)
+        assert (await client.order_state(order))["ORDER_STATUS"] == "COOKING"
+        await client.pick_up_order(courier, order)
+        await client.delivered(courier, order)
+        courier_balance, restaurant_balance = balance(fake, courier), balance(fake, restaurant)
+        await client.complete_order(customer, order)
+        assert balance(fake, courier) == courier_balance + COURIER_REWARD_AMOUNT
+        assert fake.ledger.account(encoding.decode_address(courier.address)).assets[ASSET_ID].amount == TIPS_AMOUNT
+        # the escrow closes to the restaurant, its reserve included
+        assert balance(fake, restaurant) > restaurant_balance + ORDER_AMOUNT - COURIER_REWARD_AMOUNT
+        assert await client.order_state(order) == {}
+
+    with_fake_algod(client_test, **genesis(customer, courier, restaurant))
+
+
+def test_logicsig_escrow_only_signs_its_settlement(with_fake_algod, dist_dir):
+    customer, courier, restaurant = new_account(), new_account(), new_account()
+
+    async def client_test(algod, fake):
+        await opt_in_asset(algod, courier, restaurant)
+        client = await LogicSigDeliveryClient.deploy(algod, customer, ASSET_ID, dist_dir=dist_dir)
+        order = logicsig_order(customer, courier, restaurant)
+        await client.place_order(customer, order, ORDER_AMOUNT, TIPS_AMOUNT)
+        escrow = client.escrow(order)
+        params = await algod.suggested_params()
+        # a payment out of the escrow outside of a settlement
+        theft = transaction.PaymentTxn(escrow.address(), params, courier.address, 1)
+        with pytest.raises(HttpError, match="logic signature") as error:
+            await algod.send_and_confirm([transaction.LogicSigTransaction(theft, escrow)])
+        assert error.value.status == 400
+        # signed by the escrow on behalf of another account, a delegated logic signature
+        delegated = transaction.LogicSigAccount(escrow.lsig.logic)
+        delegated.sign(customer.private_key)
+        payment = transaction.PaymentTxn(customer.address, params, courier.address, 1)
+        with pytest.raises(HttpError, match="delegated") as error:
+            await algod.send_and_confirm([transaction.LogicSigTransaction(payment, delegated)])
+        customer_balance = balance(fake, customer)
+        await client.cancel_order(courier, order)
+        assert balance(fake, customer) > customer_balance + ORDER_AMOUNT
+        assert await client.order_state(order) == {}
+
+    with_fake_algod(client_test, **genesis(customer, courier, restaurant))
+
+
+# -- identity
+
+def test_identity_attestations(with_fake_algod, dist_dir):
+    creator, buyer, store, courier = new_account(), new_account(), new_account(), new_account()
+
+    async def client_test(algod, fake):
+        identity = IdentityClient(algod, await deploy_identity(algod, creator, dist_dir))
+        await asyncio.gather(
+            identity.opt_in(buyer, "BUYER"),
+            identity.opt_in(store, "STORE", "45.0703", "7.6869"),
+            identity.opt_in(courier, "COURIER"),
+        )
+        assert (await identity.user_state(store.address))["LAT_KEY"] == b"45.0703"
+        result = await identity.validate_store(buyer, store.address)
+        assert [(event.type_name, event.address) for event in transaction_events(result)] == [
+            ("STORE_BUYER", store.address),
+            ("BUYER_STORE", buyer.address),
+        ]
+        assert encoding.decode_address(buyer.address) in (await identity.user_state(store.address))["buyers0"]
+        await identity.validate_courier(store, courier.address)
+        assert (await identity.user_state(courier.address))["COURIER_STORE_KEY"] == encoding.decode_address(store.address)
+
+    with_fake_algod(client_test, **genesis(creator, buyer, store, courier))
+
+
+# -- rewards
+
+def reward_app(fake, creator: Account, identity_id: int) -> int:
+    """Installs a reward application paying the asset of the genesis, as scenarios.reward_app does."""
+    programs = load_programs("reward")
+    creator_address = encoding.decode_address(creator.address)
+    app_id = fake.ledger.install_app(creator_address, programs.approval, programs.clear, REWARD_GLOBAL_SCHEMA, REWARD_LOCAL_SCHEMA, global_state={
+        b"account": creator_address,
+        b"plto_id": ASSET_ID,
+        b"id_app": itob(identity_id),
+        b"rewards": REWARD_TABLE,
+    })
+    app_address = fake.ledger.app(app_id).address
+    fake.ledger.fund(app_address, FUNDS)
+    fake.ledger.opt_in_asset(app_address, ASSET_ID)
+    fake.ledger.transfer_asset(creator_address, app_address, ASSET_ID, ASSET_TOTAL // 2)
+    return app_id
+
+
+def asset_amount(fake, party: Account) -> int:
+    return fake.ledger.account(encoding.decode_address(party.address)).assets[ASSET_ID].amount
+
+
+def test_reward_batch(with_fake_algod, dist_dir):
+    creator = new_account()
+    referrers = [new_account() for _ in range(2)]
+    referred = [new_account() for _ in range(2)]
+
+    async def client_test(algod, fake):
+        identity = IdentityClient(algod, await deploy_identity(algod, creator, dist_dir))
+        await opt_in_asset(algod, *referrers)
+        await asyncio.gather(*(identity.opt_in(party, "BUYER") for party in (*referrers, *referred)))
+        for referrer in referrers:
+            # the milestone of the referrals of a buyer is its first order
+            fake.ledger.account(encoding.decode_address(referrer.address)).local_states[identity.app_id][b"buyer_orders"] = 1
+        rewards = RewardClient(algod, reward_app(fake, creator, identity.app_id), ASSET_ID, identity.app_id)
+        table = await rewards.rewards()
+        assert table.milestones[:2] == (0, 1)
+        # past 4 referrals the call pools its budget with op_up calls
+        batch = [
+            Referral(referred[number % 2].address, referrers[number // 2 % 2].address, "eater_referral")
+            for number in range(rewards.layout.max_batch_referrals)
+        ]
+        before = [asset_amount(fake, referrer) for referrer in referrers]
+        result = await rewards.check_rewards(creator, batch)
+        # each referrer is paid once, the sum of its referrals
+        rewarded = [event.address for event in transaction_events(result) if event.type_name == "REWARD"]
+        assert sorted(rewarded) == sorted(referrer.address for referrer in referrers)
+        for referrer, amount in zip(referrers, before):
+            referrals = sum(referral.referrer_address == referrer.address for referral in batch)
+            assert asset_amount(fake, referrer) == amount + referrals * table.amounts[1]
+
+    with_fake_algod(client_test, **genesis(creator, *referrers, *referred))
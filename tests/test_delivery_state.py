@@ -0,0 +1,73 @@
+import pytest
+
+from avm import LedgerError, LogicError, evaluate_group
+from plato_client.delivery import delivery_layout
+from scenarios import (
+    COURIER, CREATOR, DELIVERY_ACTION_CODES, ORDER_STATUS, RESTAURANT, delivery_action, delivery_create, load_programs,
+)
+
+# The keyed (KeyedOrderState) and packed (PackedOrderState) layouts of delivery/app.py are two
+# encodings of the same order: every action must accept and reject the same calls and leave the
+# same order, events and payments behind.
+
+ACTION_ACCOUNTS = {"CANCEL": [CREATOR], "COMPLETE_ORDER": [COURIER, RESTAURANT], "CLAIM_FUNDS": [RESTAURANT]}
+SENDERS = {"creator": CREATOR, "courier": COURIER, "restaurant": RESTAURANT}
+
+
+def order_fields(global_state: dict, packed: bool) -> dict:
+    """The order under the keys of the keyed layout, a missing uint read as 0 as globalGet does."""
+    layout = delivery_layout()
+    if packed:
+        return layout.unpack_record(global_state[layout.record_key])
+    fields = {key: 0 for key, name in layout.state_keys.items() if layout.record_fields[name][2]}
+    return {**fields, **global_state}
+
+
+def action_setup(action: str, status: str, sender: bytes, packed: bool):
+    # the escrow opts in to the tips asset with ASA_OPT_IN, it is opted in for the other actions
+    return delivery_action(
+        action, status, sender, ACTION_ACCOUNTS.get(action, ()), asa_opted_in=action != "ASA_OPT_IN", packed=packed,
+    )
+
+
+def outcome(setup, packed: bool):
+    ledger, txns = setup(load_programs("delivery_packed" if packed else "delivery"))
+    app_id = next(txn.application_id for txn in txns if txn.type == "appl")
+    try:
+        results = evaluate_group(ledger, txns)
+    except (LogicError, LedgerError):
+        return "rejected"
+    app_id = app_id or results[-1].app_id
+    app = ledger.app(app_id)
+    return {
+        "order": order_fields(app.global_state, packed),
+        "logs": [log for result in results for log in result.logs],
+        "payments": [
+            (txn.type, txn.receiver, txn.amount, txn.close_remainder_to, txn.asset_receiver, txn.asset_amount, txn.asset_close_to)
+            for result in results for txn in result.inner_txns
+        ],
+        "balances": [ledger.account(address).balance for address in (CREATOR, COURIER, RESTAURANT, app.address)],
+    }
+
+
+@pytest.mark.parametrize("sender", SENDERS)
+@pytest.mark.parametrize("status", ORDER_STATUS)
+@pytest.mark.parametrize("action", DELIVERY_ACTION_CODES)
+def test_actions_are_equivalent(action, status, sender):
+    keyed, packed = (outcome(action_setup(action, status, SENDERS[sender], packed), packed) for packed in (False, True))
+    assert keyed == packed
+
+
+def test_creation_is_equivalent():
+    keyed = outcome(delivery_create(), packed=False)
+    assert keyed != "rejected"
+    assert keyed == outcome(delivery_create(packed=True), packed=True)
+
+
+def test_every_action_is_accepted_in_some_status():
+    # the equivalence is not only that of rejecting every call
+    accepted = {
+        action for action in DELIVERY_ACTION_CODES for status in ORDER_STATUS for sender in SENDERS.values()
+        if outcome(action_setup(action, status, sender, packed=True), packed=True) != "rejected"
+    }
+    assert accepted == set(DELIVERY_ACTION_CODES)
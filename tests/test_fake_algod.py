@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+from algosdk import transaction
+
+from plato_client import HttpError, TransactionRejected
+from test_clients import FUNDS, balance, genesis, new_account
+
+# The faults the fake algod injects (error_rate, drop_rate, latency and the seed drawing them), which
+# the retries of the clients and loadgen are exercised against.
+
+
+def payment(params, sender, receiver, amount: int = 1):
+    return sender.sign(transaction.PaymentTxn(sender.address, params, receiver.address, amount))
+
+
+def test_injected_error(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        with pytest.raises(HttpError, match="injected error") as error:
+            await algod.send_transactions([payment(await algod.suggested_params(), sender, receiver)])
+        assert error.value.status == 503
+        # answered before the transaction is evaluated
+        assert balance(fake, receiver) == FUNDS
+        assert not fake.transactions
+
+    with_fake_algod(client_test, error_rate=1, **genesis(sender, receiver))
+
+
+def test_dropped_transaction_is_not_applied(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        signed = payment(await algod.suggested_params(), sender, receiver)
+        with pytest.raises(TransactionRejected, match="injected drop"):
+            await algod.send_and_confirm([signed], max_rounds=2)
+        assert balance(fake, receiver) == FUNDS
+        # the same transaction sent again once the pool accepts it
+        fake.drop_rate = 0
+        await algod.send_and_confirm([signed])
+        assert balance(fake, receiver) == FUNDS + 1
+
+    with_fake_algod(client_test, round_time=0.05, drop_rate=1, **genesis(sender, receiver))
+
+
+def test_latency(with_fake_algod):
+    latency = 0.1
+
+    async def client_test(algod, fake):
+        start = time.monotonic()
+        await algod.status()
+        assert time.monotonic() - start >= latency
+
+    with_fake_algod(client_test, latency=latency)
+
+
+def test_seeded_faults_are_reproduced(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        params = await algod.suggested_params()
+        outcomes = []
+        for amount in range(1, 21):
+            try:
+                await algod.send_transactions([payment(params, sender, receiver, amount)])
+                outcomes.append("accepted")
+            except HttpError as error:
+                outcomes.append(error.status)
+        return outcomes
+
+    outcomes = [with_fake_algod(client_test, error_rate=0.5, seed=7, **genesis(sender, receiver)) for _ in range(2)]
+    assert outcomes[0] == outcomes[1]
+    assert {"accepted", 503} == set(outcomes[0])
+
+
+def test_invalid_signature(with_fake_algod):
+    sender, receiver, impostor = new_account(), new_account(), new_account()
+
+    async def client_test(algod, fake):
+        txn = transaction.PaymentTxn(sender.address, await algod.suggested_params(), receiver.address, 1)
+        # signed by another key, the signer of a rekeyed account
+        with pytest.raises(HttpError, match="another key") as error:
+            await algod.send_transactions([txn.sign(impostor.private_key)])
+        assert error.value.status == 400
+        forged = sender.sign(txn)
+        forged.signature = impostor.sign(txn).signature
+        with pytest.raises(HttpError, match="invalid signature") as error:
+            await algod.send_transactions([forged])
+        assert error.value.status == 400
+        assert balance(fake, receiver) == FUNDS
+
+    with_fake_algod(client_test, **genesis(sender, receiver))
+
+
+def test_concurrent_submissions_with_latency(with_fake_algod):
+    sender, receiver = new_account(), new_account()
+
+    async def client_test(algod, fake):
+        params = await algod.suggested_params()
+        start = time.monotonic()
+        await asyncio.gather(*(algod.send_and_confirm([payment(params, sender, receiver, amount)]) for amount in range(1, 11)))
+        # the responses are delayed concurrently, not one after the other
+        assert time.monotonic() - start < 10 * 0.05
+        assert balance(fake, receiver) == FUNDS + sum(range(1, 11))
+
+    with_fake_algod(client_test, latency=0.05, **genesis(sender, receiver))
@@ -0,0 +1,245 @@
+import asyncio
+
+from algosdk import encoding
+
+from avm import Transaction
+from avm.opcodes import NAMED_INTS
+from plato_client import DeliveryClient, IdentityClient
+from plato_client.fake_algod import evaluate_with_deltas
+from plato_client.indexer import DELETE, SET_BYTES, SET_UINT, OrderKey, OrderOrigin, StateIndex
+from plato_client.loadgen import deploy_identity
+from scenarios import (
+    ACCEPT_DELIVERY_WINDOW, COURIER, COURIER_REWARD_AMOUNT, CREATOR, CUSTOMER, DEADLINE_ROUND, DELIVERY_ACTION_CODES,
+    ESCROW, LATEST_TIMESTAMP, ORDER_AMOUNT, ORDER_FEE_RESERVE, ORDER_ID, ORDER_STATUS, RESTAURANT, SETTLEMENT_GROUP_SIZE,
+    TIPS_AMOUNT, app_call, delivery_status, itob, load_programs, order_book,
+)
+from test_clients import ASSET_ID, genesis, new_account, opt_in_asset
+
+IDENTITY_APP_ID = 1000
+STATUS_KEY = b"orderStatus"
+DELIVERED_TIME_KEY = b"deliveredTime"
+
+
+def group_block(ledger, txns, round_number: int) -> dict:
+    """Evaluates a group and returns a block holding it, with the state deltas of the fake algod."""
+    results, deltas = evaluate_with_deltas(ledger, txns)
+    entries = []
+    for txn, result, delta in zip(txns, results, deltas):
+        fields = {"type": txn.type, "snd": txn.sender}
+        if txn.type == "appl":
+            fields.update(apid=txn.application_id, apan=txn.on_completion, apat=list(txn.accounts))
+        entries.append({"txn": {name: value for name, value in fields.items() if value}, "dt": delta})
+        if txn.type == "appl" and not txn.application_id:
+            entries[-1]["apid"] = result.app_id
+    return {"rnd": round_number, "ts": ledger.latest_timestamp, "txns": entries}
+
+
+class Chain:
+    """Applies the groups evaluated against a local AVM ledger to an index, a block per group."""
+
+    def __init__(self, ledger, index: StateIndex):
+        self.ledger = ledger
+        self.index = index
+
+    def apply(self, *txns: Transaction):
+        self.index.apply_block(group_block(self.ledger, list(txns), self.index.round + 1))
+
+
+def app_block(round_number: int, timestamp: int, app_id: int, sender: bytes, global_delta=None, local_deltas=None, **fields) -> dict:
+    delta = {}
+    if global_delta is not None:
+        delta["gd"] = global_delta
+    if local_deltas is not None:
+        delta["ld"] = local_deltas
+    return {"rnd": round_number, "ts": timestamp, "txns": [{"txn": {"type": "appl", "snd": sender, "apid": app_id, **fields}, "dt": delta}]}
+
+
+# -- delta application
+
+def test_keyed_escrow_deltas():
+    index = StateIndex(IDENTITY_APP_ID)
+    # the apply data of a creation holds the ID of the application
+    created = app_block(1, 10, 0, CUSTOMER, {
+        STATUS_KEY: {"at": SET_UINT, "ui": ORDER_STATUS["COOKING"]},
+        b"courierAddr": {"at": SET_BYTES, "bs": COURIER},
+    })
+    created["txns"][0]["apid"] = 7
+    index.apply_block(created)
+    assert index.order(OrderKey(7)) == {STATUS_KEY: ORDER_STATUS["COOKING"], b"courierAddr": COURIER}
+    assert index.origins[OrderKey(7)] == OrderOrigin(CUSTOMER, 10)
+    index.apply_block(app_block(2, 20, 7, COURIER, {
+        STATUS_KEY: {"at": SET_UINT, "ui": ORDER_STATUS["DELIVERED"]},
+        DELIVERED_TIME_KEY: {"at": SET_UINT, "ui": 20},
+    }))
+    assert index.orders_with_status("DELIVERED") == {OrderKey(7)}
+    assert index.claimable_orders(window=5) == []
+    assert index.claimable_orders(now=25, window=5) == [OrderKey(7)]
+    index.apply_block(app_block(3, 30, 7, CUSTOMER, apan=NAMED_INTS["DeleteApplication"]))
+    assert index.orders == {} and index.origins == {} and index.delivered == []
+
+
+def test_calls_without_order_keys_are_ignored():
+    index = StateIndex(IDENTITY_APP_ID)
+    index.apply_block(app_block(1, 10, 8, CREATOR, {b"rewards": {"at": SET_BYTES, "bs": bytes(64)}}))
+    index.apply_block(app_block(2, 10, IDENTITY_APP_ID, CREATOR, {STATUS_KEY: {"at": SET_UINT, "ui": 1}}))
+    assert index.orders == {} and index.order_books == set()
+
+
+def test_order_book_deltas():
+    ledger, app_id, asa_id = order_book(load_programs("order_book"))
+    index = StateIndex(IDENTITY_APP_ID)
+    chain = Chain(ledger, index)
+    app_address = ledger.app(app_id).address
+    chain.apply(
+        Transaction(type="pay", sender=CUSTOMER, receiver=app_address, amount=ORDER_AMOUNT + ORDER_FEE_RESERVE),
+        Transaction(type="axfer", sender=CUSTOMER, asset_receiver=app_address, xfer_asset=asa_id, asset_amount=TIPS_AMOUNT),
+        app_call(CUSTOMER, app_id, [b"PLACE_ORDER", ORDER_ID, COURIER, RESTAURANT, itob(COURIER_REWARD_AMOUNT)]),
+    )
+    order_key = OrderKey(app_id, ORDER_ID)
+    assert index.order_books == {app_id}
+    assert index.order(order_key) == {
+        b"CUSTOMER_ADDRESS": CUSTOMER,
+        b"courierAddr": COURIER,
+        b"restaurantAddr": RESTAURANT,
+        b"ORDER_AMOUNT": ORDER_AMOUNT,
+        b"courierRewardAmount": COURIER_REWARD_AMOUNT,
+        b"TIPS_AMOUNT": TIPS_AMOUNT,
+        STATUS_KEY: ORDER_STATUS["COOKING"],
+        DELIVERED_TIME_KEY: 0,
+    }
+    assert index.origins[order_key] == OrderOrigin(CUSTOMER, LATEST_TIMESTAMP)
+
+    def action(name: bytes, sender: bytes):
+        chain.apply(app_call(sender, app_id, [name, ORDER_ID], accounts=[CUSTOMER, COURIER, RESTAURANT], assets=[asa_id]))
+
+    action(b"PICK_UP_ORDER", COURIER)
+    action(b"DELIVERED", COURIER)
+    # a state change keeps the fields of the record
+    assert index.order(order_key)[b"CUSTOMER_ADDRESS"] == CUSTOMER
+    assert index.claimable_orders(now=LATEST_TIMESTAMP + ACCEPT_DELIVERY_WINDOW) == [order_key]
+    action(b"COMPLETE_ORDER", CUSTOMER)
+    assert index.orders == {} and index.delivered == []
+
+
+def test_status_app_deltas():
+    ledger, app_id, asa_id, _ = delivery_status(load_programs("delivery_status"))
+    ledger.opt_in_asset(ESCROW, asa_id)
+    index = StateIndex(IDENTITY_APP_ID, status_app_id=app_id)
+    chain = Chain(ledger, index)
+    chain.apply(app_call(ESCROW, app_id, [COURIER, RESTAURANT, CREATOR, itob(DEADLINE_ROUND)], on_completion=NAMED_INTS["OptIn"]))
+    order_key = OrderKey(app_id, ESCROW)
+    assert index.order(order_key) == {
+        b"courierAddr": COURIER,
+        b"restaurantAddr": RESTAURANT,
+        b"CUSTOMER_ADDRESS": CREATOR,
+        STATUS_KEY: ORDER_STATUS["COOKING"],
+        DELIVERED_TIME_KEY: 0,
+        b"DEADLINE": DEADLINE_ROUND,
+    }
+    assert index.origins[order_key] == OrderOrigin(CREATOR, LATEST_TIMESTAMP)
+
+    def call(action: str, sender: bytes):
+        return app_call(sender, app_id, [bytes((DELIVERY_ACTION_CODES[action],))], accounts=[ESCROW])
+
+    chain.apply(call("PICK_UP_ORDER", COURIER))
+    chain.apply(call("DELIVERED", COURIER))
+    assert index.orders_with_status("DELIVERED") == {order_key}
+    ledger.latest_timestamp += ACCEPT_DELIVERY_WINDOW + 1
+    claim = call("CLAIM_FUNDS", COURIER)
+    claim.fee = SETTLEMENT_GROUP_SIZE * 1000
+    chain.apply(
+        claim,
+        app_call(ESCROW, app_id, [], on_completion=NAMED_INTS["CloseOut"], fee=0),
+        Transaction(type="axfer", sender=ESCROW, asset_receiver=COURIER, xfer_asset=asa_id, asset_close_to=COURIER, fee=0),
+        Transaction(type="pay", sender=ESCROW, receiver=COURIER, amount=COURIER_REWARD_AMOUNT, close_remainder_to=RESTAURANT, fee=0),
+    )
+    assert index.orders == {} and index.delivered == []
+
+
+def test_orders_delivered_at_the_same_time():
+    index = StateIndex(IDENTITY_APP_ID, status_app_id=9)
+    delivered = {STATUS_KEY: ORDER_STATUS["DELIVERED"], DELIVERED_TIME_KEY: 20}
+    order_keys = [OrderKey(5), OrderKey(6, ORDER_ID), OrderKey(9, ESCROW)]
+    for order_key in order_keys:
+        index.set_order(order_key, dict(delivered))
+    assert sorted(index.claimable_orders(now=20, window=0)) == sorted(order_keys)
+    assert index.claimable_orders(now=19, window=0) == []
+
+
+def test_local_deltas_of_shared_accounts():
+    index = StateIndex(IDENTITY_APP_ID)
+    block = app_block(1, 10, IDENTITY_APP_ID, CREATOR, local_deltas={1: {b"type": {"at": SET_UINT, "ui": 1}}})
+    block["txns"][0]["dt"]["sa"] = [CUSTOMER]
+    index.apply_block(block)
+    assert index.users == {CUSTOMER: {b"type": 1}}
+    index.apply_block(app_block(2, 10, IDENTITY_APP_ID, CUSTOMER, local_deltas={0: {b"type": {"at": DELETE}}}))
+    assert index.users == {CUSTOMER: {}}
+    index.apply_block(app_block(3, 10, IDENTITY_APP_ID, CUSTOMER, apan=NAMED_INTS["ClearState"]))
+    assert index.users == {}
+
+
+# -- blocks of the fake algod
+
+def test_follow_the_fake_algod(with_fake_algod, dist_dir):
+    customer, courier, restaurant, creator, store = (new_account() for _ in range(5))
+
+    async def client_test(algod, fake):
+        await opt_in_asset(algod, courier, restaurant)
+        identity = IdentityClient(algod, await deploy_identity(algod, creator, dist_dir))
+        await identity.opt_in(store, "STORE", "45.0703", "7.6869")
+        clients = [
+            await DeliveryClient.deploy(
+                algod, customer, restaurant.address, courier.address, 500000, 100000, 10, ASSET_ID, dist_dir=dist_dir, packed=packed,
+            )
+            for packed in (False, True)
+        ]
+        await clients[1].pick_up_order(courier)
+        index = StateIndex(identity.app_id)
+        while index.round < fake.last_round:
+            index.apply_block(await algod.block(index.round + 1))
+        assert index.orders_with_status("COOKING") == {OrderKey(clients[0].app_id)}
+        assert index.orders_with_status("DELIVERING") == {OrderKey(clients[1].app_id)}
+        for client in clients:
+            order = index.order(OrderKey(client.app_id))
+            assert order[b"courierAddr"] == encoding.decode_address(courier.address)
+            assert index.origins[OrderKey(client.app_id)].creator == encoding.decode_address(customer.address)
+        assert index.stores_with_free_slot() == [store.address]
+        result = await clients[0].cancel_order(courier, customer.address)
+        while index.round < result["confirmed-round"]:
+            index.apply_block(await algod.block(index.round + 1))
+        assert index.orders_with_status("CANCELED") == {OrderKey(clients[0].app_id)}
+        assert index.orders_with_status("COOKING") == set()
+
+    with_fake_algod(client_test, **genesis(customer, courier, restaurant, creator, store))
+
+
+# -- snapshots
+
+def test_snapshot_round_trip(tmp_path):
+    ledger, book_id, asa_id = order_book(load_programs("order_book"), "DELIVERED")
+    index = StateIndex(IDENTITY_APP_ID, round_number=41, status_app_id=9)
+    index.timestamp = LATEST_TIMESTAMP
+    index.set_order(OrderKey(5), {STATUS_KEY: ORDER_STATUS["COOKING"], b"courierAddr": COURIER, b"courierRewardAmount": 2 ** 64 - 1})
+    index.origins[OrderKey(5)] = OrderOrigin(CUSTOMER, 7)
+    index.set_order(OrderKey(9, ESCROW), {STATUS_KEY: ORDER_STATUS["DELIVERED"], DELIVERED_TIME_KEY: 3, b"DEADLINE": DEADLINE_ROUND})
+    index.apply_global_delta(book_id, {
+        key: {"at": SET_BYTES, "bs": value} for key, value in ledger.app(book_id).global_state.items()
+    })
+    index.set_user(CUSTOMER, {b"type": 1})
+    path = str(tmp_path / "index.sqlite")
+    index.save(path)
+    # saving again replaces the previous content
+    index.save(path)
+    loaded = StateIndex.load(path)
+    for attribute in (
+        "identity_app_id", "status_app_id", "round", "timestamp", "orders", "origins", "order_books", "users",
+        "orders_by_status", "delivered",
+    ):
+        assert getattr(loaded, attribute) == getattr(index, attribute), attribute
+    assert loaded.order_books == {book_id}
+    # the order book is known to the loaded index, a state change alone is applied
+    order_key = OrderKey(book_id, ORDER_ID)
+    state_key = ORDER_ID + b"s"
+    loaded.apply_global_delta(book_id, {state_key: {"at": SET_BYTES, "bs": itob(ORDER_STATUS["DISPUTE"]) + itob(3)}})
+    assert loaded.order(order_key)[STATUS_KEY] == ORDER_STATUS["DISPUTE"]
+    assert loaded.order(order_key)[b"CUSTOMER_ADDRESS"] == CUSTOMER
@@ -0,0 +1,178 @@
+import asyncio
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from algosdk import constants, encoding, transaction
+
+from plato_client import HttpError, IdentityClient, TransactionRejected
+from plato_client.loadgen import deploy_identity
+from plato_client.onboarding import Onboarding, call_from_record, pack_groups
+from test_clients import genesis, new_account
+
+IDENTITY_APP_ID = 1000
+
+
+def opt_in(index: int, party, user_type: str = "BUYER"):
+    return call_from_record(index, {"private_key": party.private_key, "user_type": user_type, "lat": "45.0703", "lng": "7.6869"})
+
+
+def attestation(index: int, party, target, action: str = "sto_val"):
+    return call_from_record(index, {"action": action, "private_key": party.private_key, "target": target.address})
+
+
+# -- packing
+
+def test_groups_are_bounded():
+    calls = [opt_in(index, new_account()) for index in range(20)]
+    groups = list(pack_groups(calls, group_size=8))
+    assert [len(group) for group in groups] == [8, 8, 4]
+    assert [call for group in groups for call in group] == calls
+    assert list(pack_groups([])) == []
+
+
+def test_groups_share_no_account():
+    buyer, store, other_buyer = new_account(), new_account(), new_account()
+    calls = [
+        opt_in(0, buyer),
+        opt_in(1, store, "STORE"),
+        # reads the local state of the store, which the opt-in of the group writes
+        attestation(2, buyer, store),
+        opt_in(3, other_buyer),
+        attestation(4, other_buyer, store),
+    ]
+    groups = [[call.index for call in group] for group in pack_groups(calls)]
+    # consecutive calls only: nothing is moved ahead of the call it conflicts with
+    assert groups == [[0, 1], [2, 3], [4]]
+
+
+def test_record_validation():
+    party = new_account()
+    with pytest.raises(ValueError, match="user_type"):
+        call_from_record(0, {"private_key": party.private_key, "user_type": "ADMIN"})
+    with pytest.raises(ValueError, match="target"):
+        call_from_record(1, {"action": "sto_val", "private_key": party.private_key})
+    with pytest.raises(ValueError, match="private_key or mnemonic"):
+        call_from_record(2, {"user_type": "BUYER"})
+    # empty fields take their default
+    call = call_from_record(3, {"private_key": party.private_key, "user_type": "BUYER", "referer": ""})
+    assert call.referer_address == constants.ZERO_ADDRESS
+
+
+# -- sending
+
+class StubAlgod:
+    """Confirms the groups it is sent unless one of their senders is rejected, or one failing
+    with a queued error."""
+
+    def __init__(self, rejected=(), errors=None):
+        self.rejected = {encoding.decode_address(party.address) for party in rejected}
+        # sender -> errors of the next groups it is in, in order
+        self.errors = {encoding.decode_address(party.address): list(queued) for party, queued in (errors or {}).items()}
+        self.senders = {}
+        # record indexes of the calls of every group sent
+        self.groups = []
+
+    def watch(self, calls):
+        self.senders.update({encoding.decode_address(call.address): call.index for call in calls})
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        return transaction.SuggestedParams(1000, 1, 1001, base64.b64encode(bytes(32)).decode(), "fake-v1", flat_fee=True)
+
+    async def send_raw_transactions(self, blob: bytes) -> str:
+        # the public keys of the senders are in the signed transactions
+        self.groups.append(sorted(index for sender, index in self.senders.items() if sender in blob))
+        for sender, queued in self.errors.items():
+            if queued and sender in blob:
+                raise queued.pop(0)
+        if any(sender in blob for sender in self.rejected):
+            raise HttpError(400, "Bad Request", b'{"message": "logic eval error"}')
+        return "txid"
+
+    async def wait_for_confirmation(self, txid: str, max_rounds: int = 10, first_round=None) -> dict:
+        return {"confirmed-round": 2}
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Delays of the retries, which are not waited for."""
+    delays = []
+
+    async def sleep(delay, result=None):
+        delays.append(delay)
+        return result
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return delays
+
+
+def send_group(algod: StubAlgod, calls, attempts: int = 3):
+    algod.watch(calls)
+    with ThreadPoolExecutor(2) as executor:
+        return asyncio.run(Onboarding(IDENTITY_APP_ID).send_group(algod, executor, calls, attempts))
+
+
+def test_rejected_calls_are_isolated(backoffs):
+    parties = [new_account() for _ in range(8)]
+    algod = StubAlgod(rejected=[parties[2], parties[5]])
+    result = send_group(algod, [opt_in(index, party) for index, party in enumerate(parties)])
+    assert result.confirmed == 6
+    assert sorted(result.failed) == [2, 5]
+    assert all(isinstance(error, HttpError) and error.status == 400 for error in result.failed.values())
+    # split in halves until the failing calls are alone, a rejected group is not sent again
+    assert algod.groups[0] == list(range(8))
+    assert [0, 1, 2, 3] in algod.groups and [4, 5, 6, 7] in algod.groups and [2] in algod.groups
+    assert sorted(map(tuple, algod.groups)) == sorted(set(map(tuple, algod.groups)))
+    assert backoffs == []
+
+
+@pytest.mark.parametrize("error", [
+    HttpError(503, "Service Unavailable", b""),
+    ConnectionResetError("connection reset"),
+    TransactionRejected("txid", "injected drop"),
+])
+def test_transient_errors_are_retried(backoffs, error):
+    parties = [new_account() for _ in range(4)]
+    algod = StubAlgod(errors={parties[1]: [error, error]})
+    result = send_group(algod, [opt_in(index, party) for index, party in enumerate(parties)])
+    assert result.confirmed == 4 and result.failed == {}
+    # signed again with fresh params and sent, after a backoff
+    assert algod.groups == [[0, 1, 2, 3]] * 3
+    assert backoffs == [0.5, 1.0]
+
+
+def test_persistent_error_after_the_attempts(backoffs):
+    error = HttpError(503, "Service Unavailable", b"")
+    parties = [new_account(), new_account()]
+    algod = StubAlgod(errors={parties[1]: [error] * 10})
+    result = send_group(algod, [opt_in(index, party) for index, party in enumerate(parties)], attempts=2)
+    assert result.confirmed == 1
+    assert result.failed == {1: error}
+    # the group, then each half, is sent attempts times
+    assert algod.groups == [[0, 1]] * 2 + [[0]] + [[1]] * 2
+
+
+def test_submit_to_the_fake_algod(with_fake_algod, dist_dir):
+    creator, buyer, store, courier, stranger = (new_account() for _ in range(5))
+
+    async def client_test(algod, fake):
+        app_id = await deploy_identity(algod, creator, dist_dir)
+        onboarding = Onboarding(app_id, group_size=4)
+        onboarding.executor = lambda: ThreadPoolExecutor(2)
+        calls = [
+            opt_in(0, buyer),
+            opt_in(1, store, "STORE"),
+            opt_in(2, courier, "COURIER"),
+            # waits for the group opting the store in
+            attestation(3, buyer, store),
+            attestation(4, store, courier, "cou_val"),
+            # the stranger never opted in
+            attestation(5, stranger, store),
+        ]
+        result = await onboarding.submit(algod, calls, concurrency=2)
+        assert result.confirmed == 5
+        assert list(result.failed) == [5]
+        identity = IdentityClient(algod, app_id)
+        assert (await identity.user_state(courier.address))["COURIER_STORE_KEY"] == encoding.decode_address(store.address)
+
+    with_fake_algod(client_test, **genesis(creator, buyer, store, courier, stranger))
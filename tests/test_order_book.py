@@ -0,0 +1,64 @@
+import pytest
+
+from avm import LedgerError, LogicError, Transaction, evaluate_group
+from avm.opcodes import NAMED_INTS
+from scenarios import (
+    COURIER, COURIER_REWARD_AMOUNT, CUSTOMER, ORDER_AMOUNT, ORDER_FEE_RESERVE, ORDER_ID, RESTAURANT, TIPS_AMOUNT,
+    app_call, itob, load_programs, order_book,
+)
+
+MAX_OPEN_ORDERS = 32
+
+
+def place_order(ledger, app_id: int, asa_id: int, order_id: bytes):
+    app_address = ledger.app(app_id).address
+    evaluate_group(ledger, [
+        Transaction(type="pay", sender=CUSTOMER, receiver=app_address, amount=ORDER_AMOUNT + ORDER_FEE_RESERVE),
+        Transaction(type="axfer", sender=CUSTOMER, asset_receiver=app_address, xfer_asset=asa_id, asset_amount=TIPS_AMOUNT),
+        app_call(CUSTOMER, app_id, [b"PLACE_ORDER", order_id, COURIER, RESTAURANT, itob(COURIER_REWARD_AMOUNT)]),
+    ])
+
+
+def order_action(ledger, app_id: int, asa_id: int, action: bytes, sender: bytes, customer: bytes = CUSTOMER):
+    evaluate_group(ledger, [app_call(sender, app_id, [action, ORDER_ID], accounts=[customer, COURIER, RESTAURANT], assets=[asa_id])])
+
+
+def test_orders_survive_a_customer_clear():
+    ledger, app_id, asa_id = order_book(load_programs("order_book"))
+    place_order(ledger, app_id, asa_id, ORDER_ID)
+    evaluate_group(ledger, [app_call(CUSTOMER, app_id, [], on_completion=NAMED_INTS["OptIn"])])
+    evaluate_group(ledger, [app_call(CUSTOMER, app_id, [], on_completion=NAMED_INTS["ClearState"])])
+    assert ORDER_ID in ledger.app(app_id).global_state
+    customer_balance = ledger.account(CUSTOMER).balance
+    order_action(ledger, app_id, asa_id, b"CANCEL", COURIER)
+    assert ORDER_ID not in ledger.app(app_id).global_state
+    assert ledger.account(CUSTOMER).balance == customer_balance + ORDER_AMOUNT
+
+
+def test_settlement_pays_the_parties():
+    ledger, app_id, asa_id = order_book(load_programs("order_book"))
+    place_order(ledger, app_id, asa_id, ORDER_ID)
+    order_action(ledger, app_id, asa_id, b"PICK_UP_ORDER", COURIER)
+    order_action(ledger, app_id, asa_id, b"DELIVERED", COURIER)
+    courier_balance, restaurant_balance = ledger.account(COURIER).balance, ledger.account(RESTAURANT).balance
+    order_action(ledger, app_id, asa_id, b"COMPLETE_ORDER", CUSTOMER)
+    assert ledger.account(COURIER).balance == courier_balance + COURIER_REWARD_AMOUNT
+    assert ledger.account(RESTAURANT).balance == restaurant_balance + ORDER_AMOUNT - COURIER_REWARD_AMOUNT
+    assert ledger.app(app_id).global_state == {}
+
+
+def test_order_of_another_customer():
+    ledger, app_id, asa_id = order_book(load_programs("order_book"), "COOKING")
+    # the refund would go to the account passed in place of the customer
+    with pytest.raises(LogicError):
+        order_action(ledger, app_id, asa_id, b"CANCEL", COURIER, customer=COURIER)
+
+
+def test_open_order_limit():
+    ledger, app_id, asa_id = order_book(load_programs("order_book"))
+    ledger.fund(CUSTOMER, MAX_OPEN_ORDERS * (ORDER_AMOUNT + ORDER_FEE_RESERVE))
+    ledger.transfer_asset(ledger.asset(asa_id).creator, CUSTOMER, asa_id, MAX_OPEN_ORDERS * TIPS_AMOUNT)
+    for number in range(MAX_OPEN_ORDERS):
+        place_order(ledger, app_id, asa_id, itob(number + 100))
+    with pytest.raises((LogicError, LedgerError), match="exceeds schema"):
+        place_order(ledger, app_id, asa_id, ORDER_ID)
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from plato_client import ConnectionPool, HttpError
+
+# Answers of the test server: (status, body), DROP to close the connection without answering,
+# or CLOSE to answer 200 and then close the connection.
+DROP = "drop"
+CLOSE = "close"
+
+
+class Server:
+    """An HTTP/1.1 server answering the requests it receives with the given answers in order."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        # (connection number, method, path) of every request received
+        self.requests = []
+        self.connections = 0
+        self.server = None
+
+    async def __aenter__(self) -> str:
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def __aexit__(self, *exc_info):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        connection = self.connections
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                content_length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    if name.lower() == "content-length":
+                        content_length = int(value)
+                await reader.readexactly(content_length)
+                method, path, _ = request_line.decode().split(" ", 2)
+                self.requests.append((connection, method, path))
+                answer = self.answers.pop(0) if self.answers else (200, b"{}")
+                if answer == DROP:
+                    break
+                status, body = (200, b"{}") if answer == CLOSE else answer
+                writer.write(f"HTTP/1.1 {status} Reason\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if answer == CLOSE:
+                    break
+        finally:
+            writer.close()
+
+
+def run(server: Server, client_test):
+    async def main():
+        async with server as url:
+            pool = ConnectionPool(url, max_connections=4)
+            try:
+                return await client_test(pool)
+            finally:
+                await pool.close()
+    return asyncio.run(main())
+
+
+def test_keep_alive_reuse():
+    server = Server()
+
+    async def client_test(pool):
+        for path in ("/a", "/b"):
+            await pool.request("GET", path)
+        await pool.request("POST", "/c", b"body")
+        # requests in parallel borrow connections of their own
+        await asyncio.gather(*(pool.request("GET", "/d") for _ in range(3)))
+
+    run(server, client_test)
+    assert server.requests[:3] == [(1, "GET", "/a"), (1, "GET", "/b"), (1, "POST", "/c")]
+    assert server.connections == 3
+
+
+def test_get_retried_on_a_dropped_connection():
+    server = Server((200, b"a"), DROP, (200, b"b"))
+
+    async def client_test(pool):
+        await pool.request("GET", "/a")
+        return await pool.request("GET", "/b")
+
+    assert run(server, client_test).body == b"b"
+    assert server.requests == [(1, "GET", "/a"), (1, "GET", "/b"), (2, "GET", "/b")]
+
+
+def test_post_not_sent_twice():
+    server = Server((200, b"a"), DROP)
+
+    async def client_test(pool):
+        await pool.request("GET", "/a")
+        with pytest.raises(ConnectionError):
+            await pool.request("POST", "/v2/transactions", b"group")
+
+    run(server, client_test)
+    assert server.requests == [(1, "GET", "/a"), (1, "POST", "/v2/transactions")]
+
+
+def test_first_request_not_retried():
+    server = Server(DROP)
+
+    async def client_test(pool):
+        with pytest.raises(ConnectionError):
+            await pool.request("GET", "/a")
+
+    run(server, client_test)
+    assert server.requests == [(1, "GET", "/a")]
+
+
+def test_connection_closed_while_idle():
+    server = Server(CLOSE)
+
+    async def client_test(pool):
+        await pool.request("GET", "/a")
+        # the pool notices the end of the connection before sending on it
+        await asyncio.sleep(0.05)
+        await pool.request("POST", "/v2/transactions", b"group")
+
+    run(server, client_test)
+    assert server.requests == [(1, "GET", "/a"), (2, "POST", "/v2/transactions")]
+
+
+@pytest.mark.parametrize("status", [400, 404, 500, 503])
+def test_error_status(status):
+    server = Server((status, b'{"message": "rejected"}'))
+
+    async def client_test(pool):
+        with pytest.raises(HttpError) as error:
+            await pool.request("POST", "/v2/transactions", b"group")
+        assert (error.value.status, error.value.body) == (status, b'{"message": "rejected"}')
+        # the connection stays usable after an error response
+        await pool.request("GET", "/a")
+
+    run(server, client_test)
+    assert server.requests == [(1, "POST", "/v2/transactions"), (1, "GET", "/a")]
@@ -0,0 +1,17 @@
+import pytest
+
+from avm import LogicError, evaluate_group
+from plato_client.reward import op_up_calls
+from scenarios import load_programs, reward_check_rewards
+
+
+@pytest.mark.parametrize("batch", range(1, 15))
+def test_op_up_calls_cover_the_batch(batch):
+    ledger, txns = reward_check_rewards(batch=batch, op_ups=op_up_calls(batch))(load_programs("reward"))
+    evaluate_group(ledger, txns)
+
+
+def test_batch_past_the_budget_of_one_call():
+    ledger, txns = reward_check_rewards(batch=14)(load_programs("reward"))
+    with pytest.raises(LogicError, match="budget"):
+        evaluate_group(ledger, txns)
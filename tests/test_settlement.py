@@ -0,0 +1,132 @@
+import pytest
+
+from avm import LedgerError, LogicError, Transaction, TransactionRejected, evaluate_group
+from avm.ledger import MIN_TXN_FEE
+from avm.opcodes import NAMED_INTS
+from scenarios import (
+    COURIER, COURIER_REWARD_AMOUNT, CREATOR, DELIVERY_ACTION_CODES, ESCROW_BALANCE, RESTAURANT, SETTLEMENT_GROUP_SIZE,
+    TIPS_AMOUNT, address, delivery_status_action, load_programs,
+)
+
+# The settlement groups of the status app (delivery/status_app.py) and of the logic signature
+# escrows (delivery/escrow_logicsig.py): [action call, escrow close out, escrow asset close,
+# escrow payment close]. The app checks the shape of the group, the logic signature where the
+# funds go and that the escrow pays no fee and is not rekeyed.
+
+ACTION, CLOSE_OUT, ASSET_CLOSE, PAYMENT_CLOSE = range(4)
+SETTLEMENTS = {"CANCEL": ("COOKING", COURIER), "COMPLETE_ORDER": ("DELIVERED", CREATOR), "CLAIM_FUNDS": ("DELIVERED", COURIER)}
+OTHER = address("other")
+SETTLEMENT_FEE = SETTLEMENT_GROUP_SIZE * MIN_TXN_FEE
+
+
+def settlement(action: str, logic_sig: bool = True):
+    status, sender = SETTLEMENTS[action]
+    return delivery_status_action(action, status, sender, logic_sig)(load_programs("delivery_status"))
+
+
+def settle(action: str, changes=None, logic_sig: bool = True):
+    """Evaluates the settlement group of action with {position: {field: value}} changes."""
+    ledger, txns = settlement(action, logic_sig)
+    for position, fields in (changes or {}).items():
+        for field, value in fields.items():
+            setattr(txns[position], field, value)
+    evaluate_group(ledger, txns)
+    return ledger, txns
+
+
+@pytest.mark.parametrize("action", SETTLEMENTS)
+def test_settlement_closes_the_escrow(action):
+    ledger, txns = settlement(action)
+    balances = {address: ledger.accounts[address].balance for address in (CREATOR, COURIER, RESTAURANT)}
+    escrow = txns[CLOSE_OUT].sender
+    evaluate_group(ledger, txns)
+    assert escrow not in ledger.accounts or ledger.accounts[escrow].balance == 0
+    paid = {address: ledger.accounts[address].balance - balance for address, balance in balances.items()}
+    if action == "CANCEL":
+        assert paid == {CREATOR: ESCROW_BALANCE, COURIER: -SETTLEMENT_FEE, RESTAURANT: 0}
+        assert ledger.accounts[CREATOR].assets[txns[ASSET_CLOSE].xfer_asset].amount > 0
+    else:
+        sender_fee = {address: -SETTLEMENT_FEE if address == SETTLEMENTS[action][1] else 0 for address in paid}
+        assert paid == {
+            CREATOR: sender_fee[CREATOR],
+            COURIER: COURIER_REWARD_AMOUNT + sender_fee[COURIER],
+            RESTAURANT: ESCROW_BALANCE - COURIER_REWARD_AMOUNT,
+        }
+        assert ledger.accounts[COURIER].assets[txns[ASSET_CLOSE].xfer_asset].amount == TIPS_AMOUNT
+
+
+def with_fee_payer(txn: Transaction):
+    """txn in a group whose other transaction pays its fee."""
+    return [Transaction(type="pay", sender=CREATOR, receiver=CREATOR, fee=2 * MIN_TXN_FEE), txn]
+
+
+@pytest.mark.parametrize("action", SETTLEMENTS)
+@pytest.mark.parametrize("position,fields", [
+    (PAYMENT_CLOSE, {"receiver": OTHER}),
+    (PAYMENT_CLOSE, {"close_remainder_to": OTHER}),
+    (PAYMENT_CLOSE, {"amount": COURIER_REWARD_AMOUNT + 1}),
+    (ASSET_CLOSE, {"asset_receiver": OTHER}),
+    (ASSET_CLOSE, {"asset_close_to": OTHER}),
+])
+def test_wrong_receiver_is_rejected(action, position, fields):
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        settle(action, {position: fields})
+
+
+def test_refund_goes_to_the_customer():
+    # the payments of a release in a CANCEL group
+    release = {"receiver": COURIER, "amount": COURIER_REWARD_AMOUNT, "close_remainder_to": RESTAURANT}
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        settle("CANCEL", {PAYMENT_CLOSE: release})
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        settle("CANCEL", {ASSET_CLOSE: {"asset_receiver": COURIER, "asset_close_to": COURIER}})
+
+
+@pytest.mark.parametrize("position", [CLOSE_OUT, ASSET_CLOSE, PAYMENT_CLOSE])
+def test_escrow_pays_no_fee(position):
+    # the escrow paying its own fee, the action call paying less
+    with pytest.raises(LogicError, match="logic signature"):
+        settle("CLAIM_FUNDS", {ACTION: {"fee": SETTLEMENT_FEE - MIN_TXN_FEE}, position: {"fee": MIN_TXN_FEE}})
+
+
+def test_fees_must_be_pooled():
+    with pytest.raises(LedgerError, match="fee too small"):
+        settle("CLAIM_FUNDS", {ACTION: {"fee": MIN_TXN_FEE}})
+
+
+@pytest.mark.parametrize("position", [CLOSE_OUT, ASSET_CLOSE, PAYMENT_CLOSE])
+def test_rekey_is_rejected(position):
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        settle("CLAIM_FUNDS", {position: {"rekey_to": COURIER}})
+
+
+def test_clear_state_from_the_escrow_is_refused():
+    # clearing would forget the order while the escrow still holds its funds
+    ledger, txns = settlement("CLAIM_FUNDS")
+    clear_state = txns[CLOSE_OUT].copy(on_completion=NAMED_INTS["ClearState"])
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        evaluate_group(ledger, with_fee_payer(clear_state))
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        settle("CLAIM_FUNDS", {CLOSE_OUT: {"on_completion": NAMED_INTS["ClearState"]}})
+
+
+def test_escrow_only_pays_out_in_a_settlement():
+    ledger, txns = settlement("CLAIM_FUNDS")
+    # the payment of an accepted settlement, without the action authorizing it
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        evaluate_group(ledger, with_fee_payer(txns[PAYMENT_CLOSE]))
+    # the action is a status change that does not settle the order
+    with pytest.raises(TransactionRejected, match="logic signature"):
+        settle("CLAIM_FUNDS", {ACTION: {"application_args": [bytes((DELIVERY_ACTION_CODES["START_DISPUTE"],))]}})
+
+
+@pytest.mark.parametrize("position,fields", [
+    (CLOSE_OUT, {"on_completion": NAMED_INTS["NoOp"]}),
+    (CLOSE_OUT, {"sender": OTHER}),
+    (ASSET_CLOSE, {"sender": OTHER}),
+    (PAYMENT_CLOSE, {"sender": OTHER}),
+])
+def test_status_app_checks_the_group(position, fields):
+    # without the logic signature, the app alone refuses a group not closing the escrow of the order
+    with pytest.raises(LogicError, match="assert failed"):
+        settle("CLAIM_FUNDS", {position: fields}, logic_sig=False)
@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+import pytest
+
+from avm.ledger import APP_PAGE_MIN_BALANCE, SCHEMA_BYTES_MIN_BALANCE, SCHEMA_UINT_MIN_BALANCE
+from scenarios import DELIVERY_GLOBAL_SCHEMA, DELIVERY_PACKED_GLOBAL_SCHEMA, ORDER_STATUS
+from simulate import NO_STATUS, Model, derive_rules, simulate
+
+# The rules of simulate.py are read from the approval program of delivery/app.py in the local
+# AVM, these are the transitions the contract is written to accept.
+
+TRANSITIONS = {
+    "CANCEL": {"COOKING": "CANCELED"},
+    "PICK_UP_ORDER": {"COOKING": "DELIVERING"},
+    "START_DISPUTE": {"DELIVERED": "DISPUTE"},
+    "COMPLETE_ORDER": {"DELIVERED": "COMPLETED", "DISPUTE": "COMPLETED"},
+    "DELIVERED": {"DELIVERING": "DELIVERED"},
+    "CLAIM_FUNDS": {"DELIVERED": "COMPLETED"},
+}
+SETTLEMENTS = ("CANCEL", "COMPLETE_ORDER", "CLAIM_FUNDS")
+
+
+@lru_cache(maxsize=None)
+def rules_of(packed: bool):
+    return derive_rules(packed)
+
+
+@pytest.fixture(params=[False, True], ids=["keyed", "packed"])
+def rules(request):
+    return rules_of(packed=request.param)
+
+
+def test_transitions(rules):
+    assert rules.to_dict()["transitions"] == TRANSITIONS
+    # every other action and status pair is rejected by the contract
+    accepted = sum(status != NO_STATUS for row in rules.next_status for status in row)
+    assert accepted == sum(map(len, TRANSITIONS.values()))
+
+
+def test_terminal_statuses(rules):
+    assert sorted(rules.terminal_statuses()) == sorted([ORDER_STATUS["COMPLETED"], ORDER_STATUS["CANCELED"]])
+
+
+def test_inner_transactions(rules):
+    # the settlements pay out and close the escrow, the tips asset opt-in is the one of place order
+    assert rules.inner_txns == {action: 2 if action in SETTLEMENTS else 0 for action in TRANSITIONS}
+    assert rules.place_order_inner_txns == 1
+    assert all(cost > 0 for cost in rules.costs.values()) and set(rules.costs) == set(TRANSITIONS)
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_minimum_balances(packed):
+    rules = rules_of(packed=packed)
+    # the escrow account and its tips asset holding
+    assert rules.escrow_min_balance == 200000
+    uints, byte_slices = DELIVERY_PACKED_GLOBAL_SCHEMA if packed else DELIVERY_GLOBAL_SCHEMA
+    assert rules.app_min_balance == APP_PAGE_MIN_BALANCE + SCHEMA_UINT_MIN_BALANCE * uints + SCHEMA_BYTES_MIN_BALANCE * byte_slices
+
+
+def test_layouts_share_the_rules():
+    keyed_rules, packed_rules = rules_of(packed=False), rules_of(packed=True)
+    assert packed_rules.next_status == keyed_rules.next_status
+    assert packed_rules.inner_txns == keyed_rules.inner_txns
+    assert packed_rules.app_min_balance < keyed_rules.app_min_balance
+
+
+def test_simulated_orders_follow_the_rules():
+    pytest.importorskip("numpy")
+    keyed_rules = rules_of(packed=False)
+    simulation = simulate(keyed_rules, Model(orders_per_second=5, duration=60))
+    counts = simulation.action_counts
+    # the parties only send what the contract accepts and every order is settled
+    assert simulation.rejected == 0
+    assert counts["PICK_UP_ORDER"] + counts["CANCEL"] == simulation.orders
+    assert counts["DELIVERED"] == counts["PICK_UP_ORDER"]
+    assert counts["COMPLETE_ORDER"] + counts["CLAIM_FUNDS"] == counts["DELIVERED"]
+    assert simulation.open_orders[-1] == 0
+    inner_txns = sum(count * keyed_rules.inner_txns[action] for action, count in counts.items())
+    assert simulation.inner_txns.sum() == inner_txns + simulation.orders * keyed_rules.place_order_inner_txns
+    # the funds of every delivered order are released
+    assert len(simulation.settle_delays) == counts["DELIVERED"]
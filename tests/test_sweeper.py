@@ -0,0 +1,164 @@
+import asyncio
+import base64
+
+import pytest
+from algosdk import encoding, transaction
+
+from plato_client import ConfirmationTimeout, HttpError, Sweeper, TransactionRejected
+from plato_client.indexer import OrderKey, OrderOrigin, StateIndex
+from plato_client.sweeper import Settlement
+from scenarios import ORDER_STATUS, itob
+from test_clients import new_account
+
+IDENTITY_APP_ID = 1000
+TIPS_ASA_ID = 1
+STATUS_KEY = b"orderStatus"
+
+
+class StubAlgod:
+    """Confirms the groups it is sent unless they call a rejected application, or one
+    failing with a queued error."""
+
+    def __init__(self, rejected=(), errors=None):
+        self.rejected = set(rejected)
+        # app ID -> errors of the next groups calling it, in order
+        self.errors = {app_id: list(queued) for app_id, queued in (errors or {}).items()}
+        # app IDs of the calls of every group sent
+        self.groups = []
+        self.signed_groups = []
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        return transaction.SuggestedParams(0, 1, 1001, base64.b64encode(bytes(32)).decode(), "fake-v1", flat_fee=True, min_fee=1000)
+
+    async def send_and_confirm(self, signed_txns) -> dict:
+        app_ids = [signed_txn.transaction.index for signed_txn in signed_txns]
+        self.groups.append(app_ids)
+        self.signed_groups.append(signed_txns)
+        for app_id in app_ids:
+            if self.errors.get(app_id):
+                raise self.errors[app_id].pop(0)
+        if self.rejected.intersection(app_ids):
+            raise HttpError(400, "Bad Request", b'{"message": "logic eval error"}')
+        return {"confirmed-round": 2}
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Delays of the retries, which are not waited for."""
+    delays = []
+
+    async def sleep(delay, result=None):
+        delays.append(delay)
+        return result
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return delays
+
+
+def sweep(algod: StubAlgod, app_ids, **options):
+    sender = new_account()
+    settlements = [Settlement(app_id, (sender.address,)) for app_id in app_ids]
+    sweeper = Sweeper(algod, StateIndex(IDENTITY_APP_ID), TIPS_ASA_ID, **options)
+    return asyncio.run(sweeper.sweep(sender, "CLAIM_FUNDS", settlements))
+
+
+def test_groups_pool_the_fees():
+    algod = StubAlgod()
+    result = sweep(algod, range(1, 21), group_size=16)
+    assert result.settled == list(range(1, 21)) and result.failed == {}
+    assert algod.groups == [list(range(1, 17)), list(range(17, 21))]
+    for group in algod.signed_groups:
+        txns = [signed_txn.transaction for signed_txn in group]
+        # the first call pays for the group and for the inner transactions of every call
+        assert txns[0].fee == len(txns) * 3 * 1000
+        assert all(txn.fee == 0 for txn in txns[1:])
+        assert len({txn.group for txn in txns}) == 1
+
+
+def test_rejected_calls_are_isolated(backoffs):
+    algod = StubAlgod(rejected={3, 6})
+    result = sweep(algod, range(1, 9), group_size=8)
+    assert sorted(result.settled) == [1, 2, 4, 5, 7, 8]
+    assert sorted(result.failed) == [3, 6]
+    assert all(isinstance(error, HttpError) and error.status == 400 for error in result.failed.values())
+    # a rejected group is split in halves without being sent again
+    assert algod.groups[0] == list(range(1, 9))
+    assert [1, 2, 3, 4] in algod.groups and [5, 6, 7, 8] in algod.groups
+    assert sorted(map(tuple, algod.groups)) == sorted(set(map(tuple, algod.groups)))
+    assert backoffs == []
+
+
+@pytest.mark.parametrize("error", [
+    HttpError(503, "Service Unavailable", b""),
+    ConnectionResetError("connection reset"),
+    TransactionRejected("txid", "injected drop"),
+    ConfirmationTimeout("txid"),
+])
+def test_transient_errors_are_retried(backoffs, error):
+    algod = StubAlgod(errors={2: [error, error]})
+    result = sweep(algod, range(1, 5), group_size=4)
+    assert result.settled == [1, 2, 3, 4] and result.failed == {}
+    # sent again as it was, after a backoff
+    assert algod.groups == [[1, 2, 3, 4]] * 3
+    assert backoffs == [0.5, 1.0]
+
+
+def test_persistent_error_after_the_attempts(backoffs):
+    error = HttpError(503, "Service Unavailable", b"")
+    algod = StubAlgod(errors={2: [error] * 10})
+    result = sweep(algod, range(1, 3), group_size=2, attempts=2)
+    assert result.settled == [1]
+    assert result.failed == {2: error}
+    # the group, then each half, is sent attempts times
+    assert algod.groups == [[1, 2]] * 2 + [[1]] + [[2]] * 2
+
+
+def test_group_size_bounds():
+    with pytest.raises(ValueError):
+        Sweeper(StubAlgod(), StateIndex(IDENTITY_APP_ID), TIPS_ASA_ID, group_size=17)
+
+
+def test_claims_the_escrow_orders_of_the_courier():
+    courier, other_courier, restaurant = new_account(), new_account(), new_account()
+    index = StateIndex(IDENTITY_APP_ID, status_app_id=9)
+    index.timestamp = 1000
+
+    def delivered(courier_address: str, delivered_time: int = 100):
+        return {
+            STATUS_KEY: ORDER_STATUS["DELIVERED"],
+            b"deliveredTime": delivered_time,
+            b"courierAddr": encoding.decode_address(courier_address),
+            b"restaurantAddr": encoding.decode_address(restaurant.address),
+        }
+
+    index.set_order(OrderKey(5), delivered(courier.address))
+    index.set_order(OrderKey(6), delivered(other_courier.address))
+    index.set_order(OrderKey(7), delivered(courier.address, delivered_time=990))
+    # orders of an order book and of the status app are settled by their own calls
+    index.set_order(OrderKey(8, itob(1)), delivered(courier.address))
+    index.set_order(OrderKey(9, encoding.decode_address(courier.address)), delivered(courier.address))
+    algod = StubAlgod()
+    result = asyncio.run(Sweeper(algod, index, TIPS_ASA_ID).claim_funds(courier, window=60))
+    assert result.settled == [5]
+    call = algod.signed_groups[0][0].transaction
+    assert call.accounts == [courier.address, restaurant.address]
+    assert call.foreign_assets == [TIPS_ASA_ID]
+
+
+def test_cancels_the_stale_orders():
+    customer, courier, restaurant = new_account(), new_account(), new_account()
+    index = StateIndex(IDENTITY_APP_ID)
+    index.timestamp = 1000
+    cooking = {
+        STATUS_KEY: ORDER_STATUS["COOKING"],
+        b"courierAddr": encoding.decode_address(courier.address),
+        b"restaurantAddr": encoding.decode_address(restaurant.address),
+    }
+    for app_id, created_time in ((5, 100), (6, 990)):
+        index.set_order(OrderKey(app_id), dict(cooking))
+        index.origins[OrderKey(app_id)] = OrderOrigin(encoding.decode_address(customer.address), created_time)
+    algod = StubAlgod()
+    result = asyncio.run(Sweeper(algod, index, TIPS_ASA_ID).cancel_stale_orders(restaurant, max_age=600))
+    assert result.settled == [5]
+    # the customer is refunded
+    assert algod.signed_groups[0][0].transaction.accounts == [customer.address]